@@ -25,6 +25,10 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# 读取 .env 中的 DATABASE_URL 等配置，使迁移与应用连接同一个数据库
+from dotenv import load_dotenv
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
+
 # 只导入必要的数据库模型，避免导入其他模块
 import importlib.util
 spec = importlib.util.spec_from_file_location(
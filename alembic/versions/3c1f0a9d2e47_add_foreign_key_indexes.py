@@ -0,0 +1,44 @@
+"""add foreign key indexes
+
+Revision ID: 3c1f0a9d2e47
+Revises: new_revision
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f0a9d2e47'
+down_revision: Union[str, None] = 'new_revision'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (表名, 列名)：角色/讨论组/配置步骤按外键批量加载时使用的列
+_INDEXED_COLUMNS = (
+    ('configuration_steps', 'configuration_id'),
+    ('roles', 'model_id'),
+    ('role_discussion_group', 'role_id'),
+    ('role_discussion_group', 'discussion_group_id'),
+)
+
+
+def _index_name(table: str, column: str) -> str:
+    """与 SQLAlchemy index=True 生成的名称一致"""
+    return f'ix_{table}_{column}'
+
+
+def upgrade() -> None:
+    for table, column in _INDEXED_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(_index_name(table, column), [column], unique=False)
+
+
+def downgrade() -> None:
+    for table, column in reversed(_INDEXED_COLUMNS):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(_index_name(table, column))
@@ -0,0 +1,43 @@
+"""add meeting states
+
+Revision ID: 5e8b2d7c4a19
+Revises: 3c1f0a9d2e47
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8b2d7c4a19'
+down_revision: Union[str, None] = '3c1f0a9d2e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'meeting_states',
+        sa.Column('id', sa.String(length=64), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('topic', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.Column('revision', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('state', sa.JSON(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('meeting_states', schema=None) as batch_op:
+        batch_op.create_index('ix_meeting_states_group_id', ['group_id'], unique=False)
+        batch_op.create_index('ix_meeting_states_status', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('meeting_states', schema=None) as batch_op:
+        batch_op.drop_index('ix_meeting_states_status')
+        batch_op.drop_index('ix_meeting_states_group_id')
+    op.drop_table('meeting_states')
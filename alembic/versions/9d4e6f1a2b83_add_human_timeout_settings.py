@@ -0,0 +1,30 @@
+"""add human timeout settings
+
+Revision ID: 9d4e6f1a2b83
+Revises: 5e8b2d7c4a19
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4e6f1a2b83'
+down_revision: Union[str, None] = '5e8b2d7c4a19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('discussion_groups', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('human_input_timeout', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('human_timeout_policy', sa.String(length=20), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('discussion_groups', schema=None) as batch_op:
+        batch_op.drop_column('human_timeout_policy')
+        batch_op.drop_column('human_input_timeout')
@@ -0,0 +1,34 @@
+"""add model hedge settings
+
+Revision ID: b61c3e8f9a27
+Revises: 9d4e6f1a2b83
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b61c3e8f9a27'
+down_revision: Union[str, None] = '9d4e6f1a2b83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('models', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hedge_enabled', sa.Boolean(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('hedge_model_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_models_hedge_model_id_models', 'models', ['hedge_model_id'], ['id'], ondelete='SET NULL'
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('models', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_models_hedge_model_id_models', type_='foreignkey')
+        batch_op.drop_column('hedge_model_id')
+        batch_op.drop_column('hedge_enabled')
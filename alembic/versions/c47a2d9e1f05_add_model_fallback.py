@@ -0,0 +1,32 @@
+"""add model fallback
+
+Revision ID: c47a2d9e1f05
+Revises: b61c3e8f9a27
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c47a2d9e1f05'
+down_revision: Union[str, None] = 'b61c3e8f9a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('models', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fallback_model_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_models_fallback_model_id_models', 'models', ['fallback_model_id'], ['id'], ondelete='SET NULL'
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('models', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_models_fallback_model_id_models', type_='foreignkey')
+        batch_op.drop_column('fallback_model_id')
@@ -0,0 +1,32 @@
+"""add model rate limits
+
+Revision ID: d83f5b2c6e14
+Revises: c47a2d9e1f05
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd83f5b2c6e14'
+down_revision: Union[str, None] = 'c47a2d9e1f05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('models', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rpm_limit', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('tpm_limit', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('max_concurrency', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('models', schema=None) as batch_op:
+        batch_op.drop_column('max_concurrency')
+        batch_op.drop_column('tpm_limit')
+        batch_op.drop_column('rpm_limit')
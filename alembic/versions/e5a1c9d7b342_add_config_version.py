@@ -0,0 +1,31 @@
+"""add config version
+
+Revision ID: e5a1c9d7b342
+Revises: d83f5b2c6e14
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a1c9d7b342'
+down_revision: Union[str, None] = 'd83f5b2c6e14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'config_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('config_version')
@@ -0,0 +1,37 @@
+"""add meeting messages
+
+Revision ID: f2b7d4e9a610
+Revises: e5a1c9d7b342
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b7d4e9a610'
+down_revision: Union[str, None] = 'e5a1c9d7b342'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 已有记录的消息仍在 state 快照中，下一次保存时整体迁移到 meeting_messages
+    with op.batch_alter_table('meeting_states', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('message_count', sa.Integer(), nullable=False, server_default='0'))
+    op.create_table(
+        'meeting_messages',
+        sa.Column('meeting_id', sa.String(length=64), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('data', sa.JSON(), nullable=False),
+        sa.PrimaryKeyConstraint('meeting_id', 'seq')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('meeting_messages')
+    with op.batch_alter_table('meeting_states', schema=None) as batch_op:
+        batch_op.drop_column('message_count')
@@ -1,14 +1,19 @@
 from typing import List, Dict, Any, Optional, Tuple
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 import uuid
 from datetime import datetime
 import logging
-import json
 import os
 
 from app.models.database import Model as ModelConfiguration, Role, DiscussionGroup
+from app.models import config_registry
+from app.clients import breaker
 from app.meeting.meeting import Meeting as MeetingSession
+from app.meeting import event_bus
+from app.meeting.store import get_meeting_store, save_meeting
 from app.meeting.agents.agent import Agent as MeetingAgent
 from app.meeting.meeting_modes.discussion import DiscussionMode
 from app.meeting.meeting_modes.brainstorming import BrainstormingMode
@@ -18,6 +23,8 @@ from app.meeting.meeting_modes.swot_analysis import SWOTAnalysisMode
 from app.meeting.meeting_modes.six_thinking_hats import SixThinkingHatsMode
 from app.meeting.utils.summary_generator import SummaryGenerator
 from app.meeting.meeting_modes.base_mode import BaseMeetingMode
+from app.utils import json_codec
+from app.clients.transport import run_sync
 
 logger = logging.getLogger(__name__)
 
@@ -26,10 +33,8 @@ class MeetingAdapter:
     适配器类，用于将DeepGemini的模型系统与会议系统整合
     """
     
-    # 类级别变量，用于在不同的实例之间共享活跃会议
-    _shared_active_meetings = {}
-    
-    def __init__(self, db: Session):
+    def __init__(self, db: Optional[Session]):
+        # 只启动、运行会议时（讨论组已预先加载）不需要同步会话，可以为 None
         self.db = db
         self.mode_classes = {
             "discussion": DiscussionMode,
@@ -39,11 +44,11 @@ class MeetingAdapter:
             "swot_analysis": SWOTAnalysisMode,
             "six_thinking_hats": SixThinkingHatsMode
         }
-        # 使用类级别共享变量
-        self.active_meetings = self.__class__._shared_active_meetings
+        # 活跃会议保存在共享的会议存储中（进程内或数据库，由 MEETING_STORE 决定）
+        self.active_meetings = get_meeting_store()
         
         # 启动时记录活跃会议
-        logger.info(f"MeetingAdapter初始化，当前活跃会议数量: {len(self.active_meetings)}, IDs: {list(self.active_meetings.keys())}")
+        logger.debug(f"MeetingAdapter初始化，会议存储后端: {self.active_meetings.backend}")
     
     # ===== 角色管理功能 =====
     
@@ -72,6 +77,7 @@ class MeetingAdapter:
             
             self.db.add(new_role)
             self.db.commit()
+            config_registry.invalidate()
             self.db.refresh(new_role)
             
             return {
@@ -96,11 +102,12 @@ class MeetingAdapter:
     def get_all_roles(self) -> List[Dict[str, Any]]:
         """获取所有角色列表"""
         try:
-            roles = self.db.query(Role).order_by(Role.created_at.desc()).all()
+            # 一次 JOIN 取出角色及其模型，避免逐个角色查询模型
+            roles = self.db.query(Role).options(joinedload(Role.model)).order_by(Role.created_at.desc()).all()
             
             result = []
             for role in roles:
-                model = self.db.query(ModelConfiguration).filter(ModelConfiguration.id == role.model_id).first()
+                model = role.model
                 
                 role_data = {
                     "id": role.id,
@@ -123,12 +130,12 @@ class MeetingAdapter:
     def get_role(self, role_id: int) -> Dict[str, Any]:
         """获取角色详情"""
         try:
-            role = self.db.query(Role).filter(Role.id == role_id).first()
+            role = self.db.query(Role).options(joinedload(Role.model)).filter(Role.id == role_id).first()
             
             if not role:
                 raise HTTPException(status_code=404, detail=f"角色ID {role_id} 不存在")
             
-            model = self.db.query(ModelConfiguration).filter(ModelConfiguration.id == role.model_id).first()
+            model = role.model
             
             return {
                 "id": role.id,
@@ -182,6 +189,7 @@ class MeetingAdapter:
             
             role.updated_at = datetime.now()
             self.db.commit()
+            config_registry.invalidate()
             self.db.refresh(role)
             
             model = self.db.query(ModelConfiguration).filter(ModelConfiguration.id == role.model_id).first()
@@ -222,6 +230,7 @@ class MeetingAdapter:
             
             self.db.delete(role)
             self.db.commit()
+            config_registry.invalidate()
             
             return {"message": f"角色 '{role.name}' 已成功删除"}
         except HTTPException:
@@ -243,12 +252,7 @@ class MeetingAdapter:
                 raise HTTPException(status_code=400, detail=f"无效的会议模式: {mode}")
             
             # 检查角色是否存在
-            roles = []
-            for role_id in role_ids:
-                role = self.db.query(Role).filter(Role.id == role_id).first()
-                if not role:
-                    raise HTTPException(status_code=404, detail=f"角色ID {role_id} 不存在")
-                roles.append(role)
+            roles = self._load_roles(role_ids)
             
             # 创建新讨论组
             new_group = DiscussionGroup(
@@ -269,6 +273,7 @@ class MeetingAdapter:
             
             self.db.add(new_group)
             self.db.commit()
+            config_registry.invalidate()
             self.db.refresh(new_group)
             
             return {
@@ -291,7 +296,10 @@ class MeetingAdapter:
     def get_all_discussion_groups(self) -> List[Dict[str, Any]]:
         """获取所有讨论组列表"""
         try:
-            groups = self.db.query(DiscussionGroup).order_by(DiscussionGroup.created_at.desc()).all()
+            # 预加载成员角色，role_count 不再逐组查询
+            groups = self.db.query(DiscussionGroup).options(
+                selectinload(DiscussionGroup.roles)
+            ).order_by(DiscussionGroup.created_at.desc()).all()
             
             result = []
             for group in groups:
@@ -316,7 +324,10 @@ class MeetingAdapter:
     def get_discussion_group(self, group_id: int) -> Dict[str, Any]:
         """获取讨论组详情"""
         try:
-            group = self.db.query(DiscussionGroup).filter(DiscussionGroup.id == group_id).first()
+            # 预加载成员角色及其模型
+            group = self.db.query(DiscussionGroup).options(
+                selectinload(DiscussionGroup.roles).joinedload(Role.model)
+            ).filter(DiscussionGroup.id == group_id).first()
             
             if not group:
                 raise HTTPException(status_code=404, detail=f"讨论组ID {group_id} 不存在")
@@ -337,7 +348,7 @@ class MeetingAdapter:
             
             # 获取角色详情
             for role in group.roles:
-                model = self.db.query(ModelConfiguration).filter(ModelConfiguration.id == role.model_id).first()
+                model = role.model
                 
                 role_data = {
                     "id": role.id,
@@ -392,12 +403,7 @@ class MeetingAdapter:
             # 更新角色列表
             if role_ids is not None:
                 # 检查角色是否存在
-                roles = []
-                for role_id in role_ids:
-                    role = self.db.query(Role).filter(Role.id == role_id).first()
-                    if not role:
-                        raise HTTPException(status_code=404, detail=f"角色ID {role_id} 不存在")
-                    roles.append(role)
+                roles = self._load_roles(role_ids)
                 
                 # 清除现有角色
                 group.roles = []
@@ -408,6 +414,7 @@ class MeetingAdapter:
             
             group.updated_at = datetime.now()
             self.db.commit()
+            config_registry.invalidate()
             self.db.refresh(group)
             
             return {
@@ -438,6 +445,7 @@ class MeetingAdapter:
             
             self.db.delete(group)
             self.db.commit()
+            config_registry.invalidate()
             
             return {"message": f"讨论组 '{group.name}' 已成功删除"}
         except HTTPException:
@@ -449,11 +457,12 @@ class MeetingAdapter:
     
     # ===== 会议功能 =====
     
-    def start_meeting(self, group_id: int, topic: str) -> str:
-        """启动会议"""
+    def start_meeting(self, group_id: int, topic: str, group=None) -> str:
+        """启动会议（group 为异步路由预先加载的讨论组，为空时用同步会话查询）"""
         try:
             # 查询讨论组
-            group = self._load_discussion_group(group_id)
+            if group is None:
+                group = self._load_discussion_group(group_id)
             
             # 获取讨论组相关信息 
             mode_name = group.mode
@@ -485,8 +494,8 @@ class MeetingAdapter:
                     logger.warning(f"角色 {role.name} 没有设置模型，将被跳过")
                     continue
                 
-                # 获取模型信息
-                model = self.db.query(ModelConfiguration).filter(ModelConfiguration.id == role.model_id).first()
+                # 获取模型信息（已随讨论组预加载，端点熔断中时改用备用模型）
+                model = breaker.available_model(role.model)
                 if not model:
                     logger.warning(f"角色 {role.name} 的模型 (ID: {role.model_id}) 不存在，将被跳过")
                     continue
@@ -515,6 +524,10 @@ class MeetingAdapter:
                         personality=role.personality,
                         skills=role.skills
                     )
+                    # 寄生的角色在人类输入超时（host 策略）时代为发言
+                    agent.host_role_name = role.host_role.name if role.host_role else None
+                    if group.human_input_timeout is not None:
+                        agent.input_timeout = group.human_input_timeout
                 else:
                     # 创建AI智能体
                     agent = MeetingAgent(
@@ -577,7 +590,7 @@ class MeetingAdapter:
                 "current_round": meeting.current_round,
                 "start_time": meeting_data["start_time"].isoformat(),
                 "end_time": meeting.end_time.isoformat() if meeting.end_time else None,
-                "history": meeting.meeting_history
+                "history": list(meeting.meeting_history)
             }
         except HTTPException:
             raise
@@ -585,14 +598,36 @@ class MeetingAdapter:
             logger.error(f"获取讨论状态失败: {str(e)}", exc_info=True)
             raise HTTPException(status_code=500, detail=f"获取讨论状态失败: {str(e)}")
     
+    def _get_meeting(self, meeting_id: str):
+        """获取会议对象，不存在时抛出 ValueError"""
+        meeting_data = self.active_meetings.get(meeting_id)
+        meeting = meeting_data.get("meeting") if meeting_data else None
+        if meeting is None:
+            raise ValueError(f"会议ID {meeting_id} 不存在")
+        return meeting
+
+    async def _get_meeting_async(self, meeting_id: str):
+        """在事件循环中获取会议对象（内存未命中时在线程中查询存储），不存在时抛出 ValueError"""
+        meeting_data = await self.active_meetings.get_async(meeting_id)
+        meeting = meeting_data.get("meeting") if meeting_data else None
+        if meeting is None:
+            raise ValueError(f"会议ID {meeting_id} 不存在")
+        return meeting
+
     def conduct_discussion_round(self, meeting_id: str, prompt_type: str = None):
-        meeting = self._get_meeting(meeting_id)
+        """推进一位发言者（同步包装，供遗留调用方使用）"""
+        return run_sync(self.conduct_discussion_round_async(meeting_id, prompt_type))
+
+    async def conduct_discussion_round_async(self, meeting_id: str, prompt_type: str = None):
+        """推进一位发言者：人类角色进入等待输入，智能体异步调用模型发言"""
+        meeting = await self._get_meeting_async(meeting_id)
         
         # 在开始新轮次前检查是否已达到最大轮次
         if meeting.current_round > meeting.max_rounds:
             logger.info(f"讨论轮次已超过上限: 当前轮次 {meeting.current_round}, 最大轮次 {meeting.max_rounds}")
             meeting.status = "已结束"
             meeting.end_time = datetime.now()
+            save_meeting(meeting_id)
             return {
                 "success": False,
                 "message": "会议已结束 (达到最大轮次)",
@@ -644,7 +679,8 @@ class MeetingAdapter:
         
         # 进行一轮讨论
         logger.info(f"开始执行一轮讨论")
-        result = meeting.conduct_round()
+        result = await meeting.conduct_round_async()
+        save_meeting(meeting_id)
         logger.info(f"讨论轮次完成: id={meeting_id}, 新状态={meeting.status}, 新轮次={meeting.current_round}")
         
         # 检查讨论结果中是否有人类智能体需要输入
@@ -685,7 +721,7 @@ class MeetingAdapter:
         """结束会议并获取总结"""
         try:
             # 获取会议对象
-            meeting_data = self.active_meetings.get(meeting_id)
+            meeting_data = await self.active_meetings.get_async(meeting_id)
             if not meeting_data:
                 logger.error(f"结束会议失败: 会议ID {meeting_id} 不存在")
                 return {"error": f"会议ID {meeting_id} 不存在"}
@@ -700,7 +736,7 @@ class MeetingAdapter:
             group_info = meeting.group_info
             
             # 检查会议是否已有总结
-            existing_summary = meeting.get_summary() if hasattr(meeting, 'get_summary') else None
+            existing_summary = meeting.existing_summary()
             if meeting.status == "已结束" and existing_summary and len(existing_summary) > 100 and "未找到总结" not in existing_summary:
                 logger.info(f"会议已结束且已有总结，直接返回: meeting_id={meeting_id}")
                 result = meeting.to_dict()
@@ -723,10 +759,9 @@ class MeetingAdapter:
                 model_id = group_info['summary_model_id']
                 logger.info(f"使用自定义总结模型: model_id={model_id}")
                 
-                # 从数据库获取模型配置
+                # 从配置注册表获取模型配置（不访问数据库）
                 try:
-                    from app.models.database import Model
-                    summary_model = self.db.query(Model).filter(Model.id == model_id).first()
+                    summary_model = breaker.available_model(config_registry.peek_model(model_id))
                 
                     if summary_model:
                         logger.info(f"找到总结模型: name={summary_model.name}")
@@ -774,7 +809,7 @@ class MeetingAdapter:
                 logger.info(f"生成总结: model_name={model_name or '默认'}, 提示模板长度={len(prompt_template)}")
                 
                 # 调用总结生成器，传递API信息
-                summary = SummaryGenerator.generate_summary(
+                summary = await SummaryGenerator.generate_summary_async(
                     meeting_topic=meeting_topic,
                     meeting_history=meeting_history,
                     prompt_template=prompt_template,
@@ -785,6 +820,7 @@ class MeetingAdapter:
                 
                 # 添加总结到会议历史
                 meeting.add_message("system", summary)
+                event_bus.publish(meeting_id, "summary", {"content": summary})
                 logger.info(f"已生成并添加总结到会议历史: 长度={len(summary)}")
             else:
                 # 使用已有的总结
@@ -796,6 +832,8 @@ class MeetingAdapter:
             if not meeting.end_time:
                 meeting.end_time = datetime.now()
             
+            save_meeting(meeting_id)
+            
             # 构建返回结果
             result = meeting.to_dict()
             
@@ -814,13 +852,45 @@ class MeetingAdapter:
                 "error": f"结束会议时出错: {str(e)}",
                 "id": meeting_id,
                 "topic": meeting.topic if meeting else "未知主题",
-                "history": meeting.meeting_history if meeting else [],
+                "history": list(meeting.meeting_history) if meeting else [],
                 "summary": "由于技术问题，无法生成会议总结。"
             }
 
+    def _load_roles(self, role_ids: List[int]) -> List[Role]:
+        """按ID批量加载角色（一次查询），保持传入顺序；任一角色不存在时返回404"""
+        found = {}
+        if role_ids:
+            found = {role.id: role for role in self.db.query(Role).filter(Role.id.in_(role_ids)).all()}
+        
+        roles = []
+        for role_id in role_ids:
+            role = found.get(role_id)
+            if not role:
+                raise HTTPException(status_code=404, detail=f"角色ID {role_id} 不存在")
+            roles.append(role)
+        return roles
+
     def _load_discussion_group(self, group_id: int):
-        """加载讨论组信息"""
-        group = self.db.query(DiscussionGroup).filter(DiscussionGroup.id == group_id).first()
+        """加载讨论组信息（同时预加载成员角色及其模型、寄生的角色）"""
+        group = self.db.query(DiscussionGroup).options(
+            selectinload(DiscussionGroup.roles).options(joinedload(Role.model), joinedload(Role.host_role))
+        ).filter(DiscussionGroup.id == group_id).first()
+        if not group:
+            logger.error(f"讨论组不存在: group_id={group_id}")
+            raise ValueError(f"讨论组ID {group_id} 不存在")
+        
+        logger.info(f"找到讨论组: {group.name}, 角色数量: {len(group.roles)}")
+        return group
+
+    @staticmethod
+    async def load_discussion_group_async(db: AsyncSession, group_id: int):
+        """用异步会话加载讨论组，预加载内容与 _load_discussion_group 相同，供异步路由传给 start_meeting"""
+        result = await db.execute(
+            select(DiscussionGroup).options(
+                selectinload(DiscussionGroup.roles).options(joinedload(Role.model), joinedload(Role.host_role))
+            ).filter(DiscussionGroup.id == group_id)
+        )
+        group = result.scalars().first()
         if not group:
             logger.error(f"讨论组不存在: group_id={group_id}")
             raise ValueError(f"讨论组ID {group_id} 不存在")
@@ -838,6 +908,8 @@ class MeetingAdapter:
             "max_rounds": group.max_rounds,
             "summary_model_id": getattr(group, "summary_model_id", None),
             "summary_prompt": getattr(group, "summary_prompt", None),
+            "human_input_timeout": getattr(group, "human_input_timeout", None),
+            "human_timeout_policy": getattr(group, "human_timeout_policy", None),
             "created_at": group.created_at.isoformat() if group.created_at else None,
             "updated_at": group.updated_at.isoformat() if group.updated_at else None,
             "roles": []
@@ -1,7 +1,12 @@
 """基础客户端类，定义通用接口"""
 from typing import AsyncGenerator, Any
-import aiohttp
 from app.utils.logger import logger
+from app.clients.transport import get_aiohttp_session
+from app.clients.retry import UpstreamStatusError, retry_stream
+from app.clients import breaker
+from app.clients.breaker import CircuitOpenError
+from app.clients import limiter
+from app.clients.sse import iter_sse_data
 from abc import ABC, abstractmethod
 
 
@@ -46,7 +51,10 @@ class BaseClient(ABC):
         return data
         
     async def _make_request(self, headers: dict, data: dict, url: str = None) -> AsyncGenerator[bytes, None]:
-        """发送请求并处理响应
+        """发送请求并处理响应（收到第一个数据块之前的可重试错误按统一重试策略重试）
+        
+        熔断拒绝与重试耗尽后的错误记录日志后继续抛出，由调用方（对冲、备用模型）决定如何处理，
+        不再以空响应结束。
         
         Args:
             headers: 请求头
@@ -56,24 +64,56 @@ class BaseClient(ABC):
         Yields:
             bytes: 原始响应数据
         """
+        request_url = url if url else self.api_url
         try:
-            request_url = url if url else self.api_url
-            async with aiohttp.ClientSession() as session:        
-                async with session.post(
-                    request_url,
-                    headers=headers,
-                    json=data
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"API 请求失败: {error_text}")
-                        return
-                        
-                    async for chunk in response.content.iter_any():
-                        yield chunk
-                        
+            async for chunk in retry_stream(
+                lambda: self._request_once(headers, data, request_url),
+                name=f"{type(self).__name__} 请求",
+                circuit=breaker.get_circuit(getattr(self, "provider", None), request_url, self.api_key),
+                quota=limiter.quota(request_url, self.api_key, data)
+            ):
+                yield chunk
+        except CircuitOpenError as e:
+            logger.warning(str(e))
+            raise
+        except UpstreamStatusError as e:
+            logger.error(f"API 请求失败: HTTP {e.status} {e.body}")
+            raise
         except Exception as e:
             logger.error(f"请求 API 时发生错误: {e}")
+            raise
+            
+    async def _request_once(self, headers: dict, data: dict, url: str) -> AsyncGenerator[bytes, None]:
+        """发送一次请求，非 200 响应抛出 UpstreamStatusError
+        
+        Args:
+            headers: 请求头
+            data: 请求数据
+            url: 请求URL
+            
+        Yields:
+            bytes: 原始响应数据
+        """
+        session = get_aiohttp_session()
+        async with session.post(url, headers=headers, json=data) as response:
+            if response.status != 200:
+                raise UpstreamStatusError(response.status, await response.text(), response.headers)
+            async for chunk in response.content.iter_any():
+                yield chunk
+            
+    async def _stream_events(self, headers: dict, data: dict, url: str = None) -> AsyncGenerator[str, None]:
+        """发送流式请求并按 SSE 事件切分响应
+        
+        Args:
+            headers: 请求头
+            data: 请求数据
+            url: 自定义请求URL，如不提供则使用self.api_url
+            
+        Yields:
+            str: 每个完整的 data 负载（不含 "data: " 前缀）
+        """
+        async for payload in iter_sse_data(self._make_request(headers, data, url)):
+            yield payload
             
     @abstractmethod
     async def stream_chat(self, messages: list, model: str) -> AsyncGenerator[tuple[str, str], None]:
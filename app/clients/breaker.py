@@ -0,0 +1,370 @@
+"""上游端点熔断器
+
+每个上游端点（provider, api_url, api_key）一个熔断器，避免提供商故障时每个请求都要等满超时：
+
+- closed: 正常放行，记录最近 BREAKER_WINDOW 秒内的调用结果
+- open: 窗口内调用数达到 BREAKER_MIN_CALLS 且错误率 ≥ BREAKER_ERROR_RATE，或慢调用
+  （首块/响应耗时 ≥ BREAKER_SLOW_SECONDS）比例 ≥ BREAKER_SLOW_RATE 时打开，直接拒绝请求（CircuitOpenError）
+- half_open: 打开 BREAKER_OPEN_SECONDS 后由后台探测任务发送轻量请求（GET 模型列表，鉴权方式与提供商客户端一致），
+  端点有响应（非 5xx/429，且不是 401/403 鉴权失败）即转为半开，只放行 BREAKER_HALF_OPEN_CALLS 个试探请求；
+  试探成功则关闭，失败则重新打开
+
+只有可重试的错误（连接错误、超时、429、5xx，见 app.clients.retry.is_retryable）计为失败，
+401/400 等请求本身的问题不影响熔断状态。同一地址（去掉查询参数与 /chat/completions 等后缀）与密钥视为同一端点，
+provider 只用于展示。熔断期间路由代码通过 available_model() 直接换用模型配置的 fallback_model_id。
+"""
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from app.utils.logger import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"环境变量 {name}={value} 不是有效数字，使用默认值 {default}")
+        return default
+
+
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+BREAKER_WINDOW = _env_float("BREAKER_WINDOW", 60)
+BREAKER_MIN_CALLS = int(_env_float("BREAKER_MIN_CALLS", 5))
+BREAKER_ERROR_RATE = _env_float("BREAKER_ERROR_RATE", 0.5)
+BREAKER_SLOW_SECONDS = _env_float("BREAKER_SLOW_SECONDS", 30)
+BREAKER_SLOW_RATE = _env_float("BREAKER_SLOW_RATE", 0.8)
+BREAKER_OPEN_SECONDS = _env_float("BREAKER_OPEN_SECONDS", 30)
+BREAKER_HALF_OPEN_CALLS = int(_env_float("BREAKER_HALF_OPEN_CALLS", 1))
+BREAKER_PROBE_INTERVAL = _env_float("BREAKER_PROBE_INTERVAL", 5)
+BREAKER_PROBE_TIMEOUT = _env_float("BREAKER_PROBE_TIMEOUT", 5)
+
+# 端点地址中代表具体接口的后缀，去掉后得到端点基础地址
+_ENDPOINT_SUFFIXES = ("/v1/chat/completions", "/chat/completions", "/v1/messages", "/v1")
+# 以 API 版本结尾的基础地址（如 Gemini 的 /v1beta）
+_VERSION_SEGMENT = re.compile(r"/v\d+\w*$")
+# 探测时视为端点仍不可用的状态码：限流与鉴权失败（密钥失效时放行试探请求只会继续失败）
+_PROBE_FAILURE_STATUS = frozenset({401, 403, 429})
+
+
+class CircuitOpenError(Exception):
+    """端点熔断中，请求被直接拒绝"""
+
+    def __init__(self, circuit: "Circuit"):
+        self.circuit = circuit
+        super().__init__(f"上游端点 {circuit.url} 熔断中（{circuit.reason}），请求被拒绝")
+
+
+def normalize_url(api_url: Optional[str]) -> str:
+    """端点基础地址：去掉查询参数（Gemini 的 key）、接口后缀与 Gemini 的模型路径"""
+    parts = urlsplit(api_url or "")
+    path = parts.path.rstrip("/")
+    if "/models/" in path:
+        path = path.split("/models/")[0]
+    for suffix in _ENDPOINT_SUFFIXES:
+        if path.endswith(suffix):
+            path = path[: -len(suffix)]
+            break
+    return f"{parts.scheme}://{parts.netloc}{path}" if parts.netloc else path
+
+
+class Circuit:
+    """单个端点的熔断器"""
+
+    def __init__(self, provider: str, url: str, api_key: str):
+        self.provider = provider or ""
+        self.url = url
+        self.api_key = api_key or ""
+        self.id = hashlib.sha1(f"{url}\n{self.api_key}".encode("utf-8")).hexdigest()[:12]
+        self.state = CLOSED
+        self.reason = ""
+        self.opened_at: Optional[float] = None
+        self.trials = 0  # 半开状态下进行中的试探请求数
+        self.calls: Deque[Tuple[float, bool, bool]] = deque()  # (时间, 是否失败, 是否慢调用)
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0, "probes": 0}
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """请求前调用：熔断中抛出 CircuitOpenError，半开时占用一个试探名额"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and self.trials < BREAKER_HALF_OPEN_CALLS:
+                self.trials += 1
+                return
+            self.stats["rejected"] += 1
+        raise CircuitOpenError(self)
+
+    def record(self, failed: bool, latency: float = 0.0) -> None:
+        """记录一次调用结果
+
+        Args:
+            failed: 是否为计入熔断的失败
+            latency: 调用耗时（流式为首块耗时）秒数
+        """
+        now = time.monotonic()
+        slow = not failed and latency >= BREAKER_SLOW_SECONDS
+        with self._lock:
+            self.stats["calls"] += 1
+            if failed:
+                self.stats["failures"] += 1
+            if self.state == HALF_OPEN:
+                self.trials = max(0, self.trials - 1)
+                if failed or slow:
+                    self._open("试探请求失败" if failed else "试探请求过慢")
+                else:
+                    self._close()
+                return
+            if self.state == OPEN:
+                return
+            self.calls.append((now, failed, slow))
+            self._trim(now)
+            total = len(self.calls)
+            if total < BREAKER_MIN_CALLS:
+                return
+            failures = sum(1 for _, f, _ in self.calls if f)
+            slows = sum(1 for _, _, s in self.calls if s)
+            if failures / total >= BREAKER_ERROR_RATE:
+                self._open(f"错误率 {failures}/{total}")
+            elif slows / total >= BREAKER_SLOW_RATE:
+                self._open(f"慢调用 {slows}/{total}")
+
+    def release(self) -> None:
+        """调用被取消或出现不计入熔断的错误时归还试探名额"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.trials = max(0, self.trials - 1)
+
+    def _trim(self, now: float) -> None:
+        while self.calls and now - self.calls[0][0] > BREAKER_WINDOW:
+            self.calls.popleft()
+
+    def _open(self, reason: str) -> None:
+        self.state = OPEN
+        self.reason = reason
+        self.opened_at = time.monotonic()
+        self.trials = 0
+        self.calls.clear()
+        self.stats["opened"] += 1
+        logger.warning(f"上游端点 {self.url} 熔断打开: {reason}")
+
+    def _close(self) -> None:
+        self.state = CLOSED
+        self.reason = ""
+        self.opened_at = None
+        self.calls.clear()
+        logger.info(f"上游端点 {self.url} 熔断关闭")
+
+    def half_open(self) -> None:
+        """探测成功后转为半开"""
+        with self._lock:
+            if self.state == OPEN:
+                self.state = HALF_OPEN
+                self.trials = 0
+                logger.info(f"上游端点 {self.url} 探测成功，进入半开状态")
+
+    def extend_open(self) -> None:
+        """探测失败，重新开始计算打开时长"""
+        with self._lock:
+            if self.state == OPEN:
+                self.opened_at = time.monotonic()
+
+    def reset(self) -> None:
+        """手动关闭熔断"""
+        with self._lock:
+            self._close()
+
+    @property
+    def probe_due(self) -> bool:
+        return self.state == OPEN and time.monotonic() - (self.opened_at or 0) >= BREAKER_OPEN_SECONDS
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            total = len(self.calls)
+            failures = sum(1 for _, f, _ in self.calls if f)
+            return {
+                "id": self.id,
+                "provider": self.provider,
+                "url": self.url,
+                "api_key": f"...{self.api_key[-4:]}" if self.api_key else "",
+                "state": self.state,
+                "reason": self.reason,
+                "open_for": round(now - self.opened_at, 1) if self.opened_at else None,
+                "window_calls": total,
+                "window_error_rate": round(failures / total, 3) if total else 0.0,
+                **self.stats,
+            }
+
+
+_circuits: Dict[Tuple[str, str], Circuit] = {}
+_lock = threading.Lock()
+_probe_task: Optional[asyncio.Task] = None
+
+
+def get_circuit(provider: Optional[str], api_url: Optional[str], api_key: Optional[str]) -> Optional[Circuit]:
+    """获取端点的熔断器（不存在时创建），熔断功能关闭时返回 None
+
+    Args:
+        provider: 提供商名称（仅用于展示）
+        api_url: 请求地址
+        api_key: API密钥
+
+    Returns:
+        Optional[Circuit]: 熔断器
+    """
+    if not BREAKER_ENABLED or not api_url:
+        return None
+    key = (normalize_url(api_url), api_key or "")
+    circuit = _circuits.get(key)
+    if circuit is None:
+        with _lock:
+            circuit = _circuits.get(key)
+            if circuit is None:
+                circuit = _circuits[key] = Circuit(provider, key[0], key[1])
+    if provider and not circuit.provider:
+        circuit.provider = provider
+    return circuit
+
+
+def is_open(api_url: Optional[str], api_key: Optional[str]) -> bool:
+    """端点当前是否拒绝请求（打开，或半开且试探名额已满）"""
+    if not BREAKER_ENABLED or not api_url:
+        return False
+    circuit = _circuits.get((normalize_url(api_url), api_key or ""))
+    if circuit is None:
+        return False
+    return circuit.state == OPEN or (circuit.state == HALF_OPEN and circuit.trials >= BREAKER_HALF_OPEN_CALLS)
+
+
+def available_model(model):
+    """路由时选择可用的模型：模型端点熔断中且配置了未熔断的 fallback_model_id 时返回备用模型
+
+    Args:
+        model: 模型快照或数据库模型对象（可为 None）
+
+    Returns:
+        原模型或备用模型快照；没有可用备用模型时返回原模型（调用时由熔断器快速失败）
+    """
+    if model is None or not is_open(model.api_url, model.api_key):
+        return model
+    fallback_id = getattr(model, "fallback_model_id", None)
+    if fallback_id and fallback_id != model.id:
+        from app.models import config_registry
+
+        # 每次路由都会调用：读取最近的编译结果，不在事件循环中重建
+        fallback = config_registry.peek_model(fallback_id)
+        if fallback is not None and not is_open(fallback.api_url, fallback.api_key):
+            logger.info(f"模型 {model.name} 的端点熔断中，改用备用模型 {fallback.name}")
+            return fallback
+    return model
+
+
+def _probe_url(circuit: Circuit) -> str:
+    """探测地址：模型列表接口（OpenAI/Anthropic 为 /v1/models，Gemini 为 /v1beta/models）"""
+    if _VERSION_SEGMENT.search(circuit.url):
+        return f"{circuit.url}/models"
+    return f"{circuit.url}/v1/models"
+
+
+def _probe_headers(circuit: Circuit) -> Dict[str, str]:
+    """探测请求头：Gemini（provider 为 google 或官方地址）使用 x-goog-api-key，其余提供商使用 Bearer"""
+    if not circuit.api_key:
+        return {}
+    if circuit.provider.lower() == "google" or "generativelanguage.googleapis.com" in circuit.url:
+        return {"x-goog-api-key": circuit.api_key}
+    return {"Authorization": f"Bearer {circuit.api_key}"}
+
+
+async def probe(circuit: Circuit) -> bool:
+    """向端点发送一次轻量请求，有响应且不是 5xx/429/401/403 时视为恢复
+
+    Args:
+        circuit: 熔断器
+
+    Returns:
+        bool: 端点是否恢复
+    """
+    import aiohttp
+    from app.clients.transport import get_aiohttp_session
+
+    circuit.stats["probes"] += 1
+    headers = _probe_headers(circuit)
+    try:
+        session = get_aiohttp_session()
+        async with session.get(
+            _probe_url(circuit),
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=BREAKER_PROBE_TIMEOUT)
+        ) as response:
+            healthy = response.status < 500 and response.status not in _PROBE_FAILURE_STATUS
+    except Exception as e:
+        logger.debug(f"探测上游端点 {circuit.url} 失败: {e}")
+        healthy = False
+    if healthy:
+        circuit.half_open()
+    else:
+        circuit.extend_open()
+    return healthy
+
+
+async def _probe_loop() -> None:
+    while True:
+        await asyncio.sleep(BREAKER_PROBE_INTERVAL)
+        due = [circuit for circuit in list(_circuits.values()) if circuit.probe_due]
+        if due:
+            await asyncio.gather(*(probe(circuit) for circuit in due), return_exceptions=True)
+
+
+def start() -> None:
+    """启动后台探测任务（应用启动时调用）"""
+    global _probe_task
+    if not BREAKER_ENABLED or BREAKER_PROBE_INTERVAL <= 0:
+        return
+    if _probe_task is None or _probe_task.done():
+        _probe_task = asyncio.get_running_loop().create_task(_probe_loop())
+
+
+async def stop() -> None:
+    """停止后台探测任务（应用关闭时调用）"""
+    global _probe_task
+    task, _probe_task = _probe_task, None
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def reset(circuit_id: Optional[str] = None) -> int:
+    """手动关闭熔断
+
+    Args:
+        circuit_id: 熔断器 ID，为空时关闭全部
+
+    Returns:
+        int: 被关闭的熔断器数量
+    """
+    count = 0
+    for circuit in list(_circuits.values()):
+        if circuit_id is None or circuit.id == circuit_id:
+            circuit.reset()
+            count += 1
+    return count
+
+
+def snapshot() -> List[Dict[str, Any]]:
+    """返回所有熔断器的状态"""
+    return [circuit.to_dict() for circuit in list(_circuits.values())]
@@ -1,7 +1,7 @@
 """Claude API 客户端"""
-import json
 from typing import AsyncGenerator, Optional, List, Dict
 from app.utils.logger import logger
+from app.utils import json_codec
 from .base_client import BaseClient
 
 
@@ -18,7 +18,6 @@ class ClaudeClient(BaseClient):
         super().__init__(api_key, api_url)
         self.provider = provider
         self.is_origin_reasoning = is_origin_reasoning
-        self.reasoning_content = []
         logger.debug(f"ClaudeClient url: {self.api_url}")
 
     async def stream_chat(
@@ -74,91 +73,84 @@ class ClaudeClient(BaseClient):
                 "Accept": "text/event-stream" if stream else "application/json",
             }
 
-            # 用于收集推理内容
-            self.reasoning_content = []
+            # 用于收集推理内容（按请求独立，客户端实例会在并发请求间共享）
+            reasoning_content = []
             in_thinking = False
 
-            async for chunk in self._make_request(headers, data):
-                chunk_str = chunk.decode('utf-8')
-                if not chunk_str.strip():
-                    continue
-
-                for line in chunk_str.split('\n'):
-                    if line.startswith('data: '):
-                        json_str = line[6:]
-                        if json_str.strip() == '[DONE]':
-                            return
+            async for json_str in self._stream_events(headers, data):
+                if json_str.strip() == '[DONE]':
+                    return
 
-                        try:
-                            chunk_data = json.loads(json_str)
-                            logger.debug(f"chunk_data: {chunk_data}")
+                try:
+                    chunk_data = json_codec.loads(json_str)
+                    logger.debug(f"chunk_data: {chunk_data}")
+                    
+                    # 处理新的响应格式
+                    if 'choices' in chunk_data:
+                        delta = chunk_data['choices'][0].get('delta', {})
+                        content = delta.get('content', '')
+                        
+                        if content:
+                            # 处理推理内容
+                            if '<think>' in content:
+                                in_thinking = True
+                                content = content.replace('<think>', '').strip()
                             
-                            # 处理新的响应格式
-                            if 'choices' in chunk_data:
-                                delta = chunk_data['choices'][0].get('delta', {})
-                                content = delta.get('content', '')
-                                
-                                if content:
-                                    # 处理推理内容
-                                    if '<think>' in content:
-                                        in_thinking = True
-                                        content = content.replace('<think>', '').strip()
-                                    
-                                    if '</think>' in content:
-                                        in_thinking = False
-                                        content = content.replace('</think>', '').strip()
-                                        if content and self.is_origin_reasoning:
-                                            yield "reasoning_content", content
-                                        return
-                                    
-                                    # 如果在推理块内且是推理模型，输出推理内容
-                                    if in_thinking and self.is_origin_reasoning:
-                                        if content.strip():
-                                            self.reasoning_content.append(content)
-                                            yield "reasoning_content", content
-                                    # 如果不是推理模型，直接输出内容
-                                    elif not self.is_origin_reasoning and content.strip():
-                                        yield "answer", content
+                            if '</think>' in content:
+                                in_thinking = False
+                                content = content.replace('</think>', '').strip()
+                                if content and self.is_origin_reasoning:
+                                    yield "reasoning_content", content
+                                return
                             
-                            # 处理旧的响应格式
-                            elif chunk_data.get('type') == 'content_block_delta':
-                                delta = chunk_data.get('delta', {})
+                            # 如果在推理块内且是推理模型，输出推理内容
+                            if in_thinking and self.is_origin_reasoning:
+                                if content.strip():
+                                    reasoning_content.append(content)
+                                    yield "reasoning_content", content
+                            # 如果不是推理模型，直接输出内容
+                            elif not self.is_origin_reasoning and content.strip():
+                                yield "answer", content
+                    
+                    # 处理旧的响应格式
+                    elif chunk_data.get('type') == 'content_block_delta':
+                        delta = chunk_data.get('delta', {})
+                        
+                        if delta.get('type') == 'thinking_delta':
+                            thinking = delta.get('thinking', '')
+                            if thinking:
+                                yield "thinking", thinking
+                        
+                        elif delta.get('type') == 'tool_use':
+                            tool_content = json_codec.dumps(delta.get('input', {}))
+                            if tool_content:
+                                yield "tool_use", tool_content
+                        
+                        elif delta.get('type') == 'text_delta':
+                            content = delta.get('text', '')
+                            if content:
+                                # 处理推理内容
+                                if '<think>' in content:
+                                    in_thinking = True
+                                    content = content.replace('<think>', '').strip()
                                 
-                                if delta.get('type') == 'thinking_delta':
-                                    thinking = delta.get('thinking', '')
-                                    if thinking:
-                                        yield "thinking", thinking
+                                if '</think>' in content:
+                                    in_thinking = False
+                                    content = content.replace('</think>', '').strip()
+                                    if content and self.is_origin_reasoning:
+                                        yield "reasoning_content", content
+                                    return
                                 
-                                elif delta.get('type') == 'tool_use':
-                                    tool_content = json.dumps(delta.get('input', {}))
-                                    if tool_content:
-                                        yield "tool_use", tool_content
+                                # 如果在推理块内且是推理模型，输出推理内容
+                                if in_thinking and self.is_origin_reasoning:
+                                    if content.strip():
+                                        reasoning_content.append(content)
+                                        yield "reasoning_content", content
+                                # 如果不是推理模型，直接输出内容
+                                elif not self.is_origin_reasoning and content.strip():
+                                    yield "answer", content
                                 
-                                elif delta.get('type') == 'text_delta':
-                                    content = delta.get('text', '')
-                                    if content:
-                                        # 处理推理内容
-                                        if '<think>' in content:
-                                            in_thinking = True
-                                            content = content.replace('<think>', '').strip()
-                                        
-                                        if '</think>' in content:
-                                            in_thinking = False
-                                            content = content.replace('</think>', '').strip()
-                                            if content and self.is_origin_reasoning:
-                                                yield "reasoning_content", content
-                                            return
-                                        
-                                        # 如果在推理块内且是推理模型，输出推理内容
-                                        if in_thinking and self.is_origin_reasoning:
-                                            if content.strip():
-                                                self.reasoning_content.append(content)
-                                                yield "reasoning_content", content
-                                        # 如果不是推理模型，直接输出内容
-                                        elif not self.is_origin_reasoning and content.strip():
-                                            yield "answer", content
-                                        
-                        except json.JSONDecodeError:
-                            continue
+                except json_codec.JSONDecodeError:
+                    continue
         else:
             raise ValueError(f"不支持的Claude Provider: {self.provider}")
@@ -1,7 +1,7 @@
 """DeepSeek API 客户端"""
-import json
 from typing import AsyncGenerator
 from app.utils.logger import logger
+from app.utils import json_codec
 from .base_client import BaseClient
 
 
@@ -64,79 +64,73 @@ class DeepSeekClient(BaseClient):
         think_content_buffer = ""  # 添加缓冲区来收集 think 标签内的内容
         in_think_tag = False  # 添加标志来追踪是否在 think 标签内
         
-        async for chunk in self._make_request(headers, data):
-            chunk_str = chunk.decode('utf-8')
+        async for json_str in self._stream_events(headers, data):
+            if json_str == "[DONE]":
+                return
             
             try:
-                lines = chunk_str.splitlines()
-                for line in lines:
-                    if line.startswith("data: "):
-                        json_str = line[len("data: "):]
-                        if json_str == "[DONE]":
-                            return
-                        
-                        data = json.loads(json_str)
-                        if data and data.get("choices") and data["choices"][0].get("delta"):
-                            delta = data["choices"][0]["delta"]
-                            if self.is_origin_reasoning:
-                                # 处理推理模型的输出
-                                if delta.get("reasoning_content"):
-                                    content = delta["reasoning_content"]
-                                    logger.debug(f"提取推理内容：{content}")
-                                    yield "reasoning", content
-                                # 处理 content 中的 think 标签内容
-                                elif delta.get("content"):
-                                    content = delta["content"]
-                                    think_content_buffer += content
-                                    
-                                    if "<think>" in content and not in_think_tag:
-                                        # 开始收集推理内容
-                                        logger.debug(f"检测到推理开始标记：{content}")
-                                        in_think_tag = True
-                                        # 提取 <think> 标签后的内容
-                                        after_start_think = content.split("<think>")[1]
-                                        if after_start_think.strip():
-                                            logger.debug(f"提取 think 标签后的推理内容")
-                                            yield "reasoning", after_start_think
-                                    
-                                    elif in_think_tag and "</think>" not in content:
-                                        # 在 think 标签内的内容
-                                        logger.debug(f"提取 think 标签内的推理内容")
-                                        yield "reasoning", content
-                                        
-                                    elif in_think_tag and "</think>" in content:
-                                        # 推理内容结束
-                                        logger.debug(f"检测到推理结束标记：{content}")
-                                        # 提取 </think> 标签前的内容
-                                        before_end_think = content.split("</think>")[0]
-                                        if before_end_think.strip():
-                                            logger.debug(f"提取 think 结束标签前的推理内容")
-                                            yield "reasoning", before_end_think
-                                        in_think_tag = False
-                                        think_content_buffer = ""
-                                        
-                                    elif not kwargs.get("is_last_step"):
-                                        return
-                            else:
-                                # 处理执行模型的输出
-                                if delta.get("content"):
-                                    content = delta["content"]
-                                    if content.strip():  # 只处理非空内容
-                                        if first_chunk and delta.get("role"):
-                                            # 第一个块可能包含角色信息
-                                            first_chunk = False
-                                            if content.strip():
-                                                logger.debug(f"执行模型首个响应：{content}")
-                                                yield "answer", content
-                                        else:
-                                            logger.debug(f"执行模型响应：{content}")
-                                            yield "answer", content
-                                elif delta.get("role") and first_chunk:
-                                    # 处理第一个只包含角色信息的块
+                data = json_codec.loads(json_str)
+                if data and data.get("choices") and data["choices"][0].get("delta"):
+                    delta = data["choices"][0]["delta"]
+                    if self.is_origin_reasoning:
+                        # 处理推理模型的输出
+                        if delta.get("reasoning_content"):
+                            content = delta["reasoning_content"]
+                            logger.debug(f"提取推理内容：{content}")
+                            yield "reasoning", content
+                        # 处理 content 中的 think 标签内容
+                        elif delta.get("content"):
+                            content = delta["content"]
+                            think_content_buffer += content
+                            
+                            if "<think>" in content and not in_think_tag:
+                                # 开始收集推理内容
+                                logger.debug(f"检测到推理开始标记：{content}")
+                                in_think_tag = True
+                                # 提取 <think> 标签后的内容
+                                after_start_think = content.split("<think>")[1]
+                                if after_start_think.strip():
+                                    logger.debug(f"提取 think 标签后的推理内容")
+                                    yield "reasoning", after_start_think
+                            
+                            elif in_think_tag and "</think>" not in content:
+                                # 在 think 标签内的内容
+                                logger.debug(f"提取 think 标签内的推理内容")
+                                yield "reasoning", content
+                                
+                            elif in_think_tag and "</think>" in content:
+                                # 推理内容结束
+                                logger.debug(f"检测到推理结束标记：{content}")
+                                # 提取 </think> 标签前的内容
+                                before_end_think = content.split("</think>")[0]
+                                if before_end_think.strip():
+                                    logger.debug(f"提取 think 结束标签前的推理内容")
+                                    yield "reasoning", before_end_think
+                                in_think_tag = False
+                                think_content_buffer = ""
+                                
+                            elif not kwargs.get("is_last_step"):
+                                return
+                    else:
+                        # 处理执行模型的输出
+                        if delta.get("content"):
+                            content = delta["content"]
+                            if content.strip():  # 只处理非空内容
+                                if first_chunk and delta.get("role"):
+                                    # 第一个块可能包含角色信息
                                     first_chunk = False
-                                    logger.debug("处理执行模型角色信息")
-                                    
-            except json.JSONDecodeError as e:
+                                    if content.strip():
+                                        logger.debug(f"执行模型首个响应：{content}")
+                                        yield "answer", content
+                                else:
+                                    logger.debug(f"执行模型响应：{content}")
+                                    yield "answer", content
+                        elif delta.get("role") and first_chunk:
+                            # 处理第一个只包含角色信息的块
+                            first_chunk = False
+                            logger.debug("处理执行模型角色信息")
+                            
+            except json_codec.JSONDecodeError as e:
                 logger.error(f"JSON解析错误: {e}")
                 continue
             except Exception as e:
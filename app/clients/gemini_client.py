@@ -1,13 +1,15 @@
 """Gemini API 客户端"""
-import json
 from typing import AsyncGenerator
 import re
 from urllib.parse import urlparse, parse_qs
 from app.utils.logger import logger
+from app.utils import json_codec
 from .base_client import BaseClient
 
+DEFAULT_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
+
 class GeminiClient(BaseClient):
-    def __init__(self, api_key: str, api_url: str = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"):
+    def __init__(self, api_key: str, api_url: str = DEFAULT_API_URL):
         """初始化 Gemini 客户端
         
         Args:
@@ -125,57 +127,42 @@ class GeminiClient(BaseClient):
         logger.debug(f"Gemini 最终请求URL: {final_url}")
         
         if stream:
-            async for chunk in self._make_request(headers, gemini_data, final_url):
+            async for json_str in self._stream_events(headers, gemini_data, final_url):
+                json_str = json_str.strip()
+                if not json_str:
+                    continue
+                if json_str == '[DONE]':
+                    logger.debug("收到流式传输结束标记 [DONE]")
+                    return
+                
                 try:
-                    chunk_str = chunk.decode('utf-8')
-                    if not chunk_str.strip():
-                        continue
+                    data = json_codec.loads(json_str)
+                    if data.get("candidates"):
+                        # 获取文本内容
+                        candidate = data["candidates"][0]
+                        content = candidate.get("content", {})
+                        parts = content.get("parts", [])
                         
-                    # 处理当前chunk中的每一行
-                    for line in chunk_str.split('\n'):
-                        line = line.strip()
-                        if not line:
-                            continue
-                            
-                        if line.startswith('data: '):
-                            json_str = line[6:]
-                            if json_str.strip() == '[DONE]':
-                                logger.debug("收到流式传输结束标记 [DONE]")
-                                return
-                            
-                            try:
-                                data = json.loads(json_str)
-                                if data.get("candidates"):
-                                    # 获取文本内容
-                                    candidate = data["candidates"][0]
-                                    content = candidate.get("content", {})
-                                    parts = content.get("parts", [])
-                                    
-                                    for part in parts:
-                                        text = part.get("text", "")
-                                        if text:
-                                            logger.debug(f"流式响应片段: {text[:30]}...")
-                                            yield "answer", text
-                            except json.JSONDecodeError as je:
-                                logger.warning(f"JSON解析错误: {je}, 原始数据: {json_str[:100]}")
-                            except Exception as e:
-                                logger.error(f"处理SSE数据时出错: {e}")
+                        for part in parts:
+                            text = part.get("text", "")
+                            if text:
+                                logger.debug(f"流式响应片段: {text[:30]}...")
+                                yield "answer", text
+                except json_codec.JSONDecodeError as je:
+                    logger.warning(f"JSON解析错误: {je}, 原始数据: {json_str[:100]}")
                 except Exception as e:
-                    logger.error(f"处理 Gemini 流式响应时发生错误: {str(e)}")
-                    continue
+                    logger.error(f"处理SSE数据时出错: {e}")
         else:
             # 非流式请求处理
-            full_response = ""
+            # 先累积原始字节再统一解码，避免多字节字符被拆分到不同块中
+            response_bytes = bytearray()
             async for chunk in self._make_request(headers, gemini_data, final_url):
-                try:
-                    chunk_str = chunk.decode('utf-8')
-                    full_response += chunk_str
-                except Exception as e:
-                    logger.error(f"处理 Gemini 非流式响应时发生错误: {e}")
+                response_bytes += chunk
+            full_response = response_bytes.decode('utf-8', errors='replace')
             
             try:
                 # 尝试解析完整响应
-                response = json.loads(full_response)
+                response = json_codec.loads(full_response)
                 if response.get("candidates"):
                     content = response["candidates"][0].get("content", {})
                     parts = content.get("parts", [])
@@ -187,7 +174,7 @@ class GeminiClient(BaseClient):
                     
                     if result_text:
                         yield "answer", result_text
-            except json.JSONDecodeError:
+            except json_codec.JSONDecodeError:
                 logger.error(f"非流式响应JSON解析失败: {full_response[:200]}")
             except Exception as e:
                 logger.error(f"处理非流式响应时发生错误: {e}")
\ No newline at end of file
@@ -1,7 +1,7 @@
 """Grok3 API 客户端"""
-import json
 from typing import AsyncGenerator
 from app.utils.logger import logger
+from app.utils import json_codec
 from .base_client import BaseClient
 
 
@@ -16,7 +16,6 @@ class Grok3Client(BaseClient):
         """
         super().__init__(api_key, api_url)
         self.provider = "grok3"
-        self._current_line = ""  # 初始化行缓存
         self.is_origin_reasoning = is_origin_reasoning
         
     async def stream_chat(
@@ -51,73 +50,66 @@ class Grok3Client(BaseClient):
         data = self._prepare_request_data(messages, model, stream=stream, **kwargs)
         
         if stream:
-            # 重置行缓存
-            self._current_line = ""
+            # 行缓存按请求独立，客户端实例会在并发请求间共享
+            current_line = ""
             reasoning_completed = False  # 追踪推理是否完成
             
-            async for chunk in self._make_request(headers, data):
+            async for json_str in self._stream_events(headers, data):
+                if json_str.strip() == '[DONE]':
+                    # 处理最后可能剩余的内容
+                    if current_line.strip():
+                        last_line = current_line.strip()
+                        if last_line.startswith('>'):
+                            if self.is_origin_reasoning:
+                                yield "reasoning", last_line[1:].strip()
+                        else:
+                            if not self.is_origin_reasoning or kwargs.get("is_last_step"):
+                                yield "content", last_line
+                    return
+
                 try:
-                    chunk_str = chunk.decode('utf-8')
-                    if not chunk_str.strip():
-                        continue
+                    data = json_codec.loads(json_str)
+                    content = data.get('choices', [{}])[0].get('delta', {}).get('content', '')
+                    
+                    if content:
+                        # 追加到当前行
+                        current_line += content
                         
-                    for line in chunk_str.split('\n'):
-                        if line.startswith('data: '):
-                            json_str = line[6:]
-                            if json_str.strip() == '[DONE]':
-                                # 处理最后可能剩余的内容
-                                if self._current_line.strip():
-                                    last_line = self._current_line.strip()
-                                    if last_line.startswith('>'):
-                                        if self.is_origin_reasoning:
-                                            yield "reasoning", last_line[1:].strip()
-                                    else:
-                                        if not self.is_origin_reasoning or kwargs.get("is_last_step"):
-                                            yield "content", last_line
-                                return
-                                
-                            data = json.loads(json_str)
-                            content = data.get('choices', [{}])[0].get('delta', {}).get('content', '')
-                            
-                            if content:
-                                # 追加到当前行
-                                self._current_line += content
-                                
-                                # 处理完整行
-                                while "\n" in self._current_line:
-                                    line, self._current_line = self._current_line.split("\n", 1)
-                                    line = line.strip()
-                                    # 跳过分隔符行
-                                    if line == "---":
-                                        continue
-                                    if line:  # 忽略空行
-                                        if line.startswith(">"):
-                                            if self.is_origin_reasoning:
-                                                yield "reasoning", "\n"+line[1:].strip()
-                                        else:
-                                            # 检测推理内容是否结束
-                                            if not reasoning_completed:
-                                                reasoning_completed = True
-                                                # 如果不是最后一步，直接结束流
-                                                if not kwargs.get("is_last_step"):
-                                                    return
-                                            # 如果是最后一步或非推理模型，继续处理 content
-                                            if not self.is_origin_reasoning or kwargs.get("is_last_step"):
-                                                yield "content", "\n"+line
-                                
-                                # 如果是结束标记，处理最后一行
-                                if data.get("finish_reason") == "stop":
-                                    last_line = self._current_line.strip()
-                                    if last_line:
-                                        if last_line.startswith(">"):
-                                            if self.is_origin_reasoning:
-                                                yield "reasoning", "\n"+last_line[1:].strip()
-                                        else:
-                                            if not self.is_origin_reasoning or kwargs.get("is_last_step"):
-                                                yield "content", "\n"+last_line
-                                    self._current_line = ""
-                                            
-                except json.JSONDecodeError:
+                        # 处理完整行
+                        while "\n" in current_line:
+                            line, current_line = current_line.split("\n", 1)
+                            line = line.strip()
+                            # 跳过分隔符行
+                            if line == "---":
+                                continue
+                            if line:  # 忽略空行
+                                if line.startswith(">"):
+                                    if self.is_origin_reasoning:
+                                        yield "reasoning", "\n"+line[1:].strip()
+                                else:
+                                    # 检测推理内容是否结束
+                                    if not reasoning_completed:
+                                        reasoning_completed = True
+                                        # 如果不是最后一步，直接结束流
+                                        if not kwargs.get("is_last_step"):
+                                            return
+                                    # 如果是最后一步或非推理模型，继续处理 content
+                                    if not self.is_origin_reasoning or kwargs.get("is_last_step"):
+                                        yield "content", "\n"+line
+                        
+                        # 如果是结束标记，处理最后一行
+                        if data.get("finish_reason") == "stop":
+                            last_line = current_line.strip()
+                            if last_line:
+                                if last_line.startswith(">"):
+                                    if self.is_origin_reasoning:
+                                        yield "reasoning", "\n"+last_line[1:].strip()
+                                else:
+                                    if not self.is_origin_reasoning or kwargs.get("is_last_step"):
+                                        yield "content", "\n"+last_line
+                            current_line = ""
+                                    
+                except json_codec.JSONDecodeError:
                     continue
                 except Exception as e:
                     logger.error(f"处理 Grok3 流式响应时发生错误: {e}")
@@ -126,7 +118,7 @@ class Grok3Client(BaseClient):
             # 非流式输出处理
             async for chunk in self._make_request(headers, data):
                 try:
-                    response = json.loads(chunk.decode('utf-8'))
+                    response = json_codec.loads(chunk.decode('utf-8'))
                     content = response.get('choices', [{}])[0].get('message', {}).get('content', '')
                     
                     if content:
@@ -149,7 +141,7 @@ class Grok3Client(BaseClient):
                                     if not self.is_origin_reasoning or kwargs.get("is_last_step"):
                                         yield "content", "\n"+line
                             
-                except json.JSONDecodeError:
+                except json_codec.JSONDecodeError:
                     continue
                 except Exception as e:
                     logger.error(f"处理 Grok3 非流式响应时发生错误: {e}")
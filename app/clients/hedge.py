@@ -0,0 +1,261 @@
+"""流式请求对冲（hedged requests）
+
+上游的首个数据块延迟（time-to-first-token）是长尾分布：偶尔一次请求要等十几秒才有输出，
+而同样的请求重新发一次往往一秒内就开始返回。对开启了对冲的模型：
+
+- 按模型记录最近 HEDGE_WINDOW 次请求的首块延迟（从取得限流名额、发出请求开始计时，不含排队时间；
+  两路都收到首块时都记录），取第 HEDGE_PERCENTILE 百分位作为阈值
+  （样本不足 HEDGE_MIN_SAMPLES 时使用 HEDGE_DEFAULT_DELAY，并限制在 HEDGE_MIN_DELAY~HEDGE_MAX_DELAY 之间）
+- 主请求取得限流名额、发出请求后超过阈值仍没有输出时（排队时间不计入），再发出一个相同的请求
+  （可指向模型配置的备用模型）
+- 任一请求先产生输出即胜出，另一个立即取消并关闭连接；一方失败时等待另一方
+- 全局对冲率上限：每个可对冲的请求存入 HEDGE_MAX_RATE 个令牌，每次对冲消耗 1 个，
+  上游整体变慢时对冲请求不会超过流量的固定比例
+
+是否对冲由模型的 hedge_enabled 列控制（默认关闭），备用模型为 hedge_model_id。
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Hashable, Optional, TypeVar
+
+from app.utils.logger import logger
+from app.clients.retry import RetryBudget, on_attempt_start
+
+T = TypeVar("T")
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"环境变量 {name}={value} 不是有效数字，使用默认值 {default}")
+        return default
+
+
+HEDGE_PERCENTILE = _env_float("HEDGE_PERCENTILE", 95)
+HEDGE_DEFAULT_DELAY = _env_float("HEDGE_DEFAULT_DELAY", 3)
+HEDGE_MIN_DELAY = _env_float("HEDGE_MIN_DELAY", 0.5)
+HEDGE_MAX_DELAY = _env_float("HEDGE_MAX_DELAY", 15)
+HEDGE_MIN_SAMPLES = int(_env_float("HEDGE_MIN_SAMPLES", 20))
+HEDGE_WINDOW = int(_env_float("HEDGE_WINDOW", 200))
+HEDGE_MAX_RATE = _env_float("HEDGE_MAX_RATE", 0.1)
+
+_samples: Dict[Hashable, Deque[float]] = {}
+_lock = threading.Lock()
+_budget = RetryBudget(ratio=HEDGE_MAX_RATE, min_per_second=0, max_tokens=10)
+_stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0, "capped": 0}
+
+
+def resolve_alternate(model) -> Optional[Any]:
+    """查找模型配置的对冲备用模型（每次从配置注册表读取，备用模型修改后立即生效）
+
+    Args:
+        model: 模型快照或数据库模型对象
+
+    Returns:
+        Optional[ModelSnapshot]: 备用模型快照，未配置或已不存在时返回 None（对冲请求发给模型自身）
+    """
+    hedge_model_id = getattr(model, "hedge_model_id", None)
+    if not hedge_model_id or hedge_model_id == getattr(model, "id", None):
+        return None
+    from app.models import config_registry
+
+    return config_registry.peek_model(hedge_model_id)
+
+
+def record_first_token(key: Hashable, latency: float) -> None:
+    """记录一次首块延迟
+
+    Args:
+        key: 模型标识（模型 ID）
+        latency: 从取得限流名额、发出请求到收到第一个数据块的秒数
+    """
+    with _lock:
+        window = _samples.get(key)
+        if window is None:
+            window = _samples[key] = deque(maxlen=HEDGE_WINDOW)
+        window.append(latency)
+
+
+def hedge_delay(key: Hashable) -> float:
+    """计算模型当前的对冲阈值（秒）
+
+    Args:
+        key: 模型标识（模型 ID）
+
+    Returns:
+        float: 主请求等待多久没有输出后发出对冲请求
+    """
+    with _lock:
+        window = _samples.get(key)
+        values = sorted(window) if window else []
+    if len(values) < HEDGE_MIN_SAMPLES:
+        delay = HEDGE_DEFAULT_DELAY
+    else:
+        index = max(0, math.ceil(HEDGE_PERCENTILE / 100 * len(values)) - 1)
+        delay = values[min(index, len(values) - 1)]
+    return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, delay))
+
+
+class _Leg:
+    """对冲中的一路请求"""
+
+    __slots__ = ("label", "stream", "started", "attempted", "first_at", "task")
+
+    def __init__(self, label: str, stream: AsyncIterator[Any]):
+        self.label = label
+        self.stream = stream
+        # 最近一次尝试发出请求的时间（重试与限流排队之后更新）与收到第一个数据块的时间
+        self.started = time.monotonic()
+        self.attempted = asyncio.Event()
+        self.first_at: Optional[float] = None
+        self.task = asyncio.ensure_future(self._first())
+
+    def _start_clock(self) -> None:
+        self.started = time.monotonic()
+        self.attempted.set()
+
+    async def wait_attempt(self) -> None:
+        """等待这一路取得限流名额、发出第一次请求（或在此之前就结束）"""
+        waiter = asyncio.ensure_future(self.attempted.wait())
+        try:
+            await asyncio.wait({self.task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+
+    async def _first(self) -> Any:
+        # 任务有独立的上下文，回调只对这一路的重试生效
+        on_attempt_start(self._start_clock)
+        first = await self.stream.__anext__()
+        self.first_at = time.monotonic()
+        return first
+
+    def first_token_latency(self) -> Optional[float]:
+        """收到第一个数据块时返回首块延迟，被取消、失败或没有输出时返回 None"""
+        if self.first_at is None:
+            return None
+        return self.first_at - self.started
+
+
+async def _discard(leg: _Leg) -> None:
+    """取消落败的一路并关闭其连接"""
+    if not leg.task.done():
+        leg.task.cancel()
+        await asyncio.wait({leg.task})
+    elif not leg.task.cancelled():
+        leg.task.exception()  # 取走异常，避免 "exception was never retrieved"
+    aclose = getattr(leg.stream, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+async def hedged_stream(key: Hashable, open_primary: Callable[[], AsyncIterator[T]],
+                        open_alternate: Optional[Callable[[], AsyncIterator[T]]] = None,
+                        name: str = "上游流式请求") -> AsyncIterator[T]:
+    """以对冲方式执行流式请求
+
+    Args:
+        key: 模型标识（模型 ID），用于首块延迟统计
+        open_primary: 发起主请求、返回异步迭代器的无参函数
+        open_alternate: 发起对冲请求的无参函数，默认与主请求相同
+        name: 日志中的调用名称
+
+    Yields:
+        胜出一路的数据块
+    """
+    open_alternate = open_alternate or open_primary
+    _stats["requests"] += 1
+    _budget.deposit()
+    delay = hedge_delay(key)
+
+    legs = [_Leg("primary", open_primary())]
+    winner: Optional[_Leg] = None
+    first: Any = None
+    finished_empty = False
+    error: Optional[BaseException] = None
+    try:
+        # 阈值从主请求真正发出时开始计算，限流排队期间不会触发对冲
+        await legs[0].wait_attempt()
+        done, _ = await asyncio.wait({legs[0].task}, timeout=delay)
+        if not done:
+            if _budget.try_withdraw():
+                _stats["hedged"] += 1
+                logger.info(f"{name} 在 {delay:.2f} 秒内没有输出，发出对冲请求")
+                legs.append(_Leg("hedge", open_alternate()))
+            else:
+                _stats["capped"] += 1
+                logger.info(f"{name} 在 {delay:.2f} 秒内没有输出，但对冲率已达上限")
+
+        pending = {leg.task: leg for leg in legs}
+        while winner is None and pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                leg = pending.pop(task)
+                try:
+                    first = task.result()
+                except StopAsyncIteration:
+                    # 没有任何输出就结束，另一路仍在进行时继续等它
+                    finished_empty = True
+                    continue
+                except Exception as e:
+                    error = e
+                    logger.warning(f"{name} 的{'对冲' if leg.label == 'hedge' else '主'}请求失败: {e}")
+                    continue
+                winner = leg
+                break
+    except BaseException:
+        for leg in legs:
+            await _discard(leg)
+        raise
+
+    for leg in legs:
+        if leg is not winner:
+            await _discard(leg)
+
+    if winner is None:
+        if finished_empty or error is None:
+            return
+        raise error
+
+    # 落败的一路如果也已收到首块，它的延迟同样是有效样本
+    for leg in legs:
+        latency = leg.first_token_latency()
+        if latency is not None:
+            record_first_token(key, latency)
+    if len(legs) > 1:
+        _stats["hedge_wins" if winner.label == "hedge" else "primary_wins"] += 1
+
+    try:
+        yield first
+        async for chunk in winner.stream:
+            yield chunk
+    finally:
+        aclose = getattr(winner.stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def stats() -> Dict[str, Any]:
+    """返回对冲统计：可对冲请求数、发出的对冲数、对冲率、胜出方分布、被上限拦截次数与各模型阈值"""
+    with _lock:
+        keys = list(_samples)
+        sample_counts = {str(key): len(_samples[key]) for key in keys}
+    requests = _stats["requests"]
+    return {
+        **_stats,
+        "hedge_rate": round(_stats["hedged"] / requests, 4) if requests else 0.0,
+        "models": {
+            str(key): {"samples": sample_counts[str(key)], "delay": round(hedge_delay(key), 3)}
+            for key in keys
+        },
+    }
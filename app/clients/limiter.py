@@ -0,0 +1,372 @@
+"""上游端点限流与自适应并发
+
+同一个提供商密钥上的请求原来没有任何限制：多个讨论组同时开始、每个组又依次调用多个智能体时，
+很快触发 429，重试又进一步放大流量。这里在共享客户端层为每个上游端点（api_url + api_key，
+与熔断器的划分相同）维护：
+
+- RPM 令牌桶: 容量为每分钟请求数，每次尝试（含重试）消耗 1 个
+- TPM 令牌桶: 容量为每分钟 token 数，每次尝试按请求体估算的输入 token 加 max_tokens 消耗
+- 并发上限: 同时进行中的请求数，流式请求持有名额直到流结束
+- AIMD: 收到 429/503/529 过载响应时并发上限乘以 LIMITER_DECREASE（每 LIMITER_DECREASE_INTERVAL 秒最多一次），
+  每次成功增加 1/当前上限（约每轮满并发加 1），不超过模型配置的 max_concurrency
+- 排队: 名额或令牌不足时按到达顺序（FIFO）等待而不是失败，队首未满足时后面的请求不会插队
+
+限额来自模型的 rpm_limit/tpm_limit/max_concurrency 列。限额按密钥计算，同一端点有多个模型时
+取各自声明值中的最小值。未声明限额的端点只启用 AIMD（LIMITER_ADAPTIVE），收到过载响应后才开始限制并发。
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.utils.logger import logger
+from app.utils import json_codec
+from app.clients.breaker import normalize_url
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"环境变量 {name}={value} 不是有效数字，使用默认值 {default}")
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+LIMITER_ENABLED = _env_bool("LIMITER_ENABLED", True)
+LIMITER_ADAPTIVE = _env_bool("LIMITER_ADAPTIVE", True)
+LIMITER_DECREASE = _env_float("LIMITER_DECREASE", 0.5)
+LIMITER_DECREASE_INTERVAL = _env_float("LIMITER_DECREASE_INTERVAL", 1)
+LIMITER_MIN_CONCURRENCY = max(1, int(_env_float("LIMITER_MIN_CONCURRENCY", 1)))
+
+
+class TokenBucket:
+    """按每分钟额度匀速补充的令牌桶"""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """取出 cost 个令牌还需等待的秒数（cost 超过容量时按容量计，避免永远等待）"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float) -> None:
+        self.tokens -= min(cost, self.capacity)
+
+    def available(self, now: float) -> int:
+        """当前可用的令牌数"""
+        return int(min(self.capacity, self.tokens + (now - self.updated) * self.rate))
+
+
+class Limiter:
+    """单个上游端点的限流器（只在应用事件循环中使用）"""
+
+    def __init__(self, url: str, api_key: str):
+        self.url = url
+        self.api_key = api_key or ""
+        self.rpm: Optional[int] = None
+        self.tpm: Optional[int] = None
+        self.max_concurrency: Optional[int] = None
+        self.rpm_bucket: Optional[TokenBucket] = None
+        self.tpm_bucket: Optional[TokenBucket] = None
+        self.limit = math.inf  # AIMD 调整的并发上限
+        self.in_flight = 0
+        self.stats = {"requests": 0, "queued": 0, "wait_seconds": 0.0, "overloads": 0, "decreases": 0}
+        self._waiters: Deque[Tuple[asyncio.Future, int]] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_decrease = 0.0
+
+    def configure(self, rpm: Optional[int], tpm: Optional[int], max_concurrency: Optional[int]) -> None:
+        """应用模型声明的限额（与当前相同时不做任何事，修改后令牌桶与并发上限重新开始）"""
+        if (rpm, tpm, max_concurrency) == (self.rpm, self.tpm, self.max_concurrency):
+            return
+        self.rpm, self.tpm, self.max_concurrency = rpm, tpm, max_concurrency
+        self.rpm_bucket = TokenBucket(rpm) if rpm else None
+        self.tpm_bucket = TokenBucket(tpm) if tpm else None
+        self.limit = float(max_concurrency) if max_concurrency else math.inf
+        logger.info(f"上游端点 {self.url} 限额: RPM={rpm}, TPM={tpm}, 并发={max_concurrency}")
+        if self._waiters:
+            self._wake()
+
+    def _capacity(self) -> float:
+        if self.limit == math.inf:
+            return math.inf
+        return max(LIMITER_MIN_CONCURRENCY, math.floor(self.limit))
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """排队等待并发名额与令牌（FIFO）
+
+        Args:
+            tokens: 本次请求估算消耗的 token 数（TPM）
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._bind(loop)
+        self.stats["requests"] += 1
+        future = loop.create_future()
+        self._waiters.append((future, tokens))
+        self._wake()
+        if future.done():
+            return
+
+        self.stats["queued"] += 1
+        started = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已经分配，但调用方在被唤醒前取消
+                self.release(None)
+            else:
+                self._wake()
+            raise
+        finally:
+            self.stats["wait_seconds"] += time.monotonic() - started
+
+    def _bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """绑定到调用方的事件循环：排队状态不加锁，只能由一个事件循环修改"""
+        if self._loop is not None and self._loop.is_running():
+            # 线程中的其他事件循环应通过 run_sync 把调用提交到应用事件循环
+            raise RuntimeError(f"上游端点 {self.url} 的限流器已绑定到另一个运行中的事件循环")
+        if self._loop is not None:
+            # 之前的事件循环已经停止（脚本、命令行中的临时事件循环）：
+            # 其中排队与进行中的请求不会再唤醒或归还名额，重新开始计数
+            logger.info(f"上游端点 {self.url} 的限流器切换到新的事件循环，丢弃 {len(self._waiters)} 个排队请求")
+            self._waiters.clear()
+            self.in_flight = 0
+        self._cancel_timer()
+        self._loop = loop
+
+    def release(self, overloaded: Optional[bool]) -> None:
+        """归还并发名额并反馈结果
+
+        Args:
+            overloaded: True 为过载响应（乘性减小并发上限），False 为成功（加性增大），None 不调整
+        """
+        self.in_flight = max(0, self.in_flight - 1)
+        if overloaded:
+            self._decrease()
+        elif overloaded is False:
+            self._increase()
+        if self._waiters:
+            self._wake()
+
+    def _wake(self) -> None:
+        """按到达顺序放行排队的请求，令牌不足时定时再检查"""
+        self._cancel_timer()
+        now = time.monotonic()
+        while self._waiters:
+            future, tokens = self._waiters[0]
+            if future.done():
+                # 已取消
+                self._waiters.popleft()
+                continue
+            if self.in_flight >= self._capacity():
+                return
+            wait = max(
+                self.rpm_bucket.wait_time(1, now) if self.rpm_bucket else 0.0,
+                self.tpm_bucket.wait_time(tokens, now) if self.tpm_bucket else 0.0
+            )
+            if wait > 0:
+                self._timer = self._loop.call_later(wait, self._wake)
+                return
+            self._waiters.popleft()
+            if self.rpm_bucket:
+                self.rpm_bucket.take(1)
+            if self.tpm_bucket:
+                self.tpm_bucket.take(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _decrease(self) -> None:
+        self.stats["overloads"] += 1
+        if not LIMITER_ADAPTIVE:
+            return
+        now = time.monotonic()
+        if now - self._last_decrease < LIMITER_DECREASE_INTERVAL:
+            return
+        self._last_decrease = now
+        current = self.limit if self.limit != math.inf else self.in_flight + 1
+        self.limit = max(LIMITER_MIN_CONCURRENCY, current * LIMITER_DECREASE)
+        self.stats["decreases"] += 1
+        logger.warning(f"上游端点 {self.url} 返回过载响应，并发上限降为 {self._capacity()}")
+
+    def _increase(self) -> None:
+        if not LIMITER_ADAPTIVE or self.limit == math.inf:
+            return
+        self.limit += 1 / self.limit
+        if self.max_concurrency:
+            self.limit = min(self.limit, float(self.max_concurrency))
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "url": self.url,
+            "api_key": f"...{self.api_key[-4:]}" if self.api_key else "",
+            "rpm_limit": self.rpm,
+            "tpm_limit": self.tpm,
+            "max_concurrency": self.max_concurrency,
+            "concurrency_limit": None if self.limit == math.inf else round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "rpm_tokens": self.rpm_bucket.available(now) if self.rpm_bucket else None,
+            "tpm_tokens": self.tpm_bucket.available(now) if self.tpm_bucket else None,
+            **self.stats,
+            "wait_seconds": round(self.stats["wait_seconds"], 3),
+        }
+
+
+class Quota:
+    """一次上游请求的限流凭据：每次尝试前 acquire()，尝试结束后 release()"""
+
+    __slots__ = ("limiter", "payload", "_tokens")
+
+    def __init__(self, limiter: Limiter, payload: Any = None):
+        self.limiter = limiter
+        self.payload = payload
+        self._tokens: Optional[int] = None
+
+    @property
+    def tokens(self) -> int:
+        """估算的 token 数（端点没有 TPM 限额时为 0，不做估算）"""
+        if self._tokens is None:
+            self._tokens = estimate_tokens(self.payload) if self.limiter.tpm_bucket else 0
+        return self._tokens
+
+    async def acquire(self) -> None:
+        await self.limiter.acquire(self.tokens)
+
+    def release(self, overloaded: Optional[bool]) -> None:
+        self.limiter.release(overloaded)
+
+
+def estimate_tokens(payload: Any) -> int:
+    """估算一次请求计入 TPM 的 token 数
+
+    输入按请求体 UTF-8 字节数 / 4 估算，再加上输出上限 max_tokens（与 OpenAI 按 max_tokens 计入 TPM 的方式一致）。
+
+    Args:
+        payload: 请求体（字典）、消息列表或提示文本
+
+    Returns:
+        int: 估算的 token 数
+    """
+    if payload is None:
+        return 0
+    text = payload if isinstance(payload, str) else json_codec.dumps(payload, ensure_ascii=False, default=str)
+    max_tokens = payload.get("max_tokens") if isinstance(payload, dict) else None
+    return len(text.encode("utf-8")) // 4 + (max_tokens if isinstance(max_tokens, int) else 0)
+
+
+_limiters: Dict[Tuple[str, str], Limiter] = {}
+_lock = threading.Lock()
+_declared: Dict[Tuple[str, str], Tuple[Optional[int], Optional[int], Optional[int]]] = {}
+_declared_source: Optional[Dict] = None
+
+
+def _min_limit(current: Optional[int], value: Optional[int]) -> Optional[int]:
+    if not value or value <= 0:
+        return current
+    return value if current is None else min(current, value)
+
+
+def _declared_limits(key: Tuple[str, str]) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """端点声明的限额 (rpm, tpm, max_concurrency)，配置注册表版本变化时重新汇总"""
+    global _declared, _declared_source
+    from app.models import config_registry
+
+    try:
+        # 每次请求都会调用：读取最近的编译结果，不在事件循环中重建
+        models = config_registry.peek_models()
+    except Exception as e:
+        logger.debug(f"读取模型限额失败: {e}")
+        return (None, None, None)
+    if models is not _declared_source:
+        declared: Dict[Tuple[str, str], Tuple[Optional[int], Optional[int], Optional[int]]] = {}
+        for model in models.values():
+            limits = (
+                getattr(model, "rpm_limit", None),
+                getattr(model, "tpm_limit", None),
+                getattr(model, "max_concurrency", None)
+            )
+            if not any(limits):
+                continue
+            model_key = (normalize_url(model.api_url), model.api_key or "")
+            current = declared.get(model_key, (None, None, None))
+            declared[model_key] = tuple(_min_limit(c, v) for c, v in zip(current, limits))
+        _declared, _declared_source = declared, models
+    return _declared.get(key, (None, None, None))
+
+
+def get_limiter(api_url: Optional[str], api_key: Optional[str]) -> Optional[Limiter]:
+    """获取端点的限流器（不存在时创建），端点无需限流时返回 None
+
+    Args:
+        api_url: 请求地址
+        api_key: API密钥
+
+    Returns:
+        Optional[Limiter]: 限流器
+    """
+    if not LIMITER_ENABLED or not api_url:
+        return None
+    key = (normalize_url(api_url), api_key or "")
+    limits = _declared_limits(key)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        if not any(limits) and not LIMITER_ADAPTIVE:
+            return None
+        with _lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                limiter = _limiters[key] = Limiter(key[0], key[1])
+    limiter.configure(*limits)
+    return limiter
+
+
+def quota(api_url: Optional[str], api_key: Optional[str], payload: Any = None) -> Optional[Quota]:
+    """为一次上游请求创建限流凭据，传给 app.clients.retry 的调用函数
+
+    Args:
+        api_url: 请求地址
+        api_key: API密钥
+        payload: 请求体（用于估算 TPM，端点有 TPM 限额时才会序列化）
+
+    Returns:
+        Optional[Quota]: 限流凭据，端点无需限流时返回 None
+    """
+    limiter = get_limiter(api_url, api_key)
+    return Quota(limiter, payload) if limiter is not None else None
+
+
+def stats() -> List[Dict[str, Any]]:
+    """返回处理过请求的端点的限流状态"""
+    return [limiter.to_dict() for limiter in list(_limiters.values()) if limiter.stats["requests"]]
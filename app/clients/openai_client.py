@@ -1,7 +1,7 @@
 """OpenAI API 客户端"""
-import json
 from typing import AsyncGenerator
 from app.utils.logger import logger
+from app.utils import json_codec
 from .base_client import BaseClient
 
 
@@ -47,35 +47,28 @@ class OpenAIClient(BaseClient):
         logger.debug(f"OpenAI 请求数据: {data}")
         if stream:
             first_chunk = True
-            async for chunk in self._make_request(headers, data):
+            async for json_str in self._stream_events(headers, data):
+                if json_str.strip() == '[DONE]':
+                    return
+                    
                 try:
-                    chunk_str = chunk.decode('utf-8')
-                    if not chunk_str.strip():
-                        continue
-                        
-                    for line in chunk_str.split('\n'):
-                        if line.startswith('data: '):
-                            json_str = line[6:]
-                            if json_str.strip() == '[DONE]':
-                                return
-                                
-                            data = json.loads(json_str)
-                            delta = data.get('choices', [{}])[0].get('delta', {})
-                            
-                            if first_chunk:
-                                content = delta.get('content', '')
-                                role = delta.get('role', '')
-                                if role:
-                                    first_chunk = False
-                                    if content:
-                                        yield "answer", content
-                                    continue
-                            
-                            content = delta.get('content', '')
+                    data = json_codec.loads(json_str)
+                    delta = data.get('choices', [{}])[0].get('delta', {})
+                    
+                    if first_chunk:
+                        content = delta.get('content', '')
+                        role = delta.get('role', '')
+                        if role:
+                            first_chunk = False
                             if content:
                                 yield "answer", content
-                                
-                except json.JSONDecodeError:
+                            continue
+                    
+                    content = delta.get('content', '')
+                    if content:
+                        yield "answer", content
+
+                except json_codec.JSONDecodeError:
                     continue
                 except Exception as e:
                     logger.error(f"处理 OpenAI 流式响应时发生错误: {e}")
@@ -83,12 +76,12 @@ class OpenAIClient(BaseClient):
         else:
             async for chunk in self._make_request(headers, data):
                 try:
-                    response = json.loads(chunk.decode('utf-8'))
+                    response = json_codec.loads(chunk.decode('utf-8'))
                     content = response.get('choices', [{}])[0].get('message', {}).get('content', '')
                     if content:
                         yield "answer", content
                         return
-                except json.JSONDecodeError:
+                except json_codec.JSONDecodeError:
                     continue
                 except Exception as e:
                     logger.error(f"处理 OpenAI 非流式响应时发生错误: {e}")
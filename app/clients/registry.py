@@ -0,0 +1,213 @@
+"""进程级上游客户端注册表
+
+请求路径上不再为每次请求新建客户端对象，而是按
+(provider, api_url, api_key, 推理标志) 从这里取已就绪的实例：
+
+- 提供商客户端（DeepSeek/Claude/Gemini/Grok3/OpenAI），供多步骤协作使用
+- UniClient，键中额外包含模型 ID 与会影响请求体的模型参数
+- 会议智能体使用的 langchain ChatOpenAI 实例，键中额外包含模型参数
+
+缓存的实例会在并发请求间共享，因此客户端不能在实例上保存单次请求的状态。
+模型通过 /v1/models 更新或删除时调用 invalidate_model() 失效对应条目。
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from app.utils.logger import logger
+from app.utils import json_codec
+from .claude_client import ClaudeClient
+from .deepseek_client import DeepSeekClient
+from .gemini_client import GeminiClient
+from .grok3_client import Grok3Client
+from .openai_client import OpenAIClient
+
+
+class _Entry:
+    """注册表条目"""
+
+    __slots__ = ("client", "api_url", "api_key", "model_id")
+
+    def __init__(self, client: Any, api_url: str, api_key: str, model_id: Any = None):
+        self.client = client
+        self.api_url = api_url or ""
+        self.api_key = api_key or ""
+        self.model_id = model_id
+
+
+_entries: Dict[Tuple, _Entry] = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "builds": 0, "invalidations": 0}
+
+
+def _get_or_build(key: Tuple, factory: Callable[[], Any], api_url: str, api_key: str, model_id: Any = None) -> Any:
+    """查找已有实例，不存在时构建并登记
+
+    Args:
+        key: 注册表键
+        factory: 构建实例的无参函数
+        api_url: 条目对应的上游地址（用于失效匹配）
+        api_key: 条目对应的 API 密钥（用于失效匹配）
+        model_id: 条目对应的模型 ID（可选）
+
+    Returns:
+        Any: 客户端实例
+    """
+    entry = _entries.get(key)
+    if entry is not None:
+        _stats["hits"] += 1
+        return entry.client
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            entry = _Entry(factory(), api_url, api_key, model_id)
+            _entries[key] = entry
+            _stats["builds"] += 1
+            logger.debug(f"已创建上游客户端: {key[0]} {api_url}")
+        else:
+            _stats["hits"] += 1
+    return entry.client
+
+
+def _params_fingerprint(params: Dict[str, Any]) -> Hashable:
+    """把参数字典转换为可哈希的键（值可能包含列表/字典）"""
+    return json_codec.dumps(params, sort_keys=True, default=str)
+
+
+def _build_provider_client(provider: str, api_key: str, api_url: str, is_reasoning: bool):
+    """按提供商构建客户端"""
+    if provider == "deepseek":
+        return DeepSeekClient(api_key, api_url, is_origin_reasoning=is_reasoning)
+    elif provider == "google":
+        return GeminiClient(api_key, api_url)
+    elif provider == "anthropic":
+        return ClaudeClient(api_key, api_url, is_origin_reasoning=is_reasoning)
+    elif provider == "grok3":
+        return Grok3Client(api_key, api_url, is_origin_reasoning=is_reasoning)
+    elif provider in ["oneapi", "openrouter", "openai-completion"]:
+        return OpenAIClient(api_key, api_url)
+    elif provider == "腾讯云":
+        # 腾讯云使用与 DeepSeek 相同的客户端
+        return DeepSeekClient(api_key, api_url, provider="腾讯云", is_origin_reasoning=is_reasoning)
+    else:
+        raise ValueError(f"Unsupported provider: {provider}")
+
+
+def get_provider_client(provider: str, api_key: str, api_url: str, is_reasoning: bool):
+    """获取提供商客户端
+
+    Args:
+        provider: 提供商名称
+        api_key: API密钥
+        api_url: API地址
+        is_reasoning: 是否为推理步骤的客户端
+
+    Returns:
+        BaseClient: 共享的客户端实例
+    """
+    key = ("provider", provider, api_url, api_key, is_reasoning)
+    return _get_or_build(
+        key,
+        lambda: _build_provider_client(provider, api_key, api_url, is_reasoning),
+        api_url,
+        api_key
+    )
+
+
+def get_uni_client(model):
+    """获取模型对应的 UniClient
+
+    UniClient 在构造时读取模型参数，键中包含这些参数，因此即使模型在
+    /v1/models 之外被修改也不会取到过期的实例。
+
+    Args:
+        model: 数据库模型对象
+
+    Returns:
+        UniClient: 共享的客户端实例
+    """
+    from .uni_client import UniClient
+
+    key = (
+        "uni",
+        (model.provider or "").lower(),
+        model.api_url,
+        model.api_key,
+        False,
+        model.id,
+        model.model_name,
+        model.temperature,
+        model.top_p,
+        model.max_tokens,
+        model.presence_penalty,
+        model.frequency_penalty,
+        _params_fingerprint(model.custom_parameters or {}),
+        getattr(model, "hedge_enabled", False),
+        getattr(model, "hedge_model_id", None)
+    )
+    return _get_or_build(key, lambda: UniClient(model), model.api_url, model.api_key, model.id)
+
+
+def get_chat_llm(model_params: Dict[str, Any]):
+    """获取会议智能体使用的 ChatOpenAI 实例
+
+    Args:
+        model_params: 传给 ChatOpenAI 的参数（包含 base_url/api_key）
+
+    Returns:
+        ChatOpenAI: 共享的 LLM 实例
+    """
+    from langchain_openai import ChatOpenAI
+
+    api_url = model_params.get("base_url") or ""
+    api_key = model_params.get("api_key") or ""
+    key = ("langchain", "openai", api_url, api_key, False, _params_fingerprint(model_params))
+    params = dict(model_params)
+    # 重试由 app.clients.retry 统一负责，关闭 SDK 自带的重试以免重复放大
+    params.setdefault("max_retries", 0)
+    return _get_or_build(key, lambda: ChatOpenAI(**params), api_url, api_key)
+
+
+def invalidate_model(model) -> int:
+    """失效某个模型对应的所有客户端
+
+    UniClient 条目按模型 ID 匹配；提供商客户端与 ChatOpenAI 条目按 API 密钥与地址匹配
+    （会议智能体使用的是去掉 /v1/chat/completions 后缀的基础地址，因此按前缀比较）。
+    需要在修改模型字段之前调用，以便用旧的地址与密钥匹配。
+
+    Args:
+        model: 数据库模型对象
+
+    Returns:
+        int: 被移除的条目数
+    """
+    model_id = model.id
+    api_url = model.api_url or ""
+    api_key = model.api_key or ""
+    with _lock:
+        stale = [
+            key for key, entry in _entries.items()
+            if (entry.model_id is not None and entry.model_id == model_id)
+            or (
+                entry.model_id is None
+                and entry.api_key == api_key
+                and (entry.api_url == api_url or (entry.api_url and api_url.startswith(entry.api_url)))
+            )
+        ]
+        for key in stale:
+            del _entries[key]
+        _stats["invalidations"] += len(stale)
+    if stale:
+        logger.info(f"模型 {model_id} 已变更，移除 {len(stale)} 个缓存的客户端")
+    return len(stale)
+
+
+def clear() -> None:
+    """清空注册表"""
+    with _lock:
+        _entries.clear()
+
+
+def stats() -> Dict[str, int]:
+    """返回注册表统计信息"""
+    return {"size": len(_entries), **_stats}
@@ -0,0 +1,410 @@
+"""上游调用的统一重试策略
+
+所有上游模型调用（提供商客户端、UniClient、会议智能体、总结生成器）都通过这里重试，
+不再各自用字符串匹配错误名、time.sleep 阻塞事件循环或静默吞掉非 200 响应。
+
+- 分类: 408/425/429/5xx（含 529 过载、Cloudflare 52x）与连接错误、超时可重试；其余 4xx 与解析错误不重试
+- Retry-After: 服务端给出的等待时间优先（秒数或 HTTP 日期），超过 UPSTREAM_RETRY_MAX_RETRY_AFTER 时不再等待
+- 退避: 指数退避加全抖动，delay = uniform(0, min(max_delay, base * 2^n))
+- 单次请求预算: 最多 UPSTREAM_RETRY_ATTEMPTS 次尝试，且累计耗时不超过 UPSTREAM_RETRY_BUDGET 秒
+- 全局重试率上限: 每个首次请求存入 UPSTREAM_RETRY_RATIO 个令牌，每次重试消耗 1 个（另有每秒
+  UPSTREAM_RETRY_MIN_PER_SECOND 的保底），上游整体故障时重试量不会超过正常流量的固定比例，避免放大故障
+
+流式请求只在收到第一个数据块之前重试（之后重试会让客户端收到重复内容）。
+传入熔断器（app.clients.breaker.Circuit）时，每次尝试前检查熔断状态（熔断中直接抛出 CircuitOpenError，不重试），
+并把可重试错误与耗时记入熔断器。传入限流凭据（app.clients.limiter.Quota）时，每次尝试前按 FIFO 排队取得
+端点的并发名额与 RPM/TPM 令牌，尝试结束后归还并把是否过载反馈给 AIMD。
+通过 on_attempt_start() 登记的回调在每次尝试取得限流名额后调用（对冲从这里计算首块延迟，不含排队时间）。
+"""
+import asyncio
+import contextvars
+import email.utils
+import os
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Mapping, Optional, TypeVar
+
+import aiohttp
+import httpx
+
+from app.utils.logger import logger
+from app.clients.breaker import Circuit
+from app.clients.limiter import Quota
+
+T = TypeVar("T")
+
+# 当前上下文中每次尝试取得限流名额、即将发出请求时调用的回调
+_attempt_hook: contextvars.ContextVar[Optional[Callable[[], None]]] = contextvars.ContextVar("attempt_hook", default=None)
+
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524, 529})
+
+# 表示上游过载、应降低并发的状态码
+OVERLOAD_STATUS = frozenset({429, 503, 529})
+
+# 第三方 SDK（openai / langchain）异常的类名，按类继承链匹配而不是匹配错误消息
+_RETRYABLE_EXCEPTION_NAMES = frozenset({
+    "RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+    "ServiceUnavailableError", "Timeout",
+})
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"环境变量 {name}={value} 不是有效数字，使用默认值 {default}")
+        return default
+
+
+class UpstreamStatusError(Exception):
+    """上游返回了非 200 状态码"""
+
+    def __init__(self, status: int, body: str = "", headers: Optional[Mapping[str, str]] = None):
+        self.status = status
+        self.body = body
+        self.retry_after = parse_retry_after((headers or {}).get("Retry-After"))
+        super().__init__(f"上游返回 HTTP {status}: {body[:200]}")
+
+
+class RetryPolicy:
+    """单次请求的重试参数"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 20.0,
+                 budget: float = 60.0, max_retry_after: float = 30.0):
+        """初始化重试策略
+
+        Args:
+            max_attempts: 最多尝试次数（含首次）
+            base_delay: 指数退避的基础秒数
+            max_delay: 单次退避的上限秒数
+            budget: 单次请求（含所有重试与等待）累计耗时上限秒数
+            max_retry_after: 愿意遵守的最长 Retry-After 秒数，更长时直接失败
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.max_retry_after = max_retry_after
+
+    def backoff(self, retry: int, retry_after: Optional[float] = None) -> float:
+        """第 retry 次重试（从 1 开始）前的等待秒数"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (retry - 1))))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class RetryBudget:
+    """全局重试令牌桶：首次请求存入 ratio 个令牌，每次重试取出 1 个"""
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+
+DEFAULT_POLICY = RetryPolicy(
+    max_attempts=int(_env_float("UPSTREAM_RETRY_ATTEMPTS", 3)),
+    base_delay=_env_float("UPSTREAM_RETRY_BASE_DELAY", 0.5),
+    max_delay=_env_float("UPSTREAM_RETRY_MAX_DELAY", 20),
+    budget=_env_float("UPSTREAM_RETRY_BUDGET", 60),
+    max_retry_after=_env_float("UPSTREAM_RETRY_MAX_RETRY_AFTER", 30),
+)
+
+_budget = RetryBudget(
+    ratio=_env_float("UPSTREAM_RETRY_RATIO", 0.2),
+    min_per_second=_env_float("UPSTREAM_RETRY_MIN_PER_SECOND", 1),
+)
+_stats = {"calls": 0, "retries": 0, "succeeded_after_retry": 0, "gave_up": 0, "not_retryable": 0, "throttled": 0}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After（秒数或 HTTP 日期），无法解析时返回 None
+
+    Args:
+        value: 响应头的值
+
+    Returns:
+        Optional[float]: 等待秒数
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed is None:
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+def _status_of(exc: BaseException) -> Optional[int]:
+    """取异常携带的 HTTP 状态码"""
+    if isinstance(exc, UpstreamStatusError):
+        return exc.status
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    status = getattr(exc, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after_of(exc: BaseException) -> Optional[float]:
+    """取异常携带的 Retry-After"""
+    if isinstance(exc, UpstreamStatusError):
+        return exc.retry_after
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or getattr(exc, "headers", None)
+    if headers:
+        try:
+            return parse_retry_after(headers.get("Retry-After"))
+        except AttributeError:
+            return None
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """判断异常是否值得重试
+
+    Args:
+        exc: 调用上游时抛出的异常
+
+    Returns:
+        bool: 可重试返回 True
+    """
+    status = _status_of(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(exc, (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                        httpx.TransportError, ConnectionError)):
+        return True
+    return any(cls.__name__ in _RETRYABLE_EXCEPTION_NAMES for cls in type(exc).__mro__)
+
+
+def is_overload(exc: BaseException) -> bool:
+    """判断异常是否表示上游过载（限流或服务过载）"""
+    return _status_of(exc) in OVERLOAD_STATUS
+
+
+def _next_delay(exc: BaseException, retry: int, started: float, policy: RetryPolicy, name: str) -> Optional[float]:
+    """决定是否重试，返回等待秒数；不重试时返回 None"""
+    if not is_retryable(exc):
+        _stats["not_retryable"] += 1
+        return None
+    if retry >= policy.max_attempts:
+        _stats["gave_up"] += 1
+        logger.warning(f"{name} 已尝试 {retry} 次，放弃重试: {exc}")
+        return None
+    retry_after = _retry_after_of(exc)
+    if retry_after is not None and retry_after > policy.max_retry_after:
+        _stats["gave_up"] += 1
+        logger.warning(f"{name} 的上游要求等待 {retry_after:.0f} 秒，超过上限，放弃重试")
+        return None
+    delay = policy.backoff(retry, retry_after)
+    if time.monotonic() - started + delay > policy.budget:
+        _stats["gave_up"] += 1
+        logger.warning(f"{name} 的重试时间预算（{policy.budget:g} 秒）已用完，放弃重试: {exc}")
+        return None
+    if not _budget.try_withdraw():
+        _stats["throttled"] += 1
+        logger.warning(f"全局重试率已达上限，{name} 不再重试: {exc}")
+        return None
+    _stats["retries"] += 1
+    logger.info(f"{name} 第 {retry} 次尝试失败（{exc}），{delay:.2f} 秒后重试")
+    return delay
+
+
+def _record_failure(circuit: Optional[Circuit], exc: BaseException) -> None:
+    """把一次失败的尝试记入熔断器：可重试错误计为失败，其余只归还试探名额"""
+    if circuit is None:
+        return
+    if isinstance(exc, Exception) and is_retryable(exc):
+        circuit.record(True)
+    else:
+        circuit.release()
+
+
+def _release_quota(quota: Optional[Quota], exc: BaseException) -> None:
+    """一次尝试失败后归还限流名额：过载响应让端点降低并发，其余错误不调整"""
+    if quota is not None:
+        quota.release(True if is_overload(exc) else None)
+
+
+def on_attempt_start(callback: Optional[Callable[[], None]]) -> None:
+    """登记当前上下文（任务）中每次尝试发出请求前调用的回调
+
+    Args:
+        callback: 无参回调，在取得熔断试探名额与限流名额之后调用；None 表示取消登记
+    """
+    _attempt_hook.set(callback)
+
+
+async def _begin_attempt(circuit: Optional[Circuit], quota: Optional[Quota]) -> None:
+    """一次尝试开始前占用熔断试探名额与限流名额；等待限流时被取消或出错则归还试探名额"""
+    if circuit is not None:
+        circuit.before_call()
+    if quota is not None:
+        try:
+            await quota.acquire()
+        except BaseException:
+            if circuit is not None:
+                circuit.release()
+            raise
+    hook = _attempt_hook.get()
+    if hook is not None:
+        hook()
+
+
+async def call_with_retry(fn: Callable[[], Awaitable[T]], name: str = "上游请求",
+                          policy: Optional[RetryPolicy] = None, circuit: Optional[Circuit] = None,
+                          quota: Optional[Quota] = None) -> T:
+    """按重试策略执行异步调用
+
+    Args:
+        fn: 每次尝试调用的无参协程函数
+        name: 日志中的调用名称
+        policy: 重试策略，默认 DEFAULT_POLICY
+        circuit: 上游端点的熔断器（可选）
+        quota: 上游端点的限流凭据（可选）
+
+    Returns:
+        fn 的返回值；不可重试或重试用尽时抛出最后一次的异常
+    """
+    policy = policy or DEFAULT_POLICY
+    _stats["calls"] += 1
+    _budget.deposit()
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        await _begin_attempt(circuit, quota)
+        attempt_started = time.monotonic()
+        try:
+            result = await fn()
+        except BaseException as e:
+            _record_failure(circuit, e)
+            _release_quota(quota, e)
+            if not isinstance(e, Exception):
+                raise
+            delay = _next_delay(e, attempt, started, policy, name)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        if circuit is not None:
+            circuit.record(False, time.monotonic() - attempt_started)
+        if quota is not None:
+            quota.release(False)
+        if attempt > 1:
+            _stats["succeeded_after_retry"] += 1
+        return result
+
+
+async def retry_stream(open_stream: Callable[[], AsyncIterator[T]], name: str = "上游流式请求",
+                       policy: Optional[RetryPolicy] = None, circuit: Optional[Circuit] = None,
+                       quota: Optional[Quota] = None) -> AsyncIterator[T]:
+    """按重试策略打开流式调用：收到第一个数据块之前失败时重试，之后的错误直接抛出
+
+    Args:
+        open_stream: 每次尝试调用、返回异步迭代器的无参函数（非 200 时应抛出 UpstreamStatusError）
+        name: 日志中的调用名称
+        policy: 重试策略，默认 DEFAULT_POLICY
+        circuit: 上游端点的熔断器（可选），按首块耗时记录
+        quota: 上游端点的限流凭据（可选），并发名额持有到流结束
+
+    Yields:
+        上游流的数据块
+    """
+    policy = policy or DEFAULT_POLICY
+    _stats["calls"] += 1
+    _budget.deposit()
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        await _begin_attempt(circuit, quota)
+        attempt_started = time.monotonic()
+        stream = open_stream()
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            if circuit is not None:
+                circuit.record(False, time.monotonic() - attempt_started)
+            if quota is not None:
+                quota.release(False)
+            return
+        except BaseException as e:
+            _record_failure(circuit, e)
+            _release_quota(quota, e)
+            await _aclose(stream)
+            if not isinstance(e, Exception):
+                raise
+            delay = _next_delay(e, attempt, started, policy, name)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        break
+
+    if circuit is not None:
+        circuit.record(False, time.monotonic() - attempt_started)
+    if attempt > 1:
+        _stats["succeeded_after_retry"] += 1
+    try:
+        yield first
+        async for chunk in stream:
+            yield chunk
+    except BaseException as e:
+        # 流中途出错或调用方取消、提前关闭：按错误归还名额，只有正常结束才算成功
+        await _aclose(stream)
+        _release_quota(quota, e)
+        raise
+    await _aclose(stream)
+    if quota is not None:
+        quota.release(False)
+
+
+async def _aclose(stream) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+def stats() -> Dict[str, Any]:
+    """返回重试统计：调用数、重试数、重试后成功 / 放弃 / 被全局上限拦截的次数与剩余令牌"""
+    return {**_stats, "budget_tokens": round(_budget.tokens, 2)}
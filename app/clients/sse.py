@@ -0,0 +1,101 @@
+"""增量 SSE 解析器
+
+上游按 TCP 读取返回的原始字节块并不保证与行边界对齐：一条 `data:` 行可能被拆到
+多个块中，多字节 UTF-8 字符也可能被截断。这里在字节缓冲区上按行切分，只解码完整
+的行（换行符 0x0A 不会出现在多字节 UTF-8 序列中间，因此按行解码总是安全的），
+缓冲区中只保留最后一个换行之后的不完整行，避免每行都复制整个缓冲区。
+"""
+from typing import AsyncGenerator, AsyncIterable, List, Union
+
+class SSEDecoder:
+    """把原始字节块切分为 SSE `data:` 负载
+
+    每个 `data:` 行视为一个事件负载（与现有各提供商的流式格式一致），
+    `event:`/`id:`/注释行以及空行会被忽略。
+    """
+
+    __slots__ = ("_buffer", "_decode")
+
+    def __init__(self, decode: bool = True):
+        """初始化解析器
+
+        Args:
+            decode: 为 True 时返回 str 负载，为 False 时返回 bytes 负载
+        """
+        self._buffer = bytearray()
+        self._decode = decode
+
+    def _parse_line(self, line: bytes) -> Union[str, bytes, None]:
+        """解析单行，返回 data 负载；非 data 行返回 None"""
+        if not line.startswith(b"data:"):
+            return None
+        if line.endswith(b"\r"):
+            line = line[:-1]
+        payload = line[6:] if line.startswith(b"data: ") else line[5:]
+        if self._decode:
+            return payload.decode("utf-8", errors="replace")
+        return payload
+
+    def feed(self, chunk: bytes) -> List[Union[str, bytes]]:
+        """写入一个字节块，返回其中已完整的事件负载
+
+        Args:
+            chunk: 上游返回的原始字节
+
+        Returns:
+            List[Union[str, bytes]]: 完整的 data 负载列表
+        """
+        if not chunk:
+            return []
+        buffer = self._buffer
+        # 只需在新数据中查找最后一个换行，之前的缓冲内容必然不含换行
+        last = chunk.rfind(b"\n")
+        if last < 0:
+            buffer += chunk
+            return []
+        if buffer:
+            complete = bytes(buffer) + chunk[:last]
+            buffer.clear()
+        else:
+            complete = chunk[:last]
+        if last + 1 < len(chunk):
+            buffer += chunk[last + 1:]
+
+        parse = self._parse_line
+        events = []
+        for line in complete.split(b"\n"):
+            if line:
+                payload = parse(line)
+                if payload is not None:
+                    events.append(payload)
+        return events
+
+    def flush(self) -> List[Union[str, bytes]]:
+        """流结束时处理缓冲区中剩余的最后一行（上游未以换行结尾的情况）"""
+        if not self._buffer:
+            return []
+        line = bytes(self._buffer)
+        self._buffer.clear()
+        payload = self._parse_line(line)
+        return [payload] if payload is not None else []
+
+
+async def iter_sse_data(
+    chunks: AsyncIterable[bytes],
+    decode: bool = True
+) -> AsyncGenerator[Union[str, bytes], None]:
+    """把字节块异步迭代器转换为 SSE data 负载的异步迭代器
+
+    Args:
+        chunks: 原始字节块，例如 aiohttp 的 response.content.iter_any()
+        decode: 是否解码为 str
+
+    Yields:
+        Union[str, bytes]: 每个完整的 data 负载
+    """
+    decoder = SSEDecoder(decode=decode)
+    async for chunk in chunks:
+        for payload in decoder.feed(chunk):
+            yield payload
+    for payload in decoder.flush():
+        yield payload
@@ -0,0 +1,242 @@
+"""进程级共享的上游 HTTP 传输层
+
+所有上游模型客户端（DeepSeek/Claude/Gemini/Grok3/OpenAI/UniClient）以及会议智能体、
+总结生成器都通过这里获取连接，而不是每次请求新建 ClientSession/AsyncClient，
+从而复用 keep-alive 连接、DNS 缓存和 TLS 会话。
+
+- aiohttp: 单个共享 ClientSession，TCPConnector 负责按主机的连接池与 DNS 缓存
+- httpx: 按上游主机（scheme://host:port）划分的 AsyncClient，可选开启 HTTP/2
+
+在应用启动时调用 startup()，关闭时调用 shutdown()；未调用 startup() 时首次使用会惰性创建。
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+import httpx
+
+from app.utils.logger import logger
+from app.utils import json_codec
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整数环境变量，非法值回退到默认值"""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning(f"环境变量 {name}={value} 不是有效整数，使用默认值 {default}")
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """读取布尔环境变量"""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _load_settings() -> Dict[str, Any]:
+    """读取连接池配置（可通过 .env 调整），在创建连接池时读取以便 load_dotenv 生效"""
+    return {
+        "max_connections": _env_int("UPSTREAM_MAX_CONNECTIONS", 200),
+        "max_connections_per_host": _env_int("UPSTREAM_MAX_CONNECTIONS_PER_HOST", 32),
+        "dns_cache_ttl": _env_int("UPSTREAM_DNS_CACHE_TTL", 300),
+        "keepalive_timeout": _env_int("UPSTREAM_KEEPALIVE_TIMEOUT", 60),
+        "connect_timeout": _env_int("UPSTREAM_CONNECT_TIMEOUT", 30),
+        "read_timeout": _env_int("UPSTREAM_READ_TIMEOUT", 300),
+        "http2": _env_bool("UPSTREAM_HTTP2", False),
+    }
+
+
+_aiohttp_session: Optional[aiohttp.ClientSession] = None
+_aiohttp_loop: Optional[asyncio.AbstractEventLoop] = None
+_httpx_clients: Dict[Tuple[str, str], httpx.AsyncClient] = {}
+_httpx_loop: Optional[asyncio.AbstractEventLoop] = None
+_closing: Set[asyncio.Task] = set()
+
+
+def _http2_available() -> bool:
+    """检查 httpx 的 HTTP/2 依赖（h2）是否已安装"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _host_key(url: str) -> Tuple[str, str]:
+    """按 scheme 与 host:port 划分连接池"""
+    parts = urlsplit(url)
+    return parts.scheme or "https", parts.netloc
+
+
+def _serialize_request_body(obj) -> str:
+    """上游请求体使用紧凑 JSON（客户端不可见，orjson 可用时更快）"""
+    return json_codec.dumps_compact(obj).decode("utf-8")
+
+
+async def _close_quietly(close: Callable[[], Awaitable[Any]], what: str) -> None:
+    try:
+        await close()
+    except Exception as e:
+        logger.debug(f"关闭旧事件循环上的{what}时出错: {e}")
+
+
+def _close_stale(close: Callable[[], Awaitable[Any]], loop: Optional[asyncio.AbstractEventLoop], what: str) -> None:
+    """事件循环变化后关闭在旧循环上创建的会话或连接池
+
+    旧循环仍在运行时提交到旧循环关闭；已停止时在当前循环中尽力关闭（未关闭的连接随旧循环失效）。
+
+    Args:
+        close: 关闭会话的无参协程函数
+        loop: 创建会话时的事件循环
+        what: 日志中的名称
+    """
+    if loop is not None and loop.is_running():
+        asyncio.run_coroutine_threadsafe(_close_quietly(close, what), loop)
+        return
+    task = asyncio.ensure_future(_close_quietly(close, what))
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+def get_aiohttp_session() -> aiohttp.ClientSession:
+    """获取共享的 aiohttp 会话
+
+    Returns:
+        aiohttp.ClientSession: 进程内共享的会话（绑定当前事件循环）
+    """
+    global _aiohttp_session, _aiohttp_loop
+    loop = asyncio.get_running_loop()
+    if _aiohttp_session is None or _aiohttp_session.closed or _aiohttp_loop is not loop:
+        if _aiohttp_session is not None and not _aiohttp_session.closed:
+            # 事件循环已变化，旧会话的连接不可复用，关闭后再替换
+            _close_stale(_aiohttp_session.close, _aiohttp_loop, "aiohttp 会话")
+        settings = _load_settings()
+        connector = aiohttp.TCPConnector(
+            limit=settings["max_connections"],
+            limit_per_host=settings["max_connections_per_host"],
+            ttl_dns_cache=settings["dns_cache_ttl"],
+            use_dns_cache=True,
+            keepalive_timeout=settings["keepalive_timeout"],
+        )
+        _aiohttp_session = aiohttp.ClientSession(
+            connector=connector,
+            json_serialize=_serialize_request_body,
+            timeout=aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=settings["connect_timeout"],
+                sock_read=settings["read_timeout"],
+            ),
+        )
+        _aiohttp_loop = loop
+        logger.debug(
+            f"已创建共享 aiohttp 会话: limit={settings['max_connections']}, "
+            f"limit_per_host={settings['max_connections_per_host']}, dns_ttl={settings['dns_cache_ttl']}"
+        )
+    return _aiohttp_session
+
+
+def get_httpx_client(url: str) -> httpx.AsyncClient:
+    """获取指定上游主机的共享 httpx 客户端
+
+    Args:
+        url: 请求地址，用于确定上游主机
+
+    Returns:
+        httpx.AsyncClient: 该主机对应的连接池客户端
+    """
+    global _httpx_loop
+    loop = asyncio.get_running_loop()
+    if _httpx_loop is not loop:
+        # 事件循环已变化（如测试或脚本多次 asyncio.run），旧连接不可复用
+        for client in _httpx_clients.values():
+            if not client.is_closed:
+                _close_stale(client.aclose, _httpx_loop, "httpx 连接池")
+        _httpx_clients.clear()
+        _httpx_loop = loop
+
+    key = _host_key(url)
+    client = _httpx_clients.get(key)
+    if client is None or client.is_closed:
+        settings = _load_settings()
+        http2 = settings["http2"] and _http2_available()
+        if settings["http2"] and not http2:
+            logger.warning("已启用 UPSTREAM_HTTP2 但未安装 h2，回退到 HTTP/1.1")
+        client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings["max_connections_per_host"],
+                max_keepalive_connections=settings["max_connections_per_host"],
+                keepalive_expiry=settings["keepalive_timeout"],
+            ),
+            timeout=httpx.Timeout(30.0, connect=settings["connect_timeout"], read=settings["read_timeout"]),
+        )
+        _httpx_clients[key] = client
+        logger.debug(f"已创建上游连接池: {key[0]}://{key[1]}, http2={http2}")
+    return client
+
+
+def run_sync(coro):
+    """在同步代码中执行使用共享连接的协程（供保留的同步接口使用）
+
+    - 在线程池线程中调用且共享会话所在的事件循环正在运行时，把协程提交到该事件循环执行并等待结果
+    - 没有运行中的应用事件循环时（脚本、命令行）在临时事件循环中执行，结束后释放连接
+    - 在事件循环线程中同步等待会阻塞所有请求，直接报错，调用方应改用异步接口
+
+    Args:
+        coro: 协程对象
+
+    Returns:
+        协程的返回值
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coro.close()
+        raise RuntimeError("不能在事件循环中同步等待上游调用，请改用异步接口")
+
+    loop = _aiohttp_loop
+    if loop is not None and loop.is_running():
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+    return asyncio.run(_run_standalone(coro))
+
+
+async def _run_standalone(coro):
+    try:
+        return await coro
+    finally:
+        await shutdown()
+
+
+async def startup() -> None:
+    """应用启动时预先创建共享会话"""
+    get_aiohttp_session()
+    logger.info("上游传输层已初始化")
+
+
+async def shutdown() -> None:
+    """应用关闭时释放所有连接"""
+    global _aiohttp_session, _aiohttp_loop, _httpx_loop
+    if _aiohttp_session is not None and not _aiohttp_session.closed:
+        await _aiohttp_session.close()
+    _aiohttp_session = None
+    _aiohttp_loop = None
+
+    clients = list(_httpx_clients.values())
+    _httpx_clients.clear()
+    _httpx_loop = None
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"关闭上游连接池时出错: {e}")
+    logger.info("上游传输层已关闭")
@@ -1,14 +1,30 @@
-from typing import List, Dict, Optional, AsyncGenerator
+from typing import List, Dict, Optional, AsyncGenerator, Tuple
 import httpx
-import json
+import re
 import time
 from app.utils.logger import logger
+from app.utils import json_codec
 from app.models.database import Model
+from app.clients.transport import get_httpx_client
+from app.clients import registry as client_registry
+from app.clients.sse import iter_sse_data
+from app.clients.retry import UpstreamStatusError, call_with_retry, retry_stream
+from app.clients import hedge
+from app.clients import breaker
+from app.clients import limiter
+from app.utils.chunk_encoder import ChunkEncoder, omit_empty_delta_fields
+
+# 透传模式下按字节改写的顶层字段（JSON 字符串内的引号必然被转义，不会误匹配内容）
+_ID_FIELD = re.compile(rb'"id"\s*:\s*"(?:[^"\\]|\\.)*"')
+_MODEL_FIELD = re.compile(rb'"model"\s*:\s*"(?:[^"\\]|\\.)*"')
 
 class UniClient:
     """
     通用的模型客户端，用于处理单模型的直接调用
     """
+    # 上游已是 OpenAI chunk 格式的提供商，流式响应可直接透传而无需重新解析
+    PASSTHROUGH_PROVIDERS = {"deepseek", "oneapi", "openrouter", "openai-completion"}
+
     def __init__(self, model: Model):
         """
         初始化通用客户端
@@ -48,18 +64,23 @@ class UniClient:
         
         # 自定义参数
         self.custom_parameters = model.custom_parameters or {}
+        
+        # 是否使用流式透传模式
+        self.passthrough = self.provider in self.PASSTHROUGH_PROVIDERS
 
-    def _process_chunk(self, chunk: str) -> Dict:
+    def _process_chunk(self, chunk: str, stream_state: Optional[Dict] = None) -> Dict:
         """处理不同模型的响应块格式
         
         Args:
             chunk: 原始响应块
+            stream_state: 单次流式请求的解析状态（如 Grok3 的行缓存）；客户端实例会在并发请求间共享，
+                因此跨块状态不能保存在实例上
             
         Returns:
             Dict: 处理后的响应数据
         """
         try:
-            chunk_data = json.loads(chunk)
+            chunk_data = json_codec.loads(chunk)
             delta = {}
             
             # 根据不同的模型提供商处理响应
@@ -69,17 +90,18 @@ class UniClient:
                     # logger.debug(f"chunk_data: {chunk_data}")
                     content = chunk_data["choices"][0].get("delta", {}).get("content", "")
                     if content:
-                        # 初始化或获取当前行缓存
-                        if not hasattr(self, '_current_line'):
-                            self._current_line = ""
+                        # 获取当前行缓存
+                        if stream_state is None:
+                            stream_state = {}
+                        current_line = stream_state.get("current_line", "")
                         
                         # 追加新内容到当前行
-                        self._current_line += content
+                        current_line += content
                         
                         # 处理完整行
                         lines = []
-                        while "\n" in self._current_line:
-                            line, self._current_line = self._current_line.split("\n", 1)
+                        while "\n" in current_line:
+                            line, current_line = current_line.split("\n", 1)
                             line = line.strip()
                             if line:  # 忽略空行
                                 lines.append(line)
@@ -97,13 +119,14 @@ class UniClient:
                         
                         # 如果是结束标记，处理最后一行
                         if chunk_data.get("finish_reason") == "stop":
-                            last_line = self._current_line.strip()
+                            last_line = current_line.strip()
                             if last_line:
                                 if last_line.startswith(">"):
                                     reasoning_lines.append("\n"+last_line)
                                 else:
                                     answer_lines.append("\n"+last_line)
-                            self._current_line = ""
+                            current_line = ""
+                        stream_state["current_line"] = current_line
                         
                         # 构造响应
                         delta = {
@@ -157,7 +180,7 @@ class UniClient:
                     }
             
             return delta
-        except json.JSONDecodeError:
+        except json_codec.JSONDecodeError:
             logger.error(f"无法解析响应块: {chunk}")
             return {
                 "role": "assistant",
@@ -214,10 +237,68 @@ class UniClient:
                     "finish_reason": "stop"
                 }]
             }
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n".encode('utf-8')
+            yield f"data: {json_codec.dumps(error_data, ensure_ascii=False)}\n\n".encode('utf-8')
             yield "data: [DONE]\n\n".encode('utf-8')
             return
             
+        # 主请求与对冲请求各自重试（收到第一个数据块之前），开启对冲时先产生输出的一路胜出
+        open_primary = lambda: self._stream_leg(cleaned_messages, chat_id, created_time)
+        try:
+            if getattr(self.model, "hedge_enabled", False):
+                alternate = self._hedge_client()
+                stream = hedge.hedged_stream(
+                    self.model.id,
+                    open_primary,
+                    lambda: alternate._stream_leg(cleaned_messages, chat_id, created_time),
+                    name=f"UniClient({self.model_name}) 流式请求"
+                )
+            else:
+                stream = open_primary()
+            
+            async for chunk in stream:
+                yield chunk
+        except UpstreamStatusError as e:
+            logger.error(f"API请求失败: 状态码={e.status}, 响应={e.body}")
+            
+            # 返回错误信息
+            error_data = {
+                "id": chat_id,
+                "object": "chat.completion.chunk",
+                "created": created_time,
+                "model": self.model_name,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": f"API请求失败: HTTP {e.status}\n{e.body}"},
+                    "finish_reason": "stop"
+                }]
+            }
+            yield f"data: {json_codec.dumps(error_data, ensure_ascii=False)}\n\n".encode('utf-8')
+            yield "data: [DONE]\n\n".encode('utf-8')
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP状态错误: {e.response.status_code} - {e.response.text}")
+            error_data = self._format_error_data(chat_id, created_time, f"HTTP错误: {e.response.status_code} - {e.response.text}")
+            yield f"data: {json_codec.dumps(error_data, ensure_ascii=False)}\n\n".encode('utf-8')
+            yield "data: [DONE]\n\n".encode('utf-8')
+        except httpx.RequestError as e:
+            logger.error(f"请求错误: {str(e)}")
+            error_data = self._format_error_data(chat_id, created_time, f"请求错误: {str(e)}")
+            yield f"data: {json_codec.dumps(error_data, ensure_ascii=False)}\n\n".encode('utf-8')
+            yield "data: [DONE]\n\n".encode('utf-8')
+        except Exception as e:
+            logger.error(f"生成响应时出错: {str(e)}")
+            error_data = self._format_error_data(chat_id, created_time, f"错误: {str(e)}")
+            yield f"data: {json_codec.dumps(error_data, ensure_ascii=False)}\n\n".encode('utf-8')
+            yield "data: [DONE]\n\n".encode('utf-8')
+
+    def _build_stream_request(self, cleaned_messages: List[Dict]) -> Tuple[str, dict]:
+        """按提供商构建流式请求的地址与载荷
+        
+        Args:
+            cleaned_messages: 已清洗的 OpenAI 格式消息
+            
+        Returns:
+            Tuple[str, dict]: (请求地址, 请求载荷)
+        """
         # 构建请求payload，确保符合API格式要求
         payload = {
             "model": self.model_name,
@@ -295,78 +376,147 @@ class UniClient:
         
         # 记录请求详情（用于调试）
         logger.info(f"发送API请求: url={request_url}, model={self.model_name}")
-        logger.debug(f"请求载荷: {json.dumps(payload, ensure_ascii=False)}")
+        logger.debug(f"请求载荷: {json_codec.dumps(payload, ensure_ascii=False)}")
+        return request_url, payload
+
+    def _stream_leg(self, cleaned_messages: List[Dict], chat_id: str, created_time: int) -> AsyncGenerator[bytes, None]:
+        """发起一路流式请求（收到第一个数据块之前按统一重试策略重试）
         
-        try:
-            # 设置 timeout 为 30 秒
-            timeout = httpx.Timeout(30.0, connect=30.0, read=30.0)
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                async with client.stream('POST', request_url, json=payload, headers=self.headers) as response:
-                    # 检查响应状态码
-                    if response.status_code != 200:
-                        error_text = await response.aread()
-                        error_text = error_text.decode('utf-8')
-                        logger.error(f"API请求失败: 状态码={response.status_code}, 响应={error_text}")
-                        
-                        # 返回错误信息
-                        error_data = {
-                            "id": chat_id,
-                            "object": "chat.completion.chunk",
-                            "created": created_time,
-                            "model": self.model_name,
-                            "choices": [{
-                                "index": 0,
-                                "delta": {"content": f"API请求失败: HTTP {response.status_code}\n{error_text}"},
-                                "finish_reason": "stop"
-                            }]
-                        }
-                        yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n".encode('utf-8')
+        Args:
+            cleaned_messages: 已清洗的 OpenAI 格式消息
+            chat_id: 本次对话的响应ID
+            created_time: 本次对话的创建时间
+            
+        Returns:
+            AsyncGenerator[bytes, None]: SSE 格式的响应片段
+        """
+        request_url, payload = self._build_stream_request(cleaned_messages)
+        # 整个流共用预序列化的 chunk 信封
+        encoder = ChunkEncoder(chat_id, self.model_name, created_time, ensure_ascii=False, omit_empty=omit_empty_delta_fields())
+        return retry_stream(
+            lambda: self._stream_once(request_url, payload, chat_id, encoder),
+            name=f"UniClient({self.model_name}) 流式请求",
+            circuit=breaker.get_circuit(self.provider, request_url, self.api_key),
+            quota=limiter.quota(request_url, self.api_key, payload)
+        )
+
+    def _hedge_client(self) -> "UniClient":
+        """对冲请求使用的客户端：模型配置了备用模型时使用备用模型，否则使用自身"""
+        hedge_model = hedge.resolve_alternate(self.model)
+        if hedge_model is None:
+            return self
+        return client_registry.get_uni_client(hedge_model)
+
+    async def _stream_once(self, request_url: str, payload: dict, chat_id: str, encoder: ChunkEncoder) -> AsyncGenerator[bytes, None]:
+        """发送一次流式请求，非 200 响应抛出 UpstreamStatusError
+        
+        Args:
+            request_url: 请求地址
+            payload: 请求载荷
+            chat_id: 本次对话的响应ID
+            encoder: 本次对话的 chunk 编码器
+            
+        Yields:
+            bytes: SSE 格式的响应片段
+        """
+        # 设置 timeout 为 30 秒
+        timeout = httpx.Timeout(30.0, connect=30.0, read=30.0)
+        client = get_httpx_client(request_url)
+        async with client.stream('POST', request_url, content=json_codec.dumps_compact(payload), headers=self.headers, timeout=timeout) as response:
+            # 检查响应状态码
+            if response.status_code != 200:
+                error_text = await response.aread()
+                raise UpstreamStatusError(response.status_code, error_text.decode('utf-8', errors='replace'), response.headers)
+            
+            # OpenAI 兼容格式直接透传上游负载
+            if self.passthrough:
+                async for chunk in self._passthrough_stream(response, chat_id, encoder):
+                    yield chunk
+                return
+            
+            # 处理成功的响应
+            stream_state = {}
+            async for line in response.aiter_lines():
+                if line.strip():
+                    if line.startswith('data: '):
+                        line = line[6:]  # 移除 "data: " 前缀
+                    if line == '[DONE]':
                         yield "data: [DONE]\n\n".encode('utf-8')
-                        return
+                        break
                     
-                    # 处理成功的响应
-                    async for line in response.aiter_lines():
-                        if line.strip():
-                            if line.startswith('data: '):
-                                line = line[6:]  # 移除 "data: " 前缀
-                            if line == '[DONE]':
-                                yield "data: [DONE]\n\n".encode('utf-8')
-                                break
-                            
-                            try:
-                                chunk = line.strip()
-                                if chunk:
-                                    # 处理响应块
-                                    delta = self._process_chunk(chunk)
-                                    response_data = {
-                                        "id": chat_id,
-                                        "object": "chat.completion.chunk",
-                                        "created": created_time,
-                                        "model": self.model_name,
-                                        "choices": [{
-                                            "index": 0,
-                                            "delta": delta
-                                        }]
-                                    }
-                                    yield f"data: {json.dumps(response_data, ensure_ascii=False)}\n\n".encode('utf-8')
-                            except Exception as e:
-                                logger.error(f"处理响应块时出错: {str(e)}")
-                                continue
-        except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP状态错误: {e.response.status_code} - {e.response.text}")
-            error_data = self._format_error_data(chat_id, created_time, f"HTTP错误: {e.response.status_code} - {e.response.text}")
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n".encode('utf-8')
-            yield "data: [DONE]\n\n".encode('utf-8')
-        except httpx.RequestError as e:
-            logger.error(f"请求错误: {str(e)}")
-            error_data = self._format_error_data(chat_id, created_time, f"请求错误: {str(e)}")
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n".encode('utf-8')
-            yield "data: [DONE]\n\n".encode('utf-8')
-        except Exception as e:
-            logger.error(f"生成响应时出错: {str(e)}")
-            error_data = self._format_error_data(chat_id, created_time, f"错误: {str(e)}")
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n".encode('utf-8')
-            yield "data: [DONE]\n\n".encode('utf-8')
+                    try:
+                        chunk = line.strip()
+                        if chunk:
+                            # 处理响应块
+                            delta = self._process_chunk(chunk, stream_state)
+                            yield encoder.encode(delta)
+                    except Exception as e:
+                        logger.error(f"处理响应块时出错: {str(e)}")
+                        continue
+
+    def _rewrite_passthrough_payload(self, payload: bytes, id_field: bytes, model_field: bytes) -> Optional[bytes]:
+        """按字节改写透传负载中的顶层 id 与 model 字段
+        
+        Args:
+            payload: 上游 data 负载
+            id_field: 替换用的 `"id":"..."` 字节串
+            model_field: 替换用的 `"model":"..."` 字节串
+            
+        Returns:
+            Optional[bytes]: 改写后的负载；不是标准 chunk 时返回 None，由调用方回退到解析路径
+        """
+        if not payload.startswith(b"{"):
+            return None
+        choices_pos = payload.find(b'"choices"')
+        if choices_pos < 0:
+            return None
+        # 只改写出现在 choices 之前的顶层字段，避免误改 tool_calls 等嵌套对象中的 id
+        id_match = _ID_FIELD.search(payload, 0, choices_pos)
+        if id_match:
+            payload = payload[:id_match.start()] + id_field + payload[id_match.end():]
+            choices_pos += len(id_field) - (id_match.end() - id_match.start())
+        model_match = _MODEL_FIELD.search(payload, 0, choices_pos)
+        if model_match:
+            payload = payload[:model_match.start()] + model_field + payload[model_match.end():]
+        return payload
+
+    async def _passthrough_stream(self, response: httpx.Response, chat_id: str, encoder: ChunkEncoder) -> AsyncGenerator[bytes, None]:
+        """透传 OpenAI 兼容格式的上游流式响应
+        
+        只在字节层面改写 id/model 字段，不做 JSON 解析与重新序列化；
+        遇到非标准负载（如错误对象）时回退到 _process_chunk 解析路径。
+        
+        Args:
+            response: 上游流式响应
+            chat_id: 本次对话的响应ID
+            encoder: 回退解析路径使用的 chunk 编码器
+            
+        Yields:
+            bytes: SSE 格式的响应片段
+        """
+        id_field = b'"id":' + json_codec.dumps(chat_id).encode('utf-8')
+        model_field = b'"model":' + json_codec.dumps(self.model_name, ensure_ascii=False).encode('utf-8')
+        
+        async for payload in iter_sse_data(response.aiter_bytes(), decode=False):
+            payload = payload.strip()
+            if not payload:
+                continue
+            if payload == b"[DONE]":
+                yield b"data: [DONE]\n\n"
+                break
+            
+            rewritten = self._rewrite_passthrough_payload(payload, id_field, model_field)
+            if rewritten is not None:
+                yield b"data: " + rewritten + b"\n\n"
+                continue
+            
+            # 回退到解析路径
+            try:
+                delta = self._process_chunk(payload.decode('utf-8', errors='replace'))
+                yield encoder.encode(delta)
+            except Exception as e:
+                logger.error(f"处理响应块时出错: {str(e)}")
+                continue
 
     def _format_error_data(self, chat_id, created_time, error_message):
         """格式化错误数据为OpenAI兼容格式"""
@@ -503,68 +653,39 @@ class UniClient:
         
         # 记录请求详情
         logger.info(f"发送API请求: url={request_url}, model={self.model_name}")
-        logger.debug(f"请求载荷: {json.dumps(payload, ensure_ascii=False)}")
+        logger.debug(f"请求载荷: {json_codec.dumps(payload, ensure_ascii=False)}")
+        
+        # 设置 timeout 为 30 秒
+        timeout = httpx.Timeout(30.0, connect=30.0, read=30.0)
+        client = get_httpx_client(request_url)
+        
+        async def post_once():
+            response = await client.post(
+                request_url,
+                content=json_codec.dumps_compact(payload),
+                headers=self.headers,
+                timeout=timeout
+            )
+            # 记录API响应状态
+            logger.info(f"API响应状态码: {response.status_code}")
+            if response.status_code != 200:
+                raise UpstreamStatusError(response.status_code, response.text, response.headers)
+            return response
         
         try:
-            # 设置 timeout 为 30 秒
-            timeout = httpx.Timeout(30.0, connect=30.0, read=30.0)
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post(
-                    request_url,
-                    json=payload,
-                    headers=self.headers
-                )
-                
-                # 记录API响应状态
-                logger.info(f"API响应状态码: {response.status_code}")
-                
-                # 检查响应状态码
-                if response.status_code != 200:
-                    error_text = response.text
-                    logger.error(f"API请求失败: 状态码={response.status_code}, 响应={error_text}")
-                    
-                    # 返回错误信息
-                    return {
-                        "id": chat_id,
-                        "object": "chat.completion",
-                        "created": created_time,
-                        "model": self.model_name,
-                        "choices": [{
-                            "index": 0,
-                            "message": {
-                                "role": "assistant",
-                                "content": f"API请求失败: HTTP {response.status_code}\n{error_text}",
-                                "reasoning_content": "",
-                                "execution_content": ""
-                            },
-                            "finish_reason": "stop"
-                        }]
-                    }
-                
-                # 处理成功的响应
-                result = response.json()
-                
-                # 确保响应格式正确
-                if "choices" not in result or not result["choices"]:
-                    logger.error(f"API响应格式错误: {result}")
-                    return {
-                        "id": chat_id,
-                        "object": "chat.completion",
-                        "created": created_time,
-                        "model": self.model_name,
-                        "choices": [{
-                            "index": 0,
-                            "message": {
-                                "role": "assistant",
-                                "content": f"API响应格式错误: {json.dumps(result)}",
-                                "reasoning_content": "",
-                                "execution_content": ""
-                            },
-                            "finish_reason": "stop"
-                        }]
-                    }
-                
-                # 构建标准格式响应
+            response = await call_with_retry(
+                post_once,
+                name=f"UniClient({self.model_name}) 请求",
+                circuit=breaker.get_circuit(self.provider, request_url, self.api_key),
+                quota=limiter.quota(request_url, self.api_key, payload)
+            )
+            
+            # 处理成功的响应
+            result = json_codec.loads(response.content)
+            
+            # 确保响应格式正确
+            if "choices" not in result or not result["choices"]:
+                logger.error(f"API响应格式错误: {result}")
                 return {
                     "id": chat_id,
                     "object": "chat.completion",
@@ -574,13 +695,51 @@ class UniClient:
                         "index": 0,
                         "message": {
                             "role": "assistant",
-                            "content": result["choices"][0]["message"]["content"],
+                            "content": f"API响应格式错误: {json_codec.dumps(result)}",
                             "reasoning_content": "",
                             "execution_content": ""
                         },
-                        "finish_reason": result["choices"][0].get("finish_reason", "stop")
+                        "finish_reason": "stop"
                     }]
                 }
+            
+            # 构建标准格式响应
+            return {
+                "id": chat_id,
+                "object": "chat.completion",
+                "created": created_time,
+                "model": self.model_name,
+                "choices": [{
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": result["choices"][0]["message"]["content"],
+                        "reasoning_content": "",
+                        "execution_content": ""
+                    },
+                    "finish_reason": result["choices"][0].get("finish_reason", "stop")
+                }]
+            }
+        except UpstreamStatusError as e:
+            logger.error(f"API请求失败: 状态码={e.status}, 响应={e.body}")
+            
+            # 返回错误信息
+            return {
+                "id": chat_id,
+                "object": "chat.completion",
+                "created": created_time,
+                "model": self.model_name,
+                "choices": [{
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": f"API请求失败: HTTP {e.status}\n{e.body}",
+                        "reasoning_content": "",
+                        "execution_content": ""
+                    },
+                    "finish_reason": "stop"
+                }]
+            }
         except Exception as e:
             logger.error(f"生成响应时出错: {str(e)}")
             return {
@@ -603,7 +762,7 @@ class UniClient:
     @staticmethod
     def create_client(model: Model) -> 'UniClient':
         """
-        创建通用客户端实例
+        获取通用客户端实例（从进程级注册表复用已创建的实例）
         
         Args:
             model (Model): 模型配置对象
@@ -611,7 +770,7 @@ class UniClient:
         Returns:
             UniClient: 通用客户端实例
         """
-        return UniClient(model)
+        return client_registry.get_uni_client(model)
 
     def _prepare_request_kwargs(self) -> dict:
         """准备请求参数"""
@@ -1,14 +1,16 @@
+import asyncio
 import os
 import sys
 from dotenv import load_dotenv
 from fastapi import FastAPI, Depends, Request, HTTPException, Body
-from fastapi.responses import StreamingResponse, JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Dict, Any, Optional
 import uvicorn
-import json
 import uuid
 import time
 import re
@@ -19,14 +21,27 @@ from starlette.types import ASGIApp
 from app.utils.logger import logger
 from app.utils.auth import verify_api_key
 
-from app.models.database import get_db, init_db, Model as DBModel, Configuration as DBConfiguration, ConfigurationStep, Role, DiscussionGroup
+from app.models.database import get_async_db, async_engine, init_db, Model as DBModel, Configuration as DBConfiguration, ConfigurationStep, Role, DiscussionGroup
 from app.models.schemas import Model, ModelCreate, Configuration, ConfigurationCreate
 from app.models import ModelCollaboration, MultiStepModelCollaboration
+from app.models import config_registry
 from app.routes import model_router, configuration_router, api_key_router, auth_router
 from app.routers import meeting, roles, discussion_groups, discussions
 from app.processors.role_processor import RoleProcessor
 from app.processors.discussion_processor import DiscussionProcessor
 from app.adapters.meeting_adapter import MeetingAdapter
+from app.meeting import store as meeting_store
+from app.meeting import human_input_reaper
+from app.processors import meeting_runner
+from app.meeting.store import get_meeting_store
+from app.clients import transport
+from app.clients import registry as client_registry
+from app.clients import retry as upstream_retry
+from app.clients import hedge as upstream_hedge
+from app.clients import breaker as upstream_breaker
+from app.clients import limiter as upstream_limiter
+from app.utils import json_codec, resumable_stream
+from app.utils.codec_route import CodecJSONRoute
 
 # 自定义中间件类，用于过滤特定路径的访问日志
 class AccessLogFilter(BaseHTTPMiddleware):
@@ -75,6 +90,7 @@ class AccessLogFilter(BaseHTTPMiddleware):
 load_dotenv()
 
 app = FastAPI(title="DeepGemini API")
+app.router.route_class = CodecJSONRoute
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -104,6 +120,30 @@ app.add_middleware(
 # Initialize database
 init_db()
 
+@app.on_event("startup")
+async def on_startup():
+    """应用启动时初始化共享的上游连接池、预热配置注册表并启动跨 worker 同步、启动熔断探测并恢复未结束的会议"""
+    await transport.startup()
+    await asyncio.to_thread(config_registry.rebuild)
+    config_registry.start()
+    get_meeting_store().restore()
+    meeting_store.start_eviction()
+    human_input_reaper.start()
+    meeting_runner.get_runner().start()
+    upstream_breaker.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """应用关闭时保存会议状态，释放上游连接与数据库连接池"""
+    await meeting_store.stop_eviction()
+    await meeting_runner.get_runner().stop()
+    human_input_reaper.stop()
+    await upstream_breaker.stop()
+    await config_registry.stop()
+    get_meeting_store().snapshot_all()
+    await transport.shutdown()
+    await async_engine.dispose()
+
 # 添加获取默认API密钥的端点
 @app.get("/v1/system/default_api_key")
 async def get_default_api_key():
@@ -113,7 +153,7 @@ async def get_default_api_key():
     try:
         # 从环境变量中获取API密钥配置
         api_keys_json = os.getenv('ALLOW_API_KEY', '[]')
-        api_keys_data = json.loads(api_keys_json)
+        api_keys_data = json_codec.loads(api_keys_json)
         
         # 确保数据是正确的格式并且有至少一个密钥
         if isinstance(api_keys_data, list) and len(api_keys_data) > 0 and isinstance(api_keys_data[0], dict) and "key" in api_keys_data[0]:
@@ -134,16 +174,16 @@ async def get_default_api_key():
 
 # Model routes
 @app.get("/v1/models")
-async def get_models(db: Session = Depends(get_db)):
+async def get_models(db: AsyncSession = Depends(get_async_db)):
     """返回OpenAI格式的模型列表，包括配置、角色和讨论组"""
     # 获取配置
-    configurations = db.query(DBConfiguration).all()
+    configurations = (await db.execute(select(DBConfiguration))).scalars().all()
     
     # 获取角色
-    roles = db.query(Role).all()
+    roles = (await db.execute(select(Role))).scalars().all()
     
     # 获取讨论组
-    groups = db.query(DiscussionGroup).all()
+    groups = (await db.execute(select(DiscussionGroup))).scalars().all()
     
     # 合并结果
     result = []
@@ -185,12 +225,12 @@ async def get_models(db: Session = Depends(get_db)):
     }
 
 @app.get("/v1/model_configs", response_model=List[Model])
-async def get_model_configs(db: Session = Depends(get_db)):
+async def get_model_configs(db: AsyncSession = Depends(get_async_db)):
     """Return the original model configurations"""
-    return db.query(DBModel).all()
+    return (await db.execute(select(DBModel))).scalars().all()
 
 @app.post("/v1/models", response_model=Model)
-async def create_model(model: ModelCreate, db: Session = Depends(get_db)):
+async def create_model(model: ModelCreate, db: AsyncSession = Depends(get_async_db)):
     try:
         # 从 model.dict() 中只获取数据库模型中存在的字段
         model_data = {
@@ -210,53 +250,82 @@ async def create_model(model: ModelCreate, db: Session = Depends(get_db)):
             'tool_choice': model.tool_choice,
             'enable_thinking': model.enable_thinking,
             'thinking_budget_tokens': model.thinking_budget_tokens,
+            'hedge_enabled': model.hedge_enabled,
+            'hedge_model_id': model.hedge_model_id,
+            'fallback_model_id': model.fallback_model_id,
+            'rpm_limit': model.rpm_limit,
+            'tpm_limit': model.tpm_limit,
+            'max_concurrency': model.max_concurrency,
             'custom_parameters': model.custom_parameters if model.custom_parameters else {}
         }
         
         db_model = DBModel(**model_data)
         db.add(db_model)
-        db.commit()
-        db.refresh(db_model)
+        await db.commit()
+        config_registry.invalidate()
+        await db.refresh(db_model)
         return db_model
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"创建模型时发生错误: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/v1/models/{model_id}", response_model=Model)
-async def update_model(model_id: int, model: ModelCreate, db: Session = Depends(get_db)):
-    db_model = db.query(DBModel).filter(DBModel.id == model_id).first()
+async def update_model(model_id: int, model: ModelCreate, db: AsyncSession = Depends(get_async_db)):
+    db_model = await db.get(DBModel, model_id)
     if not db_model:
         raise HTTPException(status_code=404, detail="Model not found")
     
+    # 用修改前的地址与密钥失效缓存的客户端
+    client_registry.invalidate_model(db_model)
+    
     for key, value in model.dict().items():
         setattr(db_model, key, value)
     
-    db.commit()
-    db.refresh(db_model)
+    await db.commit()
+    config_registry.invalidate()
+    await db.refresh(db_model)
     return db_model
 
 @app.delete("/v1/models/{model_id}")
-async def delete_model(model_id: int, db: Session = Depends(get_db)):
-    db_model = db.query(DBModel).filter(DBModel.id == model_id).first()
+async def delete_model(model_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_model = await db.get(DBModel, model_id)
     if not db_model:
         raise HTTPException(status_code=404, detail="Model not found")
     
-    db.delete(db_model)
-    db.commit()
+    client_registry.invalidate_model(db_model)
+    await db.delete(db_model)
+    await db.commit()
+    config_registry.invalidate()
     return {"status": "success"}
 
+async def _load_configuration(db: AsyncSession, config_id: int) -> Optional[DBConfiguration]:
+    """加载配置及其步骤（异步会话不能懒加载关系，需要显式预加载）"""
+    result = await db.execute(
+        select(DBConfiguration)
+        .options(selectinload(DBConfiguration.steps))
+        .where(DBConfiguration.id == config_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
 # Configuration routes
 @app.get("/v1/configurations", response_model=List[Configuration])
-async def get_configurations(db: Session = Depends(get_db)):
-    return db.query(DBConfiguration).all()
+async def get_configurations(db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(DBConfiguration).options(selectinload(DBConfiguration.steps)))
+    return result.scalars().all()
 
 @app.post("/v1/configurations", response_model=Configuration)
-async def create_configuration(config: ConfigurationCreate, db: Session = Depends(get_db)):
+async def create_configuration(config: ConfigurationCreate, db: AsyncSession = Depends(get_async_db)):
     try:
-        # 验证所有模型是否存在且用途类型正确
+        # 验证所有模型是否存在且用途类型正确（一次查询取出所有步骤用到的模型）
+        model_ids = {step.model_id for step in config.steps}
+        models = {
+            model.id: model
+            for model in (await db.execute(select(DBModel).where(DBModel.id.in_(model_ids)))).scalars()
+        }
         for step in config.steps:
-            model = db.query(DBModel).filter(DBModel.id == step.model_id).first()
+            model = models.get(step.model_id)
             if not model:
                 raise HTTPException(status_code=404, detail=f"Model {step.model_id} not found")
             if model.type not in ["both", step.step_type]:
@@ -272,8 +341,8 @@ async def create_configuration(config: ConfigurationCreate, db: Session = Depend
             transfer_content=config.transfer_content
         )
         db.add(db_config)
-        db.commit()
-        db.refresh(db_config)
+        # 只 flush 取得配置 ID，配置与步骤在同一事务中提交，注册表也只失效一次
+        await db.flush()
 
         # 创建配置步骤
         for step in config.steps:
@@ -286,20 +355,20 @@ async def create_configuration(config: ConfigurationCreate, db: Session = Depend
             )
             db.add(db_step)
         
-        db.commit()
-        db.refresh(db_config)
-        return db_config
+        await db.commit()
+        config_registry.invalidate()
+        return await _load_configuration(db, db_config.id)
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"创建配置时发生错误: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/v1/configurations/{config_id}", response_model=Configuration)
-async def update_configuration(config_id: int, config: ConfigurationCreate, db: Session = Depends(get_db)):
+async def update_configuration(config_id: int, config: ConfigurationCreate, db: AsyncSession = Depends(get_async_db)):
     try:
         # 获取现有配置
-        db_config = db.query(DBConfiguration).filter(DBConfiguration.id == config_id).first()
+        db_config = await db.get(DBConfiguration, config_id)
         if not db_config:
             raise HTTPException(status_code=404, detail="Configuration not found")
         
@@ -309,9 +378,9 @@ async def update_configuration(config_id: int, config: ConfigurationCreate, db:
         db_config.transfer_content = config.transfer_content
         
         # 删除现有步骤
-        db.query(ConfigurationStep).filter(
-            ConfigurationStep.configuration_id == config_id
-        ).delete()
+        await db.execute(
+            delete(ConfigurationStep).where(ConfigurationStep.configuration_id == config_id)
+        )
         
         # 创建新步骤
         for step in config.steps:
@@ -325,12 +394,13 @@ async def update_configuration(config_id: int, config: ConfigurationCreate, db:
             db.add(db_step)
         
         try:
-            db.commit()
-            db.refresh(db_config)
+            await db.commit()
+            config_registry.invalidate()
+            db_config = await _load_configuration(db, config_id)
             logger.info(f"配置已更新: {db_config.name}")
             return db_config
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"更新配置时发生错误: {e}")
             raise HTTPException(status_code=500, detail=str(e))
             
@@ -339,34 +409,59 @@ async def update_configuration(config_id: int, config: ConfigurationCreate, db:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/v1/configurations/{config_id}")
-async def delete_configuration(config_id: int, db: Session = Depends(get_db)):
-    db_config = db.query(DBConfiguration).filter(DBConfiguration.id == config_id).first()
+async def delete_configuration(config_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_config = await db.get(DBConfiguration, config_id)
     if not db_config:
         raise HTTPException(status_code=404, detail="Configuration not found")
     
-    db.delete(db_config)
-    db.commit()
+    await db.delete(db_config)
+    await db.commit()
+    config_registry.invalidate()
     return {"status": "success"}
 
 @app.get("/v1/configurations/{config_id}", response_model=Configuration)
-async def get_configuration(config_id: int, db: Session = Depends(get_db)):
+async def get_configuration(config_id: int, db: AsyncSession = Depends(get_async_db)):
     """获取单个配置的详细信息"""
     try:
-        # 获取配置
-        db_config = db.query(DBConfiguration).filter(DBConfiguration.id == config_id).first()
+        # 获取配置及按 step_order 排序的步骤
+        db_config = await _load_configuration(db, config_id)
         if not db_config:
             raise HTTPException(status_code=404, detail="Configuration not found")
         
-        # 获取配置步骤
-        db_config.steps = db.query(ConfigurationStep).filter(
-            ConfigurationStep.configuration_id == config_id
-        ).order_by(ConfigurationStep.step_order).all()
-        
         return db_config
     except Exception as e:
         logger.error(f"获取配置时发生错误: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# 角色与讨论组请求的 model 参数格式（支持 role-ID/role_ID 与 group-ID/group_ID）
+ROLE_MODEL_PATTERN = re.compile(r"role[-_](\d+)")
+GROUP_MODEL_PATTERN = re.compile(r"group[-_](\d+)")
+
+@app.get("/v1/registry/stats")
+async def get_registry_stats(api_key: str = Depends(verify_api_key)):
+    """获取配置注册表、上游客户端注册表、上游重试、对冲与限流、可续传流缓冲区的统计"""
+    return {
+        "configurations": config_registry.stats(),
+        "clients": client_registry.stats(),
+        "retries": upstream_retry.stats(),
+        "hedging": upstream_hedge.stats(),
+        "rate_limits": upstream_limiter.stats(),
+        "streams": resumable_stream.stats()
+    }
+
+@app.get("/v1/breakers")
+async def get_breakers(api_key: str = Depends(verify_api_key)):
+    """获取各上游端点的熔断状态"""
+    return {"enabled": upstream_breaker.BREAKER_ENABLED, "circuits": upstream_breaker.snapshot()}
+
+@app.post("/v1/breakers/reset")
+async def reset_breakers(circuit_id: Optional[str] = None, api_key: str = Depends(verify_api_key)):
+    """手动关闭熔断（不指定 circuit_id 时关闭全部）"""
+    count = upstream_breaker.reset(circuit_id)
+    if circuit_id and not count:
+        raise HTTPException(status_code=404, detail=f"熔断器 {circuit_id} 不存在")
+    return {"reset": count}
+
 # Chat completion endpoint with configuration support
 @app.post("/v1/chat/completions")
 async def chat_completions(
@@ -380,16 +475,25 @@ async def chat_completions(
     tool_choice: Optional[Dict[str, Any]] = Body(None),
     enable_thinking: Optional[bool] = Body(False),
     thinking_budget_tokens: Optional[int] = Body(2000),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     api_key: str = Depends(verify_api_key),
 ):
     """聊天补全API，兼容OpenAI格式"""
     try:
+        # 携带 Last-Event-ID 重连时补发断开期间的内容，不重新生成
+        if stream:
+            resumed = resumable_stream.resume_response(request)
+            if resumed is not None:
+                return resumed
+        
         # 记录请求
         logger.info(f"接收到聊天补全请求: model={model}, messages_count={len(messages)}, stream={stream}")
         
+        # 配置注册表过期时在线程中重建，之后的查表不访问数据库
+        await config_registry.refresh()
+        
         # 检查是否是角色请求（支持两种格式: role-ID 或 role_ID）
-        role_match = re.match(r"role[-_](\d+)", model)
+        role_match = ROLE_MODEL_PATTERN.match(model)
         if role_match:
             role_id = int(role_match.group(1))
             logger.info(f"识别为角色请求: role_id={role_id}")
@@ -400,18 +504,15 @@ async def chat_completions(
                 logger.warning(f"收到字符串格式消息，转换为标准格式")
                 messages = [{"role": "user", "content": messages}]
             
-            # 创建角色处理器
-            processor = RoleProcessor(db, role_id)
+            # 创建角色处理器（单角色对话只读配置注册表，不需要数据库会话）
+            processor = RoleProcessor(None, role_id)
             
             # 处理请求
             if stream:
                 # 流式响应
                 logger.info("使用流式响应")
                 result = await processor.process_request(messages, stream=True)
-                return StreamingResponse(
-                    convert_coroutine_to_stream(result),
-                    media_type="text/event-stream"
-                )
+                return resumable_stream.stream_response(convert_coroutine_to_stream(result))
             else:
                 # 普通响应
                 logger.info("使用普通响应")
@@ -441,14 +542,19 @@ async def chat_completions(
                 }
         
         # 处理讨论组请求（支持两种格式: group-ID 或 group_ID）
-        group_match = re.match(r"group[-_](\d+)", model)
+        group_match = GROUP_MODEL_PATTERN.match(model)
         if group_match:
             try:
                 group_id = int(group_match.group(1))
                 logger.info(f"识别为讨论组请求: group_id={group_id}")
                 
-                processor = DiscussionProcessor(db)
-                processor.adapter = MeetingAdapter(db)
+                if config_registry.get_group(group_id) is None:
+                    raise ValueError(f"讨论组ID {group_id} 不存在")
+                
+                # 用异步会话加载讨论组及成员角色，会议过程中的模型查询走配置注册表，不再需要同步会话
+                group = await MeetingAdapter.load_discussion_group_async(db, group_id)
+                processor = DiscussionProcessor(None)
+                processor.adapter = MeetingAdapter(None)
                 processor.group_id = group_id
                 
                 # 获取最后一条消息作为提示
@@ -457,19 +563,17 @@ async def chat_completions(
                 if stream:
                     # 创建处理协程的流式响应
                     # 先启动会议获取会议ID
-                    meeting_id = processor.start_meeting(group_id, prompt)
+                    meeting_id = processor.start_meeting(group_id, prompt, group=group)
                     logger.info(f"启动会议成功，meeting_id={meeting_id}")
                     
                     # 创建流式响应，带上会议ID头
-                    response = StreamingResponse(
+                    return resumable_stream.stream_response(
                         convert_coroutine_to_stream(processor.process_request(prompt, stream=True, meeting_id=meeting_id)),
-                        media_type="text/event-stream"
+                        headers={"X-Meeting-Id": meeting_id}
                     )
-                    response.headers["X-Meeting-Id"] = meeting_id
-                    return response
                 else:
                     # 非流式模式下先启动会议，以保证一致性
-                    meeting_id = processor.start_meeting(group_id, prompt)
+                    meeting_id = processor.start_meeting(group_id, prompt, group=group)
                     logger.info(f"启动会议成功，meeting_id={meeting_id}")
                     
                     # 使用现有会议ID处理请求
@@ -484,78 +588,29 @@ async def chat_completions(
             # 记录常规模型请求参数
             logger.info(f"处理常规模型请求: model={model}, enable_thinking={enable_thinking}, thinking_budget_tokens={thinking_budget_tokens}")
             
-            # 尝试判断是否是模型ID
-            try:
-                model_id = int(model)
-                # 如果是数字，先通过ID查找模型
-                db_model = db.query(DBModel).filter(DBModel.id == model_id).first()
-                if db_model:
-                    # 使用模型名称查找配置
-                    config = db.query(DBConfiguration).filter(
-                        DBConfiguration.name == db_model.name,
-                        DBConfiguration.is_active == True
-                    ).first()
-                    
-                    if not config:
-                        # 如果没有找到配置，尝试创建一个临时配置使用该模型
-                        logger.info(f"未找到模型ID {model_id} 的配置，使用单一模型直接调用")
-                        # 创建临时步骤
-                        steps = [{
-                            'model': db_model,
-                            'step_type': "both",  # 同时处理思考和执行
-                            'system_prompt': "",
-                            'tools': tools,
-                            'tool_choice': tool_choice,
-                            'enable_thinking': enable_thinking,
-                            'thinking_budget_tokens': thinking_budget_tokens
-                        }]
-                        
-                        processor = MultiStepModelCollaboration(steps=steps)
-                        
-                        # 处理请求
-                        if stream:
-                            return StreamingResponse(
-                                processor.process_with_stream(messages),
-                                media_type="text/event-stream"
-                            )
-                        else:
-                            response = await processor.process_without_stream(messages)
-                            return response
-                else:
-                    # 如果未找到对应ID的模型，尝试按名称查找配置
-                    config = db.query(DBConfiguration).filter(
-                        DBConfiguration.name == model,
-                        DBConfiguration.is_active == True
-                    ).first()
-            except ValueError:
-                # 如果不是数字，尝试按名称查找配置
-                config = db.query(DBConfiguration).filter(
-                    DBConfiguration.name == model,
-                    DBConfiguration.is_active == True
-                ).first()
+            # 从配置注册表解析路由计划（不访问数据库）
+            plan = config_registry.resolve_model_route(model)
             
             # 如果仍未找到配置，返回错误
-            if not config:
+            if plan is None:
                 raise HTTPException(status_code=404, detail=f"No active configuration found for model {model}")
             
-            # 获取配置步骤
-            steps = db.query(ConfigurationStep).filter(
-                ConfigurationStep.configuration_id == config.id
-            ).order_by(ConfigurationStep.step_order).all()
-            
-            if not steps:
+            if not plan.steps:
                 raise HTTPException(status_code=404, detail="Configuration has no steps")
             
+            # 单一模型直接调用时同时处理思考和执行，工具参数对所有步骤生效
+            single_model = plan.id is None
+            
             # 更新步骤配置
             steps = [{
-                'model': db.query(DBModel).get(step.model_id),
+                'model': step.model,
                 'step_type': step.step_type,
                 'system_prompt': step.system_prompt,
-                'tools': tools if step.step_type == "execution" else None,
-                'tool_choice': tool_choice if step.step_type == "execution" else None,
+                'tools': tools if single_model or step.step_type == "execution" else None,
+                'tool_choice': tool_choice if single_model or step.step_type == "execution" else None,
                 'enable_thinking': enable_thinking,
                 'thinking_budget_tokens': thinking_budget_tokens
-            } for step in steps]
+            } for step in plan.steps]
             
             processor = MultiStepModelCollaboration(steps=steps)
             
@@ -564,10 +619,7 @@ async def chat_completions(
             
             # 处理请求
             if stream:
-                return StreamingResponse(
-                    processor.process_with_stream(messages),
-                    media_type="text/event-stream"
-                )
+                return resumable_stream.stream_response(processor.process_with_stream(messages))
             else:
                 response = await processor.process_without_stream(messages)
                 return response
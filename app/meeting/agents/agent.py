@@ -1,14 +1,16 @@
-from langchain_openai import ChatOpenAI
 from langchain.schema import SystemMessage, HumanMessage, AIMessage
 from typing import Dict, List, Optional, Any
 import time
-import random
 import logging
 import traceback
 import asyncio
-import json
-import requests
-import aiohttp
+from app.clients.transport import get_aiohttp_session, run_sync
+from app.clients.retry import UpstreamStatusError, call_with_retry, retry_stream, is_retryable
+from app.clients import registry as client_registry
+from app.clients import breaker
+from app.clients import limiter
+from app.clients.sse import iter_sse_data
+from app.utils import json_codec
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -60,8 +62,8 @@ class Agent:
             if self.api_key and "api_key" not in self.model_params:
                 self.model_params["api_key"] = self.api_key
                 
-            # 创建LLM实例
-            self.llm = ChatOpenAI(**self.model_params)
+            # 获取LLM实例（相同配置的实例在进程内共享）
+            self.llm = client_registry.get_chat_llm(self.model_params)
             logger.info(f"已初始化智能体 {self.name} 的LLM模型: {model_name}")
         except Exception as e:
             logger.error(f"初始化LLM实例失败: {str(e)}", exc_info=True)
@@ -87,6 +89,10 @@ class Agent:
         return prompt
     
     def generate_response(self, prompt: str, context: List[Dict[str, str]] = None) -> str:
+        """生成回应（同步包装，供遗留调用方使用）"""
+        return run_sync(self.generate_response_async(prompt, context))
+    
+    async def generate_response_async(self, prompt: str, context: List[Dict[str, str]] = None) -> str:
         """生成回应"""
         try:
             # 构建消息
@@ -103,7 +109,7 @@ class Agent:
             messages.append({"role": "user", "content": prompt})
             
             # 调用API
-            response = self._call_api(messages)
+            response = await self._call_api_async(messages)
             
             return response
         except Exception as e:
@@ -141,6 +147,10 @@ class Agent:
             yield chunk
     
     def _call_api(self, messages):
+        """调用LLM API生成响应（同步包装，供遗留调用方使用）"""
+        return run_sync(self._call_api_async(messages))
+    
+    async def _call_api_async(self, messages):
         """调用LLM API生成响应"""
         try:
             # 确保API基本URL存在并有效
@@ -167,31 +177,53 @@ class Agent:
                 headers["Authorization"] = f"Bearer {api_key}"
                 logger.info("使用API密钥进行请求")
             
-            # 发送请求
-            logger.info(f"发送API请求: messages_count={len(messages)}")
-            start_time = time.time()
-            response = requests.post(
-                url,
-                json=data,
-                headers=headers
-            )
-            end_time = time.time()
-            logger.info(f"API响应时间: {end_time - start_time:.2f}秒, 状态码: {response.status_code}")
-            
-            # 解析响应
-            if response.status_code == 200:
-                result = response.json()
-                content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-                logger.info(f"API响应成功: content_length={len(content)}")
-                return result
-            else:
-                error_text = response.text
-                logger.error(f"API请求失败: 状态码={response.status_code}, 错误={error_text[:200]}")
-                raise Exception(f"API请求失败: {response.status_code} {error_text[:200]}")
+            return await self._post_chat_completion(url, data, headers)
         except Exception as e:
             logger.error(f"API调用发生异常: {str(e)}", exc_info=True)
             raise
     
+    async def _post_chat_completion(self, url: str, data: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        """通过共享连接池发送非流式请求（按统一重试策略重试），返回响应JSON"""
+        logger.info(f"发送API请求: messages_count={len(data.get('messages', []))}")
+        start_time = time.time()
+        
+        async def post_once():
+            session = get_aiohttp_session()
+            async with session.post(url, json=data, headers=headers) as response:
+                logger.info(f"API响应时间: {time.time() - start_time:.2f}秒, 状态码: {response.status}")
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"API请求失败: 状态码={response.status}, 错误={error_text[:200]}")
+                    raise UpstreamStatusError(response.status, error_text[:200], response.headers)
+                return await response.json(loads=json_codec.loads, content_type=None)
+        
+        result = await call_with_retry(post_once, name=f"{self.name} 的API请求",
+                                       circuit=self._circuit(url), quota=self._quota(data, url))
+        content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+        logger.info(f"API响应成功: content_length={len(content)}")
+        return result
+    
+    def _circuit(self, url: Optional[str] = None):
+        """智能体所用上游端点的熔断器（熔断中的请求直接失败，不等待超时）"""
+        api_key = self.api_key or self.model_params.get("api_key")
+        return breaker.get_circuit(self.provider, url or self.base_url or self.model_params.get("base_url"), api_key)
+    
+    def _quota(self, payload: Any, url: Optional[str] = None):
+        """智能体所用上游端点的限流凭据（按密钥排队，避免多个讨论组同时触发 429）"""
+        api_key = self.api_key or self.model_params.get("api_key")
+        return limiter.quota(url or self.base_url or self.model_params.get("base_url"), api_key, payload)
+    
+    async def _open_chat_stream(self, url: str, headers: Dict[str, str], payload: Dict[str, Any]):
+        """发送一次流式请求，逐个返回 SSE data 负载，非 200 响应抛出 UpstreamStatusError"""
+        session = get_aiohttp_session()
+        async with session.post(url, headers=headers, json=payload) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                logger.error(f"流式API请求失败: 状态码={response.status}, 错误={error_text[:200]}")
+                raise UpstreamStatusError(response.status, error_text, response.headers)
+            async for data in iter_sse_data(response.content.iter_any()):
+                yield data
+    
     async def _call_api_stream(self, messages: List[Dict[str, str]]):
         """流式调用API"""
         # 确保API基本URL存在并有效
@@ -218,36 +250,31 @@ class Agent:
             "stream": True
         }
         
-        # 发送请求
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                url,
-                headers=headers,
-                json=data
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    logger.error(f"流式API请求失败: 状态码={response.status}, 错误={error_text[:200]}")
-                    raise Exception(f"API调用失败: {response.status} {error_text}")
-                
-                # 处理流式响应
-                buffer = ""
-                async for line in response.content:
-                    line = line.decode('utf-8').strip()
-                    if line.startswith('data: ') and line != 'data: [DONE]':
-                        try:
-                            data = json.loads(line[6:])
-                            if 'choices' in data and len(data['choices']) > 0:
-                                delta = data['choices'][0].get('delta', {})
-                                if 'content' in delta:
-                                    content = delta['content']
-                                    buffer += content
-                                    yield {"text": content}
-                        except json.JSONDecodeError as e:
-                            logger.error(f"解析流式响应JSON失败: {e}, line: {line[:100]}")
+        # 发送请求（收到第一个数据块之前的可重试错误会重试）
+        buffer = ""
+        async for payload in retry_stream(lambda: self._open_chat_stream(url, headers, data),
+                                          name=f"{self.name} 的流式API请求", circuit=self._circuit(url),
+                                          quota=self._quota(data, url)):
+            payload = payload.strip()
+            if payload and payload != '[DONE]':
+                try:
+                    chunk = json_codec.loads(payload)
+                    if 'choices' in chunk and len(chunk['choices']) > 0:
+                        delta = chunk['choices'][0].get('delta', {})
+                        if 'content' in delta:
+                            content = delta['content']
+                            buffer += content
+                            yield {"text": content}
+                except json_codec.JSONDecodeError as e:
+                    logger.error(f"解析流式响应JSON失败: {e}, line: {payload[:100]}")
     
     def speak(self, meeting_topic: str, meeting_mode: str, 
               current_context: str, mode_specific_prompt: str = "") -> str:
+        """智能体发言（同步包装，供遗留调用方使用）"""
+        return run_sync(self.speak_async(meeting_topic, meeting_mode, current_context, mode_specific_prompt))
+    
+    async def speak_async(self, meeting_topic: str, meeting_mode: str, 
+                          current_context: str, mode_specific_prompt: str = "") -> str:
         """智能体发言"""
         try:
             # 构建提示信息
@@ -280,7 +307,7 @@ class Agent:
             messages.append({"role": "user", "content": prompt})
             
             # 使用直接API调用
-            response_content = self._call_api_directly(messages)
+            response_content = await self._call_api_directly_async(messages)
             
             # 如果使用LangChain类，则更新会话历史
             if self.llm is not None:
@@ -298,6 +325,10 @@ class Agent:
             return f"[出错] {self.name} 尝试回应，但遇到了技术问题。错误消息: {str(e)}"
     
     def _call_api_directly(self, messages: List[Dict[str, str]]) -> str:
+        """直接调用模型API（同步包装，供遗留调用方使用）"""
+        return run_sync(self._call_api_directly_async(messages))
+    
+    async def _call_api_directly_async(self, messages: List[Dict[str, str]]) -> str:
         """直接调用模型API，避免使用LangChain的消息格式转换"""
         try:
             # 确保API基本URL存在并有效
@@ -333,27 +364,8 @@ class Agent:
                 headers["Authorization"] = f"Bearer {api_key}"
                 logger.info("使用API密钥进行请求")
             
-            # 发送请求
-            logger.info(f"发送直接API请求: messages_count={len(messages)}")
-            start_time = time.time()
-            response = requests.post(
-                url,
-                json=data,
-                headers=headers
-            )
-            end_time = time.time()
-            logger.info(f"API响应时间: {end_time - start_time:.2f}秒, 状态码: {response.status_code}")
-            
-            # 解析响应
-            if response.status_code == 200:
-                result = response.json()
-                content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-                logger.info(f"API响应成功: content_length={len(content)}")
-                return content
-            else:
-                error_text = response.text
-                logger.error(f"API请求失败: 状态码={response.status_code}, 错误={error_text[:200]}")
-                raise Exception(f"API请求失败: {response.status_code} {error_text[:200]}")
+            result = await self._post_chat_completion(url, data, headers)
+            return result.get("choices", [{}])[0].get("message", {}).get("content", "")
         except Exception as e:
             logger.error(f"直接API调用发生异常: {str(e)}", exc_info=True)
             raise
@@ -385,102 +397,81 @@ class Agent:
                 
         return "gpt-3.5-turbo"  # 最终备选
     
-    def _invoke_with_smart_retry(self, messages):
-        """带有智能重试机制的LLM调用方法"""
+    async def _invoke_with_smart_retry(self, messages):
+        """按统一重试策略调用LLM，主模型重试用尽后切换到备用模型再试一轮"""
         # 如果llm未初始化，尝试初始化
         if self.llm is None:
             try:
                 logger.info(f"{self.name} 尝试初始化LLM模型...")
-                self.llm = ChatOpenAI(**self.model_params)
+                self.llm = client_registry.get_chat_llm(self.model_params)
                 logger.info(f"{self.name} 成功初始化LLM模型")
             except Exception as e:
                 logger.error(f"{self.name} 初始化LLM模型失败: {str(e)}")
                 raise ValueError(f"无法初始化LLM模型: {str(e)}")
         
-        max_retries = 5  # 最大重试次数
-        base_delay = 2  # 基础延迟（秒）
-        max_delay = 60  # 最大延迟（秒）
-        
-        # 可重试的错误类型
-        retryable_errors = [
-            "RateLimitError",  # 速率限制
-            "ServiceUnavailableError",  # 服务不可用
-            "APITimeoutError",  # API超时
-            "APIConnectionError",  # 连接错误
-            "RESOURCE_EXHAUSTED"  # 资源耗尽（通常在错误消息中）
-        ]
-        
-        attempt = 0
-        last_error = None
+        try:
+            return await call_with_retry(lambda: self.llm.ainvoke(messages), name=f"{self.name} 的LLM调用",
+                                         circuit=self._circuit(), quota=self._quota(messages))
+        except Exception as e:
+            if not is_retryable(e):
+                logger.warning(f"{self.name} 遇到不可重试的错误: {str(e)}")
+                raise
+            
+            # 主模型持续不可用，切换到备用模型
+            original_model = self.model_params.get("model_name")
+            fallback_model = self._get_fallback_model()
+            logger.info(f"{self.name} 切换到备用模型 {fallback_model}（原模型: {original_model}）")
+            self.model_params["model_name"] = fallback_model
+            self.llm = client_registry.get_chat_llm(self.model_params)
+            return await call_with_retry(lambda: self.llm.ainvoke(messages), name=f"{self.name} 的LLM调用（备用模型）",
+                                         circuit=self._circuit(), quota=self._quota(messages))
+    
+    def to_snapshot(self) -> Dict[str, Any]:
+        """
+        导出可持久化的智能体状态（供会议存储在其他进程中重建智能体）
         
-        while attempt <= max_retries:
-            try:
-                # 如果这是重试，考虑切换到备用模型
-                if attempt > 2:  # 在尝试2次主模型后，尝试备用模型
-                    # 保存旧模型参数
-                    original_model = self.model_params.get("model_name")
-                    
-                    # 切换到备用模型
-                    fallback_model = self._get_fallback_model()
-                    logger.info(f"{self.name} 切换到备用模型 {fallback_model}（原模型: {original_model}）")
-                    
-                    # 更新模型参数
-                    self.model_params["model_name"] = fallback_model
-                    
-                    # 重新创建LLM实例
-                    self.llm = ChatOpenAI(**self.model_params)
-                    logger.info(f"{self.name} 正在使用备用模型 {fallback_model} 进行第 {attempt} 次重试...")
-                elif attempt > 0:
-                    logger.info(f"{self.name} 正在使用原始模型进行第 {attempt} 次重试...")
-                
-                return self.llm.invoke(messages)
-                
-            except Exception as e:
-                last_error = e
-                error_str = str(e)
-                error_type = type(e).__name__
-                
-                # 决定是否应该重试这个错误
-                should_retry = False
-                for retry_error in retryable_errors:
-                    if retry_error in error_type or retry_error in error_str:
-                        should_retry = True
-                        break
-                
-                if not should_retry:
-                    logger.warning(f"{self.name} 遇到不可重试的错误: {error_str}")
-                    raise  # 不可重试的错误，直接抛出
-                
-                attempt += 1
-                
-                if attempt > max_retries:
-                    logger.error(f"{self.name} 达到最大重试次数 {max_retries}，放弃重试")
-                    raise  # 重试次数用完，抛出最后的错误
-                
-                # 计算延迟时间（指数退避 + 抖动）
-                delay = min(max_delay, base_delay * (2 ** (attempt - 1)))
-                jitter = random.uniform(0, 0.1 * delay)  # 添加0-10%的随机抖动
-                delay = delay + jitter
-                
-                logger.info(f"{self.name} 遇到可重试错误: {error_str}，将在 {delay:.2f} 秒后重试")
-                
-                # 如果是速率限制错误，尝试提取等待时间
-                if "RateLimitError" in error_type:
-                    # 有些API会在错误消息中提供建议的等待时间
-                    try:
-                        if "retry_after" in error_str.lower():
-                            parts = error_str.split("retry_after:")
-                            if len(parts) > 1:
-                                retry_after = float(parts[1].strip().split()[0])
-                                delay = max(delay, retry_after + jitter)
-                                logger.info(f"从错误中提取到重试时间: {retry_after} 秒")
-                    except:
-                        pass  # 提取失败，使用计算出的延迟时间
-                
-                time.sleep(delay)
+        返回:
+            Dict[str, Any]: 可 JSON 序列化的智能体状态
+        """
+        return {
+            "type": "agent",
+            "name": self.name,
+            "role_description": self.role_description,
+            "personality": self.personality,
+            "skills": list(self.skills or []),
+            "model_params": dict(self.model_params or {}),
+            "base_url": self.base_url,
+            "api_key": self.api_key,
+            "last_response": self.last_response,
+            # 只保留字典形式的对话记录，langchain 消息对象不可序列化
+            "conversation_history": [
+                entry for entry in (self.conversation_history or []) if isinstance(entry, dict)
+            ]
+        }
+    
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any]) -> "Agent":
+        """
+        由 to_snapshot() 导出的状态重建智能体
         
-        # 这行代码理论上不会执行到，因为循环内部会在达到最大重试次数时抛出异常
-        raise last_error
+        参数:
+            snapshot: 智能体状态
+            
+        返回:
+            Agent: 重建的智能体
+        """
+        agent = cls(
+            name=snapshot["name"],
+            role_description=snapshot.get("role_description", ""),
+            personality=snapshot.get("personality", ""),
+            skills=snapshot.get("skills") or [],
+            model_params=dict(snapshot.get("model_params") or {}) or None,
+            base_url=snapshot.get("base_url"),
+            api_key=snapshot.get("api_key")
+        )
+        agent.last_response = snapshot.get("last_response", "")
+        agent.conversation_history = list(snapshot.get("conversation_history") or [])
+        return agent
     
     def update_history(self, global_meeting_history: List[Dict[str, str]]):
         """更新全局会议历史到智能体的感知中"""
@@ -492,6 +483,10 @@ class Agent:
                 )) 
     
     def generate_chat_response(self, messages: List[Dict[str, str]]) -> str:
+        """根据消息历史生成聊天响应（同步包装，供遗留调用方使用）"""
+        return run_sync(self.generate_chat_response_async(messages))
+    
+    async def generate_chat_response_async(self, messages: List[Dict[str, str]]) -> str:
         """
         根据消息历史生成聊天响应
         
@@ -514,7 +509,7 @@ class Agent:
         
         try:
             # 调用API
-            response = self._call_api_with_messages(messages)
+            response = await self._call_api_with_messages(messages)
             
             # 返回生成的响应
             return response
@@ -551,6 +546,33 @@ class Agent:
             logger.error(f"流式生成聊天响应时出错: {str(e)}")
             yield f"抱歉，我在处理您的请求时遇到了问题: {str(e)}"
     
+    async def _call_api_with_messages(self, messages: List[Dict[str, str]]) -> str:
+        """调用API并获取完整响应（与流式接口使用相同的端点）"""
+        if self.provider == "google":
+            # GeminiClient 只提供流式接口，收集完整内容
+            chunks = []
+            async for chunk in self._call_api_with_messages_stream(messages):
+                chunks.append(chunk)
+            return "".join(chunks)
+
+        base_url = self.base_url or self.model_params.get("base_url") or "http://localhost:8000"
+        api_endpoint = "/v1/chat/completions"
+        full_url = base_url if base_url.endswith(api_endpoint) else f"{base_url}{api_endpoint}"
+
+        headers = {"Content-Type": "application/json"}
+        api_key = self.api_key or self.model_params.get("api_key")
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+
+        payload = {
+            "model": self.model_params.get("model_name", "gpt-3.5-turbo"),
+            "messages": messages,
+            "temperature": self.model_params.get("temperature", 0.7),
+            "max_tokens": self.model_params.get("max_tokens", 1000),
+        }
+        result = await self._post_chat_completion(full_url, payload, headers)
+        return result.get("choices", [{}])[0].get("message", {}).get("content", "")
+
     async def _call_api_with_messages_stream(self, messages: List[Dict[str, str]]):
         """调用API并获取流式响应"""
         model_name = self.model_params.get("model_name", "gpt-3.5-turbo")
@@ -558,7 +580,7 @@ class Agent:
         # 对于Gemini模型，使用GeminiClient处理
         if self.provider == "google":
             try:
-                from app.clients.gemini_client import GeminiClient
+                from app.clients.gemini_client import DEFAULT_API_URL
                 
                 # 获取API密钥
                 api_key = self.api_key
@@ -568,8 +590,8 @@ class Agent:
                 if not api_key:
                     raise ValueError("使用Gemini API需要有效的API密钥")
                 
-                # 创建GeminiClient实例
-                gemini_client = GeminiClient(api_key=api_key)
+                # 从注册表获取共享的GeminiClient实例
+                gemini_client = client_registry.get_provider_client("google", api_key, DEFAULT_API_URL, False)
                 
                 # 转换消息格式为Gemini格式
                 gemini_messages = []
@@ -640,44 +662,31 @@ class Agent:
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(full_url, 
-                                        headers=headers, 
-                                        json=payload) as response:
-                    # 检查响应
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"API调用失败: {response.status} - {error_text}")
+            async for data in retry_stream(lambda: self._open_chat_stream(full_url, headers, payload),
+                                           name=f"{self.name} 的流式API请求", circuit=self._circuit(full_url),
+                                           quota=self._quota(payload, full_url)):
+                data = data.strip()
+                
+                # 如果是空行，跳过
+                if not data:
+                    continue
+                
+                # 处理特殊的[DONE]标记
+                if data == "[DONE]":
+                    break
+                
+                try:
+                    json_data = json_codec.loads(data)
+                    choices = json_data.get("choices", [])
                     
-                    # 处理流式响应
-                    buffer = ""
-                    async for line in response.content:
-                        line = line.decode('utf-8')
-                        
-                        # 如果是空行，跳过
-                        if not line.strip():
-                            continue
+                    if choices and len(choices) > 0:
+                        delta = choices[0].get("delta", {})
+                        content = delta.get("content", "")
                         
-                        # 处理数据行
-                        if line.startswith("data: "):
-                            data = line[6:].strip()
-                            
-                            # 处理特殊的[DONE]标记
-                            if data == "[DONE]":
-                                break
-                            
-                            try:
-                                json_data = json.loads(data)
-                                choices = json_data.get("choices", [])
-                                
-                                if choices and len(choices) > 0:
-                                    delta = choices[0].get("delta", {})
-                                    content = delta.get("content", "")
-                                    
-                                    if content:
-                                        yield content
-                            except json.JSONDecodeError:
-                                continue
+                        if content:
+                            yield content
+                except json_codec.JSONDecodeError:
+                    continue
         except Exception as e:
             logger.error(f"流式API调用出错: {str(e)}", exc_info=True)
             yield f"\n\n[错误: {str(e)}]" 
\ No newline at end of file
@@ -1,6 +1,7 @@
 from typing import Dict, List, Optional, Any, AsyncGenerator
 import logging
 import asyncio
+import os
 import time
 from app.meeting.agents.agent import Agent
 from datetime import datetime
@@ -8,6 +9,9 @@ from datetime import datetime
 # 设置日志
 logger = logging.getLogger(__name__)
 
+# 流式讨论轮到人类角色时挂起等待输入的默认秒数，0 表示不挂起（结束流，提交输入后重新发起）
+DEFAULT_INPUT_TIMEOUT = float(os.getenv("HUMAN_INPUT_TIMEOUT", "600"))
+
 class HumanAgent(Agent):
     """人类智能体，表示会议中的人类参与者"""
     
@@ -38,13 +42,19 @@ class HumanAgent(Agent):
         self.stream_lock = asyncio.Lock()
         self.is_waiting_input = False  # 是否等待人类输入
         self.pending_message = None  # 等待发送的消息
-        self.input_timeout = 600  # 默认等待人类输入的超时时间（秒）
+        self.input_timeout = DEFAULT_INPUT_TIMEOUT  # 默认等待人类输入的超时时间（秒）
         self.input_start_time = None  # 记录开始等待人类输入的时间
+        self._input_ready = False  # 本次等待的输入是否已提交
+        self._input_waiter = None  # 挂起等待输入的 (事件循环, asyncio.Event)
+        self.input_outcome = None  # 本次等待的结果：input（人类提交）或超时策略 skip/host/end/timeout
     
     def wait_for_input(self):
-        """设置为等待人类输入状态，并记录开始时间"""
+        """设置为等待人类输入状态，并记录开始时间（已在等待时保留原开始时间，重复调用不会推迟截止时间）"""
+        if not self.is_waiting_input or self.input_start_time is None:
+            self.input_start_time = time.time()
         self.is_waiting_input = True
-        self.input_start_time = time.time()
+        self._input_ready = False
+        self.input_outcome = None
         logger.info(f"人类智能体 {self.name} 等待输入")
         # 通知系统会议暂停，等待人类输入
         return True
@@ -67,6 +77,65 @@ class HumanAgent(Agent):
         logger.info(f"人类智能体 {self.name} 收到消息: {content[:50]}..., 当前轮次: {self.current_round}")
         return True
     
+    async def wait_for_human_input(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        挂起等待 wait_for_input() 之后提交的人类输入，结果见 input_outcome
+        
+        参数:
+            timeout: 最长等待秒数，默认使用 input_timeout
+            
+        返回:
+            Optional[str]: 写入会议历史的内容（人类输入或超时后的代发言/跳过说明），超时或没有内容时返回 None
+        """
+        if timeout is None:
+            timeout = self.input_timeout
+        if not self._input_ready:
+            event = asyncio.Event()
+            # 先登记等待者再检查状态，与 input_received() 的顺序相反，两边不会互相错过
+            self._input_waiter = (asyncio.get_running_loop(), event)
+            try:
+                if not self._input_ready:
+                    await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.info(f"人类智能体 {self.name} 在 {timeout} 秒内没有输入")
+                return None
+            finally:
+                self._input_waiter = None
+        
+        message = self.pending_message
+        self.pending_message = None
+        return message
+    
+    def input_received(self, outcome: str = "input") -> bool:
+        """
+        人类输入处理完毕（已写入会议历史并保存）后调用，唤醒挂起等待的会议流，可在任意线程调用
+        
+        参数:
+            outcome: input 表示人类提交了输入；等待超时时为超时策略（skip/host/end/timeout）
+        
+        返回:
+            bool: 是否有会议流正在等待该输入（为 True 时原会议流会继续输出，无需重新发起）
+        """
+        self.input_outcome = outcome
+        self._input_ready = True
+        waiter = self._input_waiter
+        if waiter is None:
+            return False
+        loop, event = waiter
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        try:
+            if running is loop:
+                event.set()
+            else:
+                loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # 事件循环已关闭
+            return False
+        return True
+    
     def get_input_wait_duration(self):
         """获取已等待人类输入的时间（秒）"""
         if not self.is_waiting_input or not self.input_start_time:
@@ -100,6 +169,15 @@ class HumanAgent(Agent):
         # 特殊标志，表示需要等待人类输入
         return f"[WAITING_FOR_HUMAN_INPUT:{self.name}]"
     
+    async def generate_response_async(self, prompt: str, context: List[Dict[str, Any]] = None) -> str:
+        """异步生成响应 - 与 generate_response 相同，人类智能体不调用模型"""
+        return self.generate_response(prompt, context)
+
+    async def speak_async(self, meeting_topic: str, meeting_mode: str,
+                          current_context: str, mode_specific_prompt: str = "") -> str:
+        """人类智能体发言：返回已提交的消息，没有时进入等待输入状态并返回等待标记"""
+        return self.generate_response(mode_specific_prompt)
+
     async def generate_response_stream(self, prompt: str, context: List[Dict[str, Any]] = None):
         """流式生成响应 - 对于人类智能体，返回等待人类输入的特殊标记"""
         # 检查是否已有待处理的消息
@@ -193,6 +271,40 @@ class HumanAgent(Agent):
             logger.error(f"人类智能体响应出错: {str(e)}", exc_info=True)
             return f"[错误] 无法获取 {self.name} 的响应。错误: {str(e)}"
     
+    def to_snapshot(self) -> Dict[str, Any]:
+        """导出可持久化的人类智能体状态（包含等待输入状态）"""
+        snapshot = super().to_snapshot()
+        snapshot.update({
+            "type": "human",
+            "current_round": self.current_round,
+            "human_responses": {str(round_id): response for round_id, response in self.human_responses.items()},
+            "pending_response": self.pending_response,
+            "pending_message": self.pending_message,
+            "host_role_name": self.host_role_name,
+            "is_waiting_input": self.is_waiting_input,
+            "input_timeout": self.input_timeout,
+            "input_start_time": self.input_start_time
+        })
+        return snapshot
+    
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any]) -> "HumanAgent":
+        """由 to_snapshot() 导出的状态重建人类智能体"""
+        agent = super().from_snapshot(snapshot)
+        agent.current_round = snapshot.get("current_round", 0)
+        # JSON 会把轮次键转为字符串，这里还原为整数
+        agent.human_responses = {
+            int(round_id) if str(round_id).lstrip("-").isdigit() else round_id: response
+            for round_id, response in (snapshot.get("human_responses") or {}).items()
+        }
+        agent.pending_response = snapshot.get("pending_response")
+        agent.pending_message = snapshot.get("pending_message")
+        agent.host_role_name = snapshot.get("host_role_name")
+        agent.is_waiting_input = bool(snapshot.get("is_waiting_input", False))
+        agent.input_timeout = snapshot.get("input_timeout", agent.input_timeout)
+        agent.input_start_time = snapshot.get("input_start_time")
+        return agent
+    
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典表示"""
         return {
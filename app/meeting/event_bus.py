@@ -0,0 +1,307 @@
+"""会议事件总线
+
+同一场会议的生成过程只运行一次，任意数量的观看者通过订阅事件总线实时获得事件
+（SSE /events 与 WebSocket /ws），上游模型调用次数与观看者数量无关。
+
+事件类型:
+- speaker_start: 发言者开始发言 {speaker, round}
+- token: 发言内容增量 {speaker, content}
+- message: 消息写入消息日志 {seq, agent, content, timestamp}（轮次记录另含 round）
+- waiting_for_human: 等待人类角色输入 {agent}
+- human_timeout: 人类角色等待输入超时并已按策略处理 {agent, policy}
+- round_complete: 一轮讨论完成 {round}
+- summary_delta / summary: 会议总结增量 / 完整总结 {content}
+- stream_end: 驱动会议的流式生成结束（完成、等待人类输入或出错）
+- dropped: 订阅者消费过慢被断开（只发给该订阅者）
+- closed: 会议被删除，总线关闭
+
+每个订阅者持有一个有界队列（MEETING_EVENT_QUEUE_SIZE），队列满时不阻塞发布者，
+而是清空该订阅者的队列、发送 dropped 后断开；客户端可以通过 /messages?since= 补齐。
+发布可以在任意线程进行（分发统一在事件循环中执行）；没有总线的会议发布事件只是一次字典查找。
+
+每条事件的 ID 为 <epoch>:<seq>（epoch 区分总线实例，总线重建后旧 ID 不会误匹配）。
+总线在环形缓冲区中保留最近的事件（MEETING_EVENT_REPLAY 条 / MEETING_EVENT_REPLAY_BYTES 字节），
+最后一个订阅者离开后总线继续保留 MEETING_EVENT_RETAIN 秒；携带 Last-Event-ID 重新订阅时
+先补发缺失的事件，再继续实时推送。
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每个订阅者队列的最大事件数
+DEFAULT_QUEUE_SIZE = int(os.getenv("MEETING_EVENT_QUEUE_SIZE", "1024"))
+# 每条总线重放缓冲区的最大事件数 / 估算字节数
+REPLAY_EVENTS = int(os.getenv("MEETING_EVENT_REPLAY", "512"))
+REPLAY_BYTES = int(os.getenv("MEETING_EVENT_REPLAY_BYTES", str(512 * 1024)))
+# 最后一个订阅者离开后总线保留的秒数（供断线重连补发）
+RETAIN_SECONDS = float(os.getenv("MEETING_EVENT_RETAIN", "60"))
+
+# 订阅者收到后应结束订阅的事件
+TERMINAL_EVENTS = ("dropped", "closed")
+
+
+class MeetingEvent:
+    """一条会议事件"""
+
+    __slots__ = ("seq", "type", "data", "ts", "size")
+
+    def __init__(self, seq: int, type: str, data: Dict[str, Any], ts: float):
+        self.seq = seq
+        self.type = type
+        self.data = data
+        self.ts = ts
+        # 估算占用：字符串字段的长度加固定开销
+        self.size = 64 + sum(len(value) for value in data.values() if isinstance(value, str))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"seq": self.seq, "type": self.type, "data": self.data, "ts": self.ts}
+
+
+class Subscription:
+    """事件总线的一个订阅者"""
+
+    __slots__ = ("bus", "queue", "dropped", "closed", "replayed", "missed")
+
+    def __init__(self, bus: "MeetingEventBus", maxsize: int):
+        self.bus = bus
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = False
+        self.closed = False
+        # 续订时补发的事件数 / 已不在缓冲区中无法补发的事件数
+        self.replayed = 0
+        self.missed = 0
+
+    def _offer(self, event: MeetingEvent) -> bool:
+        """投递事件（在事件循环中调用），队列已满返回 False"""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def _drop(self, event: MeetingEvent) -> None:
+        """丢弃积压的事件，只保留一条终止事件"""
+        self.dropped = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[MeetingEvent]:
+        """
+        取下一条事件
+
+        参数:
+            timeout: 最长等待秒数，None 表示一直等待
+
+        返回:
+            Optional[MeetingEvent]: 事件，超时返回 None
+        """
+        if timeout is None:
+            return await self.queue.get()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        """取消订阅"""
+        if not self.closed:
+            self.closed = True
+            self.bus.unsubscribe(self)
+
+
+class MeetingEventBus:
+    """单个会议的事件总线"""
+
+    def __init__(self, meeting_id: str, loop: asyncio.AbstractEventLoop):
+        self.meeting_id = meeting_id
+        self.epoch = uuid.uuid4().hex[:8]
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        # 写时复制，分发时无需加锁遍历
+        self._subscribers: tuple = ()
+        self._seq = 0
+        self._history: deque = deque()
+        self._history_bytes = 0
+        self.dropped = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def event_id(self, event: MeetingEvent) -> str:
+        """事件的 Last-Event-ID 形式"""
+        return f"{self.epoch}:{event.seq}"
+
+    def subscribe(self, maxsize: Optional[int] = None, after_seq: Optional[int] = None) -> Subscription:
+        """
+        添加订阅者（在事件循环中调用）
+
+        参数:
+            maxsize: 队列容量
+            after_seq: 续订时客户端收到的最后一个序号，缓冲区中更新的事件会先放入队列
+
+        返回:
+            Subscription: 订阅对象
+        """
+        subscription = Subscription(self, maxsize or DEFAULT_QUEUE_SIZE)
+        if after_seq is not None:
+            missed = [event for event in self._history if event.seq > after_seq]
+            subscription.replayed = len(missed)
+            subscription.missed = max(0, self._seq - after_seq - len(missed))
+            for event in missed[-subscription.queue.maxsize:]:
+                subscription.queue.put_nowait(event)
+        self._subscribers = self._subscribers + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """移除订阅者，最后一个订阅者离开后总线再保留 RETAIN_SECONDS 秒"""
+        with _lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscription)
+            empty = not self._subscribers
+        if empty:
+            if RETAIN_SECONDS > 0 and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._loop.call_later, RETAIN_SECONDS, self._expire)
+            else:
+                self._expire()
+
+    def _expire(self) -> None:
+        """保留期结束仍没有订阅者时从注册表中移除"""
+        with _lock:
+            if not self._subscribers and _buses.get(self.meeting_id) is self:
+                del _buses[self.meeting_id]
+
+    def publish(self, type: str, data: Dict[str, Any]) -> None:
+        """发布事件（任意线程）"""
+        if threading.get_ident() == self._loop_thread:
+            self._dispatch(type, data)
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch, type, data)
+        except RuntimeError:
+            # 事件循环已关闭（应用退出过程中）
+            pass
+
+    def _dispatch(self, type: str, data: Dict[str, Any]) -> None:
+        """在事件循环中分配序号并投递给所有订阅者"""
+        self._seq += 1
+        event = MeetingEvent(self._seq, type, data, time.time())
+        history = self._history
+        history.append(event)
+        self._history_bytes += event.size
+        while len(history) > 1 and (len(history) > REPLAY_EVENTS or self._history_bytes > REPLAY_BYTES):
+            self._history_bytes -= history.popleft().size
+        for subscription in self._subscribers:
+            if not subscription._offer(event):
+                # 慢消费者：断开而不是阻塞发布者或无限积压
+                self.dropped += 1
+                _stats["dropped"] += 1
+                subscription._drop(MeetingEvent(event.seq, "dropped", {"reason": "slow_consumer"}, event.ts))
+                self.unsubscribe(subscription)
+                logger.warning(f"会议 {self.meeting_id} 的订阅者消费过慢，已断开")
+
+
+_buses: Dict[str, MeetingEventBus] = {}
+_drivers: set = set()
+_lock = threading.Lock()
+_stats = {"published": 0, "subscriptions": 0, "resumes": 0, "dropped": 0}
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """解析 Last-Event-ID（<epoch>:<seq>），格式不符时返回 None"""
+    if not value:
+        return None
+    epoch, _, seq = value.strip().partition(":")
+    if not epoch or not seq.isdigit():
+        return None
+    return epoch, int(seq)
+
+
+def subscribe(meeting_id: str, maxsize: Optional[int] = None, last_event_id: Optional[str] = None) -> Subscription:
+    """
+    订阅会议事件（在事件循环中调用）
+
+    参数:
+        meeting_id: 会议ID
+        maxsize: 队列容量，默认 MEETING_EVENT_QUEUE_SIZE
+        last_event_id: 断线重连时客户端收到的最后一个事件ID，属于当前总线时先补发缺失的事件
+
+    返回:
+        Subscription: 订阅对象，用完后调用 close()
+    """
+    loop = asyncio.get_running_loop()
+    parsed = parse_event_id(last_event_id)
+    with _lock:
+        bus = _buses.get(meeting_id)
+        if bus is None:
+            bus = _buses[meeting_id] = MeetingEventBus(meeting_id, loop)
+        _stats["subscriptions"] += 1
+        after_seq = parsed[1] if parsed is not None and parsed[0] == bus.epoch else None
+        if after_seq is not None:
+            _stats["resumes"] += 1
+        return bus.subscribe(maxsize, after_seq)
+
+
+def publish(meeting_id: str, type: str, data: Dict[str, Any]) -> None:
+    """
+    发布会议事件，没有订阅者时直接返回
+
+    参数:
+        meeting_id: 会议ID
+        type: 事件类型
+        data: 事件数据（可 JSON 序列化）
+    """
+    bus = _buses.get(meeting_id)
+    if bus is not None:
+        _stats["published"] += 1
+        bus.publish(type, data)
+
+
+def has_subscribers(meeting_id: str) -> bool:
+    """会议当前是否有事件总线（有订阅者或处于保留期，构造事件数据代价较高时先检查）"""
+    return meeting_id in _buses
+
+
+def claim_driver(meeting_id: str) -> bool:
+    """登记为会议的流式生成驱动者，已有驱动者时返回 False"""
+    with _lock:
+        if meeting_id in _drivers:
+            return False
+        _drivers.add(meeting_id)
+        return True
+
+
+def release_driver(meeting_id: str) -> None:
+    """驱动结束，通知订阅者 stream_end"""
+    with _lock:
+        _drivers.discard(meeting_id)
+    publish(meeting_id, "stream_end", {})
+
+
+def is_driving(meeting_id: str) -> bool:
+    """会议当前是否正在被某个流式请求驱动"""
+    return meeting_id in _drivers
+
+
+def close(meeting_id: str) -> None:
+    """会议被删除时关闭总线"""
+    publish(meeting_id, "closed", {})
+
+
+def stats() -> Dict[str, Any]:
+    """返回事件总线统计信息"""
+    buses = list(_buses.values())
+    return {
+        "buses": len(buses),
+        "subscribers": sum(bus.subscriber_count for bus in buses),
+        "replay_bytes": sum(bus._history_bytes for bus in buses),
+        "drivers": len(_drivers),
+        **_stats,
+    }
@@ -0,0 +1,318 @@
+"""人类输入截止时间
+
+HumanAgent 记录了 input_timeout，但之前没有任何地方检查：缺席的人类角色会让会议一直
+占用内存（智能体、上游客户端与消息历史），轮询请求也一直打在它上面。
+
+这里用一个最小堆按截止时间排列所有等待中的人类输入，事件循环上只挂一个定时器
+（指向最早的截止时间），不为每个会议创建任务。到期时按讨论组的策略处理：
+
+- skip: 跳过该人类角色（在会议记录中注明），会议继续
+- host: 由人类角色寄生的角色（Role.host_role_id）代为发言，没有可用的宿主角色或生成失败时按 skip 处理
+- end: 结束会议；没有流式请求驱动的会议立即归档并从内存移除
+- wait: 不处理（原有行为），挂起等待的会议流结束，之后提交输入仍可继续
+
+策略取讨论组的 human_timeout_policy，未设置时取环境变量 HUMAN_TIMEOUT_POLICY（默认 skip）；
+截止时间为开始等待的时间加上人类角色的 input_timeout（讨论组的 human_input_timeout 或
+HUMAN_INPUT_TIMEOUT），input_timeout<=0 的等待不设截止时间。
+
+堆中的条目不主动删除：到期时核对该人类角色仍在等待同一次输入（input_start_time 相同），
+否则视为已过期的条目直接丢弃。
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.meeting import event_bus
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("skip", "host", "end", "wait")
+DEFAULT_POLICY = os.getenv("HUMAN_TIMEOUT_POLICY", "skip").strip().lower()
+# 宿主角色代为发言的最长生成时间（秒）
+HOST_REPLY_TIMEOUT = float(os.getenv("HUMAN_TIMEOUT_HOST_REPLY_TIMEOUT", "120"))
+# 挂起等待输入的会议流在截止时间之后再等待的秒数，只作兜底（正常由这里到期处理后唤醒）
+GRACE_SECONDS = 30
+
+ENDED_STATUS = "已结束"
+
+_lock = threading.Lock()
+# (截止时间, 序号, 会议ID, 人类角色名, 开始等待的时间)
+_heap: List[Tuple[float, int, str, str, float]] = []
+_counter = itertools.count()
+# 已登记的等待 (会议ID, 人类角色名) -> 开始等待的时间，同一次等待重复登记时不再入堆
+_watched: Dict[Tuple[str, str], float] = {}
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_timer: Optional[asyncio.TimerHandle] = None
+_timer_deadline: Optional[float] = None
+_stats = {"watched": 0, "expired": 0, "stale": 0, "errors": 0, **{policy: 0 for policy in POLICIES}}
+
+
+def resolve_policy(meeting) -> str:
+    """
+    返回会议的人类输入超时策略
+
+    参数:
+        meeting: 会议对象
+
+    返回:
+        str: skip / host / end / wait
+    """
+    policy = ((getattr(meeting, "group_info", None) or {}).get("human_timeout_policy") or DEFAULT_POLICY)
+    policy = str(policy).strip().lower()
+    if policy not in POLICIES:
+        logger.warning(f"未知的人类输入超时策略 {policy}，按 skip 处理")
+        return "skip"
+    return policy
+
+
+def watch(meeting_id: str, agent) -> bool:
+    """
+    登记一次人类输入等待（在 agent.wait_for_input() 之后调用，可在任意线程调用）
+
+    参数:
+        meeting_id: 会议ID
+        agent: 等待输入的人类智能体
+
+    返回:
+        bool: 是否设置了截止时间
+    """
+    timeout = getattr(agent, "input_timeout", None)
+    started = getattr(agent, "input_start_time", None)
+    if not timeout or timeout <= 0 or started is None:
+        return False
+    key = (meeting_id, agent.name)
+    with _lock:
+        if _watched.get(key) == started:
+            return True
+        _watched[key] = started
+        heapq.heappush(_heap, (started + timeout, next(_counter), meeting_id, agent.name, started))
+        _stats["watched"] += 1
+    _schedule()
+    return True
+
+
+def _schedule() -> None:
+    """在事件循环中重新设置定时器"""
+    global _loop
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is not None:
+        _loop = running
+        _arm()
+        return
+    loop = _loop
+    if loop is None or loop.is_closed():
+        # 还没有事件循环（应用启动前），start() 时再设置
+        return
+    try:
+        loop.call_soon_threadsafe(_arm)
+    except RuntimeError:
+        pass
+
+
+def _arm() -> None:
+    """让定时器指向堆顶的截止时间（在事件循环中调用）"""
+    global _timer, _timer_deadline
+    with _lock:
+        deadline = _heap[0][0] if _heap else None
+    if deadline is None or (_timer is not None and _timer_deadline <= deadline):
+        return
+    if _timer is not None:
+        _timer.cancel()
+    _timer_deadline = deadline
+    _timer = _loop.call_later(max(0.0, deadline - time.time()), _fire)
+
+
+def _fire() -> None:
+    """定时器到期：取出所有到期的条目逐个处理，再指向下一个截止时间"""
+    global _timer, _timer_deadline
+    _timer = _timer_deadline = None
+    now = time.time()
+    due = []
+    with _lock:
+        while _heap and _heap[0][0] <= now:
+            entry = heapq.heappop(_heap)
+            if _watched.get((entry[2], entry[3])) == entry[4]:
+                del _watched[(entry[2], entry[3])]
+            due.append(entry)
+    for _, _, meeting_id, agent_name, started in due:
+        _loop.create_task(_expire(meeting_id, agent_name, started))
+    _arm()
+
+
+def _still_waiting(agent, started: float) -> bool:
+    return bool(getattr(agent, "is_waiting_input", False)) and agent.input_start_time == started
+
+
+def _find_waiting(meeting_id: str, agent_name: str, started: float):
+    """取出仍在等待同一次输入的会议与人类智能体，条目已过期时返回 None"""
+    from app.meeting.store import get_meeting_store
+
+    try:
+        meeting_data = get_meeting_store()[meeting_id]
+    except KeyError:
+        return None
+    meeting = meeting_data.get("meeting")
+    if meeting is None or meeting.status == ENDED_STATUS:
+        return None
+    agent = next(
+        (a for a in meeting.agents if a.name == agent_name and getattr(a, "is_human", False)),
+        None
+    )
+    if agent is None or not _still_waiting(agent, started):
+        return None
+    return meeting, agent
+
+
+async def _host_reply(meeting, agent) -> Optional[str]:
+    """由人类角色的宿主角色代为发言，没有宿主角色或生成失败时返回 None"""
+    host = next(
+        (a for a in meeting.agents if a.name == agent.host_role_name and not getattr(a, "is_human", False)),
+        None
+    ) if agent.host_role_name else None
+    if host is None:
+        return None
+
+    prompt = meeting.mode.get_agent_prompt(
+        agent_name=agent.name,
+        agent_role=agent.role_description,
+        meeting_topic=meeting.topic,
+        current_round=meeting.current_round
+    )
+    prompt = f"{agent.name} 暂时无法发言，请你以 {agent.name}（{agent.role_description}）的身份代为发言。\n\n{prompt}"
+
+    async def generate() -> str:
+        chunks = []
+        async for chunk in host.generate_response_stream(prompt, meeting._get_current_context()):
+            chunks.append(chunk)
+        return "".join(chunks)
+
+    try:
+        content = await asyncio.wait_for(generate(), HOST_REPLY_TIMEOUT)
+    except Exception as e:
+        logger.error(f"宿主角色 {host.name} 代 {agent.name} 发言失败: {str(e)}", exc_info=True)
+        return None
+    content = content.strip()
+    if not content:
+        return None
+    return f"（由 {host.name} 代为发言）{content}"
+
+
+def _apply(meeting_id: str, meeting, agent, started: float, policy: str, content: Optional[str]) -> bool:
+    """按策略更新会议状态并保存（在线程池中执行），期间人类已经提交输入时返回 False"""
+    from app.meeting.store import get_meeting_store, save_meeting
+
+    if not _still_waiting(agent, started) or meeting.status == ENDED_STATUS:
+        return False
+
+    if policy == "end":
+        agent.is_waiting_input = False
+        agent.input_start_time = None
+        meeting.waiting_for_human_input = None
+        meeting.add_message("system", f"{agent.name} 未在 {agent.input_timeout:g} 秒内发言，会议结束")
+        meeting.status = ENDED_STATUS
+        meeting.end_time = datetime.now()
+        save_meeting(meeting_id)
+        # 正在驱动的会议由流结束后的淘汰任务归档
+        if not event_bus.is_driving(meeting_id):
+            get_meeting_store().release(meeting_id)
+        return True
+
+    if content is None:
+        content = f"（{agent.name} 未在 {agent.input_timeout:g} 秒内发言，已跳过）"
+    # 与提交人类输入相同的处理：写入会议历史并推进发言者，重新发起的流也会把该角色视为已发言
+    meeting.add_human_message(agent.name, content)
+    meeting.last_human_speaker = agent.name
+    if getattr(meeting, "waiting_for_human_input", None) == agent.name:
+        meeting.waiting_for_human_input = None
+    save_meeting(meeting_id)
+    return True
+
+
+async def _expire(meeting_id: str, agent_name: str, started: float) -> None:
+    """处理一个到期的人类输入等待"""
+    try:
+        found = await asyncio.to_thread(_find_waiting, meeting_id, agent_name, started)
+        if found is None:
+            _stats["stale"] += 1
+            return
+        meeting, agent = found
+        policy = resolve_policy(meeting)
+        _stats["expired"] += 1
+        logger.info(f"会议 {meeting_id} 中人类角色 {agent_name} 等待输入超时（{agent.input_timeout:g} 秒），策略: {policy}")
+
+        if policy == "wait":
+            _stats["wait"] += 1
+            agent.input_received("timeout")
+            return
+
+        content = None
+        if policy == "host":
+            content = await _host_reply(meeting, agent)
+            if content is None:
+                logger.info(f"人类角色 {agent_name} 没有可用的宿主角色代为发言，改为跳过")
+                policy = "skip"
+
+        if not await asyncio.to_thread(_apply, meeting_id, meeting, agent, started, policy, content):
+            # 处理期间人类已经提交了输入
+            _stats["stale"] += 1
+            return
+        _stats[policy] += 1
+        event_bus.publish(meeting_id, "human_timeout", {"agent": agent_name, "policy": policy})
+        agent.input_received(policy)
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.error(f"处理人类输入超时失败: meeting_id={meeting_id}, 角色={agent_name}, 错误: {str(e)}", exc_info=True)
+
+
+def start() -> int:
+    """
+    应用启动时调用：记录事件循环，并为已恢复的会议中仍在等待的人类输入设置截止时间
+
+    返回:
+        int: 登记的等待数
+    """
+    global _loop
+    from app.meeting.store import get_meeting_store
+
+    _loop = asyncio.get_running_loop()
+    count = 0
+    for meeting_id, meeting_data in get_meeting_store()._live().items():
+        meeting = meeting_data.get("meeting")
+        if meeting is None or meeting.status == ENDED_STATUS:
+            continue
+        for agent in meeting.agents:
+            if getattr(agent, "is_human", False) and agent.is_waiting_input and watch(meeting_id, agent):
+                count += 1
+    _arm()
+    if count:
+        logger.info(f"已为 {count} 个等待中的人类输入设置截止时间")
+    return count
+
+
+def stop() -> None:
+    """应用关闭时取消定时器"""
+    global _timer, _timer_deadline
+    if _timer is not None:
+        _timer.cancel()
+    _timer = _timer_deadline = None
+
+
+def stats() -> Dict[str, Any]:
+    """返回人类输入截止时间的统计信息"""
+    with _lock:
+        pending = len(_heap)
+        next_deadline = _heap[0][0] if _heap else None
+    return {
+        "pending": pending,
+        "next_deadline_in": round(next_deadline - time.time(), 3) if next_deadline is not None else None,
+        **_stats,
+    }
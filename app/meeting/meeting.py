@@ -1,11 +1,15 @@
 from datetime import datetime
 from typing import List, Dict, Any, Optional, Union
+import asyncio
 import uuid
 import logging
 
 from app.meeting.agents.agent import Agent
 from app.meeting.agents.human_agent import HumanAgent
 from app.meeting.meeting_modes.base_mode import BaseMeetingMode
+from app.meeting.message_log import MessageLog, MessageLogView
+from app.meeting import event_bus, notifier, human_input_reaper
+from app.clients.transport import run_sync
 
 logger = logging.getLogger(__name__)
 
@@ -31,8 +35,8 @@ class Meeting:
         self.mode.set_max_rounds(max_rounds)
         
         self.agents = []
-        self.history = []  # 统一使用history存储会议历史
-        self.meeting_history = []  # 保持meeting_history兼容性
+        # 统一的只追加消息日志，history/meeting_history 是其上的只读视图
+        self.message_log = MessageLog()
         self.rounds = []  # 存储每轮讨论的消息
         self.status = "未开始"
         self.current_round = 1
@@ -42,15 +46,22 @@ class Meeting:
         self.group_info = None  # 用于存储讨论组信息
         self._skip_auto_summary = False  # 标志是否跳过自动生成总结
         
+    @property
+    def history(self) -> MessageLogView:
+        """会议历史（只读视图）：add_message 的消息与 handle_agent_response 的轮次记录"""
+        return self.message_log.history_view()
+    
+    @property
+    def meeting_history(self) -> MessageLogView:
+        """会议消息历史（只读视图）：仅 add_message 添加的消息"""
+        return self.message_log.meeting_history_view()
+    
     def add_message(self, agent_name: str, content: str):
         """添加消息到会议历史记录"""
-        message = {
-            "agent": agent_name,
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        }
-        self.history.append(message)
-        self.meeting_history.append(message)  # 同时更新两个历史记录列表
+        record = self.message_log.append_message(agent_name, content)
+        notifier.notify(self.id)
+        if event_bus.has_subscribers(self.id):
+            event_bus.publish(self.id, "message", dict(record.to_dict(), seq=record.seq))
         
     def start_meeting(self):
         """开始会议"""
@@ -105,13 +116,23 @@ class Meeting:
         
         # 使用讨论组的自定义总结模型和提示进行总结
         from app.meeting.utils.summary_generator import SummaryGenerator
-        import logging
         
-        logger = logging.getLogger(__name__)
+        summary_kwargs = self._summary_kwargs()
+        summary = SummaryGenerator.generate_summary(**summary_kwargs)
+        
+        # 添加总结到会议历史
+        self.add_message("system", summary)
+        
+        logger.info(f"会议 {self.id} 已结束，使用{'自定义' if summary_kwargs['model_name'] else '默认'}模型生成总结")
+    
+    def _summary_kwargs(self) -> Dict[str, Any]:
+        """
+        生成总结的参数：讨论组的自定义提示模板与总结模型（模型配置取自配置注册表，不访问数据库）
         
-        # 检查是否有讨论组信息和总结模型配置
+        返回:
+            Dict[str, Any]: SummaryGenerator.generate_summary / generate_summary_async 的参数
+        """
         custom_prompt = None
-        model_id = None
         api_key = None
         api_base_url = None
         model_name = None
@@ -128,16 +149,10 @@ class Meeting:
                 logger.info(f"使用讨论组自定义总结模型: model_id={model_id}")
                 
                 try:
-                    # 这里简化处理，实际使用时应从adapter获取model信息
-                    # 这里是为了保证即使无法获取model详情，也能使用默认模型生成总结
-                    from app.models.database import get_db, Model
-                    from sqlalchemy.orm import Session
+                    from app.clients import breaker
+                    from app.models import config_registry
                     
-                    # 获取数据库会话
-                    db = next(get_db())
-                    
-                    # 查询模型配置
-                    summary_model = db.query(Model).filter(Model.id == model_id).first()
+                    summary_model = breaker.available_model(config_registry.peek_model(model_id))
                     
                     if summary_model:
                         logger.info(f"找到总结模型: {summary_model.name}")
@@ -156,23 +171,15 @@ class Meeting:
                 except Exception as e:
                     logger.error(f"获取总结模型信息失败: {str(e)}，将使用默认模型", exc_info=True)
         
-        # 使用模式的默认提示模板或自定义提示
-        prompt_template = custom_prompt if custom_prompt else self.mode.get_summary_prompt_template()
-        
-        # 生成总结
-        summary = SummaryGenerator.generate_summary(
-            meeting_topic=self.topic,
-            meeting_history=self.meeting_history,
-            prompt_template=prompt_template,
-            model_name=model_name,
-            api_key=api_key,
-            api_base_url=api_base_url
-        )
-        
-        # 添加总结到会议历史
-        self.add_message("system", summary)
-        
-        logger.info(f"会议 {self.id} 已结束，使用{'自定义' if custom_prompt else '默认'}提示模板和{'自定义' if model_name else '默认'}模型生成总结")
+        return {
+            "meeting_topic": self.topic,
+            "meeting_history": self.meeting_history,
+            # 使用模式的默认提示模板或自定义提示
+            "prompt_template": custom_prompt if custom_prompt else self.mode.get_summary_prompt_template(),
+            "model_name": model_name,
+            "api_key": api_key,
+            "api_base_url": api_base_url,
+        }
     
     def _get_current_context(self) -> List[Dict[str, str]]:
         """获取当前会议上下文"""
@@ -206,18 +213,101 @@ class Meeting:
             "max_rounds": self.max_rounds,
             "start_time": self.start_time.isoformat() if self.start_time else None,
             "end_time": self.end_time.isoformat() if self.end_time else None,
-            "history": self.meeting_history,
+            "history": list(self.meeting_history),
             "summary": summary  # 确保总结字段被包含
         }
     
+    def to_snapshot(self, include_messages: bool = True) -> Dict[str, Any]:
+        """
+        导出会议的完整运行状态（元数据、智能体、发言游标、等待人类输入状态与消息）
+        
+        参数:
+            include_messages: 是否包含消息日志（会议存储单独增量保存消息时为 False）
+        
+        返回:
+            Dict[str, Any]: 可 JSON 序列化的会议状态，可用 from_snapshot() 还原
+        """
+        snapshot = {
+            "id": self.id,
+            "topic": self.topic,
+            "mode": (self.group_info or {}).get("mode") or self.mode.name,
+            "max_rounds": self.max_rounds,
+            "custom_speaking_order": self.mode.custom_speaking_order,
+            "status": self.status,
+            "current_round": self.current_round,
+            "current_speaker_index": self.current_speaker_index,
+            "start_time": self.start_time.isoformat() if self.start_time else None,
+            "end_time": self.end_time.isoformat() if self.end_time else None,
+            "group_info": self.group_info,
+            "skip_auto_summary": self._skip_auto_summary,
+            "waiting_for_human_input": getattr(self, "waiting_for_human_input", None),
+            "last_human_speaker": getattr(self, "last_human_speaker", None),
+            "agents": [agent.to_snapshot() for agent in self.agents],
+        }
+        if include_messages:
+            # 消息日志的紧凑行 [kind, agent, content, ts, round]，下标即 seq
+            snapshot["messages"] = self.message_log.to_rows()
+        return snapshot
+    
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any], mode: BaseMeetingMode) -> "Meeting":
+        """
+        由 to_snapshot() 导出的状态重建会议
+        
+        参数:
+            snapshot: 会议状态
+            mode: 已创建的会议模式实例
+            
+        返回:
+            Meeting: 重建的会议
+        """
+        meeting = cls(
+            id=snapshot["id"],
+            topic=snapshot["topic"],
+            mode=mode,
+            max_rounds=snapshot.get("max_rounds", 3)
+        )
+        if snapshot.get("custom_speaking_order"):
+            meeting.mode.set_custom_speaking_order(snapshot["custom_speaking_order"])
+        
+        meeting.status = snapshot.get("status", meeting.status)
+        meeting.current_round = snapshot.get("current_round", 1)
+        meeting.current_speaker_index = snapshot.get("current_speaker_index", 0)
+        if snapshot.get("start_time"):
+            meeting.start_time = datetime.fromisoformat(snapshot["start_time"])
+        if snapshot.get("end_time"):
+            meeting.end_time = datetime.fromisoformat(snapshot["end_time"])
+        meeting.group_info = snapshot.get("group_info")
+        meeting._skip_auto_summary = snapshot.get("skip_auto_summary", False)
+        if snapshot.get("waiting_for_human_input"):
+            meeting.waiting_for_human_input = snapshot["waiting_for_human_input"]
+        if snapshot.get("last_human_speaker"):
+            meeting.last_human_speaker = snapshot["last_human_speaker"]
+        
+        meeting.agents = [
+            (HumanAgent if agent.get("type") == "human" else Agent).from_snapshot(agent)
+            for agent in snapshot.get("agents", [])
+        ]
+        
+        if "messages" in snapshot:
+            meeting.message_log = MessageLog.from_rows(snapshot["messages"])
+        else:
+            # 兼容按 history/meeting_history 列表保存的旧快照
+            meeting.message_log = MessageLog.from_legacy(
+                snapshot.get("history") or [], snapshot.get("meeting_history") or []
+            )
+        return meeting
+    
     def get_context(self):
         """获取当前会议上下文的公共方法"""
         return self._get_current_context()
     
-    def finish(self):
+    def _finished_summary(self) -> Optional[str]:
         """
-        结束会议并生成摘要
-        该方法用于外部调用，提供了一个公共接口来结束会议
+        finish 不需要生成总结时直接返回的结果：跳过自动总结时的已有总结或默认消息、已有的有效总结
+        
+        返回:
+            Optional[str]: 需要生成总结时返回 None
         """
         # 检查是否设置了跳过自动生成总结的标志
         if hasattr(self, '_skip_auto_summary') and self._skip_auto_summary:
@@ -227,27 +317,30 @@ class Meeting:
                 self.status = "已结束"
                 self.end_time = datetime.now()
             
-            # 尝试查找已有的总结，如果有则返回
-            for message in reversed(self.meeting_history):
-                if message["agent"] == "system" and message["content"] and len(message["content"]) > 50:
-                    logger.info(f"找到已有总结，长度: {len(message['content'])}")
-                    return message["content"]
-            
-            # 如果没有找到总结，返回默认消息
+            # 尝试查找已有的总结，如果有则返回，没有时返回默认消息
+            existing_summary = self.existing_summary()
+            if existing_summary:
+                logger.info(f"找到已有总结，长度: {len(existing_summary)}")
+                return existing_summary
             return f"关于'{self.topic}'的会议已结束，总结将由外部处理。"
         
-        # 先检查是否已有总结
-        existing_summary = None
-        for message in reversed(self.meeting_history):
-            if message["agent"] == "system" and message["content"] and len(message["content"]) > 50:
-                # 找到最后一条有意义的系统消息（总结通常较长）
-                existing_summary = message["content"]
-                break
-                
         # 如果已有有效的总结，直接返回
+        existing_summary = self.existing_summary()
         if existing_summary and len(existing_summary) > 100 and "未找到总结" not in existing_summary:
             logger.info(f"会议 {self.id} 已有有效总结，长度: {len(existing_summary)}，避免重复生成")
             return existing_summary
+        return None
+    
+    def finish(self):
+        """
+        结束会议并生成摘要
+        该方法用于外部调用，提供了一个公共接口来结束会议
+        
+        总结生成会同步等待上游调用，只能在工作线程中调用；事件循环中使用 finish_async
+        """
+        summary = self._finished_summary()
+        if summary is not None:
+            return summary
         
         # 确保会议已结束
         if self.status != "已结束":
@@ -257,65 +350,32 @@ class Meeting:
         # 如果会议已结束但没有总结，则使用与_end_meeting相同的逻辑重新生成总结
         from app.meeting.utils.summary_generator import SummaryGenerator
         
-        # 检查是否有讨论组信息和总结模型配置
-        custom_prompt = None
-        model_id = None
-        api_key = None
-        api_base_url = None
-        model_name = None
+        summary = SummaryGenerator.generate_summary(**self._summary_kwargs())
         
-        if self.group_info:
-            # 获取自定义提示模板（如果有）
-            if 'summary_prompt' in self.group_info and self.group_info['summary_prompt']:
-                custom_prompt = self.group_info['summary_prompt']
-                logger.info(f"使用讨论组自定义总结提示模板: length={len(custom_prompt)}")
-            
-            # 获取自定义总结模型（如果有）
-            if 'summary_model_id' in self.group_info and self.group_info['summary_model_id']:
-                model_id = self.group_info['summary_model_id']
-                logger.info(f"使用讨论组自定义总结模型: model_id={model_id}")
-                
-                try:
-                    # 这里简化处理，实际使用时应从adapter获取model信息
-                    # 这里是为了保证即使无法获取model详情，也能使用默认模型生成总结
-                    from app.models.database import get_db, Model
-                    from sqlalchemy.orm import Session
-                    
-                    # 获取数据库会话
-                    db = next(get_db())
-                    
-                    # 查询模型配置
-                    summary_model = db.query(Model).filter(Model.id == model_id).first()
-                    
-                    if summary_model:
-                        logger.info(f"找到总结模型: {summary_model.name}")
-                        model_name = summary_model.name
-                        
-                        # 获取API密钥和基础URL
-                        api_key = getattr(summary_model, 'api_key', None)
-                        api_url = getattr(summary_model, 'api_url', None)
-                        
-                        # 处理URL，从完整URL中提取基础部分
-                        if api_url:
-                            if "/v1/chat/completions" in api_url:
-                                api_base_url = api_url.split("/v1/chat/completions")[0]
-                            else:
-                                api_base_url = api_url
-                except Exception as e:
-                    logger.error(f"获取总结模型信息失败: {str(e)}，将使用默认模型", exc_info=True)
+        # 将总结添加到会议历史中
+        self.add_message("system", summary)
         
-        # 使用模式的默认提示模板或自定义提示
-        prompt_template = custom_prompt if custom_prompt else self.mode.get_summary_prompt_template()
-        
-        # 生成总结
-        summary = SummaryGenerator.generate_summary(
-            meeting_topic=self.topic,
-            meeting_history=self.meeting_history,
-            prompt_template=prompt_template,
-            model_name=model_name,
-            api_key=api_key,
-            api_base_url=api_base_url
-        )
+        logger.info(f"会议 {self.id} 已生成总结，长度: {len(summary)}")
+        return summary
+    
+    async def finish_async(self) -> str:
+        """
+        finish 的异步版本：结束会议并通过异步接口生成总结，不阻塞事件循环
+        
+        返回:
+            str: 会议总结内容
+        """
+        summary = self._finished_summary()
+        if summary is not None:
+            return summary
+        
+        if self.status != "已结束":
+            self.status = "已结束"
+            self.end_time = datetime.now()
+        
+        from app.meeting.utils.summary_generator import SummaryGenerator
+        
+        summary = await SummaryGenerator.generate_summary_async(**self._summary_kwargs())
         
         # 将总结添加到会议历史中
         self.add_message("system", summary)
@@ -323,6 +383,19 @@ class Meeting:
         logger.info(f"会议 {self.id} 已生成总结，长度: {len(summary)}")
         return summary
     
+    def existing_summary(self) -> Optional[str]:
+        """
+        已生成的总结（会议历史中最后一条有意义的系统消息），不会触发总结生成
+        
+        返回:
+            Optional[str]: 没有时返回 None
+        """
+        for message in reversed(self.meeting_history):
+            if message["agent"] == "system" and message["content"] and len(message["content"]) > 50:
+                # 找到最后一条有意义的系统消息（总结通常较长）
+                return message["content"]
+        return None
+    
     def get_summary(self) -> str:
         """
         获取会议总结
@@ -336,14 +409,8 @@ class Meeting:
         if self.status != "已结束":
             self.finish()
         
-        # 从会议历史中查找最后一条系统消息作为总结
-        for message in reversed(self.meeting_history):
-            if message["agent"] == "system" and message["content"] and len(message["content"]) > 50:
-                # 找到最后一条有意义的系统消息（总结通常较长）
-                return message["content"]
-        
-        # 如果没有找到合适的总结，返回一个默认消息
-        return f"关于'{self.topic}'的会议已结束，但未找到总结。"
+        # 从会议历史中查找最后一条系统消息作为总结，没有找到时返回一个默认消息
+        return self.existing_summary() or f"关于'{self.topic}'的会议已结束，但未找到总结。"
     
     def get_meeting_history(self):
         """获取会议历史记录"""
@@ -430,7 +497,11 @@ class Meeting:
         return False
     
     def conduct_round(self) -> Dict[str, Any]:
-        """进行一轮会议讨论"""
+        """进行一轮会议讨论（同步包装，供遗留调用方使用）"""
+        return run_sync(self.conduct_round_async())
+
+    async def conduct_round_async(self) -> Dict[str, Any]:
+        """进行一轮会议讨论（当前发言者发言一次）"""
         try:
             if self.status != "进行中":
                 raise ValueError(f"无法进行讨论，会议状态为: {self.status}")
@@ -446,6 +517,7 @@ class Meeting:
             if hasattr(current_speaker, 'is_human') and current_speaker.is_human:
                 # 设置人类参与者等待输入状态
                 current_speaker.wait_for_input()
+                human_input_reaper.watch(self.id, current_speaker)
                 logger.info(f"等待人类角色 {current_speaker.name} 的输入")
                 
                 # 对于人类参与者，返回等待状态
@@ -469,15 +541,15 @@ class Meeting:
                     current_speaker.conversation_history = []
                 
                 # 生成响应
-                response = current_speaker.speak(
+                response = await current_speaker.speak_async(
                     meeting_topic=self.topic,
                     meeting_mode=self.mode.name,
                     current_context=current_context,
                     mode_specific_prompt=mode_specific_prompt
                 )
                 
-                # 处理响应
-                return self.handle_agent_response(current_speaker, response)
+                # 处理响应（最后一轮结束时会同步生成会议总结，放到线程池中执行）
+                return await asyncio.to_thread(self.handle_agent_response, current_speaker, response)
             
         except Exception as e:
             logger.error(f"会议 {self.id} 进行轮次时出错: {str(e)}", exc_info=True)
@@ -492,16 +564,11 @@ class Meeting:
     def handle_agent_response(self, agent: Union[Agent, HumanAgent], response: str) -> Dict[str, Any]:
         """处理智能体响应并更新会议状态"""
         try:
-            # 创建轮次记录
-            round_record = {
-                "round": self.current_round,
-                "speaker": agent.name,
-                "content": response,
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            # 添加到历史记录
-            self.history.append(round_record)
+            # 添加轮次记录到消息日志
+            record = self.message_log.append_round(self.current_round, agent.name, response)
+            notifier.notify(self.id)
+            if event_bus.has_subscribers(self.id):
+                event_bus.publish(self.id, "message", dict(record.to_dict(), seq=record.seq))
             
             # 更新智能体的对话历史
             if hasattr(agent, 'conversation_history'):
@@ -509,12 +576,8 @@ class Meeting:
                 if not isinstance(agent.conversation_history, list):
                     agent.conversation_history = []
                 
-                # 添加当前轮次的对话到历史记录
-                current_context = self._build_meeting_context()
-                agent.conversation_history.append({
-                    "role": "user", 
-                    "content": current_context
-                })
+                # 只记录智能体自己的回应：会议上下文可随时由消息日志重建，
+                # 每轮保存一份完整上下文会使内存随轮次平方增长
                 agent.conversation_history.append({
                     "role": "assistant", 
                     "content": response
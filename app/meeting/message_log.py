@@ -0,0 +1,257 @@
+"""会议消息日志
+
+每个会议只保存一份只追加的紧凑消息日志：
+
+- MessageRecord 使用 __slots__，不为每条消息分配字典
+- 发言者名称经过 sys.intern，同一角色的所有消息共享一个字符串
+- 时间戳保存为浮点数，只在生成旧格式字典时才格式化为 ISO 字符串
+- seq 从 0 开始连续递增，等于记录在日志中的下标
+
+Meeting.history / Meeting.meeting_history 是日志上的只读视图，按需生成与原来
+完全相同的字典结构，现有的遍历、下标、切片、len() 用法保持不变。
+"""
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+# 记录类型：add_message 添加的消息 / handle_agent_response 添加的轮次记录
+KIND_MESSAGE = 0
+KIND_ROUND = 1
+
+# 估算内存占用时每条记录的固定开销（对象头、槽位与浮点时间戳）
+_RECORD_OVERHEAD_BYTES = 120
+
+
+class MessageRecord:
+    """消息日志中的一条记录"""
+
+    __slots__ = ("seq", "kind", "agent", "content", "ts", "round")
+
+    def __init__(self, seq: int, kind: int, agent: str, content: Any, ts: float, round: Optional[int] = None):
+        self.seq = seq
+        self.kind = kind
+        self.agent = agent
+        self.content = content
+        self.ts = ts
+        self.round = round
+
+    @property
+    def timestamp(self) -> str:
+        """ISO 格式的时间戳（与 datetime.now().isoformat() 一致）"""
+        return datetime.fromtimestamp(self.ts).isoformat()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为旧格式的字典"""
+        if self.kind == KIND_ROUND:
+            return {
+                "round": self.round,
+                "speaker": self.agent,
+                "content": self.content,
+                "timestamp": self.timestamp
+            }
+        return {
+            "agent": self.agent,
+            "content": self.content,
+            "timestamp": self.timestamp
+        }
+
+    def to_row(self) -> list:
+        """转换为紧凑的可 JSON 序列化行（用于会议快照）"""
+        return [self.kind, self.agent, self.content, self.ts, self.round]
+
+
+def _parse_timestamp(value: Any) -> float:
+    """解析旧格式字典中的时间戳"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
+class MessageLog:
+    """只追加的会议消息日志"""
+
+    __slots__ = ("_records", "_message_seqs")
+
+    def __init__(self):
+        self._records: List[MessageRecord] = []
+        # KIND_MESSAGE 记录的 seq，用于 meeting_history 视图的下标访问
+        self._message_seqs = array("l")
+
+    def append(self, kind: int, agent: str, content: Any,
+               round: Optional[int] = None, ts: Optional[float] = None) -> MessageRecord:
+        """
+        追加一条记录
+
+        参数:
+            kind: KIND_MESSAGE 或 KIND_ROUND
+            agent: 发言者名称
+            content: 消息内容
+            round: 轮次（仅轮次记录）
+            ts: 时间戳，默认为当前时间
+
+        返回:
+            MessageRecord: 新记录
+        """
+        seq = len(self._records)
+        record = MessageRecord(
+            seq,
+            kind,
+            sys.intern(agent) if isinstance(agent, str) else agent,
+            content,
+            ts if ts is not None else time.time(),
+            round
+        )
+        self._records.append(record)
+        if kind == KIND_MESSAGE:
+            self._message_seqs.append(seq)
+        return record
+
+    def append_message(self, agent: str, content: Any, ts: Optional[float] = None) -> MessageRecord:
+        """追加一条消息（对应旧的 add_message 字典）"""
+        return self.append(KIND_MESSAGE, agent, content, ts=ts)
+
+    def append_round(self, round: int, speaker: str, content: Any, ts: Optional[float] = None) -> MessageRecord:
+        """追加一条轮次记录（对应旧的 handle_agent_response 字典）"""
+        return self.append(KIND_ROUND, speaker, content, round=round, ts=ts)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[MessageRecord]:
+        return iter(self._records)
+
+    def records(self, since: int = 0) -> List[MessageRecord]:
+        """返回 seq >= since 的记录"""
+        return self._records[max(since, 0):]
+
+    def message_records(self, since: int = 0) -> List[MessageRecord]:
+        """返回 seq >= since 的 add_message 消息（二分定位起点，不扫描更早的记录）"""
+        records = self._records
+        seqs = self._message_seqs
+        return [records[seq] for seq in seqs[bisect_left(seqs, max(since, 0)):]]
+
+    @property
+    def next_seq(self) -> int:
+        """下一条记录的 seq"""
+        return len(self._records)
+
+    def estimated_bytes(self) -> int:
+        """估算日志占用的内存"""
+        total = sys.getsizeof(self._records) + self._message_seqs.buffer_info()[1] * self._message_seqs.itemsize
+        for record in self._records:
+            total += _RECORD_OVERHEAD_BYTES
+            if isinstance(record.content, str):
+                total += sys.getsizeof(record.content)
+        return total
+
+    def history_view(self) -> "MessageLogView":
+        """旧的 history 视图：全部记录"""
+        return MessageLogView(self, messages_only=False)
+
+    def meeting_history_view(self) -> "MessageLogView":
+        """旧的 meeting_history 视图：仅 add_message 添加的消息"""
+        return MessageLogView(self, messages_only=True)
+
+    def to_rows(self) -> List[list]:
+        """导出为紧凑行列表（seq 即行下标）"""
+        return [record.to_row() for record in self._records]
+
+    @classmethod
+    def from_rows(cls, rows: List[list]) -> "MessageLog":
+        """由 to_rows() 的结果重建日志"""
+        log = cls()
+        for kind, agent, content, ts, round in rows:
+            log.append(kind, agent, content, round=round, ts=ts)
+        return log
+
+    @classmethod
+    def from_legacy(cls, history: List[Dict[str, Any]], meeting_history: List[Any]) -> "MessageLog":
+        """
+        由旧格式的 history / meeting_history 列表重建日志
+
+        参数:
+            history: 旧的 history 列表
+            meeting_history: 旧的 meeting_history 列表（元素为字典，或 history 中的下标）
+
+        返回:
+            MessageLog: 重建的日志
+        """
+        log = cls()
+        for entry in history or []:
+            if "speaker" in entry and "agent" not in entry:
+                log.append_round(entry.get("round"), entry["speaker"], entry.get("content"),
+                                 ts=_parse_timestamp(entry.get("timestamp")))
+            else:
+                log.append_message(entry.get("agent"), entry.get("content"),
+                                   ts=_parse_timestamp(entry.get("timestamp")))
+        # 只存在于 meeting_history 中的条目追加到末尾
+        for entry in meeting_history or []:
+            if isinstance(entry, dict):
+                log.append_message(entry.get("agent"), entry.get("content"),
+                                   ts=_parse_timestamp(entry.get("timestamp")))
+        return log
+
+
+class MessageLogView(Sequence):
+    """消息日志的只读视图，按需生成旧格式的字典"""
+
+    __slots__ = ("_log", "_messages_only")
+
+    def __init__(self, log: MessageLog, messages_only: bool):
+        self._log = log
+        self._messages_only = messages_only
+
+    def _record(self, index: int) -> MessageRecord:
+        if self._messages_only:
+            return self._log._records[self._log._message_seqs[index]]
+        return self._log._records[index]
+
+    def __len__(self) -> int:
+        if self._messages_only:
+            return len(self._log._message_seqs)
+        return len(self._log._records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._record(i).to_dict() for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message log index out of range")
+        return self._record(index).to_dict()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        records = self._log._records
+        if self._messages_only:
+            for seq in list(self._log._message_seqs):
+                yield records[seq].to_dict()
+        else:
+            for record in list(records):
+                yield record.to_dict()
+
+    def __reversed__(self) -> Iterator[Dict[str, Any]]:
+        for index in range(len(self) - 1, -1, -1):
+            yield self._record(index).to_dict()
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (MessageLogView, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+    def records(self) -> List[MessageRecord]:
+        """视图对应的记录"""
+        if self._messages_only:
+            return [self._log._records[seq] for seq in self._log._message_seqs]
+        return list(self._log._records)
@@ -0,0 +1,160 @@
+"""会议变更通知
+
+/messages 接口的长轮询、非流式讨论请求等待人类输入等场景在这里等待会议发生变化，而不是定时轮询：
+
+- 每个会议维护一个单调递增的变更版本号，新增消息、保存会议状态、删除会议时调用 notify()
+- 版本号取自进程内的全局计数器；会议结束、被淘汰或删除时清理其版本号，
+  之后读到的版本号不小于清理前的值，已读取旧版本号的等待者不会错过变化
+- 只有存在等待者的会议才持有 asyncio.Condition，最后一个等待者离开后即释放
+- notify() 可以在任意线程调用（同步路由运行在线程池中），唤醒操作统一投递到事件循环执行
+
+只在单个进程内生效：MEETING_STORE=sql 且多 worker 部署时，其他 worker 上的变化
+不会唤醒本进程的等待者，长轮询会在超时后返回最新状态。
+"""
+import asyncio
+import itertools
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_versions: Dict[str, int] = {}
+_counter = itertools.count(1)
+# 已清理会议的最大版本号，没有记录的会议返回该值
+_floor = 0
+_conditions: Dict[str, asyncio.Condition] = {}
+_waiters: Dict[str, int] = {}
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def version(meeting_id: str) -> int:
+    """返回会议当前的变更版本号"""
+    return _versions.get(meeting_id, _floor)
+
+
+async def _wake(condition: asyncio.Condition) -> None:
+    async with condition:
+        condition.notify_all()
+
+
+def notify(meeting_id: str) -> None:
+    """
+    标记会议发生了变化并唤醒等待者
+
+    参数:
+        meeting_id: 会议ID
+    """
+    if not meeting_id:
+        return
+    with _lock:
+        _versions[meeting_id] = next(_counter)
+        condition = _conditions.get(meeting_id)
+        loop = _loop
+    if condition is None or loop is None or loop.is_closed():
+        return
+
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    try:
+        if running is loop:
+            loop.create_task(_wake(condition))
+        else:
+            loop.call_soon_threadsafe(lambda: loop.create_task(_wake(condition)))
+    except RuntimeError:
+        # 事件循环已关闭（应用退出过程中）
+        logger.debug(f"事件循环已关闭，忽略会议变更通知: {meeting_id}")
+
+
+async def wait_for_change(meeting_id: str, seen_version: int, timeout: Optional[float]) -> bool:
+    """
+    等待会议的变更版本号不同于 seen_version
+
+    参数:
+        meeting_id: 会议ID
+        seen_version: 调用方读取状态前取得的版本号
+        timeout: 最长等待秒数，None 表示一直等待
+
+    返回:
+        bool: 发生变化返回 True，超时返回 False
+    """
+    global _loop
+    loop = asyncio.get_running_loop()
+    with _lock:
+        _loop = loop
+        if version(meeting_id) != seen_version:
+            return True
+        condition = _conditions.get(meeting_id)
+        if condition is None:
+            condition = _conditions[meeting_id] = asyncio.Condition()
+        _waiters[meeting_id] = _waiters.get(meeting_id, 0) + 1
+
+    try:
+        async with condition:
+            # wait_for 先检查一次条件，读取版本号之后、进入等待之前的通知不会丢失
+            await asyncio.wait_for(
+                condition.wait_for(lambda: version(meeting_id) != seen_version),
+                timeout
+            )
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        with _lock:
+            remaining = _waiters.get(meeting_id, 1) - 1
+            if remaining > 0:
+                _waiters[meeting_id] = remaining
+            else:
+                _waiters.pop(meeting_id, None)
+                _conditions.pop(meeting_id, None)
+
+
+async def wait_until(meeting_id: str, predicate: Callable[[], bool], timeout: Optional[float] = None) -> bool:
+    """
+    等待会议状态满足条件：会议每次变化时重新检查，不做定时轮询
+
+    参数:
+        meeting_id: 会议ID
+        predicate: 检查会议状态的函数（在事件循环中调用，不应阻塞）
+        timeout: 最长等待秒数，None 表示一直等待
+
+    返回:
+        bool: 条件成立返回 True，超时返回 False
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    while True:
+        # 先取版本号再检查条件，两者之间发生的变化会让下面的等待立即返回
+        seen_version = version(meeting_id)
+        if predicate():
+            return True
+        remaining = None if deadline is None else deadline - loop.time()
+        if remaining is not None and remaining <= 0:
+            return False
+        await wait_for_change(meeting_id, seen_version, remaining)
+
+
+def discard(meeting_id: str) -> None:
+    """
+    会议结束或被淘汰后清理版本号，不唤醒等待者
+
+    清理后 version() 返回不小于原版本号的 _floor：等待者要么看到相同的值继续等待，
+    要么提前返回一次重新读取状态，不会因为版本号回退而错过之后的变化。
+
+    参数:
+        meeting_id: 会议ID
+    """
+    global _floor
+    with _lock:
+        last = _versions.pop(meeting_id, None)
+        if last is not None and last > _floor:
+            _floor = last
+
+
+def forget(meeting_id: str) -> None:
+    """会议被删除后清理版本号（先 notify 唤醒等待者）"""
+    notify(meeting_id)
+    discard(meeting_id)
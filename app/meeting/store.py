@@ -0,0 +1,981 @@
+"""会议状态存储
+
+活跃会议原本只保存在 MeetingAdapter 的类变量中，只能运行单个 worker，重启后全部丢失，
+并且结束的会议永远不会被移除。这里把会议状态抽象为 MeetingStore（键为会议ID，
+值为 {"meeting", "group_id", "start_time"}，与原来的 active_meetings 字典结构一致），
+并提供两种后端：
+
+- memory: 进程内字典（默认）；被淘汰的会议归档到 meeting_states 表
+- sql: 每次状态变化都持久化到 meeting_states 表（与 DATABASE_URL 同库），任意 worker
+  都能按会议ID重建 Meeting；本地缓存按 revision 判断是否被其他 worker 更新过
+
+消息日志按 seq 追加保存到 meeting_messages 表，meeting_states.state 只保存不含消息的快照：
+每次保存只插入新消息，状态没有变化时只更新 revision 等列，不再重写整个会议。
+
+通过环境变量 MEETING_STORE=memory|sql 选择后端。会议状态变化后调用 save_meeting(meeting_id)
+持久化（事件循环中由线程执行写入，同一会议的多次保存会合并）；应用关闭时调用 snapshot_all()，
+启动时调用 restore() 预热未结束的会议。
+异步代码中用 get_async()/contains_async() 访问会议，内存未命中需要查询数据库时在线程中执行。
+
+后台任务定期调用 evict()，按空闲时间、内存中的会议数量与估算内存占用淘汰会议：
+淘汰前先归档，之后访问该会议时从归档透明地重新加载。
+"""
+import abc
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections.abc import MutableMapping
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import insert
+
+from app.meeting import event_bus, notifier
+from app.meeting.meeting import Meeting
+from app.meeting.meeting_modes.base_mode import BaseMeetingMode
+from app.meeting.meeting_modes.discussion import DiscussionMode
+from app.meeting.meeting_modes.brainstorming import BrainstormingMode
+from app.meeting.meeting_modes.debate import DebateMode
+from app.meeting.meeting_modes.role_playing import RolePlayingMode
+from app.meeting.meeting_modes.swot_analysis import SWOTAnalysisMode
+from app.meeting.meeting_modes.six_thinking_hats import SixThinkingHatsMode
+from app.models.database import SessionLocal, MeetingState, MeetingMessage
+from app.utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+# 会议结束后的状态值
+ENDED_STATUS = "已结束"
+
+_MODE_CLASSES = {
+    "discussion": DiscussionMode,
+    "brainstorming": BrainstormingMode,
+    "debate": DebateMode,
+    "role_playing": RolePlayingMode,
+    "swot_analysis": SWOTAnalysisMode,
+    "six_thinking_hats": SixThinkingHatsMode
+}
+
+# 估算内存占用时每条消息/每个智能体的固定开销（字典、时间戳等）
+_ENTRY_OVERHEAD_BYTES = 512
+_AGENT_OVERHEAD_BYTES = 4096
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整数环境变量，非法值回退到默认值"""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """读取浮点数环境变量，非法值回退到默认值"""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# SQL 存储在这段时间（秒）内信任本地缓存的 revision，不再查询数据库；
+# 本进程正在驱动或尚未写完的会议始终使用本地缓存
+MEETING_REVISION_CHECK_INTERVAL = _env_float("MEETING_REVISION_CHECK_INTERVAL", 1.0)
+
+
+def _load_eviction_settings() -> Dict[str, int]:
+    """读取淘汰策略配置（可通过 .env 调整）"""
+    return {
+        "interval": _env_int("MEETING_EVICT_INTERVAL", 60),
+        "idle_ttl": _env_int("MEETING_IDLE_TTL", 1800),
+        "finished_ttl": _env_int("MEETING_FINISHED_TTL", 300),
+        "min_idle": _env_int("MEETING_EVICT_MIN_IDLE", 300),
+        "max_live": _env_int("MEETING_MAX_LIVE", 200),
+        "max_bytes": _env_int("MEETING_MAX_BYTES", 256 * 1024 * 1024),
+    }
+
+
+def _create_mode(mode_name: Optional[str]) -> BaseMeetingMode:
+    """按讨论组中的模式名称创建会议模式，未知模式回退到普通讨论"""
+    mode_class = _MODE_CLASSES.get((mode_name or "").lower(), DiscussionMode)
+    return mode_class()
+
+
+def encode_meeting_data(meeting_data: Dict[str, Any], include_messages: bool = True) -> Dict[str, Any]:
+    """
+    把 active_meetings 中的一项转换为可持久化的状态
+
+    参数:
+        meeting_data: {"meeting", "group_id", "start_time"}
+        include_messages: 是否包含消息日志（保存到 meeting_messages 时为 False）
+
+    返回:
+        Dict[str, Any]: 可 JSON 序列化的状态
+    """
+    start_time = meeting_data.get("start_time")
+    return {
+        "group_id": meeting_data.get("group_id"),
+        "start_time": start_time.isoformat() if isinstance(start_time, datetime) else start_time,
+        "meeting": meeting_data["meeting"].to_snapshot(include_messages=include_messages)
+    }
+
+
+def decode_meeting_data(state: Dict[str, Any], rows: Optional[List[list]] = None) -> Dict[str, Any]:
+    """
+    由持久化的状态重建 active_meetings 中的一项
+
+    参数:
+        state: encode_meeting_data() 的结果
+        rows: 从 meeting_messages 读取的消息行，None 表示消息包含在 state 中
+
+    返回:
+        Dict[str, Any]: {"meeting", "group_id", "start_time"}
+    """
+    snapshot = state["meeting"]
+    if rows is not None:
+        snapshot = dict(snapshot, messages=rows)
+    meeting = Meeting.from_snapshot(snapshot, _create_mode(snapshot.get("mode")))
+    start_time = state.get("start_time")
+    return {
+        "meeting": meeting,
+        "group_id": state.get("group_id"),
+        "start_time": datetime.fromisoformat(start_time) if start_time else meeting.start_time
+    }
+
+
+def _entries_bytes(entries) -> int:
+    """估算消息列表的内存占用"""
+    total = 0
+    for entry in entries or []:
+        if isinstance(entry, dict):
+            content = entry.get("content")
+            total += _ENTRY_OVERHEAD_BYTES + (sys.getsizeof(content) if isinstance(content, str) else 0)
+        else:
+            total += _ENTRY_OVERHEAD_BYTES
+    return total
+
+
+def estimate_meeting_bytes(meeting: Meeting) -> int:
+    """
+    估算会议占用的内存（消息内容与智能体对话记录，LLM 客户端在进程内共享不计入）
+
+    参数:
+        meeting: 会议对象
+
+    返回:
+        int: 估算的字节数
+    """
+    total = meeting.message_log.estimated_bytes()
+    for agent in meeting.agents:
+        total += _AGENT_OVERHEAD_BYTES + _entries_bytes(getattr(agent, "conversation_history", None))
+    return total
+
+
+def _read_state(db, meeting_id: str) -> Optional[MeetingState]:
+    """读取会议的持久化记录"""
+    return db.get(MeetingState, meeting_id)
+
+
+def _read_rows(db, meeting_id: str, count: int) -> List[list]:
+    """按 seq 顺序读取会议的前 count 条消息行"""
+    return [
+        data for (data,) in db.query(MeetingMessage.data)
+        .filter(MeetingMessage.meeting_id == meeting_id, MeetingMessage.seq < count)
+        .order_by(MeetingMessage.seq)
+    ]
+
+
+def _insert_rows(db, meeting_id: str, start: int, rows: List[list]) -> None:
+    """批量追加消息行，第一行的 seq 为 start"""
+    if rows:
+        db.execute(
+            insert(MeetingMessage),
+            [{"meeting_id": meeting_id, "seq": start + i, "data": row} for i, row in enumerate(rows)]
+        )
+
+
+def _write_state(db, meeting_id: str, meeting_data: Dict[str, Any], revision: Optional[int],
+                 state: Optional[Dict[str, Any]] = None, rows: Optional[List[list]] = None) -> int:
+    """
+    整体写入会议的持久化记录与全部消息（调用方负责提交）
+
+    参数:
+        db: 数据库会话
+        meeting_id: 会议ID
+        meeting_data: {"meeting", "group_id", "start_time"}
+        revision: 本进程已知的 revision，None 表示不检查是否被其他进程更新过
+        state: 已编码的不含消息的状态，默认由 meeting_data 生成
+        rows: 全部消息行，默认由 meeting_data 生成
+
+    返回:
+        int: 写入后的 revision
+    """
+    meeting = meeting_data["meeting"]
+    if state is None:
+        state = encode_meeting_data(meeting_data, include_messages=False)
+    if rows is None:
+        rows = meeting.message_log.to_rows()
+    row = _read_state(db, meeting_id)
+    if row is None:
+        row = MeetingState(id=meeting_id, revision=0, start_time=meeting_data.get("start_time"))
+        db.add(row)
+    elif revision is not None and row.revision > revision:
+        logger.warning(
+            f"会议 {meeting_id} 已被其他进程更新 (revision {row.revision} > {revision})，以当前进程的状态覆盖"
+        )
+    row.revision = (row.revision or 0) + 1
+    row.group_id = meeting_data.get("group_id")
+    row.topic = meeting.topic
+    row.status = meeting.status
+    row.state = state
+    row.message_count = len(rows)
+    row.updated_at = datetime.now()
+    db.query(MeetingMessage).filter(MeetingMessage.meeting_id == meeting_id).delete(synchronize_session=False)
+    _insert_rows(db, meeting_id, 0, rows)
+    return row.revision
+
+
+class _PendingWrite:
+    """在会议所在线程准备好的一次保存：序列化后的状态与新增消息行，写库可以在其他线程执行"""
+
+    __slots__ = ("meeting_id", "meeting_data", "generation", "since", "rows", "state", "state_key",
+                 "group_id", "topic", "status")
+
+    def __init__(self, meeting_id: str, meeting_data: Dict[str, Any], generation: int, since: int):
+        meeting = meeting_data["meeting"]
+        self.meeting_id = meeting_id
+        self.meeting_data = meeting_data
+        self.generation = generation
+        self.since = since
+        # 消息记录不可变，只转换 seq >= since 的新记录
+        self.rows = [record.to_row() for record in meeting.message_log.records(since)]
+        self.state = encode_meeting_data(meeting_data, include_messages=False)
+        self.state_key = json_codec.dumps(self.state, default=str)
+        self.group_id = meeting_data.get("group_id")
+        self.topic = meeting.topic
+        self.status = meeting.status
+
+
+def _write_delta(db, write: _PendingWrite, start: int, rows: List[list],
+                 revision: int, state_changed: bool) -> Optional[int]:
+    """
+    增量写入：追加新消息，状态有变化时才更新 state 等列（调用方负责提交）
+
+    参数:
+        db: 数据库会话
+        write: 准备好的保存
+        start: 第一条新消息的 seq
+        rows: 新消息行
+        revision: 本进程已知的 revision
+        state_changed: 状态是否与上次保存的不同
+
+    返回:
+        Optional[int]: 写入后的 revision；记录不存在或已被其他进程更新时返回 None（需要整体重写）
+    """
+    values = {
+        MeetingState.revision: MeetingState.revision + 1,
+        MeetingState.message_count: start + len(rows),
+        MeetingState.updated_at: datetime.now(),
+    }
+    if state_changed:
+        values.update({
+            MeetingState.state: write.state,
+            MeetingState.group_id: write.group_id,
+            MeetingState.topic: write.topic,
+            MeetingState.status: write.status,
+        })
+    updated = db.query(MeetingState).filter(
+        MeetingState.id == write.meeting_id, MeetingState.revision == revision
+    ).update(values, synchronize_session=False)
+    if not updated:
+        return None
+    _insert_rows(db, write.meeting_id, start, rows)
+    return revision + 1
+
+
+class MeetingStore(MutableMapping, abc.ABC):
+    """
+    会议状态存储接口，按字典方式访问，另外提供持久化与淘汰相关的方法
+
+    子类实现 _live()/_discard() 暴露内存中的会议，淘汰策略由 evict() 统一实现。
+    """
+
+    backend = "base"
+
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self._lock = threading.RLock()
+        self._last_access: Dict[str, float] = {}
+        self._stats = {
+            "saves": 0, "loads": 0, "cache_hits": 0, "errors": 0,
+            "evictions": 0, "archived": 0, "reloads": 0,
+        }
+
+    def _touch(self, meeting_id: str) -> None:
+        """记录会议的最近访问时间"""
+        self._last_access[meeting_id] = time.time()
+
+    @abc.abstractmethod
+    def _live(self) -> Dict[str, Dict[str, Any]]:
+        """内存中的会议（会议ID -> 会议数据）"""
+
+    @abc.abstractmethod
+    def _discard(self, meeting_id: str) -> bool:
+        """归档并从内存移除会议，归档失败时保留在内存并返回 False"""
+
+    def _cached(self, meeting_id: str) -> Optional[Dict[str, Any]]:
+        """内存中的会议数据（不访问数据库、不记录访问），不在内存中时返回 None"""
+        return self._live().get(meeting_id)
+
+    def _peek(self, meeting_id: str) -> Optional[Dict[str, Any]]:
+        """不访问数据库即可使用的会议数据，需要查询数据库时返回 None"""
+        return None
+
+    async def get_async(self, meeting_id: str, default: Any = None) -> Any:
+        """
+        在事件循环中获取会议：内存命中时直接返回，需要访问数据库时交给线程执行
+
+        参数:
+            meeting_id: 会议ID
+            default: 会议不存在时的返回值
+
+        返回:
+            会议数据，不存在时返回 default
+        """
+        meeting_data = self._peek(meeting_id)
+        if meeting_data is not None:
+            return meeting_data
+        try:
+            return await asyncio.to_thread(self.__getitem__, meeting_id)
+        except KeyError:
+            return default
+
+    async def contains_async(self, meeting_id: str) -> bool:
+        """在事件循环中判断会议是否存在，需要访问数据库时交给线程执行"""
+        if self._peek(meeting_id) is not None:
+            return True
+        return await asyncio.to_thread(self.__contains__, meeting_id)
+
+    def _archive(self, meeting_id: str, meeting_data: Dict[str, Any], revision: Optional[int] = None) -> Optional[int]:
+        """把会议写入 meeting_states 表，返回写入后的 revision，失败时返回 None"""
+        db = self._session_factory()
+        try:
+            revision = _write_state(db, meeting_id, meeting_data, revision)
+            db.commit()
+            return revision
+        except Exception as e:
+            db.rollback()
+            self._stats["errors"] += 1
+            logger.error(f"保存会议状态失败: meeting_id={meeting_id}, 错误: {str(e)}", exc_info=True)
+            return None
+        finally:
+            db.close()
+
+    def _load_archived(self, db, meeting_id: str) -> Tuple[Dict[str, Any], int, Optional[int]]:
+        """
+        从 meeting_states / meeting_messages 表加载并重建会议，不存在或无法重建时抛出 KeyError
+
+        返回:
+            Tuple: (会议数据, revision, 已保存的消息数)；消息仍在旧格式快照中时消息数为 None
+        """
+        row = _read_state(db, meeting_id)
+        if row is None:
+            raise KeyError(meeting_id)
+        count = None
+        try:
+            if "messages" in (row.state.get("meeting") or {}):
+                # 旧格式：消息保存在快照中，下一次保存时整体迁移到 meeting_messages
+                meeting_data = decode_meeting_data(row.state)
+            else:
+                count = row.message_count or 0
+                meeting_data = decode_meeting_data(row.state, _read_rows(db, meeting_id, count))
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.error(f"重建会议失败: meeting_id={meeting_id}, 错误: {str(e)}", exc_info=True)
+            raise KeyError(meeting_id) from e
+        self._stats["loads"] += 1
+        logger.info(f"已从存储重建会议: meeting_id={meeting_id}, revision={row.revision}")
+        return meeting_data, row.revision, count
+
+    def save(self, meeting_id: str) -> bool:
+        """
+        持久化指定会议的当前状态（会议状态变化后调用）
+
+        参数:
+            meeting_id: 会议ID
+
+        返回:
+            bool: 是否已保存
+        """
+        self._touch(meeting_id)
+        return False
+
+    def save_later(self, meeting_id: str) -> bool:
+        """
+        在事件循环中保存会议（默认直接调用 save()；SQL 存储准备好增量后交给线程写入）
+
+        参数:
+            meeting_id: 会议ID
+
+        返回:
+            bool: 是否已保存或已安排保存
+        """
+        return self.save(meeting_id)
+
+    def snapshot_all(self) -> int:
+        """保存本进程中所有会议的状态（应用关闭时调用），返回保存的会议数"""
+        return 0
+
+    def restore(self) -> int:
+        """加载所有未结束的会议（应用启动时调用），返回恢复的会议数"""
+        return 0
+
+    def release(self, meeting_id: str) -> bool:
+        """
+        立即归档并从内存移除指定会议（如因人类输入超时而结束的会议），之后访问时从归档重新加载
+
+        参数:
+            meeting_id: 会议ID
+
+        返回:
+            bool: 是否已移除；正在被流式请求驱动或归档失败时返回 False
+        """
+        if event_bus.is_driving(meeting_id):
+            return False
+        with self._lock:
+            if meeting_id not in self._live() or not self._discard(meeting_id):
+                return False
+        notifier.discard(meeting_id)
+        self._stats["evictions"] += 1
+        logger.info(f"已归档并释放会议: {meeting_id}")
+        return True
+
+    def evict(self, now: Optional[float] = None, settings: Optional[Dict[str, int]] = None) -> List[str]:
+        """
+        按淘汰策略归档并移除内存中的会议
+
+        - 已结束且空闲超过 finished_ttl 秒、或空闲超过 idle_ttl 秒的会议
+        - 内存中的会议超过 max_live 个或估算内存超过 max_bytes 时，按最近最少使用淘汰
+          （已结束的会议优先），但不淘汰 min_idle 秒内访问过的会议，以免打断正在进行的流式讨论
+        - 正在被流式请求驱动的会议（包括挂起等待人类输入的）不会被淘汰
+
+        参数:
+            now: 当前时间戳（默认 time.time()）
+            settings: 淘汰策略配置（默认读取环境变量）
+
+        返回:
+            List[str]: 被淘汰的会议ID
+        """
+        now = now if now is not None else time.time()
+        settings = settings or _load_eviction_settings()
+
+        with self._lock:
+            # 驱动中的会议由流持有对象引用，淘汰后重新加载会得到另一个对象
+            all_live = self._live()
+            live = {
+                meeting_id: meeting_data for meeting_id, meeting_data in all_live.items()
+                if not event_bus.is_driving(meeting_id)
+            }
+            pinned = [meeting_id for meeting_id in all_live if meeting_id not in live]
+            idle = {meeting_id: now - self._last_access.get(meeting_id, now) for meeting_id in live}
+            finished = {
+                meeting_id: meeting_data["meeting"].status == ENDED_STATUS
+                for meeting_id, meeting_data in live.items()
+            }
+
+            victims = [
+                meeting_id for meeting_id in live
+                if (finished[meeting_id] and idle[meeting_id] >= settings["finished_ttl"])
+                or idle[meeting_id] >= settings["idle_ttl"]
+            ]
+
+            remaining = [meeting_id for meeting_id in live if meeting_id not in victims]
+            sizes = {meeting_id: estimate_meeting_bytes(live[meeting_id]["meeting"]) for meeting_id in remaining}
+            total_bytes = sum(sizes.values()) + sum(estimate_meeting_bytes(all_live[meeting_id]["meeting"]) for meeting_id in pinned)
+            # 已结束的优先，其次按最近访问时间从旧到新
+            remaining.sort(key=lambda meeting_id: (not finished[meeting_id], -idle[meeting_id]))
+            for meeting_id in remaining:
+                if len(all_live) - len(victims) <= settings["max_live"] and total_bytes <= settings["max_bytes"]:
+                    break
+                if idle[meeting_id] < settings["min_idle"]:
+                    continue
+                victims.append(meeting_id)
+                total_bytes -= sizes[meeting_id]
+
+            evicted = [meeting_id for meeting_id in victims if self._discard(meeting_id)]
+
+        for meeting_id in evicted:
+            notifier.discard(meeting_id)
+        if evicted:
+            self._stats["evictions"] += len(evicted)
+            logger.info(f"已淘汰 {len(evicted)} 个会议: {evicted}")
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        """返回存储统计信息（内存中的会议数与估算内存占用）"""
+        with self._lock:
+            live = self._live()
+            estimated_bytes = sum(estimate_meeting_bytes(data["meeting"]) for data in live.values())
+        return {
+            "backend": self.backend,
+            "live_meetings": len(live),
+            "estimated_bytes": estimated_bytes,
+            **self._stats,
+        }
+
+
+class MemoryMeetingStore(MeetingStore):
+    """
+    进程内存储，会议只在当前进程中可见
+
+    被淘汰的会议与关闭时仍在内存中的会议归档到 meeting_states 表，再次访问时重新加载。
+    """
+
+    backend = "memory"
+
+    def __init__(self, session_factory=SessionLocal):
+        super().__init__(session_factory)
+        self._meetings: Dict[str, Dict[str, Any]] = {}
+
+    def _live(self) -> Dict[str, Dict[str, Any]]:
+        return dict(self._meetings)
+
+    def _discard(self, meeting_id: str) -> bool:
+        meeting_data = self._meetings.get(meeting_id)
+        if meeting_data is None:
+            return False
+        if self._archive(meeting_id, meeting_data) is None:
+            return False
+        self._stats["archived"] += 1
+        del self._meetings[meeting_id]
+        self._last_access.pop(meeting_id, None)
+        return True
+
+    def _cached(self, meeting_id: str) -> Optional[Dict[str, Any]]:
+        return self._meetings.get(meeting_id)
+
+    def _peek(self, meeting_id: str) -> Optional[Dict[str, Any]]:
+        meeting_data = self._meetings.get(meeting_id)
+        if meeting_data is not None:
+            self._touch(meeting_id)
+        return meeting_data
+
+    def __getitem__(self, meeting_id: str) -> Dict[str, Any]:
+        with self._lock:
+            meeting_data = self._peek(meeting_id)
+            if meeting_data is not None:
+                return meeting_data
+
+            # 不在内存中时尝试从归档重新加载
+            db = self._session_factory()
+            try:
+                meeting_data, _, _ = self._load_archived(db, meeting_id)
+            finally:
+                db.close()
+            self._meetings[meeting_id] = meeting_data
+            self._touch(meeting_id)
+            self._stats["reloads"] += 1
+            return meeting_data
+
+    def __contains__(self, meeting_id: object) -> bool:
+        if meeting_id in self._meetings:
+            return True
+        db = self._session_factory()
+        try:
+            return db.query(MeetingState.id).filter(MeetingState.id == meeting_id).first() is not None
+        finally:
+            db.close()
+
+    def __setitem__(self, meeting_id: str, meeting_data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._meetings[meeting_id] = meeting_data
+            self._touch(meeting_id)
+
+    def __delitem__(self, meeting_id: str) -> None:
+        with self._lock:
+            found = self._meetings.pop(meeting_id, None) is not None
+            self._last_access.pop(meeting_id, None)
+            db = self._session_factory()
+            try:
+                found = db.query(MeetingState).filter(MeetingState.id == meeting_id).delete() > 0 or found
+                db.query(MeetingMessage).filter(MeetingMessage.meeting_id == meeting_id).delete()
+                db.commit()
+            finally:
+                db.close()
+            if not found:
+                raise KeyError(meeting_id)
+        notifier.forget(meeting_id)
+        event_bus.close(meeting_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._meetings))
+
+    def __len__(self) -> int:
+        return len(self._meetings)
+
+    def snapshot_all(self) -> int:
+        with self._lock:
+            saved = sum(
+                1 for meeting_id, meeting_data in list(self._meetings.items())
+                if self._archive(meeting_id, meeting_data) is not None
+            )
+        logger.info(f"已归档 {saved} 个会议的状态")
+        return saved
+
+
+class _CachedMeeting:
+    """SQL 存储本地缓存的会议及其持久化进度"""
+
+    __slots__ = ("data", "revision", "count", "state_key", "generation", "checked")
+
+    def __init__(self, data: Dict[str, Any], revision: int, count: Optional[int] = None):
+        self.data = data
+        self.revision = revision
+        # 已保存到 meeting_messages 的消息数，None 表示下一次保存需要整体重写
+        self.count = count
+        # 上一次写入的状态序列化结果，相同时不再更新 state 列
+        self.state_key: Optional[str] = None
+        # 已写入的最新一次保存的序号，较早准备的保存不会覆盖较新的状态
+        self.generation = -1
+        # 最近一次确认 revision 的时间
+        self.checked = time.monotonic()
+
+
+class SQLMeetingStore(MeetingStore):
+    """
+    数据库存储，会议状态保存在 meeting_states 表中，消息追加保存在 meeting_messages 表中
+
+    本地缓存已重建的会议对象及其 revision；访问时按 MEETING_REVISION_CHECK_INTERVAL
+    检查数据库中的 revision，被其他 worker 更新过时重新加载，因此任意 worker 都能继续同一个会议。
+    本进程正在驱动或有未写完保存的会议直接使用本地缓存。
+    """
+
+    backend = "sql"
+
+    def __init__(self, session_factory=SessionLocal):
+        super().__init__(session_factory)
+        self._cache: Dict[str, _CachedMeeting] = {}
+        self._generation = itertools.count()
+        # 同一会议的写入串行执行
+        self._write_locks: Dict[str, threading.Lock] = {}
+        # 等待写入的会议与正在执行的写入任务（只在事件循环线程中修改）
+        self._dirty: Set[str] = set()
+        self._flushing: Dict[str, asyncio.Task] = {}
+
+    def _live(self) -> Dict[str, Dict[str, Any]]:
+        return {meeting_id: cached.data for meeting_id, cached in self._cache.items()}
+
+    def _discard(self, meeting_id: str) -> bool:
+        # 每次状态变化都已持久化，这里再保存一次以防遗漏的修改
+        if not self.save(meeting_id):
+            return False
+        self._stats["archived"] += 1
+        self._cache.pop(meeting_id, None)
+        self._write_locks.pop(meeting_id, None)
+        self._last_access.pop(meeting_id, None)
+        return True
+
+    def _load(self, db, meeting_id: str) -> Dict[str, Any]:
+        """从数据库加载并缓存会议"""
+        meeting_data, revision, count = self._load_archived(db, meeting_id)
+        self._cache[meeting_id] = _CachedMeeting(meeting_data, revision, count)
+        return meeting_data
+
+    def _trusted(self, meeting_id: str, cached: _CachedMeeting) -> bool:
+        """本地缓存是否可以不查询 revision 直接使用"""
+        return (
+            meeting_id in self._dirty
+            or meeting_id in self._flushing
+            or event_bus.is_driving(meeting_id)
+            or time.monotonic() - cached.checked < MEETING_REVISION_CHECK_INTERVAL
+        )
+
+    def _cached(self, meeting_id: str) -> Optional[Dict[str, Any]]:
+        cached = self._cache.get(meeting_id)
+        return cached.data if cached is not None else None
+
+    def _peek(self, meeting_id: str) -> Optional[Dict[str, Any]]:
+        cached = self._cache.get(meeting_id)
+        if cached is None or not self._trusted(meeting_id, cached):
+            return None
+        self._touch(meeting_id)
+        self._stats["cache_hits"] += 1
+        return cached.data
+
+    def __getitem__(self, meeting_id: str) -> Dict[str, Any]:
+        with self._lock:
+            meeting_data = self._peek(meeting_id)
+            if meeting_data is not None:
+                return meeting_data
+
+            cached = self._cache.get(meeting_id)
+            db = self._session_factory()
+            try:
+                revision = db.query(MeetingState.revision).filter(MeetingState.id == meeting_id).scalar()
+                if revision is None:
+                    # 会议不存在或已被其他 worker 删除
+                    self._cache.pop(meeting_id, None)
+                    raise KeyError(meeting_id)
+
+                self._touch(meeting_id)
+                if cached is not None and cached.revision >= revision:
+                    cached.checked = time.monotonic()
+                    self._stats["cache_hits"] += 1
+                    return cached.data
+                return self._load(db, meeting_id)
+            finally:
+                db.close()
+
+    def __contains__(self, meeting_id: object) -> bool:
+        cached = self._cache.get(meeting_id)
+        if cached is not None and self._trusted(meeting_id, cached):
+            return True
+        db = self._session_factory()
+        try:
+            return db.query(MeetingState.id).filter(MeetingState.id == meeting_id).first() is not None
+        finally:
+            db.close()
+
+    def __setitem__(self, meeting_id: str, meeting_data: Dict[str, Any]) -> None:
+        with self._lock:
+            cached = self._cache.get(meeting_id)
+            # 新的会议对象：下一次保存整体写入
+            self._cache[meeting_id] = _CachedMeeting(meeting_data, cached.revision if cached else 0)
+            self._touch(meeting_id)
+        self.save_later(meeting_id)
+
+    def __delitem__(self, meeting_id: str) -> None:
+        with self._lock:
+            self._cache.pop(meeting_id, None)
+            self._write_locks.pop(meeting_id, None)
+            self._dirty.discard(meeting_id)
+            self._last_access.pop(meeting_id, None)
+            db = self._session_factory()
+            try:
+                deleted = db.query(MeetingState).filter(MeetingState.id == meeting_id).delete()
+                db.query(MeetingMessage).filter(MeetingMessage.meeting_id == meeting_id).delete()
+                db.commit()
+            finally:
+                db.close()
+            if not deleted:
+                raise KeyError(meeting_id)
+        notifier.forget(meeting_id)
+        event_bus.close(meeting_id)
+
+    def __iter__(self) -> Iterator[str]:
+        db = self._session_factory()
+        try:
+            return iter([row.id for row in db.query(MeetingState.id).all()])
+        finally:
+            db.close()
+
+    def __len__(self) -> int:
+        db = self._session_factory()
+        try:
+            return db.query(MeetingState.id).count()
+        finally:
+            db.close()
+
+    def _prepare(self, meeting_id: str) -> Optional[_PendingWrite]:
+        """在会议所在线程序列化状态并取出未保存的消息（不访问数据库）"""
+        cached = self._cache.get(meeting_id)
+        if cached is None:
+            return None
+        self._touch(meeting_id)
+        since = cached.count if cached.count is not None else 0
+        return _PendingWrite(meeting_id, cached.data, next(self._generation), since)
+
+    def _write(self, write: _PendingWrite) -> bool:
+        """把准备好的保存写入数据库（可在线程池中执行）"""
+        meeting_id = write.meeting_id
+        with self._write_locks.setdefault(meeting_id, threading.Lock()):
+            cached = self._cache.get(meeting_id)
+            if cached is None or cached.data is not write.meeting_data:
+                # 会议已被移除，或已替换为新的会议对象
+                return False
+            if write.generation < cached.generation:
+                # 更晚准备的保存已经写入，其中包含了本次的全部消息
+                return True
+
+            db = self._session_factory()
+            try:
+                revision = None
+                if cached.count is not None:
+                    # 与已写入的保存重叠的消息跳过
+                    start = max(cached.count, write.since)
+                    rows = write.rows[start - write.since:]
+                    revision = _write_delta(
+                        db, write, start, rows, cached.revision, write.state_key != cached.state_key
+                    )
+                if revision is None:
+                    # 首次保存、旧格式快照或被其他进程更新过：整体重写
+                    start = 0
+                    rows = write.rows if write.since == 0 else write.meeting_data["meeting"].message_log.to_rows()
+                    revision = _write_state(db, meeting_id, write.meeting_data, cached.revision, write.state, rows)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                self._stats["errors"] += 1
+                logger.error(f"保存会议状态失败: meeting_id={meeting_id}, 错误: {str(e)}", exc_info=True)
+                return False
+            finally:
+                db.close()
+
+            cached.revision = revision
+            cached.count = start + len(rows)
+            cached.state_key = write.state_key
+            cached.generation = write.generation
+            cached.checked = time.monotonic()
+            self._stats["saves"] += 1
+            return True
+
+    def save(self, meeting_id: str) -> bool:
+        write = self._prepare(meeting_id)
+        return write is not None and self._write(write)
+
+    def save_later(self, meeting_id: str) -> bool:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.save(meeting_id)
+        if meeting_id not in self._cache:
+            return False
+        self._touch(meeting_id)
+        self._dirty.add(meeting_id)
+        if meeting_id not in self._flushing:
+            self._flushing[meeting_id] = loop.create_task(self._flush(meeting_id))
+        return True
+
+    async def _flush(self, meeting_id: str) -> None:
+        """写入会议的待保存状态；写入期间的多次保存合并为下一次写入"""
+        try:
+            while meeting_id in self._dirty:
+                self._dirty.discard(meeting_id)
+                write = self._prepare(meeting_id)
+                if write is None:
+                    break
+                await asyncio.to_thread(self._write, write)
+        finally:
+            self._flushing.pop(meeting_id, None)
+
+    def snapshot_all(self) -> int:
+        saved = 0
+        for meeting_id in list(self._cache):
+            if self.save(meeting_id):
+                saved += 1
+        logger.info(f"已保存 {saved} 个会议的状态")
+        return saved
+
+    def restore(self) -> int:
+        restored = 0
+        db = self._session_factory()
+        try:
+            ids = [
+                row.id for row in db.query(MeetingState.id)
+                .filter((MeetingState.status != ENDED_STATUS) | (MeetingState.status.is_(None)))
+                .all()
+            ]
+            with self._lock:
+                for meeting_id in ids:
+                    try:
+                        self._load(db, meeting_id)
+                        self._touch(meeting_id)
+                        restored += 1
+                    except KeyError:
+                        continue
+        finally:
+            db.close()
+        logger.info(f"已从存储恢复 {restored} 个未结束的会议")
+        return restored
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "size": len(self), "pending_saves": len(self._dirty | set(self._flushing))}
+
+
+_store: Optional[MeetingStore] = None
+_store_lock = threading.Lock()
+_eviction_task: Optional[asyncio.Task] = None
+
+
+def create_meeting_store(backend: Optional[str] = None) -> MeetingStore:
+    """
+    按名称创建存储后端
+
+    参数:
+        backend: memory 或 sql，默认读取环境变量 MEETING_STORE
+
+    返回:
+        MeetingStore: 存储实例
+    """
+    backend = (backend or os.getenv("MEETING_STORE", "memory")).strip().lower()
+    if backend in ("sql", "sqlite", "database", "db"):
+        return SQLMeetingStore()
+    if backend != "memory":
+        logger.warning(f"未知的会议存储后端 {backend}，使用进程内存储")
+    return MemoryMeetingStore()
+
+
+def get_meeting_store() -> MeetingStore:
+    """获取进程内共享的会议存储（首次调用时按 MEETING_STORE 创建）"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_meeting_store()
+                logger.info(f"会议存储后端: {_store.backend}")
+    return _store
+
+
+def save_meeting(meeting_id: str) -> bool:
+    """持久化指定会议的当前状态并通知等待中的长轮询，失败只记录日志不影响会议进行
+
+    在事件循环中调用时只准备增量，写库交给线程执行，不阻塞事件循环。
+    """
+    notifier.notify(meeting_id)
+    try:
+        store = get_meeting_store()
+        saved = store.save_later(meeting_id)
+        meeting_data = store._cached(meeting_id)
+        if meeting_data is not None and meeting_data["meeting"].status == ENDED_STATUS:
+            # 已结束的会议不再需要保留变更版本号（之后的变化会重新记录）
+            notifier.discard(meeting_id)
+        return saved
+    except Exception as e:
+        logger.error(f"保存会议状态失败: meeting_id={meeting_id}, 错误: {str(e)}", exc_info=True)
+        return False
+
+
+async def _eviction_loop(interval: int) -> None:
+    """后台定期执行淘汰（数据库读写放到线程池，避免阻塞事件循环）"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(get_meeting_store().evict)
+        except Exception as e:
+            logger.error(f"淘汰会议时出错: {str(e)}", exc_info=True)
+
+
+def start_eviction() -> None:
+    """启动后台淘汰任务（应用启动时调用，MEETING_EVICT_INTERVAL<=0 时不启动）"""
+    global _eviction_task
+    interval = _load_eviction_settings()["interval"]
+    if interval <= 0 or (_eviction_task is not None and not _eviction_task.done()):
+        return
+    _eviction_task = asyncio.get_running_loop().create_task(_eviction_loop(interval))
+    logger.info(f"会议淘汰任务已启动，间隔 {interval} 秒")
+
+
+async def stop_eviction() -> None:
+    """停止后台淘汰任务（应用关闭时调用）"""
+    global _eviction_task
+    task, _eviction_task = _eviction_task, None
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
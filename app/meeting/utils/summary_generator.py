@@ -3,12 +3,16 @@ from langchain.schema import HumanMessage
 import os
 import traceback
 import logging
-import time
-import random
 from typing import List, Dict, Any
-import json
 import asyncio
 
+from app.clients.transport import get_aiohttp_session, run_sync
+from app.clients.sse import iter_sse_data
+from app.clients.retry import UpstreamStatusError, call_with_retry, retry_stream
+from app.clients import breaker
+from app.clients import limiter
+from app.utils import json_codec
+
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("SummaryGenerator")
@@ -21,11 +25,56 @@ class SummaryGenerator:
         self.api_key = api_key
         self.api_url = api_url
     
+    @staticmethod
+    def _build_summary_prompt(meeting_topic: str, meeting_history: List[Dict[str, Any]], prompt_template: str) -> str:
+        """用会议历史（排除系统消息）填充总结提示模板"""
+        history_text = ""
+        for entry in meeting_history:
+            if entry["agent"] != "system":  # 排除系统消息
+                history_text += f"[{entry['agent']}]: {entry['content']}\n\n"
+        
+        return prompt_template.format(
+            topic=meeting_topic,
+            meeting_topic=meeting_topic,
+            history=history_text,
+            history_text=history_text
+        )
+    
+    @staticmethod
+    def _create_summary_llm(model_name: str = None, api_key: str = None, api_base_url: str = None) -> ChatOpenAI:
+        """创建生成总结使用的 LLM（SDK 自带重试关闭，由统一重试策略负责）"""
+        logger.info(f"使用模型生成总结: model_name={model_name or '默认模型'}")
+        
+        # 如果API URL或密钥为空，记录警告
+        if not api_base_url:
+            logger.warning("API基础URL为空，可能影响总结生成")
+        if not api_key:
+            logger.warning("API密钥为空，可能影响总结生成")
+        
+        # 创建模型时传入API密钥和基础URL
+        model_kwargs = {"temperature": 0.3, "max_retries": 0}
+        if api_key:
+            model_kwargs["api_key"] = api_key
+            logger.info("使用提供的API密钥")
+        if api_base_url:
+            model_kwargs["base_url"] = api_base_url
+            logger.info(f"使用提供的API基础URL: {api_base_url}")
+        
+        # 设置默认模型名称
+        if not model_name:
+            model_name = os.environ.get("OPENAI_MODEL_NAME", "gpt-3.5-turbo")
+            logger.info(f"使用默认模型名称: {model_name}")
+        
+        logger.info(f"初始化LLM模型: {model_name}")
+        return ChatOpenAI(model_name=model_name, **model_kwargs)
+    
     @staticmethod
     def generate_summary(meeting_topic: str, meeting_history: List[Dict[str, Any]], 
                          prompt_template: str, model_name: str = None, api_key: str = None, api_base_url: str = None) -> str:
         """
-        生成会议总结
+        生成会议总结（同步版本，只应在工作线程中调用；事件循环中使用 generate_summary_async）
+        
+        把 generate_summary_async 提交到应用事件循环执行，与异步版本共用重试策略、熔断与端点限流。
         
         Args:
             meeting_topic: 会议主题
@@ -38,80 +87,34 @@ class SummaryGenerator:
         Returns:
             str: 生成的总结
         """
+        return run_sync(SummaryGenerator.generate_summary_async(
+            meeting_topic, meeting_history, prompt_template, model_name, api_key, api_base_url
+        ))
+    
+    @staticmethod
+    async def generate_summary_async(meeting_topic: str, meeting_history: List[Dict[str, Any]], 
+                                     prompt_template: str, model_name: str = None, api_key: str = None,
+                                     api_base_url: str = None) -> str:
+        """
+        异步生成会议总结，参数与返回值同 generate_summary，重试等待不阻塞事件循环
+        """
         try:
             logger.info(f"开始生成'{meeting_topic}'的会议总结: 历史消息数={len(meeting_history)}")
-            
-            # 构建历史文本
-            history_text = ""
-            for entry in meeting_history:
-                if entry["agent"] != "system":  # 排除系统消息
-                    history_text += f"[{entry['agent']}]: {entry['content']}\n\n"
-            
-            # 格式化提示模板
-            summary_prompt = prompt_template.format(
-                topic=meeting_topic,
-                meeting_topic=meeting_topic,
-                history=history_text,
-                history_text=history_text
-            )
-            
-            # 获取模型名称
-            logger.info(f"使用模型生成总结: model_name={model_name or '默认模型'}")
-            
-            # 如果API URL或密钥为空，记录警告
-            if not api_base_url:
-                logger.warning("API基础URL为空，可能影响总结生成")
-            if not api_key:
-                logger.warning("API密钥为空，可能影响总结生成")
+            summary_prompt = SummaryGenerator._build_summary_prompt(meeting_topic, meeting_history, prompt_template)
             
             try:
-                # 创建模型时传入API密钥和基础URL
-                model_kwargs = {"temperature": 0.3}
-                if api_key:
-                    model_kwargs["api_key"] = api_key
-                    logger.info("使用提供的API密钥")
-                if api_base_url:
-                    model_kwargs["base_url"] = api_base_url
-                    logger.info(f"使用提供的API基础URL: {api_base_url}")
-                
-                # 设置默认模型名称
-                if not model_name:
-                    model_name = os.environ.get("OPENAI_MODEL_NAME", "gpt-3.5-turbo")
-                    logger.info(f"使用默认模型名称: {model_name}")
-                
-                logger.info(f"初始化LLM模型: {model_name}")
-                llm = ChatOpenAI(model_name=model_name, **model_kwargs)
-                
-                # 智能重试机制
-                max_retries = 3
-                base_delay = 2
-                
-                for attempt in range(max_retries + 1):
-                    try:
-                        if attempt > 0:
-                            logger.info(f"总结生成尝试 {attempt}/{max_retries}...")
-                        
-                        logger.info("调用LLM生成总结")
-                        response = llm.invoke([HumanMessage(content=summary_prompt)])
-                        summary = response.content
-                        
-                        logger.info(f"成功生成总结: 长度={len(summary)}")
-                        return summary
-                        
-                    except Exception as e:
-                        logger.warning(f"总结生成错误: {str(e)}")
-                        
-                        if attempt == max_retries:
-                            raise  # 最后一次尝试，重新抛出异常
-                        
-                        # 指数退避
-                        delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
-                        logger.info(f"等待 {delay:.2f} 秒后重试...")
-                        time.sleep(delay)
-                
+                llm = SummaryGenerator._create_summary_llm(model_name, api_key, api_base_url)
+                logger.info("调用LLM生成总结")
+                response = await call_with_retry(
+                    lambda: llm.ainvoke([HumanMessage(content=summary_prompt)]), name="会议总结生成",
+                    circuit=breaker.get_circuit(None, api_base_url, api_key),
+                    quota=limiter.quota(api_base_url, api_key, summary_prompt)
+                )
+                summary = response.content
+                logger.info(f"成功生成总结: 长度={len(summary)}")
+                return summary
             except Exception as e:
                 logger.error(f"调用API生成总结失败: {str(e)}", exc_info=True)
-                # 调用备用方法生成模板总结
                 logger.info("使用模板总结作为备用")
                 return SummaryGenerator._generate_template_summary(meeting_topic, len(meeting_history))
             
@@ -170,19 +173,8 @@ class SummaryGenerator:
         try:
             logger.info(f"开始流式生成'{meeting_topic}'的会议总结: 历史消息数={len(meeting_history)}")
             
-            # 构建历史文本
-            history_text = ""
-            for entry in meeting_history:
-                if entry["agent"] != "system":  # 排除系统消息
-                    history_text += f"[{entry['agent']}]: {entry['content']}\n\n"
-            
             # 格式化提示模板
-            summary_prompt = prompt_template.format(
-                topic=meeting_topic,
-                meeting_topic=meeting_topic,
-                history=history_text,
-                history_text=history_text
-            )
+            summary_prompt = SummaryGenerator._build_summary_prompt(meeting_topic, meeting_history, prompt_template)
             
             # 获取或设置默认模型参数
             if not model_params:
@@ -241,59 +233,43 @@ class SummaryGenerator:
                 # 打印完整参数配置（调试用，生产环境可注释）
                 logger.debug(f"API请求参数: {payload}")
                 
-                import aiohttp
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        f"{api_base_url}/v1/chat/completions" if api_base_url else "https://api.openai.com/v1/chat/completions",
-                        headers=headers,
-                        json=payload
-                    ) as response:
-                        # 检查响应
-                        if response.status != 200:
-                            error_text = await response.text()
-                            logger.error(f"API调用失败: {response.status} - {error_text}")
-                            # 如果流式API失败，使用备用总结
-                            backup_summary = SummaryGenerator._generate_template_summary(meeting_topic, len(meeting_history))
-                            for char in backup_summary:
-                                yield char
-                                await asyncio.sleep(0.01)
-                            return
+                url = f"{api_base_url}/v1/chat/completions" if api_base_url else "https://api.openai.com/v1/chat/completions"
+                
+                # 处理流式响应（非 200 或连接错误在收到内容前按统一重试策略重试，仍失败时使用备用总结）
+                logger.info("开始接收流式总结内容")
+                accumulated_text = ""
+                async for data in retry_stream(
+                    lambda: SummaryGenerator._open_summary_stream(url, headers, payload), name="会议总结流式生成",
+                    circuit=breaker.get_circuit(None, url, api_key),
+                    quota=limiter.quota(url, api_key, payload)
+                ):
+                    data = data.strip()
+                    
+                    # 如果是空行，跳过
+                    if not data:
+                        continue
+                    
+                    # 处理特殊的[DONE]标记
+                    if data == "[DONE]":
+                        break
+                    
+                    try:
+                        json_data = json_codec.loads(data)
+                        choices = json_data.get("choices", [])
                         
-                        # 处理流式响应
-                        logger.info("开始接收流式总结内容")
-                        accumulated_text = ""
-                        async for line in response.content:
-                            line = line.decode('utf-8').strip()
-                            
-                            # 如果是空行，跳过
-                            if not line:
-                                continue
+                        if choices and len(choices) > 0:
+                            delta = choices[0].get("delta", {})
+                            content = delta.get("content", "")
                             
-                            # 处理数据行
-                            if line.startswith("data: "):
-                                data = line[6:].strip()
-                                
-                                # 处理特殊的[DONE]标记
-                                if data == "[DONE]":
-                                    break
-                                
-                                try:
-                                    json_data = json.loads(data)
-                                    choices = json_data.get("choices", [])
-                                    
-                                    if choices and len(choices) > 0:
-                                        delta = choices[0].get("delta", {})
-                                        content = delta.get("content", "")
-                                        
-                                        if content:
-                                            # 累积文本同时返回每个增量
-                                            accumulated_text += content
-                                            yield content
-                                except json.JSONDecodeError:
-                                    continue
-                        
-                        logger.info(f"流式总结生成完成: 总长度={len(accumulated_text)}")
-                        
+                            if content:
+                                # 累积文本同时返回每个增量
+                                accumulated_text += content
+                                yield content
+                    except json_codec.JSONDecodeError:
+                        continue
+                
+                logger.info(f"流式总结生成完成: 总长度={len(accumulated_text)}")
+                    
             except Exception as e:
                 logger.error(f"流式总结生成错误: {str(e)}", exc_info=True)
                 # 如果出错，生成备用总结
@@ -310,4 +286,16 @@ class SummaryGenerator:
             error_msg = f"[生成会议总结失败: {str(e)}]"
             for char in error_msg:
                 yield char
-                await asyncio.sleep(0.01) 
\ No newline at end of file
+                await asyncio.sleep(0.01)
+
+    @staticmethod
+    async def _open_summary_stream(url: str, headers: Dict[str, str], payload: Dict[str, Any]):
+        """发送一次流式总结请求，逐个返回 SSE data 负载，非 200 响应抛出 UpstreamStatusError"""
+        session = get_aiohttp_session()
+        async with session.post(url, headers=headers, json=payload) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                logger.error(f"API调用失败: {response.status} - {error_text}")
+                raise UpstreamStatusError(response.status, error_text, response.headers)
+            async for data in iter_sse_data(response.content.iter_any()):
+                yield data
@@ -1,9 +1,9 @@
 """通用模型协作类，用于处理不同模型之间的协作"""
-import json
 import time
 import asyncio
 from typing import AsyncGenerator
 from app.utils.logger import logger
+from app.utils.chunk_encoder import ChunkEncoder
 from app.clients import DeepSeekClient, ClaudeClient, GeminiClient
 
 class ModelCollaboration:
@@ -164,6 +164,8 @@ class ModelCollaboration:
         output_queue = asyncio.Queue()
         execution_queue = asyncio.Queue()
         reasoning_content = []
+        reasoning_encoder = ChunkEncoder(chat_id, self.reasoning_model_config['model_name'], created_time)
+        execution_encoder = ChunkEncoder(chat_id, self.execution_model_config['model_name'], created_time)
 
         async def process_reasoning():
             """处理推理模型的输出"""
@@ -185,21 +187,11 @@ class ModelCollaboration:
                 async for content_type, content in self.reasoning_client.stream_chat(**client_args):
                     if content_type == "reasoning":
                         reasoning_content.append(content)
-                        response = {
-                            "id": chat_id,
-                            "object": "chat.completion.chunk",
-                            "created": created_time,
-                            "model": self.reasoning_model_config['model_name'],
-                            "choices": [{
-                                "index": 0,
-                                "delta": {
-                                    "role": "assistant",
-                                    "reasoning_content": content,
-                                    "content": ""
-                                }
-                            }]
-                        }
-                        await output_queue.put(f"data: {json.dumps(response)}\n\n".encode('utf-8'))
+                        await output_queue.put(reasoning_encoder.encode({
+                            "role": "assistant",
+                            "reasoning_content": content,
+                            "content": ""
+                        }))
                     elif content_type == "content":
                         logger.info(f"推理完成，收集到的推理内容长度：{len(''.join(reasoning_content))}")
                         logger.info(f"推理内容：{''.join(reasoning_content)}")
@@ -257,37 +249,11 @@ class ModelCollaboration:
                     if content_type in ["answer", "reasoning"]:  # 兼容不同客户端的输出类型
                         if first_chunk:
                             # 收集首个响应的内容并立即发送
-                            response = {
-                                "id": chat_id,
-                                "object": "chat.completion.chunk",
-                                "created": created_time,
-                                "model": self.execution_model_config['model_name'],
-                                "choices": [{
-                                    "index": 0,
-                                    "delta": {
-                                        "role": "assistant",
-                                        "content": content
-                                    }
-                                }]
-                            }
-                            await output_queue.put(f"data: {json.dumps(response)}\n\n".encode('utf-8'))
+                            await output_queue.put(execution_encoder.content(content, role="assistant"))
                             first_chunk = False
                         else:
                             # 处理后续响应
-                            response = {
-                                "id": chat_id,
-                                "object": "chat.completion.chunk",
-                                "created": created_time,
-                                "model": self.execution_model_config['model_name'],
-                                "choices": [{
-                                    "index": 0,
-                                    "delta": {
-                                        "role": "assistant",
-                                        "content": content
-                                    }
-                                }]
-                            }
-                            await output_queue.put(f"data: {json.dumps(response)}\n\n".encode('utf-8'))
+                            await output_queue.put(execution_encoder.content(content, role="assistant"))
                 
             except Exception as e:
                 logger.error(f"处理执行模型流时发生错误: {e}")
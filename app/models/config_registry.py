@@ -0,0 +1,395 @@
+"""编译后的配置注册表
+
+把数据库中的模型、启用的配置、角色和讨论组编译为只读的路由计划，
+/v1/chat/completions 路由请求时直接查表，不再访问数据库。
+
+- 增删改模型/配置/角色/讨论组后调用 invalidate() 使版本号递增，同时递增数据库中的
+  config_version 计数，其他 worker 的后台任务每 CONFIG_REGISTRY_SYNC_INTERVAL 秒比较一次并随之失效
+- 下一次查询发现版本变化时用新的数据库会话整体重建（一次性批量查询，无 N+1）；
+  异步路由先 await refresh()，重建在线程中执行，不阻塞事件循环
+- 每次上游请求都会读取的热路径（限流、熔断换用备用模型）使用 peek_model()/peek_models()，
+  直接返回最近一次的编译结果，过期时在后台线程中重建，不在调用方重建
+- stats() 返回命中与重建次数
+"""
+import asyncio
+import copy
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy.exc import IntegrityError
+
+from app.utils.logger import logger
+from app.models.database import (
+    SessionLocal,
+    ConfigVersion,
+    Model,
+    Configuration,
+    ConfigurationStep,
+    Role,
+    DiscussionGroup,
+    role_discussion_group,
+)
+
+# 检查其他 worker 是否修改了配置的间隔（秒），0 表示不检查（单 worker 部署）
+try:
+    CONFIG_REGISTRY_SYNC_INTERVAL = float(os.getenv("CONFIG_REGISTRY_SYNC_INTERVAL", "2"))
+except ValueError:
+    CONFIG_REGISTRY_SYNC_INTERVAL = 2.0
+
+
+class _Snapshot:
+    """只读快照基类，构造后禁止修改属性"""
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} 是只读的")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} 是只读的")
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} id={getattr(self, 'id', None)} name={getattr(self, 'name', None)!r}>"
+
+
+def _columns(row) -> Dict[str, Any]:
+    """复制 ORM 对象的所有列值（JSON 列深拷贝，避免与会话中的对象共享）"""
+    return {
+        column.name: copy.deepcopy(getattr(row, column.name))
+        for column in row.__table__.columns
+    }
+
+
+class ModelSnapshot(_Snapshot):
+    """模型配置快照，属性与 Model 的列一致，可直接传给 MultiStepModelCollaboration/UniClient"""
+
+
+class StepPlan(_Snapshot):
+    """配置中的单个步骤：model/step_type/step_order/system_prompt"""
+
+
+class ConfigPlan(_Snapshot):
+    """配置的路由计划：id/name/steps（按 step_order 排序的 StepPlan 元组）"""
+
+
+class RolePlan(_Snapshot):
+    """角色快照，属性与 Role 的列一致，另含解析后的 model（ModelSnapshot 或 None）"""
+
+
+class GroupPlan(_Snapshot):
+    """讨论组快照，属性与 DiscussionGroup 的列一致，另含 role_ids 元组"""
+
+
+class _Compiled:
+    """一次编译的结果"""
+
+    __slots__ = ("version", "models", "configs_by_name", "single_model_plans", "roles", "groups")
+
+    def __init__(self, version: int):
+        self.version = version
+        self.models: Dict[int, ModelSnapshot] = {}
+        self.configs_by_name: Dict[str, ConfigPlan] = {}
+        self.single_model_plans: Dict[int, ConfigPlan] = {}
+        self.roles: Dict[int, RolePlan] = {}
+        self.groups: Dict[int, GroupPlan] = {}
+
+
+_version = 0
+# 最近一次从数据库读到的共享版本号，None 表示尚未读取
+_shared_version: Optional[int] = None
+_compiled: Optional[_Compiled] = None
+_lock = threading.Lock()
+_stats = {"hits": 0, "rebuilds": 0, "invalidations": 0, "remote_invalidations": 0}
+_sync_task: Optional[asyncio.Task] = None
+_pending_bumps: Set[asyncio.Task] = set()
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def _compile(db, version: int) -> _Compiled:
+    """从数据库批量读取并编译所有路由计划"""
+    compiled = _Compiled(version)
+
+    for row in db.query(Model).all():
+        compiled.models[row.id] = ModelSnapshot(**_columns(row))
+
+    # 没有对应配置时，按模型ID请求会直接使用该模型（同时处理思考和执行）
+    for model_id, model in compiled.models.items():
+        compiled.single_model_plans[model_id] = ConfigPlan(
+            id=None,
+            name=model.name,
+            steps=(StepPlan(model=model, step_type="both", step_order=0, system_prompt=""),)
+        )
+
+    steps_by_config: Dict[int, list] = {}
+    for step in db.query(ConfigurationStep).order_by(ConfigurationStep.step_order).all():
+        steps_by_config.setdefault(step.configuration_id, []).append(
+            StepPlan(
+                model=compiled.models.get(step.model_id),
+                step_type=step.step_type,
+                step_order=step.step_order,
+                system_prompt=step.system_prompt
+            )
+        )
+
+    for config in db.query(Configuration).filter(Configuration.is_active == True).order_by(Configuration.id).all():
+        # 与按名称 .first() 查询的语义一致：同名时保留 ID 最小的配置
+        if config.name in compiled.configs_by_name:
+            continue
+        compiled.configs_by_name[config.name] = ConfigPlan(
+            id=config.id,
+            name=config.name,
+            steps=tuple(steps_by_config.get(config.id, ()))
+        )
+
+    for row in db.query(Role).all():
+        compiled.roles[row.id] = RolePlan(model=compiled.models.get(row.model_id), **_columns(row))
+
+    role_ids_by_group: Dict[int, list] = {}
+    for link in db.query(role_discussion_group).all():
+        role_ids_by_group.setdefault(link.discussion_group_id, []).append(link.role_id)
+
+    for row in db.query(DiscussionGroup).all():
+        compiled.groups[row.id] = GroupPlan(role_ids=tuple(role_ids_by_group.get(row.id, ())), **_columns(row))
+
+    return compiled
+
+
+def _current() -> _Compiled:
+    """获取当前版本的编译结果，版本过期时重建"""
+    compiled = _compiled
+    if compiled is not None and compiled.version == _version:
+        _stats["hits"] += 1
+        return compiled
+    return rebuild()
+
+
+def _latest() -> _Compiled:
+    """最近一次的编译结果：事件循环中过期时不等待重建，安排后台重建后返回上一版本"""
+    compiled = _compiled
+    if compiled is None or compiled.version == _version:
+        return _current()
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # 线程或脚本中可以直接重建
+        return rebuild()
+    _schedule_refresh(loop)
+    return compiled
+
+
+def _schedule_refresh(loop: asyncio.AbstractEventLoop) -> None:
+    """在后台线程中重建（同一时间只安排一次）"""
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = loop.create_task(refresh())
+
+
+def rebuild() -> _Compiled:
+    """重建注册表（启动预热或版本过期时调用）
+
+    Returns:
+        _Compiled: 最新的编译结果
+    """
+    global _compiled, _shared_version
+    with _lock:
+        compiled = _compiled
+        if compiled is not None and compiled.version == _version:
+            return compiled
+        version = _version
+        db = SessionLocal()
+        try:
+            if _shared_version is None:
+                # 首次编译前记下共享版本号，之后其他 worker 的修改都能被发现
+                _shared_version = db.query(ConfigVersion.version).filter(ConfigVersion.id == 1).scalar() or 0
+            compiled = _compile(db, version)
+        finally:
+            db.close()
+        _compiled = compiled
+        _stats["rebuilds"] += 1
+    logger.info(
+        f"配置注册表已重建: version={version}, 模型 {len(compiled.models)} 个, "
+        f"配置 {len(compiled.configs_by_name)} 个, 角色 {len(compiled.roles)} 个, 讨论组 {len(compiled.groups)} 个"
+    )
+    return compiled
+
+
+async def refresh() -> None:
+    """异步路由查表前调用：版本过期时在线程中重建，之后的同步查询直接命中"""
+    compiled = _compiled
+    if compiled is None or compiled.version != _version:
+        await asyncio.to_thread(rebuild)
+
+
+def invalidate() -> None:
+    """在模型/配置/角色/讨论组变更提交后调用，下一次查询时重建
+
+    本进程立即失效；数据库中的共享版本号在事件循环中交给线程递增，
+    在线程或脚本中调用时直接递增。
+    """
+    global _version
+    with _lock:
+        _version += 1
+        _stats["invalidations"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _bump_shared_version()
+        return
+    task = loop.create_task(asyncio.to_thread(_bump_shared_version))
+    _pending_bumps.add(task)
+    task.add_done_callback(_pending_bumps.discard)
+
+
+def _bump_shared_version() -> None:
+    """递增数据库中的共享版本号，通知其他 worker 重建"""
+    global _shared_version
+    db = SessionLocal()
+    try:
+        for _ in range(2):
+            updated = db.query(ConfigVersion).filter(ConfigVersion.id == 1).update(
+                {ConfigVersion.version: ConfigVersion.version + 1}, synchronize_session=False
+            )
+            if not updated:
+                db.add(ConfigVersion(id=1, version=1))
+            try:
+                db.flush()
+            except IntegrityError:
+                # 其他 worker 同时插入了首行，改为递增
+                db.rollback()
+                continue
+            value = db.query(ConfigVersion.version).filter(ConfigVersion.id == 1).scalar()
+            db.commit()
+            with _lock:
+                # 本进程已经失效过，紧接着的递增不需要再触发一次重建
+                if _shared_version is None or value == _shared_version + 1:
+                    _shared_version = value
+            return
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"递增配置共享版本号失败，其他 worker 将在下次修改时才会重建: {e}")
+    finally:
+        db.close()
+
+
+def sync_shared_version() -> bool:
+    """读取数据库中的共享版本号，其他 worker 修改过配置时使本进程失效
+
+    Returns:
+        bool: 本进程是否因此失效
+    """
+    global _version, _shared_version
+    db = SessionLocal()
+    try:
+        value = db.query(ConfigVersion.version).filter(ConfigVersion.id == 1).scalar() or 0
+    finally:
+        db.close()
+    with _lock:
+        previous, _shared_version = _shared_version, value
+        if previous is None or previous == value:
+            return False
+        _version += 1
+        _stats["remote_invalidations"] += 1
+    logger.info(f"其他 worker 修改了配置（共享版本 {previous} -> {value}），注册表将重建")
+    return True
+
+
+async def _sync_loop() -> None:
+    while True:
+        await asyncio.sleep(CONFIG_REGISTRY_SYNC_INTERVAL)
+        try:
+            await asyncio.to_thread(sync_shared_version)
+            # 其他 worker 的修改与本进程尚未重建的修改都在这里追上
+            await refresh()
+        except Exception as e:
+            logger.warning(f"同步配置共享版本号失败: {e}")
+
+
+def start() -> None:
+    """启动跨 worker 的版本同步任务（应用启动时调用）"""
+    global _sync_task
+    if CONFIG_REGISTRY_SYNC_INTERVAL <= 0:
+        return
+    if _sync_task is None or _sync_task.done():
+        _sync_task = asyncio.get_running_loop().create_task(_sync_loop())
+
+
+async def stop() -> None:
+    """停止版本同步任务（应用关闭时调用）"""
+    global _sync_task
+    task, _sync_task = _sync_task, None
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def resolve_model_route(model: str) -> Optional[ConfigPlan]:
+    """解析 /v1/chat/completions 的 model 参数
+
+    数字 ID 先按模型查找：有同名的启用配置则使用该配置，否则直接使用该模型；
+    其他情况按名称查找启用的配置。
+
+    Args:
+        model: 请求中的 model 参数
+
+    Returns:
+        Optional[ConfigPlan]: 路由计划，未找到时返回 None
+    """
+    compiled = _current()
+    try:
+        model_id = int(model)
+    except ValueError:
+        return compiled.configs_by_name.get(model)
+
+    db_model = compiled.models.get(model_id)
+    if db_model is None:
+        return compiled.configs_by_name.get(model)
+    config = compiled.configs_by_name.get(db_model.name)
+    if config is None:
+        logger.info(f"未找到模型ID {model_id} 的配置，使用单一模型直接调用")
+        return compiled.single_model_plans[model_id]
+    return config
+
+
+def get_role(role_id: int) -> Optional[RolePlan]:
+    """按 ID 获取角色快照"""
+    return _current().roles.get(role_id)
+
+
+def get_group(group_id: int) -> Optional[GroupPlan]:
+    """按 ID 获取讨论组快照"""
+    return _current().groups.get(group_id)
+
+
+def get_model(model_id: int) -> Optional[ModelSnapshot]:
+    """按 ID 获取模型快照"""
+    return _current().models.get(model_id)
+
+
+def get_models() -> Dict[int, ModelSnapshot]:
+    """获取所有模型快照（按 ID 索引，版本变化前返回同一个字典，调用方不应修改）"""
+    return _current().models
+
+
+def peek_model(model_id: int) -> Optional[ModelSnapshot]:
+    """按 ID 获取模型快照，不在调用方重建（版本过期时可能返回上一版本，见 _latest）"""
+    return _latest().models.get(model_id)
+
+
+def peek_models() -> Dict[int, ModelSnapshot]:
+    """获取所有模型快照，不在调用方重建（版本过期时可能返回上一版本，见 _latest）"""
+    return _latest().models
+
+
+def stats() -> Dict[str, int]:
+    """返回注册表统计信息"""
+    compiled = _compiled
+    return {
+        "version": _version,
+        "shared_version": _shared_version,
+        "compiled_version": compiled.version if compiled is not None else None,
+        **_stats,
+    }
@@ -1,11 +1,12 @@
 from typing import List, Dict, AsyncGenerator
 import asyncio
-import json
 import time
 from app.utils.logger import logger
-from app.clients import DeepSeekClient, ClaudeClient, GeminiClient
+from app.clients import registry as client_registry
 from app.clients.uni_client import UniClient
-from app.clients.openai_client import OpenAIClient
+from app.clients import hedge
+from app.clients import breaker
+from app.utils.chunk_encoder import ChunkEncoder, omit_empty_delta_fields
 
 class MultiStepModelCollaboration:
     """处理多步骤模型协作的类"""
@@ -19,6 +20,8 @@ class MultiStepModelCollaboration:
                 - step_type: 步骤类型 (reasoning/execution)
                 - system_prompt: 系统提示词
         """
+        # 端点熔断中的模型直接换成配置的备用模型，不再等待超时
+        steps = [{**step, 'model': breaker.available_model(step['model'])} for step in steps]
         self.steps = steps
         self.clients = []
         
@@ -38,6 +41,8 @@ class MultiStepModelCollaboration:
             )
             self.clients.append({
                 'client': client,
+                'model_id': model.id,
+                'hedge': self._init_hedge(model, step['step_type'] == 'reasoning'),
                 'model_name': model.model_name,
                 'temperature': model.temperature,
                 'max_tokens': model.max_tokens,
@@ -53,34 +58,47 @@ class MultiStepModelCollaboration:
             })
 
     def _init_client(self, provider: str, api_key: str, api_url: str, is_reasoning: bool):
-        """初始化对应的客户端"""
+        """获取对应的客户端（从进程级注册表复用已创建的实例）"""
         try:
-            # 根据提供商类型初始化对应的客户端
-            if provider == "deepseek":
-                return DeepSeekClient(api_key, api_url, is_origin_reasoning=is_reasoning)
-            elif provider == "google":
-                # 对于多步骤处理使用专用客户端
-                if not self.is_single_model:
-                    return GeminiClient(api_key, api_url)
-                # 对于单模型处理，UniClient会处理
+            # 对于单模型处理，UniClient会处理
+            if provider == "google" and self.is_single_model:
                 return None
-            elif provider == "anthropic":
-                return ClaudeClient(api_key, api_url, is_origin_reasoning=is_reasoning)
-            elif provider == "grok3":
-                from app.clients import Grok3Client
-                return Grok3Client(api_key, api_url, is_origin_reasoning=is_reasoning)
-            elif provider in ["oneapi", "openrouter", "openai-completion"]:
-                from app.clients import OpenAIClient
-                return OpenAIClient(api_key, api_url)
-            elif provider == "腾讯云":
-                # 腾讯云使用与 DeepSeek 相同的客户端
-                return DeepSeekClient(api_key, api_url, provider="腾讯云", is_origin_reasoning=is_reasoning)
-            else:
-                raise ValueError(f"Unsupported provider: {provider}")
+            return client_registry.get_provider_client(provider, api_key, api_url, is_reasoning)
         except Exception as e:
             logger.error(f"初始化客户端时发生错误: {e}")
             raise
 
+    def _init_hedge(self, model, is_reasoning: bool):
+        """模型开启对冲时准备对冲请求使用的客户端（备用模型或模型自身）"""
+        if not getattr(model, 'hedge_enabled', False) or self.is_single_model:
+            return None
+        alternate = hedge.resolve_alternate(model) or model
+        return {
+            'client': self._init_client(alternate.provider, alternate.api_key, alternate.api_url, is_reasoning),
+            'model_name': alternate.model_name
+        }
+
+    def _stream_step(self, client_info: Dict, **kwargs) -> AsyncGenerator[tuple, None]:
+        """调用步骤客户端的流式接口，模型开启对冲时以对冲方式执行
+        
+        Args:
+            client_info: 步骤的客户端信息
+            **kwargs: 传给 stream_chat 的参数（不含 model）
+            
+        Returns:
+            AsyncGenerator[tuple, None]: (内容类型, 内容)
+        """
+        client = client_info['client']
+        hedge_info = client_info.get('hedge')
+        if hedge_info is None:
+            return client.stream_chat(model=client_info['model_name'], **kwargs)
+        return hedge.hedged_stream(
+            client_info['model_id'],
+            lambda: client.stream_chat(model=client_info['model_name'], **kwargs),
+            lambda: hedge_info['client'].stream_chat(model=hedge_info['model_name'], **kwargs),
+            name=f"{client_info['model_name']} 流式请求"
+        )
+
     async def process_with_stream(
         self,
         messages: list
@@ -95,6 +113,7 @@ class MultiStepModelCollaboration:
         """
         chat_id = f"chatcmpl-{hex(int(time.time() * 1000))[2:]}"
         created_time = int(time.time())
+        omit_empty = omit_empty_delta_fields()
         
         current_messages = messages.copy()
         previous_result = ""
@@ -110,7 +129,6 @@ class MultiStepModelCollaboration:
             return
         
         for idx, client_info in enumerate(self.clients):
-            client = client_info['client']
             step_type = client_info['step_type']
             system_prompt = client_info['system_prompt']
             is_last_step = idx == len(self.clients) - 1
@@ -130,9 +148,10 @@ class MultiStepModelCollaboration:
             
             # 收集当前步骤的输出
             current_output = []
-            async for content_type, content in client.stream_chat(
+            encoder = ChunkEncoder(chat_id, client_info['model_name'], created_time, omit_empty=omit_empty)
+            async for content_type, content in self._stream_step(
+                client_info,
                 messages=current_messages,
-                model=client_info['model_name'],
                 temperature=client_info['temperature'],
                 max_tokens=client_info['max_tokens'],
                 top_p=client_info['top_p'],
@@ -160,18 +179,7 @@ class MultiStepModelCollaboration:
                     delta["content"] = content
                 # logger.debug(f"delta: {delta}")
                 # 生成流式响应
-                response = {
-                    "id": chat_id,
-                    "object": "chat.completion.chunk",
-                    "created": created_time,
-                    "model": client_info['model_name'],
-                    "choices": [{
-                        "index": 0,
-                        "delta": delta
-                    }]
-                }
-                
-                yield f"data: {json.dumps(response)}\n\n".encode('utf-8')
+                yield encoder.encode(delta)
             
             # 保存当前步骤的完整输出，用于下一步
             previous_result = "".join(current_output)
@@ -206,7 +214,6 @@ class MultiStepModelCollaboration:
             )
         
         for idx, client_info in enumerate(self.clients):
-            client = client_info['client']
             step_type = client_info['step_type']
             system_prompt = client_info['system_prompt']
             is_last_step = idx == len(self.clients) - 1
@@ -222,9 +229,9 @@ class MultiStepModelCollaboration:
                 )
             
             current_output = []
-            async for content_type, content in client.stream_chat(
+            async for content_type, content in self._stream_step(
+                client_info,
                 messages=current_messages,
-                model=client_info['model_name'],
                 is_last_step=is_last_step,
                 is_first_step=is_first_step
             ):
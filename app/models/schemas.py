@@ -19,6 +19,12 @@ class ModelBase(BaseModel):
     tool_choice: Optional[Dict] = None
     enable_thinking: bool = False
     thinking_budget_tokens: int = 16000
+    hedge_enabled: bool = False
+    hedge_model_id: Optional[int] = None
+    fallback_model_id: Optional[int] = None
+    rpm_limit: Optional[int] = None
+    tpm_limit: Optional[int] = None
+    max_concurrency: Optional[int] = None
     custom_parameters: Optional[Dict[str, Union[str, int, float, bool]]] = Field(default_factory=dict)
 
     @validator('temperature', 'top_p', pre=True)
@@ -27,6 +33,14 @@ class ModelBase(BaseModel):
             return float(v)
         return v
 
+    @validator('rpm_limit', 'tpm_limit', 'max_concurrency', pre=True)
+    def empty_limit_to_none(cls, v):
+        # 空值或非正数表示不限制
+        if v in (None, ''):
+            return None
+        v = int(v)
+        return v if v > 0 else None
+
     @validator('type')
     def validate_type(cls, v):
         valid_types = {'reasoning', 'execution', 'both'}
@@ -1,43 +1,49 @@
 from typing import Dict, Any, List, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 import logging
 import asyncio
-import json
 import re
 import time
 import random
 from datetime import datetime
 
 from app.models.database import DiscussionGroup, Role
+from app.models import config_registry
+from app.clients import breaker
 from app.adapters.meeting_adapter import MeetingAdapter
+from app.meeting import event_bus, human_input_reaper, notifier
+from app.meeting.store import get_meeting_store, save_meeting
 from app.meeting.utils.summary_generator import SummaryGenerator
+from app.utils.chunk_encoder import ChunkEncoder
+from app.utils import json_codec
 
 logger = logging.getLogger(__name__)
 
 class DiscussionProcessor:
     """讨论组处理器，用于管理讨论组数据"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Optional[Session]):
+        # 只通过 adapter 运行会议时（如 /v1/chat/completions）不需要同步会话，可以为 None
         self.db = db
         self.adapter = None  # 保留adapter引用以便兼容过渡
         self.group_id = None
         self.current_meeting_id = None  # 添加一个属性来跟踪当前会议ID
-        self.active_meetings = {}  # 自己管理活跃会议
+        self.active_meetings = get_meeting_store()  # 与 MeetingAdapter 共享的会议存储
     
-    def start_meeting(self, group_id: int, topic: str = None) -> str:
-        """启动一个新的讨论会议"""
+    def start_meeting(self, group_id: int, topic: str = None, group: DiscussionGroup = None) -> str:
+        """启动一个新的讨论会议（group 为异步路由预先加载的讨论组，可选）"""
         if self.adapter:
             # 如果存在adapter，使用它启动会议（兼容现有代码）
             self.group_id = group_id
             
             # 如果没有提供主题，使用默认主题
             if not topic or topic.strip() == "":
-                group = self._load_group(group_id)
-                topic = group.topic if group.topic else f"讨论组{group_id}的新讨论"
+                topic_group = group if group is not None else self._load_group(group_id)
+                topic = topic_group.topic if topic_group.topic else f"讨论组{group_id}的新讨论"
             
             # 启动会议并返回会议ID
             logger.info(f"通过adapter启动讨论: group_id={group_id}, topic={topic}")
-            meeting_id = self.adapter.start_meeting(group_id, topic)
+            meeting_id = self.adapter.start_meeting(group_id, topic, group=group)
             self.current_meeting_id = meeting_id  # 保存当前会议ID
             
             # 将会议数据也存入自己的管理字典，以便过渡
@@ -52,7 +58,7 @@ class DiscussionProcessor:
     
     def get_groups(self) -> List[Dict[str, Any]]:
         """获取所有讨论组"""
-        groups = self.db.query(DiscussionGroup).all()
+        groups = self.db.query(DiscussionGroup).options(selectinload(DiscussionGroup.roles)).all()
         return [self._group_to_dict(group) for group in groups]
     
     def get_group(self, group_id: int) -> Optional[Dict[str, Any]]:
@@ -75,7 +81,9 @@ class DiscussionProcessor:
             mode=group_data.get('mode', 'discussion'),
             max_rounds=group_data.get('max_rounds', 3),
             summary_model_id=group_data.get('summary_model_id'),
-            summary_prompt=group_data.get('summary_prompt')
+            summary_prompt=group_data.get('summary_prompt'),
+            human_input_timeout=group_data.get('human_input_timeout'),
+            human_timeout_policy=self._check_timeout_policy(group_data.get('human_timeout_policy'))
         )
         
         self.db.add(group)
@@ -91,6 +99,7 @@ class DiscussionProcessor:
             self.db.commit()
             self.db.refresh(group)
         
+        config_registry.invalidate()
         return self._group_to_dict(group)
     
     def update_group(self, group_id: int, group_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -116,6 +125,10 @@ class DiscussionProcessor:
             group.summary_prompt = group_data['summary_prompt']
         if 'custom_speaking_order' in group_data:
             group.custom_speaking_order = group_data['custom_speaking_order']
+        if 'human_input_timeout' in group_data:
+            group.human_input_timeout = group_data['human_input_timeout']
+        if 'human_timeout_policy' in group_data:
+            group.human_timeout_policy = self._check_timeout_policy(group_data['human_timeout_policy'])
         
         # 更新角色关联
         if 'role_ids' in group_data:
@@ -130,6 +143,7 @@ class DiscussionProcessor:
         
         self.db.commit()
         self.db.refresh(group)
+        config_registry.invalidate()
         
         return self._group_to_dict(group)
     
@@ -144,6 +158,7 @@ class DiscussionProcessor:
         
         self.db.delete(group)
         self.db.commit()
+        config_registry.invalidate()
         
         return True
     
@@ -159,6 +174,8 @@ class DiscussionProcessor:
             "summary_model_id": group.summary_model_id,
             "summary_prompt": group.summary_prompt or "",
             "custom_speaking_order": group.custom_speaking_order,
+            "human_input_timeout": group.human_input_timeout,
+            "human_timeout_policy": group.human_timeout_policy,
             "created_at": group.created_at.isoformat() if group.created_at else None,
             "updated_at": group.updated_at.isoformat() if group.updated_at else None,
             "roles": [
@@ -171,6 +188,15 @@ class DiscussionProcessor:
             "role_ids": [role.id for role in group.roles]
         }
     
+    def _check_timeout_policy(self, policy: Optional[str]) -> Optional[str]:
+        """校验人类输入超时策略，空值表示使用默认策略"""
+        if not policy:
+            return None
+        policy = str(policy).strip().lower()
+        if policy not in human_input_reaper.POLICIES:
+            raise ValueError(f"无效的人类输入超时策略: {policy}，可选: {', '.join(human_input_reaper.POLICIES)}")
+        return policy
+    
     def _load_group(self, group_id: int) -> DiscussionGroup:
         """加载讨论组信息"""
         group = self.db.query(DiscussionGroup).filter(DiscussionGroup.id == group_id).first()
@@ -222,10 +248,20 @@ class DiscussionProcessor:
         """
         # 非异步函数中返回一个同步生成器
         async def process_meeting():
-            # 内部处理会议并生成数据
-            generator = self._stream_discussion_process(meeting_id)
-            async for chunk in generator:
-                yield chunk
+            # 同一会议同时只由一个请求驱动，其他请求订阅事件总线观看，避免重复调用模型
+            if not event_bus.claim_driver(meeting_id):
+                logger.info(f"会议 {meeting_id} 已在其他请求中生成，转为订阅事件")
+                async for chunk in self._follow_stream(meeting_id):
+                    yield chunk
+                return
+
+            try:
+                # 内部处理会议并生成数据
+                generator = self._stream_discussion_process(meeting_id)
+                async for chunk in generator:
+                    yield chunk
+            finally:
+                event_bus.release_driver(meeting_id)
         
         # 创建一个类似于生成器的对象，但它能被FastAPI的StreamingResponse正确处理
         class AsyncIteratorWrapper:
@@ -247,25 +283,67 @@ class DiscussionProcessor:
         # 返回一个可迭代对象
         return AsyncIteratorWrapper(process_meeting())
     
+    async def _follow_stream(self, meeting_id: str):
+        """订阅正在进行的会议生成，把事件转换为与驱动请求相同格式的 chunk"""
+        conversation_id = f"chatcmpl-{int(time.time())}"
+        encoder = ChunkEncoder(f"{conversation_id}-follow", "discussion-group", int(time.time()), ensure_ascii=False, with_finish_reason=True)
+        subscription = event_bus.subscribe(meeting_id)
+        try:
+            yield encoder.encode_text({"role": "assistant", "content": ""})
+            # 订阅之后只检查一次：驱动请求在订阅之前已经结束时直接返回，
+            # 否则它结束时 release_driver 发布的 stream_end 一定会送达，不需要定时检查
+            following = event_bus.is_driving(meeting_id)
+            while following:
+                event = await subscription.get()
+
+                if event.type == "speaker_start":
+                    yield encoder.encode_text({"content": f"\n### {event.data['speaker']} 发言：\n\n"})
+                elif event.type in ("token", "summary_delta"):
+                    yield encoder.encode_text({"content": event.data["content"]})
+                elif event.type == "round_complete":
+                    yield encoder.encode_text({"content": "\n\n---\n\n"})
+                elif event.type == "waiting_for_human":
+                    client_instruction = {
+                        "id": f"{conversation_id}-client-instruction",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": "discussion-group",
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"content": f"\n\n[WAITING_FOR_HUMAN_INPUT:{event.data['agent']}]\n\n"},
+                            "finish_reason": "waiting_human"
+                        }]
+                    }
+                    yield f"data: {json_codec.dumps(client_instruction, ensure_ascii=False)}\n\n"
+                elif event.type == "stream_end" or event.type in event_bus.TERMINAL_EVENTS:
+                    break
+        finally:
+            subscription.close()
+        yield "data: [DONE]\n\n"
+
     async def _complete_discussion_process(self, meeting_id: str) -> str:
         """完整讨论过程，一次性返回结果"""
         round_count = 0
         # 进行讨论直到结束
         while True:
             logger.info(f"开始执行第{round_count+1}轮讨论: meeting_id={meeting_id}")
-            round_data = self.adapter.conduct_discussion_round(meeting_id)
+            round_data = await self.adapter.conduct_discussion_round_async(meeting_id)
             logger.info(f"第{round_count+1}轮讨论完成: {round_data}")
             
             # 每轮结束后打印当前轮次的对话内容
-            self._print_latest_round_content(meeting_id)
+            self._print_latest_round_content(await self.adapter.active_meetings.get_async(meeting_id))
             
             round_count += 1
-            if round_data["status"] == "已结束":
+            if round_data.get("status") == "已结束":
                 logger.info(f"讨论已结束: meeting_id={meeting_id}")
                 break
             
-            logger.info(f"等待下一轮讨论...")
-            await asyncio.sleep(0.5)
+            human_name = round_data.get("waiting_for_human_input") or (
+                round_data.get("speaker") if round_data.get("waiting_for_human") else None
+            )
+            if human_name and not await self._wait_for_human_turn(meeting_id, human_name):
+                logger.info(f"人类角色 {human_name} 未在截止时间内输入，返回当前讨论状态: meeting_id={meeting_id}")
+                return f"讨论正在等待 {human_name} 输入，提交输入后可继续讨论。"
         
         # 结束讨论并获取结果
         logger.info(f"获取讨论结果: meeting_id={meeting_id}")
@@ -277,10 +355,34 @@ class DiscussionProcessor:
         logger.info(f"获取到讨论结果: summary_length={len(result.get('summary', ''))}")
         return result["summary"] or "讨论已完成，但未生成总结。"
     
+    async def _wait_for_human_turn(self, meeting_id: str, agent_name: str) -> bool:
+        """
+        等待人类角色提交输入（或按超时策略处理、会议结束），会议状态变化时立即返回
+
+        参数:
+            meeting_id: 会议ID
+            agent_name: 等待输入的人类角色名
+
+        返回:
+            bool: 可以继续讨论返回 True；截止时间（加宽限）内没有变化返回 False
+        """
+        meeting = await self.adapter._get_meeting_async(meeting_id)
+        agent = next((a for a in meeting.agents if a.name == agent_name and getattr(a, 'is_human', False)), None)
+        if agent is None:
+            return True
+
+        timeout = getattr(agent, 'input_timeout', 0)
+        timeout = timeout + human_input_reaper.GRACE_SECONDS if timeout and timeout > 0 else None
+        logger.info(f"等待人类角色 {agent_name} 输入: meeting_id={meeting_id}, 最长等待={timeout}")
+        return await notifier.wait_until(
+            meeting_id,
+            lambda: not agent.is_waiting_input or meeting.status == "已结束",
+            timeout
+        )
+
     async def _stream_discussion_process(self, meeting_id: str):
         """流式讨论过程，实时返回每个角色的回答"""
         import time
-        import json
         import asyncio
         import random
         from datetime import datetime
@@ -290,7 +392,7 @@ class DiscussionProcessor:
         round_count = 0  # 这是用于前端显示的轮次计数
         
         # 获取会议对象
-        meeting_data = self.adapter.active_meetings.get(meeting_id)
+        meeting_data = await self.adapter.active_meetings.get_async(meeting_id)
         if not meeting_data:
             yield f"data: {{\"error\": \"会议ID {meeting_id} 不存在\"}}\n\n"
             return
@@ -325,7 +427,7 @@ class DiscussionProcessor:
                     "finish_reason": None
                 }]
             }
-            yield f"data: {json.dumps(start_event, ensure_ascii=False)}\n\n"
+            yield f"data: {json_codec.dumps(start_event, ensure_ascii=False)}\n\n"
             
             # 发送会议结束信息
             end_meeting_info = {
@@ -339,8 +441,7 @@ class DiscussionProcessor:
                     "finish_reason": None
                 }]
             }
-            yield f"data: {json.dumps(end_meeting_info, ensure_ascii=False)}\n\n"
-            await asyncio.sleep(0.5)
+            yield f"data: {json_codec.dumps(end_meeting_info, ensure_ascii=False)}\n\n"
             
             # 使用流式总结生成器实时生成并发送总结
             # 获取会议主题和历史
@@ -375,7 +476,7 @@ class DiscussionProcessor:
                         db = next(get_db())
                         
                         # 查询模型配置
-                        summary_model = db.query(Model).filter(Model.id == model_id).first()
+                        summary_model = breaker.available_model(db.query(Model).filter(Model.id == model_id).first())
                         
                         if summary_model:
                             logger.info(f"找到总结模型: {summary_model.name}")
@@ -409,8 +510,7 @@ class DiscussionProcessor:
                     "finish_reason": None
                 }]
             }
-            yield f"data: {json.dumps(summary_title_event, ensure_ascii=False)}\n\n"
-            await asyncio.sleep(0.3)
+            yield f"data: {json_codec.dumps(summary_title_event, ensure_ascii=False)}\n\n"
             
             # 使用流式总结生成器实时生成并发送总结
             logger.info(f"开始直接流式生成和发送会议总结")
@@ -447,7 +547,7 @@ class DiscussionProcessor:
                         db = next(get_db())
                         
                         # 查询模型配置
-                        summary_model = db.query(Model).filter(Model.id == model_id).first()
+                        summary_model = breaker.available_model(db.query(Model).filter(Model.id == model_id).first())
                         
                         if summary_model:
                             logger.info(f"找到总结模型: {summary_model.name}")
@@ -471,6 +571,7 @@ class DiscussionProcessor:
             
             # 开始流式生成总结
             accumulated_summary = ""
+            summary_encoder = ChunkEncoder(f"{conversation_id}-summary-chunk", "discussion-group", int(time.time()), ensure_ascii=False, with_finish_reason=True)
             async for chunk in SummaryGenerator.generate_summary_stream(
                 meeting_topic=meeting_topic,
                 meeting_history=meeting_history,
@@ -480,21 +581,13 @@ class DiscussionProcessor:
                 api_base_url=api_base_url
             ):
                 accumulated_summary += chunk
-                summary_chunk_event = {
-                    "id": f"{conversation_id}-summary-chunk-{int(time.time()*1000)}",
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "model": "discussion-group",
-                    "choices": [{
-                        "index": 0,
-                        "delta": {"content": chunk},
-                        "finish_reason": None
-                    }]
-                }
-                yield f"data: {json.dumps(summary_chunk_event, ensure_ascii=False)}\n\n"
+                event_bus.publish(meeting_id, "summary_delta", {"content": chunk})
+                yield summary_encoder.encode_text({"content": chunk})
             
             # 将累积的总结保存到会议历史
             meeting.add_message("system", accumulated_summary)
+            event_bus.publish(meeting_id, "summary", {"content": accumulated_summary})
+            save_meeting(meeting_id)
             
             # 发送完成事件
             summary_end_event = {
@@ -508,7 +601,7 @@ class DiscussionProcessor:
                     "finish_reason": "stop"
                 }]
             }
-            yield f"data: {json.dumps(summary_end_event, ensure_ascii=False)}\n\n"
+            yield f"data: {json_codec.dumps(summary_end_event, ensure_ascii=False)}\n\n"
             
             logger.info(f"总结内容已通过流式方式实时生成和发送完毕，总长度: {len(accumulated_summary)}")
             print("会议结束，已实时生成并流式发送总结")
@@ -580,7 +673,7 @@ class DiscussionProcessor:
                     "finish_reason": None
                 }]
             }
-            yield f"data: {json.dumps(start_event, ensure_ascii=False)}\n\n"
+            yield f"data: {json_codec.dumps(start_event, ensure_ascii=False)}\n\n"
             
             # 发送会议主题与格式说明
             intro_event = {
@@ -594,8 +687,7 @@ class DiscussionProcessor:
                     "finish_reason": None
                 }]
             }
-            yield f"data: {json.dumps(intro_event, ensure_ascii=False)}\n\n"
-            await asyncio.sleep(0.3)
+            yield f"data: {json_codec.dumps(intro_event, ensure_ascii=False)}\n\n"
         
         # 主循环 - 处理讨论轮次
         while True:
@@ -617,11 +709,10 @@ class DiscussionProcessor:
                         "finish_reason": None
                     }]
                 }
-                yield f"data: {json.dumps(end_meeting_info, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.5)
+                yield f"data: {json_codec.dumps(end_meeting_info, ensure_ascii=False)}\n\n"
                 
                 # 调用finish方法生成会议总结，使用讨论组的自定义模型和提示
-                summary = meeting.finish()
+                summary = await asyncio.to_thread(meeting.finish)
                 logger.info(f"已生成会议总结，长度: {len(summary)}")
                 
                 # 发送会议总结 - 使用流式方式发送
@@ -659,7 +750,7 @@ class DiscussionProcessor:
                             db = next(get_db())
                             
                             # 查询模型配置
-                            summary_model = db.query(Model).filter(Model.id == model_id).first()
+                            summary_model = breaker.available_model(db.query(Model).filter(Model.id == model_id).first())
                             
                             if summary_model:
                                 logger.info(f"找到总结模型: {summary_model.name}")
@@ -683,6 +774,7 @@ class DiscussionProcessor:
                 
                 # 开始流式生成总结
                 accumulated_summary = ""
+                summary_encoder = ChunkEncoder(f"{conversation_id}-summary-chunk", "discussion-group", int(time.time()), ensure_ascii=False, with_finish_reason=True)
                 async for chunk in SummaryGenerator.generate_summary_stream(
                     meeting_topic=meeting_topic,
                     meeting_history=meeting_history,
@@ -692,21 +784,13 @@ class DiscussionProcessor:
                     api_base_url=api_base_url
                 ):
                     accumulated_summary += chunk
-                    summary_chunk_event = {
-                        "id": f"{conversation_id}-summary-chunk-{int(time.time()*1000)}",
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": "discussion-group",
-                        "choices": [{
-                            "index": 0,
-                            "delta": {"content": chunk},
-                            "finish_reason": None
-                        }]
-                    }
-                    yield f"data: {json.dumps(summary_chunk_event, ensure_ascii=False)}\n\n"
+                    event_bus.publish(meeting_id, "summary_delta", {"content": chunk})
+                    yield summary_encoder.encode_text({"content": chunk})
                 
                 # 将累积的总结保存到会议历史
                 meeting.add_message("system", accumulated_summary)
+                event_bus.publish(meeting_id, "summary", {"content": accumulated_summary})
+                save_meeting(meeting_id)
                 
                 # 发送完成事件
                 summary_end_event = {
@@ -720,7 +804,7 @@ class DiscussionProcessor:
                         "finish_reason": "stop"
                     }]
                 }
-                yield f"data: {json.dumps(summary_end_event, ensure_ascii=False)}\n\n"
+                yield f"data: {json_codec.dumps(summary_end_event, ensure_ascii=False)}\n\n"
                 
                 logger.info(f"总结内容已通过流式方式实时生成和发送完毕，总长度: {len(accumulated_summary)}")
                 print("会议结束，已实时生成并流式发送总结")
@@ -747,8 +831,7 @@ class DiscussionProcessor:
                         "finish_reason": None
                     }]
                 }
-                yield f"data: {json.dumps(round_title, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.3)
+                yield f"data: {json_codec.dumps(round_title, ensure_ascii=False)}\n\n"
             else:
                 # 继续处理时，重置标志
                 is_continuation = False
@@ -975,6 +1058,8 @@ class DiscussionProcessor:
                     # 尚未达到最大轮次，进入下一轮
                     old_round = meeting.current_round
                     meeting.current_round += 1
+                    save_meeting(meeting_id)
+                    event_bus.publish(meeting_id, "round_complete", {"round": old_round})
                     logger.info(f"完成第{old_round}轮，开始第{meeting.current_round}轮讨论")
                     
                     # 使用原始发言顺序开始新轮讨论
@@ -1039,8 +1124,8 @@ class DiscussionProcessor:
                         "finish_reason": None
                     }]
                 }
-                yield f"data: {json.dumps(speaker_info, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.2)
+                yield f"data: {json_codec.dumps(speaker_info, ensure_ascii=False)}\n\n"
+                event_bus.publish(meeting_id, "speaker_start", {"speaker": agent_name, "round": meeting.current_round})
                 
                 # 获取智能体提示
                 prompt = meeting.mode.get_agent_prompt(
@@ -1075,10 +1160,14 @@ class DiscussionProcessor:
                             "finish_reason": None
                         }]
                     }
-                    yield f"data: {json.dumps(waiting_event, ensure_ascii=False)}\n\n"
+                    yield f"data: {json_codec.dumps(waiting_event, ensure_ascii=False)}\n\n"
                     
                     # 暂停讨论，记录等录状态
                     meeting.waiting_for_human_input = agent.name
+                    save_meeting(meeting_id)
+                    event_bus.publish(meeting_id, "waiting_for_human", {"agent": agent.name})
+                    # 到达截止时间时按讨论组策略处理（跳过/宿主代答/结束）
+                    human_input_reaper.watch(meeting_id, agent)
                     
                     # 不添加等待消息到会议历史
                     # meeting.add_message("system", f"等待人类角色 {agent.name} 输入")
@@ -1095,8 +1184,51 @@ class DiscussionProcessor:
                             "finish_reason": "waiting_human"
                         }]
                     }
-                    yield f"data: {json.dumps(client_instruction, ensure_ascii=False)}\n\n"
-                    
+                    yield f"data: {json_codec.dumps(client_instruction, ensure_ascii=False)}\n\n"
+
+                    # 挂起等待人类输入，提交后在同一个流中继续本轮，不必重新发起流并重新计算发言顺序
+                    if agent.input_timeout and agent.input_timeout > 0:
+                        logger.info(f"流式讨论挂起，等待人类角色 {agent.name} 输入（最长 {agent.input_timeout} 秒）")
+                        # 截止时间由 human_input_reaper 处理后唤醒，这里的超时只作兜底
+                        human_message = await agent.wait_for_human_input(agent.input_timeout + human_input_reaper.GRACE_SECONDS)
+                        outcome = agent.input_outcome
+                        if outcome in ("input", "skip", "host"):
+                            # 内容已写入会议历史并推进发言者，这里只记录本轮已发言
+                            spoken_agents_in_current_round.setdefault(meeting.current_round, []).append(agent.name)
+                            if outcome != "input" and human_message:
+                                # 代为发言或跳过说明不是客户端提交的，需要在流中输出
+                                timeout_event = {
+                                    "id": f"{conversation_id}-{agent_name}-timeout",
+                                    "object": "chat.completion.chunk",
+                                    "created": int(time.time()),
+                                    "model": "discussion-group",
+                                    "choices": [{
+                                        "index": 0,
+                                        "delta": {"content": f"{human_message}\n\n"},
+                                        "finish_reason": None
+                                    }]
+                                }
+                                yield f"data: {json_codec.dumps(timeout_event, ensure_ascii=False)}\n\n"
+                            logger.info(f"人类角色 {agent.name} 的发言已处理（{outcome}），继续当前轮次 {meeting.current_round}")
+                            continue
+                        if outcome == "end":
+                            end_event = {
+                                "id": f"{conversation_id}-meeting-end",
+                                "object": "chat.completion.chunk",
+                                "created": int(time.time()),
+                                "model": "discussion-group",
+                                "choices": [{
+                                    "index": 0,
+                                    "delta": {"content": f"\n\n## 会议结束\n\n{agent.name} 未在规定时间内发言，会议已结束。\n\n"},
+                                    "finish_reason": "stop"
+                                }]
+                            }
+                            yield f"data: {json_codec.dumps(end_event, ensure_ascii=False)}\n\n"
+                            yield "data: [DONE]\n\n"
+                            logger.info(f"人类角色 {agent.name} 等待输入超时，会议已结束")
+                            return
+                        logger.info(f"等待人类角色 {agent.name} 输入超时，结束当前流")
+
                     # 暂停继续执行，退出当前函数等待人类输入
                     # 标记未完成本轮讨论
                     all_agents_spoke = False
@@ -1121,10 +1253,13 @@ class DiscussionProcessor:
                         "finish_reason": None
                     }]
                 }
-                yield f"data: {json.dumps(thinking_event, ensure_ascii=False)}\n\n"
+                yield f"data: {json_codec.dumps(thinking_event, ensure_ascii=False)}\n\n"
                 
                 print(f"生成 {agent_name} 的回应中...")
                 
+                # 同一发言者的内容块共用预序列化的信封
+                chunk_encoder = ChunkEncoder(f"{conversation_id}-{agent_name}-chunk", "discussion-group", int(time.time()), ensure_ascii=False, with_finish_reason=True)
+                
                 # 使用累积缓冲区优化流式输出
                 async for chunk in agent.generate_response_stream(prompt, context):
                     # 检查是否是等待人类输入的特殊标记
@@ -1150,10 +1285,12 @@ class DiscussionProcessor:
                                     "finish_reason": "waiting_human"
                                 }]
                             }
-                            yield f"data: {json.dumps(waiting_event, ensure_ascii=False)}\n\n"
+                            yield f"data: {json_codec.dumps(waiting_event, ensure_ascii=False)}\n\n"
                             
                             # 暂停讨论，记录等待状态
                             meeting.waiting_for_human_input = human_name
+                            save_meeting(meeting_id)
+                            event_bus.publish(meeting_id, "waiting_for_human", {"agent": human_name})
                             
                             # 添加等待消息到会议历史
                             # meeting.add_message("system", f"轮到 {human_name} (人类角色) 发言，请输入您的发言内容")
@@ -1170,7 +1307,7 @@ class DiscussionProcessor:
                                     "finish_reason": "waiting_human"
                                 }]
                             }
-                            yield f"data: {json.dumps(client_instruction, ensure_ascii=False)}\n\n"
+                            yield f"data: {json_codec.dumps(client_instruction, ensure_ascii=False)}\n\n"
                             
                             # 暂停继续执行，退出当前函数等待人类输入
                             # 标记未完成本轮讨论
@@ -1185,40 +1322,15 @@ class DiscussionProcessor:
                     # 使用更小的缓冲区和更短的时间间隔，创造打字效果
                     # 每1-3个字符输出一次，或每0.1-0.2秒输出一次
                     if len(buffer) >= random.randint(1, 3) or (current_time - last_chunk_time) > random.uniform(0.1, 0.2):
-                        content_chunk = {
-                            "id": f"{conversation_id}-{agent_name}-chunk-{int(current_time*1000)}",
-                            "object": "chat.completion.chunk",
-                            "created": int(current_time),
-                            "model": "discussion-group",
-                            "choices": [{
-                                "index": 0,
-                                "delta": {"content": buffer},
-                                "finish_reason": None
-                            }]
-                        }
-                        yield f"data: {json.dumps(content_chunk, ensure_ascii=False)}\n\n"
+                        event_bus.publish(meeting_id, "token", {"speaker": agent_name, "content": buffer})
+                        yield chunk_encoder.encode_text({"content": buffer})
                         buffer = ""
                         last_chunk_time = current_time
-                        
-                        # 添加极小的随机暂停以增强打字效果的自然感
-                        # 这个暂停是异步的，不会阻塞其他处理
-                        if random.random() < 0.3:  # 30%概率添加微小停顿
-                            await asyncio.sleep(random.uniform(0.03, 0.08))
                 
                 # 发送剩余的缓冲区内容
                 if buffer:
-                    content_chunk = {
-                        "id": f"{conversation_id}-{agent_name}-final",
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": "discussion-group",
-                        "choices": [{
-                            "index": 0,
-                            "delta": {"content": buffer},
-                            "finish_reason": None
-                        }]
-                    }
-                    yield f"data: {json.dumps(content_chunk, ensure_ascii=False)}\n\n"
+                    event_bus.publish(meeting_id, "token", {"speaker": agent_name, "content": buffer})
+                    yield chunk_encoder.encode_text({"content": buffer})
                 
                 # 获取生成的完整回应
                 response = agent.last_response
@@ -1228,10 +1340,8 @@ class DiscussionProcessor:
                 
                 # 添加到会议历史
                 meeting.add_message(agent.name, response)
+                save_meeting(meeting_id)
                 logger.info(f"当前回应: {response}")
-                
-                # 添加轻微的随机延迟使发言更自然
-                await asyncio.sleep(0.3 + random.uniform(0, 0.3))
             
             # 只有所有角色都发言完毕，才增加轮次计数
             if all_agents_spoke:
@@ -1240,7 +1350,9 @@ class DiscussionProcessor:
                 
                 # 增加会议轮次 - 确保只在此处增加轮次，避免重复计算
                 meeting.current_round += 1
+                save_meeting(meeting_id)
                 logger.info(f"所有角色已完成发言，轮次递增: {meeting.current_round}")
+                event_bus.publish(meeting_id, "round_complete", {"round": meeting.current_round - 1})
                 
                 # 打印清晰的轮次完成标记
                 print(f"\n{'*'*40}")
@@ -1273,7 +1385,7 @@ class DiscussionProcessor:
                             "finish_reason": None
                         }]
                     }
-                    yield f"data: {json.dumps(end_meeting_info, ensure_ascii=False)}\n\n"
+                    yield f"data: {json_codec.dumps(end_meeting_info, ensure_ascii=False)}\n\n"
                     print("会议结束，正在生成总结...")
                     break
             else:
@@ -1292,7 +1404,7 @@ class DiscussionProcessor:
                     "finish_reason": None
                 }]
             }
-            yield f"data: {json.dumps(round_separator, ensure_ascii=False)}\n\n"
+            yield f"data: {json_codec.dumps(round_separator, ensure_ascii=False)}\n\n"
             
             # 检查是否已达到最大轮次，如果是则结束会议并生成总结
             if meeting.current_round > meeting.max_rounds and meeting.status != "已结束":
@@ -1315,8 +1427,7 @@ class DiscussionProcessor:
                         "finish_reason": None
                     }]
                 }
-                yield f"data: {json.dumps(end_meeting_info, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.5)
+                yield f"data: {json_codec.dumps(end_meeting_info, ensure_ascii=False)}\n\n"
                 
                 # 直接流式生成总结，不再调用meeting.finish()
                 logger.info(f"开始直接流式生成和发送会议总结")
@@ -1353,7 +1464,7 @@ class DiscussionProcessor:
                             db = next(get_db())
                             
                             # 查询模型配置
-                            summary_model = db.query(Model).filter(Model.id == model_id).first()
+                            summary_model = breaker.available_model(db.query(Model).filter(Model.id == model_id).first())
                             
                             if summary_model:
                                 logger.info(f"找到总结模型: {summary_model.name}")
@@ -1377,6 +1488,7 @@ class DiscussionProcessor:
                 
                 # 开始流式生成总结
                 accumulated_summary = ""
+                summary_encoder = ChunkEncoder(f"{conversation_id}-summary-chunk", "discussion-group", int(time.time()), ensure_ascii=False, with_finish_reason=True)
                 async for chunk in SummaryGenerator.generate_summary_stream(
                     meeting_topic=meeting_topic,
                     meeting_history=meeting_history,
@@ -1386,21 +1498,13 @@ class DiscussionProcessor:
                     api_base_url=api_base_url
                 ):
                     accumulated_summary += chunk
-                    summary_chunk_event = {
-                        "id": f"{conversation_id}-summary-chunk-{int(time.time()*1000)}",
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": "discussion-group",
-                        "choices": [{
-                            "index": 0,
-                            "delta": {"content": chunk},
-                            "finish_reason": None
-                        }]
-                    }
-                    yield f"data: {json.dumps(summary_chunk_event, ensure_ascii=False)}\n\n"
+                    event_bus.publish(meeting_id, "summary_delta", {"content": chunk})
+                    yield summary_encoder.encode_text({"content": chunk})
                 
                 # 将累积的总结保存到会议历史
                 meeting.add_message("system", accumulated_summary)
+                event_bus.publish(meeting_id, "summary", {"content": accumulated_summary})
+                save_meeting(meeting_id)
                 
                 # 发送完成事件
                 summary_end_event = {
@@ -1414,7 +1518,7 @@ class DiscussionProcessor:
                         "finish_reason": "stop"
                     }]
                 }
-                yield f"data: {json.dumps(summary_end_event, ensure_ascii=False)}\n\n"
+                yield f"data: {json_codec.dumps(summary_end_event, ensure_ascii=False)}\n\n"
                 
                 logger.info(f"总结内容已通过流式方式实时生成和发送完毕，总长度: {len(accumulated_summary)}")
                 print("会议结束，已实时生成并流式发送总结")
@@ -1422,9 +1526,6 @@ class DiscussionProcessor:
                 # 发送结束标志
                 yield f"data: [DONE]\n\n"
                 return
-            
-            # 暂停一下再进行下一轮 - 适当的延迟使整体流程更自然
-            await asyncio.sleep(0.7 + random.uniform(0, 0.5))
         
         # 发送完成标记
         yield "data: [DONE]\n\n"
@@ -1433,6 +1534,7 @@ class DiscussionProcessor:
         if meeting and not meeting.status == "已结束":
             meeting.status = "已结束"
             meeting.end_time = datetime.now()
+            save_meeting(meeting_id)
             logger.info(f"会议流处理完成，已标记为结束: meeting_id={meeting_id}")
             
             # 生成并添加总结
@@ -1472,7 +1574,7 @@ class DiscussionProcessor:
                             db = next(get_db())
                             
                             # 查询模型配置
-                            summary_model = db.query(Model).filter(Model.id == model_id).first()
+                            summary_model = breaker.available_model(db.query(Model).filter(Model.id == model_id).first())
                             
                             if summary_model:
                                 logger.info(f"找到总结模型: {summary_model.name}")
@@ -1496,6 +1598,7 @@ class DiscussionProcessor:
                 
                 # 开始流式生成总结
                 accumulated_summary = ""
+                summary_encoder = ChunkEncoder(f"{conversation_id}-summary-chunk", "discussion-group", int(time.time()), ensure_ascii=False, with_finish_reason=True)
                 async for chunk in SummaryGenerator.generate_summary_stream(
                     meeting_topic=meeting_topic,
                     meeting_history=meeting_history,
@@ -1505,21 +1608,13 @@ class DiscussionProcessor:
                     api_base_url=api_base_url
                 ):
                     accumulated_summary += chunk
-                    summary_chunk_event = {
-                        "id": f"{conversation_id}-summary-chunk-{int(time.time()*1000)}",
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": "discussion-group",
-                        "choices": [{
-                            "index": 0,
-                            "delta": {"content": chunk},
-                            "finish_reason": None
-                        }]
-                    }
-                    yield f"data: {json.dumps(summary_chunk_event, ensure_ascii=False)}\n\n"
+                    event_bus.publish(meeting_id, "summary_delta", {"content": chunk})
+                    yield summary_encoder.encode_text({"content": chunk})
                 
                 # 将累积的总结保存到会议历史
                 meeting.add_message("system", accumulated_summary)
+                event_bus.publish(meeting_id, "summary", {"content": accumulated_summary})
+                save_meeting(meeting_id)
                 
                 # 发送完成事件
                 summary_end_event = {
@@ -1533,7 +1628,7 @@ class DiscussionProcessor:
                         "finish_reason": "stop"
                     }]
                 }
-                yield f"data: {json.dumps(summary_end_event, ensure_ascii=False)}\n\n"
+                yield f"data: {json_codec.dumps(summary_end_event, ensure_ascii=False)}\n\n"
                 
                 logger.info(f"总结内容已通过流式方式实时生成和发送完毕，总长度: {len(accumulated_summary)}")
                 print("会议结束，已实时生成并流式发送总结")
@@ -1584,7 +1679,7 @@ class DiscussionProcessor:
                                 db = next(get_db())
                                 
                                 # 查询模型配置
-                                summary_model = db.query(Model).filter(Model.id == model_id).first()
+                                summary_model = breaker.available_model(db.query(Model).filter(Model.id == model_id).first())
                                 
                                 if summary_model:
                                     logger.info(f"找到总结模型: {summary_model.name}")
@@ -1608,6 +1703,7 @@ class DiscussionProcessor:
                     
                     # 开始流式生成总结
                     accumulated_summary = ""
+                    summary_encoder = ChunkEncoder(f"{conversation_id}-summary-chunk", "discussion-group", int(time.time()), ensure_ascii=False, with_finish_reason=True)
                     async for chunk in SummaryGenerator.generate_summary_stream(
                         meeting_topic=meeting_topic,
                         meeting_history=meeting_history,
@@ -1617,21 +1713,13 @@ class DiscussionProcessor:
                         api_base_url=api_base_url
                     ):
                         accumulated_summary += chunk
-                        summary_chunk_event = {
-                            "id": f"{conversation_id}-summary-chunk-{int(time.time()*1000)}",
-                            "object": "chat.completion.chunk",
-                            "created": int(time.time()),
-                            "model": "discussion-group",
-                            "choices": [{
-                                "index": 0,
-                                "delta": {"content": chunk},
-                                "finish_reason": None
-                            }]
-                        }
-                        yield f"data: {json.dumps(summary_chunk_event, ensure_ascii=False)}\n\n"
+                        event_bus.publish(meeting_id, "summary_delta", {"content": chunk})
+                        yield summary_encoder.encode_text({"content": chunk})
                     
                     # 将累积的总结保存到会议历史
                     meeting.add_message("system", accumulated_summary)
+                    event_bus.publish(meeting_id, "summary", {"content": accumulated_summary})
+                    save_meeting(meeting_id)
                     
                     # 发送完成事件
                     summary_end_event = {
@@ -1645,7 +1733,7 @@ class DiscussionProcessor:
                             "finish_reason": "stop"
                         }]
                     }
-                    yield f"data: {json.dumps(summary_end_event, ensure_ascii=False)}\n\n"
+                    yield f"data: {json_codec.dumps(summary_end_event, ensure_ascii=False)}\n\n"
                     
                     logger.info(f"总结内容已通过流式方式实时生成和发送完毕，总长度: {len(accumulated_summary)}")
                     print("会议结束，已实时生成并流式发送总结")
@@ -1659,10 +1747,9 @@ class DiscussionProcessor:
         # 打印完整会议历史
         self._print_full_discussion({'history': meeting.meeting_history, 'summary': meeting.get_summary()})
     
-    def _print_latest_round_content(self, meeting_id: str):
+    def _print_latest_round_content(self, meeting_data: Optional[Dict[str, Any]]):
         """打印最新一轮的对话内容"""
         try:
-            meeting_data = self.adapter.active_meetings.get(meeting_id)
             if not meeting_data:
                 return
             
@@ -1859,27 +1946,33 @@ class DiscussionProcessor:
             logger.info(f"人类输入后检查发现轮次已超过最大值 (当前轮次={meeting.current_round}, 最大轮次={meeting.max_rounds})，结束会议")
             meeting.status = "已结束"
             meeting.end_time = datetime.now()
+            save_meeting(meeting_id)
             return {
                 "success": True,
                 "message": f"{agent_name} 的消息已提交，会议已结束 (达到最大轮次)",
                 "meeting_id": meeting_id,
                 "status": "已结束",
-                "current_round": meeting.current_round
+                "current_round": meeting.current_round,
+                "resumed": human_agent.input_received()
             }
         
+        save_meeting(meeting_id)
+        
+        # 唤醒挂起等待该输入的会议流；resumed 为 True 时原流会继续输出，客户端无需重新发起
         return {
             "success": True,
             "message": f"{agent_name} 的消息已提交，会议将继续进行",
             "meeting_id": meeting_id,
             "status": meeting.status,
-            "current_round": meeting.current_round
+            "current_round": meeting.current_round,
+            "resumed": human_agent.input_received()
         }
 
     async def _end_meeting(self, meeting_id: str) -> Dict[str, Any]:
         """结束会议并获取总结"""
         try:
             # 获取会议对象
-            meeting_data = self.active_meetings.get(meeting_id)
+            meeting_data = await self.active_meetings.get_async(meeting_id)
             if not meeting_data:
                 logger.error(f"结束会议失败: 会议ID {meeting_id} 不存在")
                 return {"error": f"会议ID {meeting_id} 不存在"}
@@ -1894,7 +1987,7 @@ class DiscussionProcessor:
             group_info = meeting.group_info
             
             # 检查会议是否已有总结
-            existing_summary = meeting.get_summary() if hasattr(meeting, 'get_summary') else None
+            existing_summary = meeting.existing_summary()
             if meeting.status == "已结束" and existing_summary and len(existing_summary) > 100 and "未找到总结" not in existing_summary:
                 logger.info(f"会议已结束且已有总结，直接返回: meeting_id={meeting_id}")
                 result = meeting.to_dict()
@@ -1917,10 +2010,9 @@ class DiscussionProcessor:
                 model_id = group_info['summary_model_id']
                 logger.info(f"使用自定义总结模型: model_id={model_id}")
                 
-                # 从数据库获取模型配置
+                # 从配置注册表获取模型配置（不访问数据库）
                 try:
-                    from app.models.database import Model
-                    summary_model = self.db.query(Model).filter(Model.id == model_id).first()
+                    summary_model = breaker.available_model(config_registry.peek_model(model_id))
                 
                     if summary_model:
                         logger.info(f"找到总结模型: {summary_model.name}")
@@ -1981,9 +2073,11 @@ class DiscussionProcessor:
                     api_base_url=api_base_url
                 ):
                     accumulated_summary += chunk
-                
+                    event_bus.publish(meeting_id, "summary_delta", {"content": chunk})
+
                 # 将累积的总结添加到会议历史
                 meeting.add_message("system", accumulated_summary)
+                event_bus.publish(meeting_id, "summary", {"content": accumulated_summary})
                 logger.info(f"已流式生成并添加总结到会议历史: 长度={len(accumulated_summary)}")
                 
                 # 使用累积的总结作为结果
@@ -1997,6 +2091,7 @@ class DiscussionProcessor:
             meeting.status = "已结束"
             if not meeting.end_time:
                 meeting.end_time = datetime.now()
+            save_meeting(meeting_id)
             
             # 构建返回结果
             result = meeting.to_dict()
@@ -2016,6 +2111,6 @@ class DiscussionProcessor:
                 "error": f"结束会议时出错: {str(e)}",
                 "id": meeting_id,
                 "topic": meeting.topic if meeting else "未知主题",
-                "history": meeting.meeting_history if meeting else [],
+                "history": list(meeting.meeting_history) if meeting else [],
                 "summary": "由于技术问题，无法生成会议总结。"
             } 
\ No newline at end of file
@@ -0,0 +1,427 @@
+"""会议运行服务
+
+会议进度原来由正在迭代生成器的 HTTP 请求驱动：客户端断开、代理超时或关闭标签页都会让讨论
+停在半途；同步的 POST /discussions/{id}/round 还会在整轮大模型调用期间占住一个线程池线程。
+
+这里把会议执行改为后台作业（MeetingJob）：
+- 启动会议或请求一轮讨论只是提交作业，作业进入队列后立即返回作业ID
+- 固定数量的 asyncio worker（MEETING_RUNNER_WORKERS）从队列取出作业并驱动到完成，与有没有人观看无关
+- HTTP 接口只负责启动、观察（作业输出流 / 事件总线 / 消息与作业状态轮询）、暂停、继续与取消
+
+作业类型:
+- run: 驱动流式讨论过程直到会议结束或等待人类输入，输出写入可续传的流（resumable_stream），
+  观看者随时连接、断开或续传都不影响会议本身
+- round: 与原来的 /round 接口相同，逐个发言者推进直到本轮结束
+
+作业每完成一步（run: 一个 chunk；round: 一位发言者）检查暂停与取消请求。暂停的作业和等待
+人类输入的作业都不占用 worker：作业保留生成器，继续时由任意 worker 接着迭代。
+同一会议同时只有一个活跃作业，并通过 event_bus.claim_driver 与直接驱动的流式请求互斥。
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.adapters.meeting_adapter import MeetingAdapter
+from app.meeting import event_bus
+from app.models.database import SessionLocal
+from app.processors.discussion_processor import DiscussionProcessor
+from app.utils import json_codec, resumable_stream
+
+logger = logging.getLogger(__name__)
+
+# 并发驱动会议的 worker 数
+WORKERS = int(os.getenv("MEETING_RUNNER_WORKERS", "4"))
+# 排队中的作业上限，超过时拒绝提交
+MAX_QUEUED = int(os.getenv("MEETING_RUNNER_QUEUE", "100"))
+# 已结束的作业保留的秒数（供查询结果）
+JOB_RETAIN = float(os.getenv("MEETING_JOB_RETAIN", "600"))
+
+KINDS = ("run", "round")
+
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+WAITING_HUMAN = "waiting_human"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING, PAUSED, WAITING_HUMAN)
+
+
+class RunnerBusyError(RuntimeError):
+    """作业队列已满"""
+
+
+class MeetingJob:
+    """一个会议作业"""
+
+    def __init__(self, meeting_id: str, kind: str):
+        self.id = uuid.uuid4().hex
+        self.meeting_id = meeting_id
+        self.kind = kind
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps = 0
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        # run 作业的输出流
+        self.stream: Optional[resumable_stream.ResumableStream] = None
+        self.pause_requested = False
+        self.cancel_requested = False
+        # 驱动会议的异步生成器，以及正在执行的一步（__anext__）
+        self._steps = None
+        self._pending: Optional[asyncio.Future] = None
+        self._db = None
+        self._claimed = False
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "meeting_id": self.meeting_id,
+            "kind": self.kind,
+            "status": self.status,
+            "steps": self.steps,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "pause_requested": self.pause_requested,
+            "cancel_requested": self.cancel_requested,
+            "stream_id": self.stream.stream_id if self.stream is not None else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class MeetingRunner:
+    """后台驱动会议的作业队列与 worker 池"""
+
+    def __init__(self, workers: int = WORKERS, max_queued: int = MAX_QUEUED):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self._jobs: Dict[str, MeetingJob] = {}
+        # 会议ID -> 活跃作业 / 最近一个作业
+        self._active: Dict[str, MeetingJob] = {}
+        self._latest: Dict[str, str] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._busy = 0
+        self._stats = {
+            "submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "cancelled": 0,
+            "paused": 0, "waiting_human": 0,
+        }
+
+    def start(self) -> None:
+        """在当前事件循环中启动 worker（重复调用无副作用）"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"会议运行服务已启动: {self.workers} 个 worker")
+
+    async def stop(self) -> None:
+        """取消 worker 与所有活跃作业"""
+        for job in list(self._active.values()):
+            job.cancel_requested = True
+            if job._pending is not None:
+                job._pending.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in list(self._active.values()):
+            await self._finish(job, CANCELLED, "服务关闭")
+
+    def submit(self, meeting_id: str, kind: str = "run") -> Tuple[MeetingJob, bool]:
+        """
+        提交会议作业（在事件循环中调用），会议已有活跃作业时直接返回该作业
+
+        参数:
+            meeting_id: 会议ID
+            kind: run / round
+
+        返回:
+            Tuple[MeetingJob, bool]: 作业，以及是否为新提交的作业
+        """
+        if kind not in KINDS:
+            raise ValueError(f"未知的作业类型: {kind}")
+        self.start()
+        existing = self._active.get(meeting_id)
+        if existing is not None:
+            return existing, False
+        if self._queue.qsize() >= self.max_queued:
+            self._stats["rejected"] += 1
+            raise RunnerBusyError("会议作业队列已满，请稍后重试")
+        if event_bus.is_driving(meeting_id):
+            raise RuntimeError(f"会议 {meeting_id} 正在被其他请求驱动")
+
+        job = MeetingJob(meeting_id, kind)
+        if kind == "run":
+            job.stream = resumable_stream.open_stream(headers={"X-Meeting-Id": meeting_id, "X-Job-Id": job.id})
+        self._jobs[job.id] = job
+        self._active[meeting_id] = job
+        self._latest[meeting_id] = job.id
+        self._stats["submitted"] += 1
+        self._queue.put_nowait(job)
+        logger.info(f"已提交会议作业: job_id={job.id}, meeting_id={meeting_id}, 类型={kind}")
+        return job, True
+
+    def get(self, job_id: str) -> Optional[MeetingJob]:
+        return self._jobs.get(job_id)
+
+    def job_for_meeting(self, meeting_id: str) -> Optional[MeetingJob]:
+        """会议的活跃作业，没有时返回最近一个（仍在保留期内的）作业"""
+        job = self._active.get(meeting_id)
+        if job is None:
+            job = self._jobs.get(self._latest.get(meeting_id, ""))
+        return job
+
+    def pause(self, job_id: str) -> MeetingJob:
+        """
+        暂停作业：排队中的作业立即暂停，执行中的作业在当前一步完成后暂停
+
+        参数:
+            job_id: 作业ID
+
+        返回:
+            MeetingJob: 作业
+        """
+        job = self._require_active(job_id)
+        job.pause_requested = True
+        if job.status == QUEUED:
+            self._park(job, PAUSED)
+        return job
+
+    def resume(self, job_id: str) -> MeetingJob:
+        """继续暂停的作业（重新进入队列）"""
+        job = self._require_active(job_id)
+        job.pause_requested = False
+        if job.status == PAUSED:
+            job.status = QUEUED
+            self._queue.put_nowait(job)
+        return job
+
+    def cancel(self, job_id: str) -> MeetingJob:
+        """
+        取消作业：正在执行的一步被取消，会议停在当前状态（可以重新提交作业继续）
+
+        参数:
+            job_id: 作业ID
+
+        返回:
+            MeetingJob: 作业
+        """
+        job = self._require_active(job_id)
+        job.cancel_requested = True
+        if job._pending is not None and not job._pending.done():
+            # 由等待该步的 worker 或 _on_step_done 收尾
+            job._pending.cancel()
+        elif job.status in (QUEUED, PAUSED):
+            asyncio.get_running_loop().create_task(self._finish(job, CANCELLED))
+        return job
+
+    def _require_active(self, job_id: str) -> MeetingJob:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if not job.active:
+            raise ValueError(f"作业已结束（{job.status}）")
+        return job
+
+    def _park(self, job: MeetingJob, status: str) -> None:
+        """作业让出 worker（暂停或等待人类输入）"""
+        job.status = status
+        self._stats[status] += 1
+        logger.info(f"会议作业 {job.id} 进入 {status}，已让出 worker")
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            # 队列中可能残留已暂停、已取消或已被其他 worker 接手的作业
+            if job.status != QUEUED:
+                continue
+            self._busy += 1
+            try:
+                await self._drive(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"会议作业 {job.id} 执行失败: {str(e)}", exc_info=True)
+                job._pending = None
+                await self._finish(job, FAILED, str(e))
+            finally:
+                self._busy -= 1
+
+    async def _drive(self, job: MeetingJob) -> None:
+        """驱动作业直到结束、暂停或等待人类输入"""
+        job.status = RUNNING
+        if job._steps is None:
+            if not event_bus.claim_driver(job.meeting_id):
+                await self._finish(job, FAILED, "会议正在被其他请求驱动")
+                return
+            job._claimed = True
+            job.started_at = time.time()
+            job._steps = self._make_steps(job)
+
+        while True:
+            if job._pending is None:
+                job._pending = asyncio.ensure_future(job._steps.__anext__())
+            try:
+                step = await job._pending
+            except StopAsyncIteration:
+                job._pending = None
+                await self._finish(job, COMPLETED)
+                return
+            except asyncio.CancelledError:
+                job._pending = None
+                if asyncio.current_task().cancelling():
+                    # worker 本身被取消（服务关闭）
+                    raise
+                await self._finish(job, CANCELLED)
+                return
+            job._pending = None
+            self._emit(job, step)
+
+            if job.cancel_requested:
+                await self._finish(job, CANCELLED)
+                return
+            if job.pause_requested:
+                self._park(job, PAUSED)
+                return
+            if job.kind == "run" and "waiting_human" in step:
+                # 下一步会挂起直到人类输入或超时处理，不必占用 worker
+                job._pending = asyncio.ensure_future(job._steps.__anext__())
+                self._park(job, WAITING_HUMAN)
+                job._pending.add_done_callback(lambda _: self._on_step_done(job))
+                return
+
+    def _on_step_done(self, job: MeetingJob) -> None:
+        """等待人类输入的一步完成，作业重新进入队列"""
+        if job.status != WAITING_HUMAN:
+            return
+        if job.cancel_requested:
+            job._pending = None
+            asyncio.get_running_loop().create_task(self._finish(job, CANCELLED))
+            return
+        job.status = QUEUED
+        self._queue.put_nowait(job)
+
+    def _make_steps(self, job: MeetingJob):
+        job._db = SessionLocal()
+        adapter = MeetingAdapter(job._db)
+        if job.kind == "round":
+            return self._round_steps(job, adapter)
+        processor = DiscussionProcessor(job._db)
+        processor.adapter = adapter
+        processor.current_meeting_id = job.meeting_id
+        return processor._stream_discussion_process(job.meeting_id)
+
+    async def _round_steps(self, job: MeetingJob, adapter: MeetingAdapter):
+        """逐个发言者推进直到本轮结束（原 POST /round 的逻辑），每位发言者为一步"""
+        meeting = await asyncio.to_thread(adapter._get_meeting, job.meeting_id)
+        start_round = meeting.current_round
+        results = []
+        completed_speakers = 0
+        round_completed = False
+
+        while not round_completed and completed_speakers < len(meeting.agents):
+            result = await adapter.conduct_discussion_round_async(job.meeting_id)
+            results.append(result)
+            completed_speakers += 1
+            logger.info(f"发言者 {completed_speakers}/{len(meeting.agents)} 结果: {result}")
+            yield result
+
+            if result.get("waiting_for_human", False) or result.get("waiting_for_human_input"):
+                logger.info(f"等待人类角色 {result.get('speaker', result.get('waiting_for_human_input', '未知'))} 的输入，暂停轮次")
+                job.result = result
+                return
+            if meeting.current_round > start_round:
+                round_completed = True
+            if meeting.status == "已结束" or result.get("status") == "已结束":
+                round_completed = True
+
+        job.result = {
+            "meeting_id": job.meeting_id,
+            "current_round": meeting.current_round,
+            "status": meeting.status,
+            "success": True,
+            "message": "当前轮次所有角色已完成发言" if round_completed else "已处理部分角色发言",
+            "results": results
+        }
+
+    def _emit(self, job: MeetingJob, step) -> None:
+        job.steps += 1
+        if job.stream is not None:
+            job.stream.write(step)
+
+    async def _finish(self, job: MeetingJob, status: str, error: Optional[str] = None) -> None:
+        """结束作业：关闭生成器与数据库会话，释放驱动权，结束输出流"""
+        if not job.active:
+            return
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        self._stats[status] += 1
+
+        steps, job._steps = job._steps, None
+        if steps is not None:
+            try:
+                await steps.aclose()
+            except Exception as e:
+                logger.warning(f"关闭会议作业 {job.id} 的生成器出错: {str(e)}")
+        if job._db is not None:
+            job._db.close()
+            job._db = None
+        if job._claimed:
+            job._claimed = False
+            event_bus.release_driver(job.meeting_id)
+        if job.stream is not None and not job.stream.done:
+            if status != COMPLETED:
+                message = error or "会议作业已取消"
+                job.stream.write(f"data: {json_codec.dumps({'error': message, 'job_status': status}, ensure_ascii=False)}\n\n")
+                job.stream.write("data: [DONE]\n\n")
+            job.stream.finish()
+
+        if self._active.get(job.meeting_id) is job:
+            del self._active[job.meeting_id]
+        logger.info(f"会议作业结束: job_id={job.id}, meeting_id={job.meeting_id}, 状态={status}")
+        asyncio.get_running_loop().call_later(JOB_RETAIN, self._forget, job.id)
+
+    def _forget(self, job_id: str) -> None:
+        job = self._jobs.pop(job_id, None)
+        if job is not None and self._latest.get(job.meeting_id) == job_id:
+            del self._latest[job.meeting_id]
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self._active.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "workers": len(self._tasks),
+            "busy_workers": self._busy,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "active_jobs": len(self._active),
+            "active_by_status": statuses,
+            "retained_jobs": len(self._jobs),
+            **self._stats,
+        }
+
+
+_runner: Optional[MeetingRunner] = None
+
+
+def get_runner() -> MeetingRunner:
+    """获取全局会议运行服务"""
+    global _runner
+    if _runner is None:
+        _runner = MeetingRunner()
+    return _runner
@@ -1,23 +1,25 @@
 from typing import Dict, Any, List, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 import logging
-import json
 import time
 
 from app.models.database import Role, Model
+from app.models import config_registry
+from app.models.config_registry import RolePlan
 from app.meeting.agents.agent import Agent
+from app.utils import json_codec
 
 logger = logging.getLogger(__name__)
 
 class RoleProcessor:
     """角色处理器，用于管理角色数据"""
     
-    def __init__(self, db: Session, role_id: Optional[int] = None):
+    def __init__(self, db: Optional[Session], role_id: Optional[int] = None):
         """
         初始化角色处理器
         
         参数:
-            db: 数据库会话
+            db: 数据库会话（单角色对话只读配置注册表，可以为 None）
             role_id: 可选的角色ID，用于单角色对话
         """
         self.db = db
@@ -31,12 +33,19 @@ class RoleProcessor:
     
     def get_roles(self) -> List[Dict[str, Any]]:
         """获取所有角色"""
-        roles = self.db.query(Role).all()
+        # 预加载模型与寄生角色，避免每个角色额外查询两次
+        roles = self.db.query(Role).options(
+            joinedload(Role.model),
+            joinedload(Role.host_role)
+        ).all()
         return [self._role_to_dict(role) for role in roles]
     
     def get_role(self, role_id: int) -> Optional[Dict[str, Any]]:
         """获取特定角色"""
-        role = self.db.query(Role).filter(Role.id == role_id).first()
+        role = self.db.query(Role).options(
+            joinedload(Role.model),
+            joinedload(Role.host_role)
+        ).filter(Role.id == role_id).first()
         if not role:
             return None
         return self._role_to_dict(role)
@@ -79,6 +88,7 @@ class RoleProcessor:
         self.db.add(role)
         self.db.commit()
         self.db.refresh(role)
+        config_registry.invalidate()
         
         return self._role_to_dict(role)
     
@@ -110,6 +120,7 @@ class RoleProcessor:
         
         self.db.commit()
         self.db.refresh(role)
+        config_registry.invalidate()
         
         return self._role_to_dict(role)
     
@@ -121,17 +132,16 @@ class RoleProcessor:
         
         self.db.delete(role)
         self.db.commit()
+        config_registry.invalidate()
         
         return True
     
     def _role_to_dict(self, role: Role) -> Dict[str, Any]:
         """将角色对象转换为字典"""
-        model = self.db.query(Model).filter(Model.id == role.model_id).first()
+        model = role.model
         
         # 获取寄生的角色信息（如果有）
-        host_role = None
-        if role.host_role_id:
-            host_role = self.db.query(Role).filter(Role.id == role.host_role_id).first()
+        host_role = role.host_role if role.host_role_id else None
         
         return {
             "id": role.id,
@@ -156,17 +166,22 @@ class RoleProcessor:
         return role
     
     def _load_model(self, role: Role) -> Model:
-        """加载模型信息"""
-        model = self.db.query(Model).filter(Model.id == role.model_id).first()
+        """加载模型信息（注册表中的角色快照已包含解析后的模型）"""
+        if isinstance(role, RolePlan):
+            model = role.model
+        else:
+            model = self.db.query(Model).filter(Model.id == role.model_id).first()
         if not model:
             raise ValueError(f"模型ID {role.model_id} 不存在")
         return model
     
     def _create_agent(self, role: Role) -> Agent:
-        """创建智能体实例"""
-        # 构建模型参数
-        model_params = role.parameters or {}
-        model_params["model_name"] = self._load_model(role).model_name
+        """创建智能体实例（底层 LLM 客户端从进程级注册表复用）"""
+        model = self._load_model(role)
+        
+        # 构建模型参数（复制一份，避免修改角色对象上的 JSON 字段）
+        model_params = dict(role.parameters or {})
+        model_params["model_name"] = model.model_name
         
         # 创建智能体
         agent = Agent(
@@ -175,8 +190,8 @@ class RoleProcessor:
             personality=role.personality or "",
             skills=role.skills or [],
             model_params=model_params,
-            base_url=self._load_model(role).api_url,
-            api_key=self._load_model(role).api_key
+            base_url=model.api_url,
+            api_key=model.api_key
         )
         
         return agent
@@ -186,7 +201,8 @@ class RoleProcessor:
         try:
             # 如果是单角色对话模式
             if self.role_id:
-                role = self.db.query(Role).filter(Role.id == self.role_id).first()
+                # 从配置注册表获取角色及其模型，不访问数据库
+                role = config_registry.get_role(self.role_id)
                 if not role:
                     raise ValueError(f"角色ID {self.role_id} 不存在")
                     
@@ -209,14 +225,14 @@ class RoleProcessor:
 请根据你的角色特点和专业知识回答用户的问题。
 """
     
-    def _process_normal_request(self, prompt: str, system_prompt: str) -> str:
+    async def _process_normal_request(self, prompt: str, system_prompt: str) -> str:
         """处理普通请求"""
         # 设置系统提示
         agent = self._create_agent(self._load_role(prompt))
         agent.system_prompt = system_prompt
         
         # 处理请求
-        response = agent.generate_response(prompt)
+        response = await agent.generate_response_async(prompt)
         return response
     
     async def _process_stream_request(self, prompt: str, system_prompt: str):
@@ -320,8 +336,8 @@ class RoleProcessor:
 
     async def _get_normal_chat_response(self, agent: Agent, messages: List[Dict[str, Any]]) -> str:
         """获取普通聊天响应"""
-        # 处理请求
-        response = agent.generate_chat_response(messages)
+        # 处理请求（异步调用，不阻塞事件循环）
+        response = await agent.generate_chat_response_async(messages)
         return response
 
     async def _get_stream_chat_response(self, agent: Agent, messages: List[Dict[str, Any]]):
@@ -352,7 +368,7 @@ class RoleProcessor:
                         "finish_reason": None
                     }]
                 }
-                yield f"data: {json.dumps(role_data)}\n\n".encode('utf-8')
+                yield f"data: {json_codec.dumps(role_data)}\n\n".encode('utf-8')
                 first_chunk = False
             
             # 流式发送内容
@@ -371,7 +387,7 @@ class RoleProcessor:
                             "finish_reason": None
                         }]
                     }
-                    yield f"data: {json.dumps(content_data)}\n\n".encode('utf-8')
+                    yield f"data: {json_codec.dumps(content_data)}\n\n".encode('utf-8')
             
             # 发送完成信息
             finish_data = {
@@ -385,7 +401,7 @@ class RoleProcessor:
                     "finish_reason": "stop"
                 }]
             }
-            yield f"data: {json.dumps(finish_data)}\n\n".encode('utf-8')
+            yield f"data: {json_codec.dumps(finish_data)}\n\n".encode('utf-8')
             
             # 发送结束标记
             yield b"data: [DONE]\n\n"
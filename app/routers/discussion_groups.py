@@ -2,14 +2,16 @@ from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 import logging
-import json
 import traceback
 from fastapi.responses import StreamingResponse
 
 from app.models.database import get_db
 from app.processors.discussion_processor import DiscussionProcessor
+from app.utils import json_codec
+from app.utils.codec_route import CodecJSONRoute
 
 router = APIRouter(
+    route_class=CodecJSONRoute,
     prefix="/v1/discussion_groups",
     tags=["discussion_groups"],
 )
@@ -70,6 +72,8 @@ def update_discussion_group(group_id: int, group_data: Dict[str, Any], db: Sessi
         return group
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"更新讨论组 {group_id} 失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"更新讨论组失败: {str(e)}")
@@ -113,7 +117,7 @@ async def stream_discussion_process(group_id: int, request: Request, db: Session
                 "error": str(e),
                 "detail": traceback.format_exc()
             }
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+            yield f"data: {json_codec.dumps(error_data, ensure_ascii=False)}\n\n"
             yield "data: [DONE]\n\n"
             
         return StreamingResponse(error_stream(), media_type="text/event-stream") 
\ No newline at end of file
@@ -4,13 +4,16 @@ from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from typing import Dict, Any
 import logging
-import json
 
 from app.models.database import get_db
 from app.adapters.meeting_adapter import MeetingAdapter
 from app.processors.discussion_processor import DiscussionProcessor
+from app.processors import meeting_runner
+from app.utils import json_codec, resumable_stream
+from app.utils.codec_route import CodecJSONRoute
 
 router = APIRouter(
+    route_class=CodecJSONRoute,
     prefix="/v1/discussions",
     tags=["discussions"],
 )
@@ -42,17 +45,19 @@ def start_discussion(
 @router.post("/stream/{group_id}")
 async def stream_discussion_process(group_id: int, request: Request, db: Session = Depends(get_db)):
     """开始流式讨论过程"""
+    # 携带 Last-Event-ID 重连时续传原来的流，不再启动新会议
+    resumed = resumable_stream.resume_response(request)
+    if resumed is not None:
+        return resumed
+    
     processor = DiscussionProcessor(db)
     
     try:
         # 开始会议
         meeting_id = processor.start_meeting(group_id)
         
-        # 返回流式响应
-        return StreamingResponse(
-            processor._stream_discussion_process(meeting_id),
-            media_type="text/event-stream"
-        )
+        # 会议由后台作业驱动，返回作业的输出流，断开连接不会中断会议
+        return _job_stream_response(processor, meeting_id)
         
     except Exception as e:
         logger.error(f"启动流式讨论过程时出错: {str(e)}", exc_info=True)
@@ -63,14 +68,18 @@ async def stream_discussion_process(group_id: int, request: Request, db: Session
                 "error": str(e),
                 "detail": traceback.format_exc()
             }
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+            yield f"data: {json_codec.dumps(error_data, ensure_ascii=False)}\n\n"
             yield "data: [DONE]\n\n"
             
         return StreamingResponse(error_stream(), media_type="text/event-stream")
 
 @router.get("/stream/{meeting_id}")
-async def continue_stream_discussion(meeting_id: str, db: Session = Depends(get_db)):
-    """继续进行流式讨论过程（从当前状态继续）"""
+async def continue_stream_discussion(meeting_id: str, request: Request, db: Session = Depends(get_db)):
+    """继续进行流式讨论过程（从当前状态继续），携带 Last-Event-ID 重连时续传断开的流"""
+    resumed = resumable_stream.resume_response(request)
+    if resumed is not None:
+        return resumed
+    
     processor = DiscussionProcessor(db)
     processor.adapter = MeetingAdapter(db)
     # 设置当前会议ID
@@ -79,11 +88,8 @@ async def continue_stream_discussion(meeting_id: str, db: Session = Depends(get_
     try:
         logger.info(f"继续会议流程: meeting_id={meeting_id}")
         
-        # 返回流式响应，直接使用处理器的_stream_discussion_process方法
-        return StreamingResponse(
-            processor._stream_discussion_process(meeting_id),
-            media_type="text/event-stream"
-        )
+        # 已有后台作业时观看该作业，否则提交作业继续会议
+        return _job_stream_response(processor, meeting_id)
         
     except Exception as e:
         logger.error(f"继续流式讨论过程时出错: {str(e)}", exc_info=True)
@@ -94,11 +100,33 @@ async def continue_stream_discussion(meeting_id: str, db: Session = Depends(get_
                 "error": str(e),
                 "detail": traceback.format_exc()
             }
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+            yield f"data: {json_codec.dumps(error_data, ensure_ascii=False)}\n\n"
             yield "data: [DONE]\n\n"
             
         return StreamingResponse(error_stream(), media_type="text/event-stream")
 
+def _job_stream_response(processor: DiscussionProcessor, meeting_id: str) -> StreamingResponse:
+    """
+    返回驱动会议的后台作业的输出流
+
+    会议已有 run 作业时直接观看；已由其他请求或 round 作业驱动时订阅事件总线观看；
+    作业队列已满时退回到由当前请求驱动。
+    """
+    runner = meeting_runner.get_runner()
+    job = runner.job_for_meeting(meeting_id)
+    if job is None or not job.active or job.stream is None:
+        try:
+            job, _ = runner.submit(meeting_id, "run")
+        except RuntimeError as e:
+            logger.info(f"会议 {meeting_id} 无法提交后台作业（{str(e)}），由当前请求处理")
+            job = None
+    if job is None or job.stream is None:
+        return resumable_stream.stream_response(
+            processor._get_stream_response(meeting_id),
+            headers={"X-Meeting-Id": meeting_id}
+        )
+    return resumable_stream.read_response(job.stream)
+
 @router.post("/{meeting_id}/human_input", response_model=Dict[str, Any])
 def submit_human_input(
     meeting_id: str,
@@ -1,14 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
+import asyncio
+import gzip
+import hashlib
 import logging
+import os
+import time
 from fastapi.responses import StreamingResponse
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
 from app.models.database import get_db
 from app.adapters.meeting_adapter import MeetingAdapter
+from app.meeting import event_bus, human_input_reaper, notifier
+from app.meeting.store import get_meeting_store, save_meeting
+from app.processors import meeting_runner
+from app.utils import json_codec, resumable_stream
+from app.utils.codec_route import CodecJSONRoute
 
 router = APIRouter(
+    route_class=CodecJSONRoute,
     prefix="/api/meeting",
     tags=["meeting"],
     responses={404: {"description": "Not found"}},
@@ -189,96 +201,34 @@ def create_discussion(
             }
         )
 
-@router.post("/discussions/{meeting_id}/round", response_model=Dict[str, Any])
-def conduct_discussion_round(meeting_id: str, db: Session = Depends(get_db)):
-    """进行一轮讨论"""
-    adapter = MeetingAdapter(db)
-    
-    # 输出所有活跃会议的ID，帮助调试
-    logger.info(f"进行讨论轮次: meeting_id={meeting_id}")
-    logger.info(f"活跃会议IDs: {list(adapter.active_meetings.keys())}")
-    
-    # 检查会议是否存在
-    meeting_data = adapter.active_meetings.get(meeting_id)
-    if not meeting_data:
-        # 检查会议是否刚刚创建
-        if meeting_id:
-            adapter.active_meetings = {} # 尝试清空并重新加载
-            
-        logger.error(f"讨论轮次失败: 找不到会议ID {meeting_id}，当前活跃会议IDs: {list(adapter.active_meetings.keys())}")
-        raise HTTPException(status_code=404, detail=f"会议ID {meeting_id} 不存在")
-    
-    # 输出会议数据结构信息
-    logger.info(f"获取到会议数据: 类型={type(meeting_data)}, 键={list(meeting_data.keys())}")
-    
-    # 从会议数据中获取会议对象
-    meeting = meeting_data.get("meeting")
-    if not meeting:
-        logger.error(f"会议数据格式错误: meeting_id={meeting_id}, 会议数据={meeting_data}")
-        raise HTTPException(status_code=500, detail=f"会议数据格式错误")
-    
-    # 记录会议对象类型，帮助调试
-    logger.info(f"会议对象类型: {type(meeting)}, 状态: {meeting.status}, 轮次: {meeting.current_round}")
-    
-    # 调用讨论轮次
+@router.post("/discussions/{meeting_id}/round", response_model=None)
+async def conduct_discussion_round(meeting_id: str):
+    """进行一轮讨论：提交后台作业并立即返回 202，通过 /jobs/{job_id} 查询进度与结果"""
+    logger.info(f"提交讨论轮次作业: meeting_id={meeting_id}")
+    await run_in_threadpool(_load_meeting, meeting_id)
+    return _submit_job(meeting_id, "round")
+
+@router.post("/discussions/{meeting_id}/run", response_model=None)
+async def run_discussion(meeting_id: str):
+    """在后台驱动会议直到结束或等待人类输入，立即返回 202；输出可从 /jobs/{job_id}/stream 观看"""
+    await run_in_threadpool(_load_meeting, meeting_id)
+    return _submit_job(meeting_id, "run")
+
+def _submit_job(meeting_id: str, kind: str) -> JSONResponse:
+    """提交会议作业，返回 202 与作业信息；会议已有活跃作业时返回该作业"""
+    runner = meeting_runner.get_runner()
     try:
-        # 获取当前轮次所有角色的发言顺序
-        speaking_order = meeting.mode.determine_speaking_order(
-            [{"name": agent.name, "role": agent.role_description} for agent in meeting.agents],
-            meeting.current_round
-        )
-        
-        # 记录当前轮次和参与者
-        logger.info(f"当前轮次: {meeting.current_round}, 发言顺序: {speaking_order}")
-        
-        # 记录开始时的轮次和发言者索引
-        start_round = meeting.current_round
-        start_speaker_index = meeting.current_speaker_index
-        
-        # 准备收集本轮所有发言结果
-        results = []
-        completed_speakers = 0
-        round_completed = False
-        
-        # 持续执行直到完成当前轮次（所有角色都发言完毕或轮次增加）
-        while not round_completed and completed_speakers < len(meeting.agents):
-            # 执行单个发言者的发言
-            result = adapter.conduct_discussion_round(meeting_id)
-            results.append(result)
-            completed_speakers += 1
-            
-            logger.info(f"发言者 {completed_speakers}/{len(meeting.agents)} 结果: {result}")
-            
-            # 如果需要等待人类输入，则中断循环
-            if result.get("waiting_for_human", False):
-                logger.info(f"等待人类角色 {result.get('speaker', '未知')} 的输入，暂停轮次")
-                return result
-            
-            # 如果轮次已经变化，表示完成了一轮
-            if meeting.current_round > start_round:
-                round_completed = True
-                logger.info(f"轮次已增加: {start_round} -> {meeting.current_round}，认为当前轮次已完成")
-            
-            # 如果会议状态变为"已结束"，也中断循环
-            if meeting.status == "已结束" or result.get("status") == "已结束":
-                round_completed = True
-                logger.info("会议已结束")
-        
-        # 返回最终结果
-        final_result = {
-            "meeting_id": meeting_id,
-            "current_round": meeting.current_round,
-            "status": meeting.status,
-            "success": True,
-            "message": "当前轮次所有角色已完成发言" if round_completed else "已处理部分角色发言",
-            "results": results  # 包含每个角色的发言结果
-        }
-        
-        logger.info(f"讨论轮次完成: {final_result}")
-        return final_result
-    except Exception as e:
-        logger.error(f"执行讨论轮次时发生错误: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"执行讨论轮次失败: {str(e)}")
+        job, created = runner.submit(meeting_id, kind)
+    except meeting_runner.RunnerBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    content = dict(job.to_dict(), created=created)
+    return JSONResponse(
+        status_code=202,
+        content=content,
+        headers={"Location": f"{router.prefix}/jobs/{job.id}", "X-Meeting-Id": meeting_id, "X-Job-Id": job.id}
+    )
 
 @router.get("/discussions/{meeting_id}/round", response_model=Dict[str, Any])
 def get_discussion_round(
@@ -323,11 +273,11 @@ async def end_discussion(meeting_id: str, db: Session = Depends(get_db)):
     """结束讨论会议"""
     adapter = MeetingAdapter(db)
     
-    # 输出所有活跃会议的ID，帮助调试
-    logger.info(f"活跃会议IDs: {list(adapter.active_meetings.keys())}")
+    # 输出所有活跃会议的ID，帮助调试（sql 存储需要查询数据库，在线程中执行）
+    logger.info(f"活跃会议IDs: {await asyncio.to_thread(list, adapter.active_meetings)}")
     
     # 检查会议是否存在
-    if meeting_id not in adapter.active_meetings:
+    if not await adapter.active_meetings.contains_async(meeting_id):
         raise HTTPException(status_code=404, detail=f"会议ID {meeting_id} 不存在")
     
     # 结束会议
@@ -400,6 +350,9 @@ def submit_human_input(
         meeting.status = "进行中"
         logger.info(f"已将会议状态从'{meeting.status}'更改为'进行中'")
     
+    # 持久化会议状态，其他 worker 可以继续该会议
+    save_meeting(meeting_id)
+    
     # 输出会议状态
     logger.info(f"人类输入已添加: 会议ID={meeting_id}, 角色={agent_name}, 消息长度={len(message)}")
     
@@ -417,7 +370,9 @@ def submit_human_input(
         "message": f"{agent_name} 的消息已提交，会议将继续进行",
         "meeting_id": meeting_id,
         "status": meeting.status,
-        "current_round": meeting.current_round
+        "current_round": meeting.current_round,
+        # 唤醒挂起等待该输入的会议流
+        "resumed": human_agent.input_received()
     }
 
 @router.get("/discussions/{meeting_id}/human_roles", response_model=List[Dict[str, Any]])
@@ -448,97 +403,115 @@ def get_human_roles(meeting_id: str, db: Session = Depends(get_db)):
     logger.info(f"找到 {len(human_roles)} 个人类角色: {[role.get('name') for role in human_roles]}")
     return human_roles
 
-@router.get("/discussions/{meeting_id}/messages", response_model=Dict[str, Any])
-def get_meeting_messages(meeting_id: str, format: str = "standard", db: Session = Depends(get_db)):
-    """获取会议消息历史"""
-    adapter = MeetingAdapter(db)
-    
-    # 输出所有活跃会议的ID，帮助调试
-    logger.info(f"获取会议消息，活跃会议IDs: {list(adapter.active_meetings.keys())}")
-    
-    # 检查会议是否存在
-    meeting_data = adapter.active_meetings.get(meeting_id)
+# ===== 会议消息（增量游标 / ETag / 长轮询） =====
+
+# 长轮询最长挂起时间（秒），超过时截断
+MESSAGES_MAX_WAIT = float(os.getenv("MEETING_MESSAGES_MAX_WAIT", "30"))
+# 响应体超过该字节数且客户端支持时使用 gzip 压缩
+MESSAGES_GZIP_MIN_BYTES = int(os.getenv("MEETING_MESSAGES_GZIP_MIN_BYTES", "1024"))
+
+
+def _load_meeting(meeting_id: str):
+    """从会议存储中取出会议对象（可能访问数据库，在线程池中调用）"""
+    meeting_data = get_meeting_store().get(meeting_id)
     if not meeting_data:
-        logger.error(f"找不到会议ID: {meeting_id}，当前活跃会议: {list(adapter.active_meetings.keys())}")
+        logger.error(f"找不到会议ID: {meeting_id}")
         raise HTTPException(status_code=404, detail=f"会议ID {meeting_id} 不存在")
-    
-    # 从会议数据中获取会议对象
+
     meeting = meeting_data.get("meeting")
     if not meeting:
         logger.error(f"会议数据格式错误: meeting_id={meeting_id}")
         raise HTTPException(status_code=500, detail=f"会议数据格式错误")
-    
-    # 输出会议对象类型
-    logger.info(f"会议对象类型: {type(meeting)}")
-    
-    # 获取消息历史
-    history = meeting.get_meeting_history()
-    
-    # 添加角色等待状态
+    return meeting
+
+
+def _waiting_state(meeting):
+    """
+    计算人类角色的等待状态
+
+    返回:
+        tuple: (waiting_for_agent, 等待中的人类智能体列表)
+    """
     waiting_for_agent = None
-    waiting_for_human = []
-    
-    # 获取人类角色信息
-    human_roles = meeting.get_human_roles()
-    
-    # 检查是否有人类角色正在等待输入
-    is_waiting_for_human = False
+    waiting_agents = []
     for agent in meeting.agents:
-        if hasattr(agent, 'is_human') and agent.is_human and agent.is_waiting_for_input():
+        if getattr(agent, 'is_human', False) and agent.is_waiting_for_input():
             waiting_for_agent = agent.name
-            is_waiting_for_human = True
-            # 查找对应的人类角色详细信息
-            for role in human_roles:
-                if role['name'] == agent.name:
-                    waiting_for_human.append(role)
-                    break
-            # 如果没有找到角色信息，添加基本信息
-            if not waiting_for_human or waiting_for_human[-1]['name'] != agent.name:
-                waiting_for_human.append({
-                    'name': agent.name,
-                    'id': getattr(agent, 'id', 0),
-                    'is_waiting': True
-                })
-    
+            waiting_agents.append(agent)
+
     # 检查下一个发言者是否为人类角色
     if meeting.status == "进行中" and meeting.current_speaker_index < len(meeting.agents):
         next_speaker = meeting.agents[meeting.current_speaker_index]
-        if hasattr(next_speaker, 'is_human') and next_speaker.is_human:
-            is_waiting_for_human = True
+        if getattr(next_speaker, 'is_human', False):
             waiting_for_agent = next_speaker.name
-            
-            # 确保这个人类角色也在waiting_for_human列表中
-            agent_in_list = False
-            for role in waiting_for_human:
-                if role.get('name') == next_speaker.name:
-                    agent_in_list = True
-                    break
-            
-            if not agent_in_list:
-                waiting_for_human.append({
-                    'name': next_speaker.name,
-                    'id': getattr(next_speaker, 'id', 0),
-                    'is_waiting': True
-                })
-    
+            if next_speaker not in waiting_agents:
+                waiting_agents.append(next_speaker)
+    return waiting_for_agent, waiting_agents
+
+
+def _messages_etag(meeting_id: str, meeting, waiting_for_agent, waiting_agents) -> str:
+    """由消息日志长度与会议状态生成弱 ETag，与 since 无关，便于长轮询推进游标时复用"""
+    fingerprint = (
+        meeting_id,
+        meeting.message_log.next_seq,
+        meeting.status,
+        meeting.current_round,
+        meeting.max_rounds,
+        meeting.current_speaker_index,
+        len(meeting.rounds),
+        waiting_for_agent,
+        tuple(agent.name for agent in waiting_agents),
+    )
+    digest = hashlib.blake2b(repr(fingerprint).encode("utf-8"), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中当前 ETag（弱比较）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    current = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == current:
+            return True
+    return False
+
+
+def _build_messages_result(meeting, since: Optional[int], waiting_for_agent, waiting_agents) -> Dict[str, Any]:
+    """组装 /messages 的响应体，只格式化 seq >= since 的消息"""
+    waiting_for_human = []
+    if waiting_agents:
+        human_roles = {role['name']: role for role in meeting.get_human_roles()}
+        for agent in waiting_agents:
+            waiting_for_human.append(human_roles.get(agent.name) or {
+                'name': agent.name,
+                'id': getattr(agent, 'id', 0),
+                'is_waiting': True
+            })
+
     # 格式化消息供前端使用
-    formatted_messages = []
-    for msg in history:
-        formatted_messages.append({
-            "role": "user" if msg.get("agent") != "system" else "system",
-            "content": msg.get("content", ""),
-            "agent_name": msg.get("agent", "系统"),
-            "timestamp": msg.get("timestamp", "")
-        })
-    
+    formatted_messages = [
+        {
+            "seq": record.seq,
+            "role": "user" if record.agent != "system" else "system",
+            "content": record.content if record.content is not None else "",
+            "agent_name": record.agent if record.agent is not None else "系统",
+            "timestamp": record.timestamp
+        }
+        for record in meeting.message_log.message_records(since or 0)
+    ]
+
     # 如果有人类角色等待输入，设置状态为waiting_for_human
-    status = meeting.status
-    if is_waiting_for_human:
-        status = "waiting_for_human"
-    
+    status = "waiting_for_human" if waiting_for_agent else meeting.status
+
     # 整理讨论的轮次信息
     rounds = []
-    for round_idx, round_data in enumerate(meeting.rounds if hasattr(meeting, 'rounds') else []):
+    for round_idx, round_data in enumerate(meeting.rounds):
         if round_data and isinstance(round_data, dict) and round_data.get('messages'):
             rounds.append({
                 'round_number': round_idx + 1,
@@ -550,22 +523,171 @@ def get_meeting_messages(meeting_id: str, format: str = "standard", db: Session
                     } for msg in round_data.get('messages', [])
                 ]
             })
-    
-    # 记录结果信息
-    result = {
+
+    return {
         "status": status,
         "waiting_for_human": waiting_for_human,
         "waiting_for_agent": waiting_for_agent,
         "messages": formatted_messages,
+        "since": since,
+        "next_since": meeting.message_log.next_seq,
         "current_round": meeting.current_round,
         "max_rounds": meeting.max_rounds,
         "topic": meeting.topic,
         "rounds": rounds if rounds else [{"round_number": 1, "messages": []}]
     }
-    
-    logger.info(f"返回会议消息，状态:{status}, 当前轮次:{meeting.current_round}, 消息数:{len(formatted_messages)}, 等待人类输入:{is_waiting_for_human}")
-    
-    return result
+
+
+@router.get("/discussions/{meeting_id}/messages", response_model=Dict[str, Any])
+async def get_meeting_messages(
+    meeting_id: str,
+    request: Request,
+    format: str = "standard",
+    since: Optional[int] = None,
+    wait: float = 0
+):
+    """
+    获取会议消息历史
+
+    参数:
+        since: 增量游标，只返回 seq >= since 的消息；响应中的 next_since 即下一次请求的游标
+        wait: 长轮询秒数（上限 MEETING_MESSAGES_MAX_WAIT）。If-None-Match 与当前 ETag 相同，
+            或未携带 If-None-Match 但 since 之后没有新消息时，挂起直到会议发生变化或超时
+
+    返回:
+        会议状态与消息；If-None-Match 命中时返回 304，响应体较大且客户端支持时 gzip 压缩
+    """
+    if_none_match = request.headers.get("if-none-match")
+    wait = min(max(wait, 0.0), MESSAGES_MAX_WAIT)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+
+    while True:
+        # 先取版本号再读取状态：读取之后发生的变化一定会让下面的等待立即返回
+        seen_version = notifier.version(meeting_id)
+        meeting = await run_in_threadpool(_load_meeting, meeting_id)
+        waiting_for_agent, waiting_agents = _waiting_state(meeting)
+        etag = _messages_etag(meeting_id, meeting, waiting_for_agent, waiting_agents)
+
+        if if_none_match:
+            unchanged = _etag_matches(if_none_match, etag)
+        else:
+            unchanged = since is not None and meeting.message_log.next_seq <= since
+
+        remaining = deadline - loop.time()
+        if not unchanged or remaining <= 0:
+            break
+        if not await notifier.wait_for_change(meeting_id, seen_version, remaining):
+            # 超时后再读取一次，返回最新状态
+            continue
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    result = _build_messages_result(meeting, since, waiting_for_agent, waiting_agents)
+    logger.debug(
+        f"返回会议消息，状态:{result['status']}, 当前轮次:{meeting.current_round}, "
+        f"消息数:{len(result['messages'])}, since:{since}, 等待人类输入:{bool(waiting_for_agent)}"
+    )
+
+    body = JSONResponse(result).body
+    if len(body) >= MESSAGES_GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# ===== 会议事件订阅（SSE / WebSocket） =====
+
+# 没有事件时发送心跳的间隔（秒），避免代理断开空闲连接
+EVENTS_HEARTBEAT_INTERVAL = float(os.getenv("MEETING_EVENTS_HEARTBEAT", "15"))
+
+
+def _subscribed_event(meeting_id: str, meeting, subscription: event_bus.Subscription) -> Dict[str, Any]:
+    """
+    订阅成功后的第一条事件：客户端用 next_since 调用 /messages 补齐订阅前的消息；
+    断线重连时 replayed 为补发的事件数，missed 为已不在缓冲区、需要通过 /messages 补齐的事件数
+    """
+    return {
+        "meeting_id": meeting_id,
+        "status": meeting.status,
+        "current_round": meeting.current_round,
+        "next_since": meeting.message_log.next_seq,
+        "driving": event_bus.is_driving(meeting_id),
+        "replayed": subscription.replayed,
+        "missed": subscription.missed
+    }
+
+
+async def _sse_event_stream(subscription: event_bus.Subscription, hello: Dict[str, Any]):
+    """把订阅转换为 SSE：每条事件为 id: <epoch>:<seq> / event: <type> / data: <json>"""
+    bus = subscription.bus
+    try:
+        yield f"event: subscribed\ndata: {json_codec.dumps(hello, ensure_ascii=False)}\n\n"
+        while True:
+            event = await subscription.get(EVENTS_HEARTBEAT_INTERVAL)
+            if event is None:
+                yield ": ping\n\n"
+                continue
+            yield (
+                f"id: {bus.event_id(event)}\nevent: {event.type}\n"
+                f"data: {json_codec.dumps(event.to_dict(), ensure_ascii=False)}\n\n"
+            )
+            if event.type in event_bus.TERMINAL_EVENTS:
+                break
+    finally:
+        subscription.close()
+
+
+@router.get("/discussions/{meeting_id}/events", response_model=None)
+async def subscribe_meeting_events(meeting_id: str, request: Request):
+    """以 SSE 订阅会议事件，任意数量的观看者共享同一次生成；携带 Last-Event-ID 重连时补发缺失的事件"""
+    meeting = await run_in_threadpool(_load_meeting, meeting_id)
+    # 先订阅再读取游标，两者之间新增的消息会同时出现在事件与 /messages?since= 中，不会遗漏
+    subscription = event_bus.subscribe(meeting_id, last_event_id=request.headers.get("last-event-id"))
+    return StreamingResponse(
+        _sse_event_stream(subscription, _subscribed_event(meeting_id, meeting, subscription)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/discussions/{meeting_id}/ws")
+async def meeting_events_websocket(websocket: WebSocket, meeting_id: str, last_event_id: Optional[str] = None):
+    """以 WebSocket 订阅会议事件，消息格式与 SSE 的 data 相同并附带 id；重连时通过 last_event_id 参数补发"""
+    try:
+        meeting = await run_in_threadpool(_load_meeting, meeting_id)
+    except HTTPException as e:
+        await websocket.close(code=4404 if e.status_code == 404 else 1011)
+        return
+
+    await websocket.accept()
+    subscription = event_bus.subscribe(meeting_id, last_event_id=last_event_id)
+    bus = subscription.bus
+    try:
+        await websocket.send_text(json_codec.dumps(
+            {"seq": 0, "type": "subscribed", "data": _subscribed_event(meeting_id, meeting, subscription), "ts": time.time()},
+            ensure_ascii=False
+        ))
+        while True:
+            event = await subscription.get(EVENTS_HEARTBEAT_INTERVAL)
+            if event is None:
+                await websocket.send_text('{"type": "ping"}')
+                continue
+            await websocket.send_text(json_codec.dumps(dict(event.to_dict(), id=bus.event_id(event)), ensure_ascii=False))
+            if event.type in event_bus.TERMINAL_EVENTS:
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscription.close()
+
+
+@router.get("/events/stats", response_model=Dict[str, Any])
+def get_meeting_events_stats():
+    """获取事件总线统计：总线数、订阅者数、驱动中的会议数、发布与断开的次数"""
+    return event_bus.stats()
 
 @router.get("/discussions/active", response_model=Dict[str, Any])
 def get_active_meetings(db: Session = Depends(get_db)):
@@ -594,13 +716,85 @@ def get_active_meetings(db: Session = Depends(get_db)):
         "meetings": meetings_info
     }
 
+@router.get("/store/stats", response_model=Dict[str, Any])
+def get_meeting_store_stats():
+    """获取会议存储统计：内存中的会议数、估算内存占用、淘汰与重新加载次数"""
+    return get_meeting_store().stats()
+
+@router.get("/human_input/stats", response_model=Dict[str, Any])
+def get_human_input_stats():
+    """获取人类输入截止时间统计：等待中的数量、最近的截止时间、各超时策略的处理次数"""
+    return human_input_reaper.stats()
+
+@router.get("/jobs/stats", response_model=Dict[str, Any])
+def get_meeting_jobs_stats():
+    """获取会议运行服务统计：worker 数、排队与活跃作业数、各结束状态的次数"""
+    return meeting_runner.get_runner().stats()
+
+def _get_job(job_id: str):
+    job = meeting_runner.get_runner().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"作业ID {job_id} 不存在或已过期")
+    return job
+
+def _control_job(action, job_id: str) -> Dict[str, Any]:
+    try:
+        return action(job_id).to_dict()
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"作业ID {job_id} 不存在或已过期")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/jobs/{job_id}", response_model=Dict[str, Any])
+async def get_meeting_job(job_id: str):
+    """查询会议作业状态与结果"""
+    return _get_job(job_id).to_dict()
+
+@router.get("/jobs/{job_id}/stream", response_model=None)
+async def stream_meeting_job(job_id: str, request: Request):
+    """观看 run 作业的输出（从头补发），断开不影响作业；携带 Last-Event-ID 重连时续传"""
+    resumed = resumable_stream.resume_response(request)
+    if resumed is not None:
+        return resumed
+    job = _get_job(job_id)
+    if job.stream is None:
+        raise HTTPException(status_code=400, detail="该作业没有输出流，请轮询作业状态")
+    return resumable_stream.read_response(job.stream)
+
+@router.post("/jobs/{job_id}/pause", response_model=Dict[str, Any])
+async def pause_meeting_job(job_id: str):
+    """暂停会议作业（当前一步完成后生效）"""
+    return _control_job(meeting_runner.get_runner().pause, job_id)
+
+@router.post("/jobs/{job_id}/resume", response_model=Dict[str, Any])
+async def resume_meeting_job(job_id: str):
+    """继续暂停的会议作业"""
+    return _control_job(meeting_runner.get_runner().resume, job_id)
+
+@router.post("/jobs/{job_id}/cancel", response_model=Dict[str, Any])
+async def cancel_meeting_job(job_id: str):
+    """取消会议作业，会议停在当前状态"""
+    return _control_job(meeting_runner.get_runner().cancel, job_id)
+
+@router.get("/discussions/{meeting_id}/job", response_model=Dict[str, Any])
+async def get_discussion_job(meeting_id: str):
+    """查询会议当前（或最近一个）作业"""
+    job = meeting_runner.get_runner().job_for_meeting(meeting_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"会议 {meeting_id} 没有作业")
+    return job.to_dict()
+
 @router.get("/discussions/{meeting_id}/stream", response_model=None)
-async def stream_meeting_messages(meeting_id: str, db: Session = Depends(get_db)):
-    """流式获取会议消息，用于实时显示"""
+async def stream_meeting_messages(meeting_id: str, request: Request, db: Session = Depends(get_db)):
+    """流式获取会议消息，用于实时显示；携带 Last-Event-ID 重连时续传断开的流"""
+    resumed = resumable_stream.resume_response(request)
+    if resumed is not None:
+        return resumed
+    
     adapter = MeetingAdapter(db)
     
     # 确保会议存在
-    meeting_data = adapter.active_meetings.get(meeting_id)
+    meeting_data = await adapter.active_meetings.get_async(meeting_id)
     if not meeting_data:
         raise HTTPException(status_code=404, detail=f"会议ID {meeting_id} 不存在")
     
@@ -610,16 +804,11 @@ async def stream_meeting_messages(meeting_id: str, db: Session = Depends(get_db)
         raise HTTPException(status_code=500, detail=f"会议数据格式错误")
     
     # 开始流式响应
-    return StreamingResponse(
-        generate_meeting_stream(meeting, adapter, meeting_id),
-        media_type="text/event-stream"
-    )
+    return resumable_stream.stream_response(generate_meeting_stream(meeting, adapter, meeting_id))
 
 async def generate_meeting_stream(meeting, adapter, meeting_id: str):
     """生成会议消息的流式响应"""
-    import json
     import asyncio
-    import time
     
     # 生成唯一会话ID
     conversation_id = f"chatcmpl-{hex(int(time.time() * 1000))[2:]}"
@@ -637,7 +826,7 @@ async def generate_meeting_stream(meeting, adapter, meeting_id: str):
             "finish_reason": None
         }]
     }
-    yield f"data: {json.dumps(start_event)}\n\n".encode('utf-8')
+    yield f"data: {json_codec.dumps(start_event)}\n\n".encode('utf-8')
     
     # 发送会议主题
     intro_event = {
@@ -651,13 +840,18 @@ async def generate_meeting_stream(meeting, adapter, meeting_id: str):
             "finish_reason": None
         }]
     }
-    yield f"data: {json.dumps(intro_event)}\n\n".encode('utf-8')
+    yield f"data: {json_codec.dumps(intro_event)}\n\n".encode('utf-8')
     await asyncio.sleep(0.2)
     
     # 调用会议轮次API生成响应
     try:
         # 获取当前轮次状态
-        result = adapter.conduct_discussion_round(meeting_id)
+        if not event_bus.claim_driver(meeting_id):
+            raise RuntimeError("会议正在其他请求中生成，请订阅 /events 观看")
+        try:
+            result = await adapter.conduct_discussion_round_async(meeting_id)
+        finally:
+            event_bus.release_driver(meeting_id)
         
         # 如果结果表示等待人类输入，直接返回
         if result.get("waiting_for_human", False):
@@ -672,7 +866,7 @@ async def generate_meeting_stream(meeting, adapter, meeting_id: str):
                     "finish_reason": None
                 }]
             }
-            yield f"data: {json.dumps(waiting_info)}\n\n".encode('utf-8')
+            yield f"data: {json_codec.dumps(waiting_info)}\n\n".encode('utf-8')
             
             # 发送完成事件
             done_event = {
@@ -686,7 +880,7 @@ async def generate_meeting_stream(meeting, adapter, meeting_id: str):
                     "finish_reason": "stop"
                 }]
             }
-            yield f"data: {json.dumps(done_event)}\n\n".encode('utf-8')
+            yield f"data: {json_codec.dumps(done_event)}\n\n".encode('utf-8')
             yield f"data: [DONE]\n\n".encode('utf-8')
             return
         
@@ -707,7 +901,7 @@ async def generate_meeting_stream(meeting, adapter, meeting_id: str):
                     "finish_reason": None
                 }]
             }
-            yield f"data: {json.dumps(speaker_info)}\n\n".encode('utf-8')
+            yield f"data: {json_codec.dumps(speaker_info)}\n\n".encode('utf-8')
             await asyncio.sleep(0.2)
             
             # 流式发送内容
@@ -727,7 +921,7 @@ async def generate_meeting_stream(meeting, adapter, meeting_id: str):
                             "finish_reason": None
                         }]
                     }
-                    yield f"data: {json.dumps(content_chunk)}\n\n".encode('utf-8')
+                    yield f"data: {json_codec.dumps(content_chunk)}\n\n".encode('utf-8')
                     # 添加延迟，模拟真实打字速度，但不要太慢
                     await asyncio.sleep(0.05)
         
@@ -743,7 +937,7 @@ async def generate_meeting_stream(meeting, adapter, meeting_id: str):
                 "finish_reason": "stop"
             }]
         }
-        yield f"data: {json.dumps(done_event)}\n\n".encode('utf-8')
+        yield f"data: {json_codec.dumps(done_event)}\n\n".encode('utf-8')
         yield f"data: [DONE]\n\n".encode('utf-8')
                 
     except Exception as e:
@@ -760,16 +954,21 @@ async def generate_meeting_stream(meeting, adapter, meeting_id: str):
                 "finish_reason": "error"
             }]
         }
-        yield f"data: {json.dumps(error_event)}\n\n".encode('utf-8')
+        yield f"data: {json_codec.dumps(error_event)}\n\n".encode('utf-8')
         yield f"data: [DONE]\n\n".encode('utf-8')
 
 @router.post("/discussions/stream", response_model=None)
 async def start_and_stream_discussion(
+    request: Request,
     group_id: int = Body(...),
     topic: str = Body(...),
     db: Session = Depends(get_db)
 ):
-    """启动讨论并立即以流式方式返回响应"""
+    """启动讨论并立即以流式方式返回响应；携带 Last-Event-ID 重连时续传断开的流，不再启动新会议"""
+    resumed = resumable_stream.resume_response(request)
+    if resumed is not None:
+        return resumed
+    
     adapter = MeetingAdapter(db)
     
     try:
@@ -777,7 +976,7 @@ async def start_and_stream_discussion(
         meeting_id = adapter.start_meeting(group_id, topic)
         
         # 获取会议对象
-        meeting_data = adapter.active_meetings.get(meeting_id)
+        meeting_data = await adapter.active_meetings.get_async(meeting_id)
         if not meeting_data:
             raise HTTPException(status_code=404, detail=f"会议ID {meeting_id} 不存在")
         
@@ -786,9 +985,9 @@ async def start_and_stream_discussion(
             raise HTTPException(status_code=500, detail=f"会议数据格式错误")
         
         # 开始流式响应
-        return StreamingResponse(
+        return resumable_stream.stream_response(
             generate_meeting_stream(meeting, adapter, meeting_id),
-            media_type="text/event-stream"
+            headers={"X-Meeting-Id": meeting_id}
         )
         
     except Exception as e:
@@ -806,7 +1005,7 @@ async def start_and_stream_discussion(
                     "finish_reason": "error"
                 }]
             }
-            yield f"data: {json.dumps(error_data)}\n\n".encode('utf-8')
+            yield f"data: {json_codec.dumps(error_data)}\n\n".encode('utf-8')
             yield f"data: [DONE]\n\n".encode('utf-8')
         
         return StreamingResponse(error_stream(), media_type="text/event-stream")
@@ -850,7 +1049,7 @@ async def get_meeting_status_and_summary(meeting_id: str, db: Session = Depends(
     logger.info(f"获取会议状态和总结，会议ID: {meeting_id}")
     
     # 检查会议是否存在
-    meeting_data = adapter.active_meetings.get(meeting_id)
+    meeting_data = await adapter.active_meetings.get_async(meeting_id)
     if not meeting_data:
         logger.warning(f"找不到会议ID: {meeting_id}，尝试结束会议以获取总结")
         try:
@@ -887,7 +1086,8 @@ async def get_meeting_status_and_summary(meeting_id: str, db: Session = Depends(
         if not existing_summary or len(existing_summary) < 100 or "未找到总结" in existing_summary:
             logger.info(f"会议已结束但未找到有效总结，生成总结...")
             try:
-                summary = meeting.finish()
+                summary = await meeting.finish_async()
+                save_meeting(meeting_id)
                 logger.info(f"已生成会议总结，长度: {len(summary)}")
             except Exception as e:
                 logger.error(f"生成总结时出错: {str(e)}", exc_info=True)
@@ -7,8 +7,10 @@ from app.models.database import get_db, Model, Role, DiscussionGroup
 from app.models.schemas import Model as ModelSchema, ModelCreate
 from app.processors.role_processor import RoleProcessor
 from app.processors.discussion_processor import DiscussionProcessor
+from app.utils.codec_route import CodecJSONRoute
 
 router = APIRouter(
+    route_class=CodecJSONRoute,
     prefix="/models",
     tags=["models"],
     responses={404: {"description": "Not found"}},
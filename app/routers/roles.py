@@ -5,8 +5,10 @@ import logging
 
 from app.models.database import get_db
 from app.processors.role_processor import RoleProcessor
+from app.utils.codec_route import CodecJSONRoute
 
 router = APIRouter(
+    route_class=CodecJSONRoute,
     prefix="/v1/roles",
     tags=["roles"],
 )
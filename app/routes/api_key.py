@@ -5,8 +5,9 @@ from typing import List, Optional
 from dotenv import load_dotenv
 import json
 from app.utils.logger import logger
+from app.utils.codec_route import CodecJSONRoute
 
-router = APIRouter()
+router = APIRouter(route_class=CodecJSONRoute)
 
 class ApiKey(BaseModel):
     api_key: str
@@ -3,8 +3,9 @@ from pydantic import BaseModel
 import os
 from app.utils.auth import create_access_token, verify_token, update_admin_credentials
 from typing import Optional
+from app.utils.codec_route import CodecJSONRoute
 
-router = APIRouter()
+router = APIRouter(route_class=CodecJSONRoute)
 
 class LoginRequest(BaseModel):
     username: str
@@ -1,22 +1,37 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
 
-from app.models.database import get_db, Configuration as DBConfiguration, ConfigurationStep, Model as DBModel
+from app.models.database import get_async_db, Configuration as DBConfiguration, ConfigurationStep, Model as DBModel
 from app.models.schemas import Configuration, ConfigurationCreate
+from app.models import config_registry
+from app.utils.codec_route import CodecJSONRoute
 
-router = APIRouter()
+router = APIRouter(route_class=CodecJSONRoute)
+
+async def _load_configuration(db: AsyncSession, config_id: int) -> Optional[DBConfiguration]:
+    """加载配置及其步骤（异步会话不能懒加载关系，需要显式预加载）"""
+    result = await db.execute(
+        select(DBConfiguration)
+        .options(selectinload(DBConfiguration.steps))
+        .where(DBConfiguration.id == config_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
 
 @router.get("/configurations", response_model=List[Configuration])
-async def get_configurations(db: Session = Depends(get_db)):
-    return db.query(DBConfiguration).all()
+async def get_configurations(db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(DBConfiguration).options(selectinload(DBConfiguration.steps)))
+    return result.scalars().all()
 
 @router.post("/configurations", response_model=Configuration)
-async def create_configuration(config: ConfigurationCreate, db: Session = Depends(get_db)):
+async def create_configuration(config: ConfigurationCreate, db: AsyncSession = Depends(get_async_db)):
     try:
         # 验证所有模型是否存在且用途类型正确
         for step in config.steps:
-            model = db.query(DBModel).filter(DBModel.id == step.model_id).first()
+            model = await db.get(DBModel, step.model_id)
             if not model:
                 raise HTTPException(status_code=404, detail=f"Model {step.model_id} not found")
             if model.type not in ["both", step.step_type]:
@@ -32,8 +47,8 @@ async def create_configuration(config: ConfigurationCreate, db: Session = Depend
             transfer_content=config.transfer_content
         )
         db.add(db_config)
-        db.commit()
-        db.refresh(db_config)
+        # 只 flush 取得配置 ID，配置与步骤在同一事务中提交，注册表也只失效一次
+        await db.flush()
 
         # 创建配置步骤
         for step in config.steps:
@@ -46,18 +61,18 @@ async def create_configuration(config: ConfigurationCreate, db: Session = Depend
             )
             db.add(db_step)
         
-        db.commit()
-        db.refresh(db_config)
-        return db_config
+        await db.commit()
+        config_registry.invalidate()
+        return await _load_configuration(db, db_config.id)
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/configurations/{config_id}", response_model=Configuration)
-async def update_configuration(config_id: int, config: ConfigurationCreate, db: Session = Depends(get_db)):
+async def update_configuration(config_id: int, config: ConfigurationCreate, db: AsyncSession = Depends(get_async_db)):
     try:
-        db_config = db.query(DBConfiguration).filter(DBConfiguration.id == config_id).first()
+        db_config = await db.get(DBConfiguration, config_id)
         if not db_config:
             raise HTTPException(status_code=404, detail="Configuration not found")
         
@@ -65,9 +80,9 @@ async def update_configuration(config_id: int, config: ConfigurationCreate, db:
         db_config.is_active = config.is_active
         db_config.transfer_content = config.transfer_content
         
-        db.query(ConfigurationStep).filter(
-            ConfigurationStep.configuration_id == config_id
-        ).delete()
+        await db.execute(
+            delete(ConfigurationStep).where(ConfigurationStep.configuration_id == config_id)
+        )
         
         for step in config.steps:
             db_step = ConfigurationStep(
@@ -79,20 +94,21 @@ async def update_configuration(config_id: int, config: ConfigurationCreate, db:
             )
             db.add(db_step)
         
-        db.commit()
-        db.refresh(db_config)
-        return db_config
+        await db.commit()
+        config_registry.invalidate()
+        return await _load_configuration(db, db_config.id)
             
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/configurations/{config_id}")
-async def delete_configuration(config_id: int, db: Session = Depends(get_db)):
-    db_config = db.query(DBConfiguration).filter(DBConfiguration.id == config_id).first()
+async def delete_configuration(config_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_config = await db.get(DBConfiguration, config_id)
     if not db_config:
         raise HTTPException(status_code=404, detail="Configuration not found")
     
-    db.delete(db_config)
-    db.commit()
+    await db.delete(db_config)
+    await db.commit()
+    config_registry.invalidate()
     return {"status": "success"} 
\ No newline at end of file
@@ -1,21 +1,25 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import logging
 
-from app.models.database import get_db, Model as DBModel
+from app.models.database import get_async_db, Model as DBModel
+from app.models import config_registry
+from app.clients import registry as client_registry
 from app.models.schemas import Model, ModelCreate
+from app.utils.codec_route import CodecJSONRoute
 
-router = APIRouter()
+router = APIRouter(route_class=CodecJSONRoute)
 
 logger = logging.getLogger(__name__)
 
 @router.get("/models", response_model=List[Model])
-async def get_models(db: Session = Depends(get_db)):
-    return db.query(DBModel).all()
+async def get_models(db: AsyncSession = Depends(get_async_db)):
+    return (await db.execute(select(DBModel))).scalars().all()
 
 @router.post("/models", response_model=Model)
-async def create_model(model: ModelCreate, db: Session = Depends(get_db)):
+async def create_model(model: ModelCreate, db: AsyncSession = Depends(get_async_db)):
     try:
         logger.debug(f"Creating model with data: {model.dict()}")
         model_data = {
@@ -35,6 +39,12 @@ async def create_model(model: ModelCreate, db: Session = Depends(get_db)):
             'tool_choice': model.tool_choice,
             'enable_thinking': model.enable_thinking,
             'thinking_budget_tokens': model.thinking_budget_tokens,
+            'hedge_enabled': model.hedge_enabled,
+            'hedge_model_id': model.hedge_model_id,
+            'fallback_model_id': model.fallback_model_id,
+            'rpm_limit': model.rpm_limit,
+            'tpm_limit': model.tpm_limit,
+            'max_concurrency': model.max_concurrency,
             'custom_parameters': model.custom_parameters if model.custom_parameters else {}
         }
         
@@ -42,38 +52,45 @@ async def create_model(model: ModelCreate, db: Session = Depends(get_db)):
         
         db_model = DBModel(**model_data)
         db.add(db_model)
-        db.commit()
-        db.refresh(db_model)
+        await db.commit()
+        config_registry.invalidate()
+        await db.refresh(db_model)
         logger.debug(f"Created model: {db_model.__dict__}")
         return db_model
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error creating model: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/models/{model_id}", response_model=Model)
-async def update_model(model_id: int, model: ModelCreate, db: Session = Depends(get_db)):
-    db_model = db.query(DBModel).filter(DBModel.id == model_id).first()
+async def update_model(model_id: int, model: ModelCreate, db: AsyncSession = Depends(get_async_db)):
+    db_model = await db.get(DBModel, model_id)
     if not db_model:
         raise HTTPException(status_code=404, detail="Model not found")
     
+    # 用修改前的地址与密钥失效缓存的客户端
+    client_registry.invalidate_model(db_model)
+    
     for key, value in model.dict().items():
         setattr(db_model, key, value)
     
     try:
-        db.commit()
-        db.refresh(db_model)
+        await db.commit()
+        config_registry.invalidate()
+        await db.refresh(db_model)
         return db_model
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/models/{model_id}")
-async def delete_model(model_id: int, db: Session = Depends(get_db)):
-    db_model = db.query(DBModel).filter(DBModel.id == model_id).first()
+async def delete_model(model_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_model = await db.get(DBModel, model_id)
     if not db_model:
         raise HTTPException(status_code=404, detail="Model not found")
     
-    db.delete(db_model)
-    db.commit()
+    client_registry.invalidate_model(db_model)
+    await db.delete(db_model)
+    await db.commit()
+    config_registry.invalidate()
     return {"status": "success"} 
\ No newline at end of file
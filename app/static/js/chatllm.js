@@ -2714,6 +2714,11 @@ document.addEventListener("DOMContentLoaded", function() {
             // 添加人类发言到聊天界面
             addMessageToChat('user', messageText, roleName);
             
+            // 原会议流挂起等待该输入时会直接继续输出，无需重新连接
+            if (data.resumed) {
+                return;
+            }
+            
             // 等待一段时间，确保后端有时间处理输入
             await new Promise(resolve => setTimeout(resolve, 1000));
             
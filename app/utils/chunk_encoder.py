@@ -0,0 +1,100 @@
+"""OpenAI chat.completion.chunk 的 SSE 编码器
+
+同一个流中每个 chunk 的外层信封（id/object/created/model/choices）都相同，
+只有 delta 不同。这里在创建编码器时把信封序列化一次，之后每个 chunk 只需要
+对 delta 中的字符串做转义再拼接，输出与 json.dumps 完全一致。
+"""
+import json
+import os
+from json.encoder import encode_basestring, encode_basestring_ascii
+from typing import Any, Dict, Optional
+
+# 占位符只用于切分预序列化的信封
+_DELTA_PLACEHOLDER = "\x00__delta__\x00"
+
+
+def omit_empty_delta_fields() -> bool:
+    """是否在流式输出中省略空的 delta 字段（STREAM_OMIT_EMPTY_DELTA，默认关闭以保持兼容）"""
+    return os.getenv("STREAM_OMIT_EMPTY_DELTA", "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+class ChunkEncoder:
+    """预序列化信封的流式 chunk 编码器"""
+
+    __slots__ = ("_prefix", "_suffix", "_escape", "_ensure_ascii", "_omit_empty", "_keys")
+
+    def __init__(
+        self,
+        chat_id: str,
+        model: str,
+        created: int,
+        ensure_ascii: bool = True,
+        omit_empty: bool = False,
+        with_finish_reason: bool = False
+    ):
+        """初始化编码器
+
+        Args:
+            chat_id: 响应ID
+            model: 模型名称
+            created: 创建时间戳
+            ensure_ascii: 与 json.dumps 的 ensure_ascii 含义相同
+            omit_empty: 是否省略值为空字符串的 delta 字段
+            with_finish_reason: 是否在 choice 中输出 "finish_reason": null
+        """
+        choice = {"index": 0, "delta": _DELTA_PLACEHOLDER}
+        if with_finish_reason:
+            choice["finish_reason"] = None
+        envelope = {
+            "id": chat_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [choice]
+        }
+        serialized = json.dumps(envelope, ensure_ascii=ensure_ascii)
+        prefix, suffix = serialized.split(json.dumps(_DELTA_PLACEHOLDER, ensure_ascii=ensure_ascii), 1)
+        self._prefix = "data: " + prefix
+        self._suffix = suffix + "\n\n"
+        self._escape = encode_basestring_ascii if ensure_ascii else encode_basestring
+        self._ensure_ascii = ensure_ascii
+        self._omit_empty = omit_empty
+        self._keys: Dict[str, str] = {}
+
+    def _key(self, key: str) -> str:
+        """获取已转义的字段名（带冒号分隔符），按字段缓存"""
+        encoded = self._keys.get(key)
+        if encoded is None:
+            encoded = self._escape(key) + ": "
+            self._keys[key] = encoded
+        return encoded
+
+    def encode_text(self, delta: Dict[str, Any]) -> str:
+        """编码一个 delta，返回完整的 SSE 文本
+
+        Args:
+            delta: delta 字典，字符串值走快速转义，其他类型回退到 json.dumps
+
+        Returns:
+            str: `data: {...}\\n\\n`
+        """
+        escape = self._escape
+        parts = []
+        for key, value in delta.items():
+            if type(value) is str:
+                if not value and self._omit_empty:
+                    continue
+                parts.append(self._key(key) + escape(value))
+            else:
+                parts.append(self._key(key) + json.dumps(value, ensure_ascii=self._ensure_ascii))
+        return self._prefix + "{" + ", ".join(parts) + "}" + self._suffix
+
+    def encode(self, delta: Dict[str, Any]) -> bytes:
+        """编码一个 delta，返回 UTF-8 字节"""
+        return self.encode_text(delta).encode("utf-8")
+
+    def content(self, text: str, role: Optional[str] = None) -> bytes:
+        """编码只包含 content（可选 role）的 delta"""
+        if role is None:
+            return (self._prefix + '{"content": ' + self._escape(text) + "}" + self._suffix).encode("utf-8")
+        return self.encode({"role": role, "content": text})
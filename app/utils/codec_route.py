@@ -0,0 +1,31 @@
+"""让 FastAPI 的请求体解析使用统一 JSON 编解码（app.utils.json_codec）
+
+FastAPI 只对路由自身的 route_class 生效，include_router 不会替换子路由的路由类，
+因此应用与每个 APIRouter 都要指定 route_class=CodecJSONRoute。
+"""
+from typing import Any
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+
+from app.utils import json_codec
+
+
+# 使用统一 JSON 编解码解析请求体的请求类
+class CodecJSONRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = json_codec.loads(await self.body())
+        return self._json
+
+
+# 自定义路由类，让 Body 参数解析走 json_codec
+class CodecJSONRoute(APIRoute):
+    def get_route_handler(self):
+        original_route_handler = super().get_route_handler()
+
+        async def codec_route_handler(request: Request):
+            request = CodecJSONRequest(request.scope, request.receive)
+            return await original_route_handler(request)
+
+        return codec_route_handler
@@ -0,0 +1,89 @@
+"""JSON 编解码
+
+全应用统一从这里做 JSON 编解码：解析在安装了 orjson 时使用 orjson，否则回退到标准库 json。
+
+- loads: 结果与 json.loads 完全一致；orjson 拒绝而标准库接受的输入（NaN、超出 64 位的整数等）
+  会自动回退到标准库解析
+- dumps: 输出与 json.dumps 逐字节一致，所有客户端可见的输出（SSE chunk、接口响应）都应使用它
+- dumps_compact: 紧凑格式，输出与 json.dumps(ensure_ascii=False, separators=(",", ":")) 的 UTF-8 编码逐字节一致，
+  用于上游请求体
+
+序列化不使用 orjson：它的浮点数格式与标准库不同（1.5e-05 输出为 0.000015，1e-07 输出为 1e-7），
+NaN/Infinity 会被输出为 null，无法保证逐字节一致。与标准库的一致性由 tests/test_json_codec.py 保证。
+"""
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 为可选依赖
+    orjson = None
+
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，统一捕获这个即可
+JSONDecodeError = json.JSONDecodeError
+
+HAS_ORJSON = orjson is not None
+
+# orjson 会把超出 64 位的整数解析为浮点数：出现 20 位以上连续数字时交给标准库。
+# 用 translate 把数字映射为 "0"、其他字节映射为空格后做子串查找，比正则扫描快数倍
+_DIGIT_TABLE = bytes(0x30 if 0x30 <= i <= 0x39 else 0x20 for i in range(256))
+_LONG_DIGIT_RUN = b"0" * 20
+
+
+def _has_long_digit_run(data: Union[bytes, bytearray]) -> bool:
+    """是否包含 20 位以上的连续数字（可能是超出 64 位的整数）"""
+    return _LONG_DIGIT_RUN in data.translate(_DIGIT_TABLE)
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """解析 JSON 文本
+
+    Args:
+        data: JSON 字符串或 UTF-8 字节
+
+    Returns:
+        Any: 解析结果
+    """
+    if orjson is not None:
+        try:
+            raw = data.encode("utf-8") if isinstance(data, str) else data
+        except UnicodeEncodeError:
+            # 含孤立代理项的字符串只有标准库能处理
+            return json.loads(data)
+        if _has_long_digit_run(raw):
+            return json.loads(data)
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # 交给标准库处理边界情况；确实非法时由标准库抛出同样的 JSONDecodeError
+            pass
+    return json.loads(data)
+
+
+def dumps(obj: Any, ensure_ascii: bool = True, **kwargs) -> str:
+    """序列化为 JSON 字符串，输出与 json.dumps 逐字节一致
+
+    orjson 只能输出紧凑格式，无法与 json.dumps 默认的 ", "/": " 分隔符保持一致，
+    因此这里始终使用标准库（其默认参数路径本身就是 C 实现）。
+
+    Args:
+        obj: 待序列化对象
+        ensure_ascii: 与 json.dumps 相同
+        **kwargs: 透传给 json.dumps 的其他参数
+
+    Returns:
+        str: JSON 字符串
+    """
+    return json.dumps(obj, ensure_ascii=ensure_ascii, **kwargs)
+
+
+def dumps_compact(obj: Any) -> bytes:
+    """序列化为紧凑的 UTF-8 JSON 字节（不转义非 ASCII 字符）
+
+    Args:
+        obj: 待序列化对象
+
+    Returns:
+        bytes: JSON 字节
+    """
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,338 @@
+"""可续传的 SSE 流
+
+代理或浏览器在流式输出中途断开后，原来只能重新发起请求，服务端重新生成或重新发送全部内容。
+这里把流式生成与 HTTP 连接解耦：
+
+- 生成器在后台任务中运行，每个 SSE chunk 分配单调递增的序号，输出时带上
+  `id: <stream_id>:<seq>`，响应头 X-Stream-Id 为流ID
+- 每个流在有界环形缓冲区中保留最近的 chunk（条数与字节数双重上限）
+- 客户端携带 Last-Event-ID 重连时只补发缺失的尾部，之后继续实时输出；
+  缓冲区已淘汰的部分无法补发，会输出一条 SSE 注释说明丢失的条数
+- 所有流的缓冲总字节数有上限，超出时优先淘汰已结束的流
+- 流结束后保留 SSE_REPLAY_TTL 秒供重连；没有任何连接超过 SSE_RESUME_GRACE 秒的
+  未结束流会被取消，避免无人接收时继续消耗上游调用
+- 也可以不提供生成器，由外部（如后台会议作业）调用 write()/finish() 写入，
+  这种流的生命周期由写入方决定，没有连接时不会被取消
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from app.utils.logger import logger
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+# 单个流缓冲的最大 chunk 数 / 字节数
+MAX_EVENTS = _env_int("SSE_REPLAY_EVENTS", 2048)
+MAX_BYTES = _env_int("SSE_REPLAY_BYTES", 1024 * 1024)
+# 所有流缓冲的总字节数上限
+MAX_TOTAL_BYTES = _env_int("SSE_REPLAY_TOTAL_BYTES", 64 * 1024 * 1024)
+# 流结束后保留多久（秒）
+REPLAY_TTL = _env_int("SSE_REPLAY_TTL", 120)
+# 没有连接的未结束流保留多久（秒）后取消
+RESUME_GRACE = _env_int("SSE_RESUME_GRACE", 30)
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class _Chunk:
+    __slots__ = ("seq", "text")
+
+    def __init__(self, seq: int, text: str):
+        self.seq = seq
+        self.text = text
+
+
+class ResumableStream:
+    """在后台运行的、带重放缓冲区的 SSE 流"""
+
+    def __init__(self, source=None, stream_id: Optional[str] = None, headers: Optional[Dict[str, str]] = None):
+        """初始化并立即开始生成（需要在事件循环中调用）
+
+        Args:
+            source: 产生 SSE 文本（str 或 bytes）的异步可迭代对象；为 None 时由调用方 write()/finish()
+            stream_id: 流ID，默认随机生成
+            headers: 响应头（续传时原样返回，如 X-Meeting-Id）
+        """
+        self.stream_id = stream_id or uuid.uuid4().hex
+        self.headers = dict(headers or {})
+        self._chunks: deque = deque()
+        self.buffered_bytes = 0
+        self.last_seq = 0
+        self.evicted = 0
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.readers = 0
+        self._detached_at: Optional[float] = time.monotonic()
+        self._changed = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._pump(source)) if source is not None else None
+
+    async def _pump(self, source) -> None:
+        """消费源生成器，写入缓冲区并唤醒读取者"""
+        try:
+            async for chunk in source:
+                self.write(chunk)
+        except asyncio.CancelledError:
+            logger.info(f"流 {self.stream_id} 长时间没有连接，已取消生成")
+            raise
+        except Exception as e:
+            logger.error(f"流 {self.stream_id} 生成出错: {e}", exc_info=True)
+        finally:
+            self.finish()
+
+    def write(self, chunk) -> None:
+        """写入一个 SSE chunk（str 或 bytes，需要在事件循环中调用）"""
+        if self.done:
+            return
+        if isinstance(chunk, (bytes, bytearray)):
+            chunk = chunk.decode("utf-8")
+        self._append(chunk)
+
+    def finish(self) -> None:
+        """标记流结束，读取者输出完缓冲区后结束；REPLAY_TTL 秒后从注册表移除"""
+        if self.done:
+            return
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._wake()
+        asyncio.get_running_loop().call_later(REPLAY_TTL, _expire, self.stream_id)
+
+    def _append(self, text: str) -> None:
+        self.last_seq += 1
+        self._chunks.append(_Chunk(self.last_seq, text))
+        self.buffered_bytes += len(text)
+        _totals["bytes"] += len(text)
+        # 最新的 chunk 总是保留，实时读取者不会丢数据
+        while len(self._chunks) > 1 and (len(self._chunks) > MAX_EVENTS or self.buffered_bytes > MAX_BYTES):
+            self._evict_oldest()
+        if _totals["bytes"] > MAX_TOTAL_BYTES:
+            _sweep()
+        self._wake()
+
+    def _evict_oldest(self) -> None:
+        chunk = self._chunks.popleft()
+        self.buffered_bytes -= len(chunk.text)
+        _totals["bytes"] -= len(chunk.text)
+        self.evicted += 1
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def release(self) -> None:
+        """丢弃缓冲区（流从注册表移除时调用）"""
+        _totals["bytes"] -= self.buffered_bytes
+        self.buffered_bytes = 0
+        self._chunks.clear()
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    @property
+    def idle_seconds(self) -> float:
+        """没有连接的时长，有连接时为 0"""
+        if self.readers or self._detached_at is None:
+            return 0.0
+        return time.monotonic() - self._detached_at
+
+    def _format(self, chunk: _Chunk) -> str:
+        return f"id: {self.stream_id}:{chunk.seq}\n{chunk.text}"
+
+    async def read(self, after_seq: int = 0) -> AsyncIterator[str]:
+        """输出 seq > after_seq 的 chunk，追上后继续实时输出直到流结束
+
+        Args:
+            after_seq: 客户端已收到的最后一个序号（Last-Event-ID 中的序号）
+
+        Returns:
+            AsyncIterator[str]: 带 id 行的 SSE 文本
+        """
+        self.readers += 1
+        self._detached_at = None
+        seq = after_seq
+        try:
+            while True:
+                changed = self._changed
+                chunks = self._chunks
+                if chunks and chunks[-1].seq > seq:
+                    first = chunks[0].seq
+                    if seq + 1 < first:
+                        yield f": {first - seq - 1} events are no longer buffered\n\n"
+                        seq = first - 1
+                    # 缓冲区中的序号连续，按下标定位；每次输出后重新定位，期间可能有旧 chunk 被淘汰
+                    chunk = chunks[seq + 1 - first]
+                    seq = chunk.seq
+                    yield self._format(chunk)
+                    continue
+                if seq < self.last_seq:
+                    # 缓冲区已被整体淘汰
+                    yield f": {self.last_seq - seq} events are no longer buffered\n\n"
+                    seq = self.last_seq
+                    continue
+                if self.done:
+                    return
+                if self._changed is changed:
+                    await changed.wait()
+        finally:
+            self.readers -= 1
+            if not self.readers:
+                self._detached_at = time.monotonic()
+                if not self.done and self._task is not None:
+                    asyncio.get_running_loop().call_later(RESUME_GRACE, self._cancel_if_abandoned)
+
+    def _cancel_if_abandoned(self) -> None:
+        """断开后 RESUME_GRACE 秒内没有重连，取消生成"""
+        if not self.done and self.idle_seconds >= RESUME_GRACE:
+            _stats["abandoned"] += 1
+            self._task.cancel()
+
+
+_streams: Dict[str, ResumableStream] = {}
+_totals = {"bytes": 0}
+_stats = {"streams": 0, "resumes": 0, "resume_misses": 0, "expired": 0, "abandoned": 0}
+
+
+def _expire(stream_id: str) -> None:
+    """流结束 REPLAY_TTL 秒后从注册表移除"""
+    stream = _streams.get(stream_id)
+    if stream is not None and stream.done and not stream.readers:
+        _streams.pop(stream_id).release()
+        _stats["expired"] += 1
+
+
+def _sweep() -> None:
+    """清理过期的流，并在总字节数超限时淘汰缓冲区"""
+    now = time.monotonic()
+    for stream_id, stream in list(_streams.items()):
+        if stream.done and now - stream.finished_at > REPLAY_TTL:
+            _streams.pop(stream_id).release()
+            _stats["expired"] += 1
+
+    if _totals["bytes"] <= MAX_TOTAL_BYTES:
+        return
+    # 先整体移除已结束且没有连接的流（最早结束的优先）
+    finished = sorted(
+        (s for s in _streams.values() if s.done and not s.readers),
+        key=lambda s: s.finished_at
+    )
+    for stream in finished:
+        if _totals["bytes"] <= MAX_TOTAL_BYTES:
+            return
+        _streams.pop(stream.stream_id).release()
+        _stats["expired"] += 1
+    # 仍然超限时，从缓冲最多的流开始丢弃最旧的 chunk
+    for stream in sorted(_streams.values(), key=lambda s: s.buffered_bytes, reverse=True):
+        while len(stream._chunks) > 1 and _totals["bytes"] > MAX_TOTAL_BYTES:
+            stream._evict_oldest()
+        if _totals["bytes"] <= MAX_TOTAL_BYTES:
+            return
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """解析 Last-Event-ID（<stream_id>:<seq>）
+
+    Args:
+        value: 请求头的值
+
+    Returns:
+        Optional[Tuple[str, int]]: (流ID, 序号)，格式不符时返回 None
+    """
+    if not value:
+        return None
+    stream_id, _, seq = value.strip().rpartition(":")
+    if not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
+
+
+def read_response(stream: ResumableStream, after_seq: int = 0) -> StreamingResponse:
+    """
+    返回读取已有流的响应（从 after_seq 之后开始，缓冲区中更早的部分会被补发）
+
+    Args:
+        stream: 流
+        after_seq: 客户端已收到的最后一个序号
+
+    Returns:
+        StreamingResponse: 流式响应
+    """
+    response_headers = dict(SSE_HEADERS)
+    response_headers.update(stream.headers)
+    response_headers["X-Stream-Id"] = stream.stream_id
+    return StreamingResponse(stream.read(after_seq), media_type="text/event-stream", headers=response_headers)
+
+
+def resume_response(request: Request) -> Optional[StreamingResponse]:
+    """请求携带的 Last-Event-ID 指向仍在缓冲的流时，返回续传响应
+
+    Args:
+        request: 当前请求
+
+    Returns:
+        Optional[StreamingResponse]: 续传响应；不是续传请求或流已过期时返回 None，
+        调用方应按普通请求重新生成
+    """
+    parsed = parse_last_event_id(request.headers.get("last-event-id"))
+    if parsed is None:
+        return None
+    _sweep()
+    stream_id, after_seq = parsed
+    stream = _streams.get(stream_id)
+    if stream is None:
+        _stats["resume_misses"] += 1
+        logger.info(f"流 {stream_id} 已过期，无法续传，将重新生成")
+        return None
+    _stats["resumes"] += 1
+    logger.info(f"续传流 {stream_id}: 从序号 {after_seq} 之后补发（当前序号 {stream.last_seq}）")
+    return read_response(stream, after_seq)
+
+
+def stream_response(source, headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """把新的 SSE 生成器包装为可续传的流式响应
+
+    Args:
+        source: 产生 SSE 文本的异步可迭代对象
+        headers: 额外的响应头
+
+    Returns:
+        StreamingResponse: 流式响应
+    """
+    return read_response(open_stream(source, headers))
+
+
+def open_stream(source=None, headers: Optional[Dict[str, str]] = None) -> ResumableStream:
+    """
+    创建并登记可续传的流（需要在事件循环中调用）
+
+    Args:
+        source: 产生 SSE 文本的异步可迭代对象；为 None 时由调用方 write()/finish()
+        headers: 额外的响应头
+
+    Returns:
+        ResumableStream: 流，可用 read_response() 返回给客户端
+    """
+    _sweep()
+    stream = ResumableStream(source, headers=headers)
+    _streams[stream.stream_id] = stream
+    _stats["streams"] += 1
+    return stream
+
+
+def stats() -> Dict[str, int]:
+    """返回可续传流的统计信息"""
+    return {
+        "live_streams": len(_streams),
+        "buffered_bytes": _totals["bytes"],
+        **_stats,
+    }
@@ -0,0 +1,152 @@
+"""SSE 分帧微基准
+
+在 fixtures/ 下录制的提供商流式响应上比较：
+- legacy: 改造前的做法，每个 TCP 块单独 decode() 后 splitlines()，跨块的行与被截断的多字节字符会丢失
+- framing: app.clients.sse.SSEDecoder 只做分帧
+- framing+json: 分帧后对每个负载 json.loads（与客户端实际开销接近）
+
+每个流按三种块大小随机切分（大块 4-16KB、常见 64-1500B、极端 1-64B），
+输出每秒事件数与 legacy 丢失/解析失败的事件数。
+
+用法:
+    python benchmarks/sse_framing.py [--events 20000] [--repeat 5]
+    python benchmarks/sse_framing.py --record URL API_KEY MODEL fixtures/name.sse  # 录制新的 OpenAI 兼容流
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.clients.sse import SSEDecoder  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CHUNK_SIZES = ((4000, 16000), (64, 1500), (1, 64))
+
+
+def load_fixtures(min_events: int) -> Dict[str, bytes]:
+    """读取录制的流，重复拼接到至少 min_events 个事件"""
+    streams = {}
+    for name in sorted(os.listdir(FIXTURES)):
+        if not name.endswith(".sse"):
+            continue
+        with open(os.path.join(FIXTURES, name), "rb") as f:
+            raw = f.read()
+        events = max(1, raw.count(b"data:"))
+        streams[name[:-4]] = raw * max(1, -(-min_events // events))
+    return streams
+
+
+def split(raw: bytes, lo: int, hi: int, rng: random.Random) -> List[bytes]:
+    """按随机块大小切分，模拟 TCP 读取"""
+    chunks, i = [], 0
+    while i < len(raw):
+        size = rng.randint(lo, hi)
+        chunks.append(raw[i:i + size])
+        i += size
+    return chunks
+
+
+def legacy(chunks: List[bytes]) -> Tuple[int, int]:
+    """改造前: 每块独立解码并按行切分"""
+    ok = lost = 0
+    for chunk in chunks:
+        try:
+            text = chunk.decode("utf-8")
+        except UnicodeDecodeError:
+            lost += 1
+            continue
+        for line in text.splitlines():
+            if line.startswith("data: "):
+                payload = line[6:]
+                if payload == "[DONE]":
+                    continue
+                try:
+                    json.loads(payload)
+                    ok += 1
+                except json.JSONDecodeError:
+                    lost += 1
+    return ok, lost
+
+
+def framing(chunks: List[bytes], parse: bool = False) -> Tuple[int, int]:
+    """SSEDecoder 分帧（可选 json.loads）"""
+    ok = 0
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        for payload in decoder.feed(chunk):
+            if payload == "[DONE]":
+                continue
+            if parse:
+                json.loads(payload)
+            ok += 1
+    ok += len(decoder.flush())
+    return ok, 0
+
+
+def best_of(fn: Callable[[List[bytes]], Tuple[int, int]], chunks: List[bytes], repeat: int) -> Tuple[float, int, int]:
+    best = float("inf")
+    result = (0, 0)
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(chunks)
+        best = min(best, time.perf_counter() - started)
+    return best, result[0], result[1]
+
+
+def run(events: int, repeat: int) -> None:
+    rng = random.Random(7)
+    cases = (
+        ("legacy", legacy),
+        ("framing", framing),
+        ("framing+json", lambda chunks: framing(chunks, parse=True)),
+    )
+    print(f"{'stream':18s} {'chunks':>11s} {'n':>6s} {'method':13s} {'events':>7s} {'lost':>6s} {'k ev/s':>8s}")
+    for name, raw in load_fixtures(events).items():
+        expected = framing([raw])[0]
+        for lo, hi in CHUNK_SIZES:
+            chunks = split(raw, lo, hi, rng)
+            for label, fn in cases:
+                seconds, ok, lost = best_of(fn, chunks, repeat)
+                if label != "legacy" and ok != expected:
+                    raise SystemExit(f"{name} {label}: 切分后得到 {ok} 个事件，整体解析为 {expected} 个")
+                rate = ok / seconds / 1e3 if ok else 0.0
+                print(f"{name:18s} {f'{lo}-{hi}':>11s} {len(chunks):6d} {label:13s} {ok:7d} {lost:6d} {rate:8.0f}")
+
+
+def record(url: str, api_key: str, model: str, path: str) -> None:
+    """录制一次 OpenAI 兼容接口的原始流式响应"""
+    import httpx
+
+    payload = {
+        "model": model,
+        "stream": True,
+        "messages": [{"role": "user", "content": "请用中文和英文混合，分步骤详细分析一个复杂问题，至少 800 字。"}],
+    }
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    with httpx.stream("POST", url, json=payload, headers=headers, timeout=120) as response, open(path, "wb") as f:
+        response.raise_for_status()
+        for chunk in response.iter_raw():
+            f.write(chunk)
+    print(f"已写入 {path}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000, help="每个流至少包含的事件数")
+    parser.add_argument("--repeat", type=int, default=5, help="每种情况取最好成绩的次数")
+    parser.add_argument("--record", nargs=4, metavar=("URL", "API_KEY", "MODEL", "PATH"), help="录制新的流")
+    args = parser.parse_args()
+    if args.record:
+        record(*args.record)
+    else:
+        run(args.events, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
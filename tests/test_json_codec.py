@@ -0,0 +1,184 @@
+"""json_codec 与标准库 json 的一致性测试
+
+loads 在 orjson 与标准库两种后端下都要与 json.loads 结果一致（包括抛出的异常），
+dumps / dumps_compact 的输出要与对应参数的 json.dumps 逐字节一致。
+"""
+import json
+import math
+import random
+import struct
+
+import pytest
+
+from app.utils import json_codec
+
+BACKENDS = ["stdlib"] + (["orjson"] if json_codec.HAS_ORJSON else [])
+
+
+@pytest.fixture(params=BACKENDS)
+def codec(request, monkeypatch):
+    """分别在 orjson 与纯标准库后端下运行"""
+    if request.param == "stdlib":
+        monkeypatch.setattr(json_codec, "orjson", None)
+    return json_codec
+
+
+def _same(a, b) -> bool:
+    """比较解析结果，NaN 视为相等，并区分 int/float 与 -0.0"""
+    if isinstance(a, float) and isinstance(b, float):
+        if math.isnan(a) and math.isnan(b):
+            return True
+        return a == b and math.copysign(1, a) == math.copysign(1, b)
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict):
+        return list(a) == list(b) and all(_same(a[k], b[k]) for k in a)
+    return a == b
+
+
+LOADS_CASES = [
+    # NaN / Infinity（orjson 拒绝，回退标准库）
+    "NaN",
+    "[NaN, Infinity, -Infinity]",
+    '{"temperature": NaN, "top_p": Infinity}',
+    # 64 位边界与超出 64 位的整数（20 位以上连续数字走预扫描）
+    "9223372036854775807",
+    "-9223372036854775808",
+    "18446744073709551615",
+    "18446744073709551616",
+    "-123456789012345678901234567890",
+    '{"id": 123456789012345678901234567890, "n": 1}',
+    "[1, 12345678901234567890123, 2.5]",
+    # 20 位以上的数字出现在字符串或小数里同样走标准库，结果不变
+    '"order-12345678901234567890123"',
+    "0.123456789012345678901234567",
+    "1234567890123456789012345.5e-3",
+    # 19 位数字不触发预扫描
+    "1234567890123456789",
+    # 浮点格式
+    "[1e-07, 1.5e-05, 1e16, 1E+22, -0.0, 0.1, 5e-324]",
+    # 孤立代理项与非 BMP 字符
+    '"\\ud800"',
+    '"\\udfff tail"',
+    '"\\ud83d\\ude00"',
+    '"😀 思考 🚀"',
+    '{"emoji": "\\ud83d\\ude00", "lone": "\\ud83d"}',
+    # 普通的流式 chunk
+    '{"choices":[{"delta":{"content":"你好"},"index":0,"finish_reason":null}]}',
+    '{"a": [true, false, null], "b": {"c": ""}}',
+]
+
+
+@pytest.mark.parametrize("text", LOADS_CASES)
+def test_loads_matches_stdlib(codec, text):
+    expected = json.loads(text)
+    assert _same(codec.loads(text), expected)
+    assert _same(codec.loads(text.encode("utf-8")), expected)
+    assert _same(codec.loads(bytearray(text.encode("utf-8"))), expected)
+
+
+def test_loads_big_int_stays_int(codec):
+    value = codec.loads("[18446744073709551616, 12345678901234567890123]")
+    assert value == [18446744073709551616, 12345678901234567890123]
+    assert all(type(v) is int for v in value)
+
+
+def test_loads_raw_lone_surrogate_str(codec):
+    # str 中直接包含孤立代理项时无法编码为 UTF-8，只能交给标准库
+    text = '"a\ud800b"'
+    assert codec.loads(text) == json.loads(text)
+
+
+def test_long_digit_prescan():
+    assert json_codec._has_long_digit_run(b"12345678901234567890")
+    assert json_codec._has_long_digit_run(b'{"x": "abc-99999999999999999999999"}')
+    assert not json_codec._has_long_digit_run(b"1234567890123456789")
+    assert not json_codec._has_long_digit_run(b"1234567890.1234567890")
+
+
+@pytest.mark.parametrize("text", ["", "{", '{"a": 1,}', "[1, 2", "nul", '"\\x"', "1 2", "\xff"])
+def test_loads_errors_match_stdlib(codec, text):
+    with pytest.raises(json.JSONDecodeError) as expected:
+        json.loads(text)
+    with pytest.raises(json.JSONDecodeError) as actual:
+        codec.loads(text)
+    assert str(actual.value) == str(expected.value)
+
+
+def test_loads_random_floats(codec):
+    rng = random.Random(5)
+    values = []
+    while len(values) < 2000:
+        value = struct.unpack("d", struct.pack("Q", rng.getrandbits(64)))[0]
+        if math.isfinite(value):
+            values.append(value)
+    text = json.dumps(values)
+    assert _same(codec.loads(text), json.loads(text))
+
+
+DUMPS_CASES = [
+    {"id": "chatcmpl-1", "choices": [{"index": 0, "delta": {"content": "你好，世界"}, "finish_reason": None}]},
+    {"nan": float("nan"), "inf": float("inf"), "-inf": float("-inf")},
+    [18446744073709551616, -123456789012345678901234567890, 9223372036854775807],
+    [1e-07, 1.5e-05, 1e16, 1e22, -0.0, 0.1, 1 / 3, 5e-324, 123456789.12345679],
+    "\ud800",
+    {"lone": "\udfff", "pair": "😀", "emoji": "😀🚀", "zh": "思考"},
+    {1: "int key", 2.5: "float key", True: "bool key", None: "null key"},
+    {"nested": {"list": [1, [2, [3, {"x": ""}]]], "empty": {}, "tuple": (1, 2)}},
+    "quote \" backslash \\ control \n\t\x00\x1f del \x7f",
+    [],
+    None,
+]
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+@pytest.mark.parametrize("obj", DUMPS_CASES)
+def test_dumps_byte_identical(obj, ensure_ascii):
+    assert json_codec.dumps(obj, ensure_ascii=ensure_ascii) == json.dumps(obj, ensure_ascii=ensure_ascii)
+
+
+@pytest.mark.parametrize("obj", DUMPS_CASES)
+def test_dumps_default_separators(obj):
+    # 默认参数与 json.dumps 相同：ensure_ascii=True，分隔符为 ", " 与 ": "
+    assert json_codec.dumps(obj) == json.dumps(obj)
+    if isinstance(obj, dict) and len(obj) > 1:
+        assert ", " in json_codec.dumps(obj) and ": " in json_codec.dumps(obj)
+
+
+@pytest.mark.parametrize("kwargs", [{"sort_keys": True}, {"indent": 2}, {"separators": (",", ":")}, {"default": str}])
+def test_dumps_kwargs_passthrough(kwargs):
+    obj = {"b": 1, "a": [1.5e-05, "思考"], "c": {"z": None}}
+    assert json_codec.dumps(obj, ensure_ascii=False, **kwargs) == json.dumps(obj, ensure_ascii=False, **kwargs)
+
+
+def _stdlib_compact(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@pytest.mark.parametrize("obj", DUMPS_CASES)
+def test_dumps_compact_byte_identical(obj):
+    try:
+        expected = _stdlib_compact(obj)
+    except UnicodeEncodeError:
+        # 孤立代理项无法编码为 UTF-8，两者抛出同样的异常
+        with pytest.raises(UnicodeEncodeError):
+            json_codec.dumps_compact(obj)
+        return
+    assert json_codec.dumps_compact(obj) == expected
+
+
+def test_dumps_compact_random_floats():
+    rng = random.Random(9)
+    values = []
+    while len(values) < 2000:
+        value = struct.unpack("d", struct.pack("Q", rng.getrandbits(64)))[0]
+        if math.isfinite(value):
+            values.append(value)
+    assert json_codec.dumps_compact(values) == _stdlib_compact(values)
+
+
+def test_dumps_compact_round_trip(codec):
+    payload = {"model": "deepseek-chat", "temperature": 0.7, "messages": [{"role": "user", "content": "你好 😀"}]}
+    assert codec.loads(json_codec.dumps_compact(payload)) == payload
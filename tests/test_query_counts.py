@@ -0,0 +1,115 @@
+"""角色与讨论组读取路径的 SQL 语句数测试
+
+在内存 SQLite 中分别准备 1 个和 N 个角色，统计 MeetingAdapter.get_all_roles、
+get_discussion_group、start_meeting 与 RoleProcessor._create_agent 执行的语句数，
+语句数不应随角色数量增长（没有逐行懒加载的 N+1 查询）。
+"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  先完成 app.models 的初始化，避免循环导入
+from app.adapters.meeting_adapter import MeetingAdapter
+from app.models.database import Base, DiscussionGroup, Model, Role
+from app.processors.role_processor import RoleProcessor
+
+ROLE_COUNTS = (1, 8)
+
+
+@pytest.fixture
+def make_db():
+    """按角色数量创建独立的内存数据库，返回 (engine, session, group_id, role_ids)"""
+    created = []
+
+    def _make(role_count: int):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine, autoflush=False)()
+        created.append((engine, db))
+
+        # 每个角色使用不同的模型，懒加载时无法从身份映射命中，N+1 会直接体现在语句数上
+        models = [
+            Model(
+                name=f"model-{i}", type="both", provider="deepseek", api_key=f"sk-test-{i}",
+                api_url="http://127.0.0.1:9/v1/chat/completions", model_name="deepseek-chat",
+            )
+            for i in range(role_count)
+        ]
+        db.add_all(models)
+        db.flush()
+        host = Role(name="host", description="主持", model_id=models[0].id, skills=["总结"], parameters={})
+        roles = [host]
+        for i in range(1, role_count):
+            # 一半是寄生在 host 上的人类角色，覆盖 host_role 的预加载
+            roles.append(Role(
+                name=f"role-{i}", description=f"角色{i}", model_id=models[i].id, skills=[], parameters={},
+                is_human=i % 2 == 0, host_role=host if i % 2 == 0 else None,
+            ))
+        group = DiscussionGroup(name="group", mode="discussion", max_rounds=2, roles=roles)
+        db.add(group)
+        db.commit()
+        group_id, role_ids = group.id, [role.id for role in roles]
+        # 清空会话，后续读取全部来自数据库而不是身份映射
+        db.expunge_all()
+        return engine, db, group_id, role_ids
+
+    yield _make
+    for engine, db in created:
+        db.close()
+        engine.dispose()
+
+
+@contextmanager
+def count_statements(engine):
+    """统计代码块内执行的 SQL 语句"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _statement_counts(make_db, role_count: int) -> dict:
+    engine, db, group_id, role_ids = make_db(role_count)
+    adapter = MeetingAdapter(db)
+    counts = {}
+
+    with count_statements(engine) as statements:
+        roles = adapter.get_all_roles()
+    assert len(roles) == role_count
+    counts["get_all_roles"] = len(statements)
+    db.expunge_all()
+
+    with count_statements(engine) as statements:
+        group = adapter.get_discussion_group(group_id)
+    assert len(group["roles"]) == role_count
+    counts["get_discussion_group"] = len(statements)
+    db.expunge_all()
+
+    with count_statements(engine) as statements:
+        meeting_id = adapter.start_meeting(group_id, "查询数测试")
+    assert len(adapter.active_meetings[meeting_id]["meeting"].agents) == role_count
+    counts["start_meeting"] = len(statements)
+    db.expunge_all()
+
+    processor = RoleProcessor(db)
+    role = processor._load_role(role_ids[-1])
+    with count_statements(engine) as statements:
+        processor._create_agent(role)
+    counts["_create_agent"] = len(statements)
+    return counts
+
+
+def test_statement_count_independent_of_role_count(make_db):
+    single, many = (_statement_counts(make_db, n) for n in ROLE_COUNTS)
+    assert single == many
+    # 每个读取路径都实际访问了数据库
+    assert all(count > 0 for count in single.values())